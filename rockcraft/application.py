@@ -18,17 +18,45 @@
 
 from __future__ import annotations
 
-from typing import TYPE_CHECKING
+import concurrent.futures
+import pathlib
+import subprocess
+import sys
+from typing import IO, TYPE_CHECKING, Any, cast
 
-from craft_application import Application, AppMetadata, errors
+import craft_providers
+from craft_application import Application, AppMetadata, ConfigModel, errors
+from craft_cli import emit
 from overrides import override  # type: ignore[reportUnknownVariableType]
 
 from rockcraft import plugins
+from rockcraft.dependency_cache import DEPENDENCY_CACHE_DIR
+from rockcraft.errors import RockcraftError
+from rockcraft.image_cache import BASE_IMAGE_CACHE_DIR
 from rockcraft.models import project
+from rockcraft.part_cache import PART_CACHE_DIR
 
 if TYPE_CHECKING:
+    import argparse
+    from collections.abc import Sequence
+
+    import craft_cli
+    import craft_platforms
     from craft_parts.plugins.plugins import PluginType
 
+    from rockcraft.services import RockcraftPackageService
+
+
+class RockcraftConfigModel(ConfigModel):
+    """Rockcraft's configuration, set through ``ROCKCRAFT_*`` variables."""
+
+    offline: bool = False
+    """Build against the cached base images, without contacting the registry."""
+
+    jobs: int = 1
+    """The number of parts that can be pulled and built at the same time."""
+
+
 APP_METADATA = AppMetadata(
     name="rockcraft",
     summary="A tool to create OCI images",
@@ -37,19 +65,178 @@ APP_METADATA = AppMetadata(
     docs_url="https://documentation.ubuntu.com/rockcraft/en/{version}",
     check_supported_base=True,
     artifact_type="rock",
+    ConfigModel=RockcraftConfigModel,
 )
 
 
 class Rockcraft(Application):
     """Rockcraft application definition."""
 
+    _multi_arch = False
+    _stdout = False
+    _pack_output = pathlib.Path()
+
+    @property
+    @override
+    def app_config(self) -> dict[str, Any]:
+        """Get the configuration of the commands, with the cache directory."""
+        config = super().app_config
+        config["cache_dir"] = self.cache_dir
+        return config
+
+    @override
+    def _pre_run(self, dispatcher: craft_cli.Dispatcher) -> None:
+        super()._pre_run(dispatcher)
+        args = dispatcher.parsed_args()
+        self._multi_arch = bool(getattr(args, "multi_arch", False))
+        self._stdout = bool(getattr(args, "stdout", False))
+        self._pack_output = getattr(args, "output", pathlib.Path())
+        if self._multi_arch and not self.is_managed() and self._is_destructive(args):
+            raise RockcraftError(
+                "Cannot create a multi-architecture rock in destructive mode.",
+                resolution="Pack the rock in managed instances, which build "
+                "every platform.",
+            )
+
+    @override
+    def run_managed(self, platform: str | None, build_for: str | None) -> None:
+        """Run the application in a managed instance for each planned build.
+
+        With ``pack --multi-arch``, the instances run concurrently, and the rocks
+        packed in them are then combined in a multi-architecture rock. With
+        ``pack --stdout``, the rock that the instance writes to its standard
+        output is forwarded to the standard output.
+        """
+        if not (self._multi_arch or self._stdout):
+            super().run_managed(platform, build_for)
+            return
+
+        build_planner = self.services.get("build_plan")
+        if platform:
+            build_planner.set_platforms(platform)
+        if build_for:
+            build_planner.set_build_fors(build_for)
+        plan = build_planner.plan()
+        if self._stdout:
+            if len(plan) > 1:
+                raise RockcraftError(
+                    "Cannot write the rocks of several platforms to the standard "
+                    "output.",
+                    resolution="Select a single platform with '--platform'.",
+                )
+            super().run_managed(platform, build_for)
+            return
+
+        # The fetch service has one session at a time.
+        fetch_active = self.services.get("fetch").is_active(
+            enable_command_line=self._enable_fetch_service
+        )
+        if len(plan) > 1 and not fetch_active:
+            self._run_instances(plan)
+        else:
+            super().run_managed(platform, build_for)
+
+        package = cast("RockcraftPackageService", self.services.get("package"))
+        # The instances write the rocks relative to the project directory.
+        package.pack_multi_arch(
+            [build_info.platform for build_info in plan],
+            self.project_dir / self._pack_output,
+        )
+
+    def _run_instances(self, plan: Sequence[craft_platforms.BuildInfo]) -> None:
+        """Run the command in a managed instance for each build, concurrently.
+
+        A failure is reported as soon as it happens, but the other instances
+        keep running to the end of their builds before it is raised.
+        """
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(plan)) as executor:
+            futures = {
+                executor.submit(self._run_instance, build_info): build_info
+                for build_info in plan
+            }
+            failures: list[BaseException] = []
+            for future in concurrent.futures.as_completed(futures):
+                exc = future.exception()
+                if exc is None:
+                    continue
+                if not failures:
+                    emit.progress(
+                        f"Failed to build {futures[future].platform}, waiting "
+                        "for the other platforms",
+                        permanent=True,
+                    )
+                failures.append(exc)
+        if failures:
+            raise failures[0]
+
+    def _run_instance(self, build_info: craft_platforms.BuildInfo) -> None:
+        """Run the command in a managed instance for ``build_info``.
+
+        The output of the instance is streamed through the emitter, as the
+        terminal can't be handed over to several instances at once, with each
+        line prefixed by the platform.
+        """
+        env: dict[str, str | None] = {
+            "CRAFT_PLATFORM": build_info.platform,
+            "CRAFT_VERBOSITY_LEVEL": emit.get_mode().name,
+        }
+        cmd = [self.app.name, *sys.argv[1:]]
+        active_fetch_service = self.services.get("fetch").is_active(
+            enable_command_line=self._enable_fetch_service
+        )
+        with self.services.get("provider").instance(
+            build_info,
+            work_dir=self._work_dir,
+            use_base_instance=not active_fetch_service,
+        ) as instance:
+            env.update(self.services.get("proxy").configure_instance(instance))
+            emit.debug(f"Executing {cmd} in the {build_info.platform} instance")
+            prefix = f"[{build_info.platform}] ".encode()
+            with (
+                emit.open_stream() as stream,
+                open(stream, "wb", closefd=False) as pipe,
+            ):
+                process = instance.execute_popen(
+                    cmd,
+                    cwd=self.app.managed_instance_project_path,
+                    env=env,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT,
+                )
+                for line in cast("IO[bytes]", process.stdout):
+                    pipe.write(prefix + line)
+                    pipe.flush()
+                returncode = process.wait()
+        if returncode:
+            raise craft_providers.ProviderError(
+                f"Failed to execute {self.app.name} in the "
+                f"{build_info.platform} instance."
+            )
+
+    def _is_destructive(self, args: argparse.Namespace) -> bool:
+        """Whether the command runs on the host rather than in managed instances."""
+        if getattr(args, "destructive_mode", False):
+            return True
+        build_env = self.services.get("config").get("build_environment")
+        return bool(build_env and build_env.lower().strip() == "host")
+
     @override
     def _configure_services(self, provider_name: str | None) -> None:
+        base_image_cache_dir = self.cache_dir / BASE_IMAGE_CACHE_DIR
         self.services.update_kwargs(
-            "image", work_dir=self._work_dir, project_dir=self.project_dir
+            "image",
+            work_dir=self._work_dir,
+            project_dir=self.project_dir,
+            cache_dir=base_image_cache_dir,
         )
         self.services.update_kwargs("init", default_name="my-rock-name")
         super()._configure_services(provider_name)
+        self.services.update_kwargs(
+            "provider",
+            base_image_cache_dir=base_image_cache_dir,
+            part_cache_dir=self.cache_dir / PART_CACHE_DIR,
+            dependency_cache_dir=self.cache_dir / DEPENDENCY_CACHE_DIR,
+        )
 
     @override
     def _get_app_plugins(self) -> dict[str, PluginType]:
@@ -34,7 +34,21 @@ COMMAND_GROUPS: list[CommandGroup] = [
             commands.ExpandExtensionsCommand,
         ],
     ),
-    CommandGroup("Lifecycle", [appcommands.TestCommand, appcommands.RemoteBuild]),
+    CommandGroup(
+        "Lifecycle",
+        [
+            commands.RockcraftPackCommand,
+            appcommands.TestCommand,
+            appcommands.RemoteBuild,
+        ],
+    ),
+    CommandGroup(
+        "Caches",
+        [
+            commands.DependencyCachesCommand,
+            commands.PruneDependencyCachesCommand,
+        ],
+    ),
 ]
 
 
@@ -16,14 +16,19 @@
 
 """Rockcraft commands."""
 
+from .caches import DependencyCachesCommand, PruneDependencyCachesCommand
 from .extensions import (
     ExpandExtensionsCommand,
     ExtensionsCommand,
     ListExtensionsCommand,
 )
+from .pack import RockcraftPackCommand
 
 __all__ = [
+    "DependencyCachesCommand",
     "ExpandExtensionsCommand",
     "ExtensionsCommand",
     "ListExtensionsCommand",
+    "PruneDependencyCachesCommand",
+    "RockcraftPackCommand",
 ]
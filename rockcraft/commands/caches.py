@@ -0,0 +1,117 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright 2025 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Cache-related cli commands."""
+
+import abc
+import argparse
+import textwrap
+from typing import Any, cast
+
+import tabulate
+from craft_application.commands import AppCommand
+from craft_cli import emit
+from overrides import overrides  # type: ignore[reportUnknownVariableType]
+
+from rockcraft.dependency_cache import (
+    DEPENDENCY_CACHE_DIR,
+    ECOSYSTEM_ENVIRONMENTS,
+    DependencyCache,
+)
+
+_SIZE_UNITS = ("B", "KiB", "MiB", "GiB")
+
+
+class _DependencyCacheCommand(AppCommand, abc.ABC):
+    """A command on the host's dependency caches."""
+
+    @property
+    def _dependency_cache(self) -> DependencyCache:
+        config = cast(dict[str, Any], self.config)
+        return DependencyCache(config["cache_dir"] / DEPENDENCY_CACHE_DIR)
+
+
+class DependencyCachesCommand(_DependencyCacheCommand):
+    """Show the size of the dependency caches."""
+
+    name = "dependency-caches"
+    help_msg = "Show the size of the dependency caches."
+    overview = textwrap.dedent(
+        """
+        Show the size of the caches that the package managers of the parts
+        share between builds, for each ecosystem.
+        """
+    )
+
+    @overrides
+    def run(self, parsed_args: argparse.Namespace) -> None:  # noqa: ARG002 (unused arg)
+        """Print the size of each dependency cache."""
+        cache = self._dependency_cache
+        sizes = cache.get_sizes()
+        if not sizes:
+            emit.message("The dependency caches are empty.")
+            return
+
+        rows = [
+            {
+                "Ecosystem": ecosystem,
+                "Size": _format_size(size),
+                "Path": str(cache.path / ecosystem),
+            }
+            for ecosystem, size in sizes.items()
+        ]
+        emit.message(tabulate.tabulate(rows, headers="keys"))
+
+
+class PruneDependencyCachesCommand(_DependencyCacheCommand):
+    """Remove dependency caches."""
+
+    name = "prune-dependency-caches"
+    help_msg = "Remove dependency caches."
+    overview = textwrap.dedent(
+        f"""
+        Remove the caches that the package managers of the parts share
+        between builds, for the given ecosystems or for all of them.
+
+        The ecosystems are: {", ".join(ECOSYSTEM_ENVIRONMENTS)}.
+        """
+    )
+
+    @overrides
+    def fill_parser(self, parser: argparse.ArgumentParser) -> None:
+        """Add the ecosystems to the command's arguments."""
+        parser.add_argument(
+            "ecosystems",
+            metavar="ecosystem",
+            nargs="*",
+            help="The ecosystems whose cache to remove, instead of all of them.",
+        )
+
+    @overrides
+    def run(self, parsed_args: argparse.Namespace) -> None:
+        """Remove the dependency caches."""
+        self._dependency_cache.evict(parsed_args.ecosystems or None)
+        emit.message("Dependency caches removed.")
+
+
+def _format_size(size: int) -> str:
+    """Format a size in bytes for humans."""
+    value = float(size)
+    for unit in _SIZE_UNITS[:-1]:
+        if value < 1024:  # noqa: PLR2004 (magic value)
+            return f"{value:.0f} {unit}" if unit == "B" else f"{value:.1f} {unit}"
+        value /= 1024
+    return f"{value:.1f} {_SIZE_UNITS[-1]}"
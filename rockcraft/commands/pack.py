@@ -0,0 +1,101 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright 2025 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Rockcraft's pack command."""
+
+import argparse
+import typing
+
+from craft_application.commands.lifecycle import PackCommand
+from overrides import overrides  # type: ignore[reportUnknownVariableType]
+
+from rockcraft.compression import Compression
+
+if typing.TYPE_CHECKING:
+    from rockcraft.services import RockcraftLifecycleService, RockcraftPackageService
+
+
+class RockcraftPackCommand(PackCommand):
+    """Pack the rock, with options to tune the lifecycle and the compression of its layers."""
+
+    @overrides
+    def _fill_parser(self, parser: argparse.ArgumentParser) -> None:
+        super()._fill_parser(parser)
+
+        codecs = typing.get_args(Compression.model_fields["codec"].annotation)
+        parser.add_argument(
+            "--compression-codec",
+            choices=codecs,
+            help="The compression algorithm for the rock's layers.",
+        )
+        parser.add_argument(
+            "--compression-level",
+            type=int,
+            metavar="level",
+            help="The compression level for the rock's layers.",
+        )
+        parser.add_argument(
+            "--compression-threads",
+            type=int,
+            metavar="threads",
+            help="The number of threads compressing each of the rock's layers.",
+        )
+        parser.add_argument(
+            "--jobs",
+            type=int,
+            metavar="jobs",
+            help="The number of parts that can be pulled and built at the same time.",
+        )
+        output_group = parser.add_mutually_exclusive_group()
+        output_group.add_argument(
+            "--multi-arch",
+            action="store_true",
+            help="Also combine the rocks of every platform in a multi-architecture "
+            "rock.",
+        )
+        output_group.add_argument(
+            "--oci-layout",
+            action="store_true",
+            help="Write the rock as an OCI image layout directory instead of an archive.",
+        )
+        output_group.add_argument(
+            "--stdout",
+            action="store_true",
+            help="Write the rock's archive to the standard output, to pipe it into "
+            "'podman load' or 'docker load'.",
+        )
+
+    @overrides
+    def _run_real(
+        self, parsed_args: argparse.Namespace, step_name: str | None = None
+    ) -> None:
+        package = typing.cast("RockcraftPackageService", self._services.get("package"))
+        package.override_compression(
+            codec=getattr(parsed_args, "compression_codec", None),
+            level=getattr(parsed_args, "compression_level", None),
+            threads=getattr(parsed_args, "compression_threads", None),
+        )
+        jobs = getattr(parsed_args, "jobs", None)
+        if jobs is not None:
+            lifecycle = typing.cast(
+                "RockcraftLifecycleService", self._services.get("lifecycle")
+            )
+            lifecycle.set_jobs(jobs)
+        if getattr(parsed_args, "stdout", False):
+            package.set_output_format("stdout")
+        elif getattr(parsed_args, "oci_layout", False):
+            package.set_output_format("oci-layout")
+        super()._run_real(parsed_args, step_name)
@@ -0,0 +1,283 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright 2025 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Compression of the rock's layer blobs."""
+
+import collections
+import gzip
+import os
+import struct
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import BinaryIO, Literal, Protocol, cast
+
+import pydantic
+import zstandard
+from craft_application.models import CraftBaseModel
+from typing_extensions import Self
+
+GZIP_LAYER_MEDIA_TYPE = "application/vnd.oci.image.layer.v1.tar+gzip"
+ZSTD_LAYER_MEDIA_TYPE = "application/vnd.oci.image.layer.v1.tar+zstd"
+
+DEFAULT_GZIP_LEVEL = 6
+DEFAULT_ZSTD_LEVEL = 3
+
+_MEDIA_TYPES = {"gzip": GZIP_LAYER_MEDIA_TYPE, "zstd": ZSTD_LAYER_MEDIA_TYPE}
+_DEFAULT_LEVELS = {"gzip": DEFAULT_GZIP_LEVEL, "zstd": DEFAULT_ZSTD_LEVEL}
+_MAX_LEVELS = {"gzip": 9, "zstd": zstandard.MAX_COMPRESSION_LEVEL}
+
+# The amount of uncompressed data compressed by each worker at a time.
+DEFAULT_BLOCK_SIZE = 1024 * 1024
+
+# The amount of uncompressed data in each job of the zstd worker threads.
+_ZSTD_JOB_SIZE = 4 * 1024 * 1024
+
+# The size of the deflate window: each block is primed with this much of the
+# data preceding it, so that splitting the data barely affects the ratio.
+_DICTIONARY_SIZE = 32 * 1024
+
+# gzip header: magic, deflate method, no flags, no mtime, no extra flags, Unix
+_GZIP_HEADER = struct.pack("<BBBBIBB", 0x1F, 0x8B, 8, 0, 0, 0, 3)
+
+
+class Compression(CraftBaseModel):
+    """Settings for the compression of the rock's layers."""
+
+    codec: Literal["gzip", "zstd"] = pydantic.Field(
+        default="gzip",
+        description="The compression algorithm used for the layers.",
+    )
+    """The compression algorithm used for the layers.
+
+    ``zstd`` layers decompress several times faster than ``gzip`` ones, but
+    need a container runtime that supports the
+    ``application/vnd.oci.image.layer.v1.tar+zstd`` media type.
+    """
+    level: int | None = pydantic.Field(
+        default=None,
+        ge=1,
+        le=zstandard.MAX_COMPRESSION_LEVEL,
+        description=(
+            "The compression level, from 1 (fastest) to 9 for gzip or 22 for zstd "
+            "(smallest). Defaults to 6 for gzip and 3 for zstd."
+        ),
+    )
+    threads: int | None = pydantic.Field(
+        default=None,
+        ge=1,
+        description=(
+            "The number of threads compressing each layer. "
+            "Defaults to the number of available CPUs."
+        ),
+    )
+    """The number of threads compressing each layer.
+
+    Layers are split into blocks of a fixed size that are compressed
+    concurrently and stitched back into a single stream that any decoder can
+    read. The blocks don't depend on the number of threads, so neither do the
+    compressed layers.
+    """
+
+    @pydantic.model_validator(mode="after")
+    def _validate_level(self) -> Self:
+        max_level = _MAX_LEVELS[self.codec]
+        if self.level is not None and self.level > max_level:
+            raise ValueError(
+                f"{self.codec} compression level must be at most {max_level}"
+            )
+        return self
+
+    @property
+    def media_type(self) -> str:
+        """The media type of the layers compressed with these settings."""
+        return _MEDIA_TYPES[self.codec]
+
+    def get_level(self) -> int:
+        """Get the compression level to use."""
+        return self.level or _DEFAULT_LEVELS[self.codec]
+
+    def get_threads(self) -> int:
+        """Get the number of compression threads to use."""
+        return self.threads or os.cpu_count() or 1
+
+
+class Compressor(Protocol):
+    """A streaming compressor, with the interface of ``zlib`` compress objects."""
+
+    def compress(self, data: bytes) -> bytes:
+        """Compress ``data``, returning the compressed data that is ready."""
+
+    def flush(self) -> bytes:
+        """Finish the compressed stream, returning the remaining data."""
+
+    def close(self) -> None:
+        """Release the compressor's resources, finished or not."""
+
+
+class ParallelGzipCompressor:
+    """A gzip compressor that compresses blocks of data in parallel threads.
+
+    This works like pigz: the data is split into blocks that are compressed
+    as independent raw deflate streams, each one primed with the end of the
+    previous block and ended on a byte boundary. Concatenated, they form a
+    single deflate stream, wrapped in a regular gzip header and trailer, so
+    the output can be read by any gzip decoder. zlib releases the GIL while
+    compressing, so the throughput scales with the number of threads.
+
+    The output only depends on the data, the level and the block size, and
+    not on the number of threads, so it's used even with a single thread.
+
+    :param level: The compression level.
+    :param threads: The number of compression threads.
+    :param block_size: The size of the uncompressed blocks.
+    """
+
+    def __init__(
+        self,
+        level: int = DEFAULT_GZIP_LEVEL,
+        threads: int = 1,
+        block_size: int = DEFAULT_BLOCK_SIZE,
+    ) -> None:
+        self._level = level
+        self._block_size = block_size
+        # Bound the blocks in flight, to bound the memory that is used.
+        self._max_pending = 2 * threads
+        self._executor = ThreadPoolExecutor(
+            max_workers=threads, thread_name_prefix="rockcraft-gzip"
+        )
+        self._pending: collections.deque[Future[bytes]] = collections.deque()
+        self._buffer = bytearray()
+        self._dictionary = b""
+        self._crc = 0
+        self._size = 0
+        self._header = _GZIP_HEADER
+
+    def compress(self, data: bytes) -> bytes:
+        """Compress ``data``, returning the compressed data that is ready."""
+        self._crc = zlib.crc32(data, self._crc)
+        self._size += len(data)
+        self._buffer += data
+
+        while len(self._buffer) >= self._block_size:
+            block = bytes(self._buffer[: self._block_size])
+            del self._buffer[: self._block_size]
+            self._submit(block, last=False)
+
+        return self._collect(drain=False)
+
+    def flush(self) -> bytes:
+        """Finish the compressed stream, returning the remaining data."""
+        self._submit(bytes(self._buffer), last=True)
+        self._buffer.clear()
+        data = self._collect(drain=True)
+        self.close()
+        return data + struct.pack("<II", self._crc, self._size & 0xFFFFFFFF)
+
+    def close(self) -> None:
+        """Stop the compression threads."""
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def _submit(self, block: bytes, *, last: bool) -> None:
+        self._pending.append(
+            self._executor.submit(
+                _compress_block, block, self._dictionary, self._level, last=last
+            )
+        )
+        self._dictionary = block[-_DICTIONARY_SIZE:]
+
+    def _collect(self, *, drain: bool) -> bytes:
+        """Get the compressed blocks that are done, in order.
+
+        Waits for the oldest blocks when too many are pending, or for all of
+        them if ``drain`` is set.
+        """
+        chunks = [self._header]
+        self._header = b""
+        while self._pending and (
+            drain or self._pending[0].done() or len(self._pending) > self._max_pending
+        ):
+            chunks.append(self._pending.popleft().result())
+        return b"".join(chunks)
+
+
+def _compress_block(
+    block: bytes, dictionary: bytes, level: int, *, last: bool
+) -> bytes:
+    """Compress a block into a raw deflate stream that can be concatenated."""
+    if dictionary:
+        compressor = zlib.compressobj(
+            level, zlib.DEFLATED, -zlib.MAX_WBITS, zdict=dictionary
+        )
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    data = compressor.compress(block)
+    return data + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+
+class ZstdCompressor:
+    """A zstd compressor, using zstd's own worker threads.
+
+    zstd splits the data into jobs of a fixed size, compressed by its worker
+    threads. Unlike its single-threaded mode, which is never used, the output
+    of the multi-threaded mode doesn't depend on the number of threads.
+
+    :param level: The compression level.
+    :param threads: The number of compression threads.
+    """
+
+    def __init__(self, level: int = DEFAULT_ZSTD_LEVEL, threads: int = 1) -> None:
+        parameters = zstandard.ZstdCompressionParameters.from_level(
+            level, threads=threads, job_size=_ZSTD_JOB_SIZE
+        )
+        self._compressor = zstandard.ZstdCompressor(
+            compression_params=parameters
+        ).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        """Compress ``data``, returning the compressed data that is ready."""
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        """Finish the compressed stream, returning the remaining data."""
+        return self._compressor.flush()
+
+    def close(self) -> None:
+        """Release the compressor's resources (a no-op)."""
+
+
+def new_compressor(compression: Compression) -> Compressor:
+    """Create a compressor for a layer, following the ``compression`` settings."""
+    level = compression.get_level()
+    threads = compression.get_threads()
+    if compression.codec == "zstd":
+        return ZstdCompressor(level, threads)
+    return ParallelGzipCompressor(level, threads)
+
+
+def open_layer(blob: BinaryIO, media_type: str) -> BinaryIO:
+    """Get a stream of the uncompressed tarball of a layer blob.
+
+    :param blob: The layer blob.
+    :param media_type: The media type of the layer, which sets its compression.
+    :raises ValueError: If the layer's compression is not supported.
+    """
+    if media_type.endswith("gzip"):
+        return cast(BinaryIO, gzip.GzipFile(fileobj=blob, mode="rb"))
+    if media_type.endswith("zstd"):
+        return cast(BinaryIO, zstandard.ZstdDecompressor().stream_reader(blob))
+    if media_type.endswith("tar"):
+        return blob
+    raise ValueError(f"Unsupported layer media type {media_type!r}")
@@ -0,0 +1,148 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright 2025 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""User-level caches of the package managers of the parts, shared by every project."""
+
+import os
+import shutil
+import stat
+from collections.abc import Iterable
+from pathlib import Path, PurePosixPath
+from typing import Any
+
+from craft_cli import emit
+
+from rockcraft import errors
+
+# The name of the dependency caches in the application's cache directory.
+DEPENDENCY_CACHE_DIR = "dependencies"
+
+# Where the host's dependency caches are mounted in managed instances,
+# matching the cache directory of the root user that runs Rockcraft in them.
+MANAGED_DEPENDENCY_CACHE_DIR = PurePosixPath("/root/.cache/rockcraft") / (
+    DEPENDENCY_CACHE_DIR
+)
+
+# The environment that points the tools of each ecosystem to its cache, where
+# "{cache}" is the ecosystem's cache directory.
+ECOSYSTEM_ENVIRONMENTS: dict[str, dict[str, str]] = {
+    "pip": {"PIP_CACHE_DIR": "{cache}"},
+    "poetry": {"POETRY_CACHE_DIR": "{cache}"},
+    "uv": {"UV_CACHE_DIR": "{cache}"},
+    # Overrides the local repository of the settings that the plugins write.
+    "maven": {"MAVEN_OPTS": "-Dmaven.repo.local={cache}/repository"},
+    "gradle": {"GRADLE_USER_HOME": "{cache}"},
+    "npm": {"npm_config_cache": "{cache}"},
+    "go": {"GOMODCACHE": "{cache}/mod", "GOCACHE": "{cache}/build"},
+}
+
+# The ecosystems whose tools each plugin runs.
+PLUGIN_ECOSYSTEMS: dict[str, tuple[str, ...]] = {
+    "python": ("pip",),
+    "poetry": ("poetry", "pip"),
+    "uv": ("uv",),
+    "maven": ("maven",),
+    "maven-use": ("maven",),
+    "gradle": ("gradle",),
+    "npm": ("npm",),
+    "go": ("go",),
+    "go-use": ("go",),
+}
+
+
+class DependencyCache:
+    """The caches of the package managers run by the parts, one per ecosystem.
+
+    Downloading and resolving dependencies dominates the build of most parts,
+    so the package managers share their caches between builds, and projects.
+    The tools of each ecosystem handle the concurrent use of their cache.
+
+    :param path: The directory holding the caches.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+
+    def get_build_environment(
+        self, spec: dict[str, Any], *, part_name: str
+    ) -> list[dict[str, str]]:
+        """Get the build environment that points a part's tools to their caches.
+
+        :param spec: The specification of the part.
+        :param part_name: The name of the part, which is also its plugin's if
+            the specification doesn't have one.
+        """
+        plugin = spec.get("plugin", part_name)
+        return [
+            {key: value.format(cache=self.path / ecosystem)}
+            for ecosystem in PLUGIN_ECOSYSTEMS.get(plugin, ())
+            for key, value in ECOSYSTEM_ENVIRONMENTS[ecosystem].items()
+        ]
+
+    def get_sizes(self) -> dict[str, int]:
+        """Get the size of each ecosystem's cache, in bytes.
+
+        :returns: The sizes of the caches that exist, by ecosystem.
+        """
+        return {
+            ecosystem: _get_size(self.path / ecosystem)
+            for ecosystem in ECOSYSTEM_ENVIRONMENTS
+            if (self.path / ecosystem).is_dir()
+        }
+
+    def evict(self, ecosystems: Iterable[str] | None = None) -> None:
+        """Remove the caches of ``ecosystems``, or of every ecosystem.
+
+        :raises RockcraftError: If an ecosystem is unknown.
+        """
+        if ecosystems is None:
+            ecosystems = ECOSYSTEM_ENVIRONMENTS
+        ecosystems = list(ecosystems)
+        unknown = [name for name in ecosystems if name not in ECOSYSTEM_ENVIRONMENTS]
+        if unknown:
+            raise errors.RockcraftError(
+                f"Unknown dependency caches: {', '.join(unknown)}",
+                resolution="Use one of: " + ", ".join(sorted(ECOSYSTEM_ENVIRONMENTS)),
+            )
+        for ecosystem in ecosystems:
+            cache_dir = self.path / ecosystem
+            if cache_dir.is_dir():
+                emit.debug(f"Removing the {ecosystem} cache")
+                # Go makes its module cache read-only.
+                _make_writable(cache_dir)
+                shutil.rmtree(cache_dir)
+
+
+def _get_size(path: Path) -> int:
+    """Get the size of the files under ``path``, counting hardlinked files once."""
+    size = 0
+    inodes: set[tuple[int, int]] = set()
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            info = os.lstat(os.path.join(dirpath, filename))  # noqa: PTH118
+            if info.st_nlink > 1:
+                if (info.st_dev, info.st_ino) in inodes:
+                    continue
+                inodes.add((info.st_dev, info.st_ino))
+            size += info.st_size
+    return size
+
+
+def _make_writable(path: Path) -> None:
+    """Make the directories under ``path`` writable, so that they can be removed."""
+    for dirpath, _, _ in os.walk(path):
+        directory = Path(dirpath)
+        directory.chmod(directory.stat().st_mode | stat.S_IWUSR)
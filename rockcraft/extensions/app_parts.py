@@ -16,6 +16,9 @@
 
 """Common extension application parts."""
 
+from collections.abc import Mapping
+from typing import Any
+
 from rockcraft.usernames import SUPPORTED_GLOBAL_USERNAMES
 
 USER_UID: int = SUPPORTED_GLOBAL_USERNAMES["_daemon_"]["uid"]
@@ -45,3 +48,25 @@ def gen_logging_part(
         "override-build": "\n".join(_override_build_lines),
         "permissions": _permissions,
     }
+
+
+def gen_layers(
+    parts: Mapping[str, Any], layers: dict[str, dict[str, list[str]]]
+) -> dict[str, dict[str, list[str]]]:
+    """Generate the default layers of an application.
+
+    :param parts: The application's parts; the layers only refer to these.
+    :param layers: The layers, in the order they are added to the rock, with
+        the parts and paths that go in each one.
+    :returns: The layers that select any files, in the ``layers`` key format.
+    """
+    result: dict[str, dict[str, list[str]]] = {}
+    for name, layer in layers.items():
+        selection = {
+            "parts": [part for part in layer.get("parts", []) if part in parts],
+            "paths": layer.get("paths", []),
+        }
+        selection = {key: value for key, value in selection.items() if value}
+        if selection:
+            result[name] = selection
+    return result
@@ -24,7 +24,7 @@ from overrides import override  # type: ignore[reportUnknownVariableType]
 from rockcraft.errors import ExtensionError
 from rockcraft.usernames import SUPPORTED_GLOBAL_USERNAMES
 
-from .app_parts import gen_logging_part
+from .app_parts import gen_layers, gen_logging_part
 from .extension import Extension
 
 USER_UID: int = SUPPORTED_GLOBAL_USERNAMES["_daemon_"]["uid"]
@@ -84,6 +84,21 @@ class ExpressJSFramework(Extension):
         if runtime_part:
             snippet["parts"]["expressjs-framework/runtime"] = runtime_part
         snippet["parts"]["expressjs-framework/logging"] = gen_logging_part()
+        if "layers" not in self.yaml_data:
+            snippet["layers"] = gen_layers(
+                snippet["parts"],
+                {
+                    "runtime": {
+                        "parts": [
+                            "expressjs-framework/runtime",
+                            "expressjs-framework/logging",
+                        ]
+                    },
+                    "dependencies": {
+                        "paths": [f"{self.IMAGE_BASE_DIR}/node_modules"],
+                    },
+                },
+            )
         return snippet
 
     @override
@@ -29,7 +29,7 @@ from rockcraft.errors import ExtensionError
 from rockcraft.usernames import SUPPORTED_GLOBAL_USERNAMES
 
 from ._python_utils import has_global_variable
-from .app_parts import gen_logging_part
+from .app_parts import gen_layers, gen_logging_part
 from .extension import Extension
 
 USER_UID: int = SUPPORTED_GLOBAL_USERNAMES["_daemon_"]["uid"]
@@ -79,6 +79,19 @@ class FastAPIFramework(Extension):
             )
 
         snippet["parts"] = self._get_parts()
+        if "layers" not in self.yaml_data:
+            snippet["layers"] = gen_layers(
+                snippet["parts"],
+                {
+                    "runtime": {
+                        "parts": [
+                            "fastapi-framework/runtime",
+                            "fastapi-framework/logging",
+                        ]
+                    },
+                    "dependencies": {"parts": ["fastapi-framework/dependencies"]},
+                },
+            )
         return snippet
 
     @override
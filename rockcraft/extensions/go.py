@@ -25,7 +25,7 @@ from overrides import override  # type: ignore[reportUnknownVariableType]
 from rockcraft.errors import ExtensionError
 from rockcraft.usernames import SUPPORTED_GLOBAL_USERNAMES
 
-from .app_parts import gen_logging_part
+from .app_parts import gen_layers, gen_logging_part
 from .extension import Extension
 
 USER_UID: int = SUPPORTED_GLOBAL_USERNAMES["_daemon_"]["uid"]
@@ -87,6 +87,20 @@ class GoFramework(Extension):
         if assets_part:
             snippet["parts"]["go-framework/assets"] = assets_part
 
+        if "layers" not in self.yaml_data:
+            snippet["layers"] = gen_layers(
+                snippet["parts"],
+                {
+                    "runtime": {
+                        "parts": [
+                            "go-framework/base-layout",
+                            "go-framework/runtime",
+                            "go-framework/logging",
+                        ]
+                    },
+                },
+            )
+
         return snippet
 
     @override
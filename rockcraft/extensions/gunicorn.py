@@ -18,6 +18,7 @@
 
 import abc
 import contextlib
+import copy
 import fnmatch
 import os.path
 import posixpath
@@ -32,11 +33,20 @@ from rockcraft.usernames import SUPPORTED_GLOBAL_USERNAMES
 
 from ._python_utils import has_global_variable
 from ._utils import find_ubuntu_base_python_version
-from .app_parts import gen_logging_part
+from .app_parts import gen_layers, gen_logging_part
 from .extension import Extension, get_extensions_data_dir
 
 USER_UID: int = SUPPORTED_GLOBAL_USERNAMES["_daemon_"]["uid"]
 
+# The part building the statsd exporter, whose output is shared by every project
+# through the part cache.
+STATSD_EXPORTER_PART_SPEC: dict[str, Any] = {
+    "build-snaps": ["go"],
+    "source-tag": "v0.26.0",
+    "plugin": "go",
+    "source": "https://github.com/prometheus/statsd_exporter.git",
+}
+
 
 class _GunicornBase(Extension):
     """An extension base class for Python WSGI framework extensions."""
@@ -119,12 +129,9 @@ class _GunicornBase(Extension):
                     },
                 ],
             },
-            f"{self.framework}-framework/statsd-exporter": {
-                "build-snaps": ["go"],
-                "source-tag": "v0.26.0",
-                "plugin": "go",
-                "source": "https://github.com/prometheus/statsd_exporter.git",
-            },
+            f"{self.framework}-framework/statsd-exporter": copy.deepcopy(
+                STATSD_EXPORTER_PART_SPEC
+            ),
             f"{self.framework}-framework/logging": gen_logging_part(
                 override_build_lines=[
                     f"mkdir -p $CRAFT_PART_INSTALL/var/log/{self.framework}"
@@ -202,6 +209,22 @@ class _GunicornBase(Extension):
             },
         }
         snippet["parts"] = self._gen_parts()
+        if "layers" not in self.yaml_data:
+            snippet["layers"] = gen_layers(
+                snippet["parts"],
+                {
+                    "runtime": {
+                        "parts": [
+                            f"{self.framework}-framework/runtime",
+                            f"{self.framework}-framework/statsd-exporter",
+                            f"{self.framework}-framework/logging",
+                        ]
+                    },
+                    "dependencies": {
+                        "parts": [f"{self.framework}-framework/dependencies"]
+                    },
+                },
+            )
         return snippet
 
     @override
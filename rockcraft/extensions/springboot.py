@@ -25,6 +25,7 @@ from overrides import override  # type: ignore[reportUnknownVariableType]
 
 from rockcraft.errors import ExtensionError
 
+from .app_parts import gen_layers
 from .extension import Extension
 
 
@@ -75,6 +76,12 @@ class SpringBootFramework(Extension):
         if assets_part:
             snippet["parts"]["spring-boot-framework/assets"] = assets_part
 
+        if "layers" not in self.yaml_data:
+            snippet["layers"] = gen_layers(
+                snippet["parts"],
+                {"runtime": {"parts": ["spring-boot-framework/runtime"]}},
+            )
+
         return snippet
 
     @override
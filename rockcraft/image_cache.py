@@ -0,0 +1,142 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright 2025 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""User-level cache of base images, shared by every project."""
+
+import contextlib
+import fcntl
+import json
+from collections.abc import Iterator
+from pathlib import Path, PurePosixPath
+
+from craft_cli import emit
+
+from rockcraft import errors, oci
+
+# The name of the base image cache in the application's cache directory.
+BASE_IMAGE_CACHE_DIR = "base-images"
+
+# Where the host's base image cache is mounted in managed instances, matching
+# the cache directory of the root user that runs Rockcraft in them.
+MANAGED_BASE_IMAGE_CACHE_DIR = PurePosixPath("/root/.cache/rockcraft") / (
+    BASE_IMAGE_CACHE_DIR
+)
+
+
+class BaseImageCache:
+    """A cache of base images, keyed by the digest they were resolved to.
+
+    The images are stored in OCI image layouts (one per repository, like
+    ``ubuntu``) and tagged with their digest and architecture. As blobs are
+    stored by digest, the images of a repository share their common layers.
+    An index records the digest that each base last resolved to, so that the
+    cache can be used without contacting the registry.
+
+    All the operations on the cache must be made with its lock held: shared
+    to read cached images, exclusive to change the cache.
+
+    :param path: The directory holding the cache.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.images_dir = path / "oci"
+        self._digests_path = path / "digests.json"
+        self._lock_path = path / ".lock"
+
+    @contextlib.contextmanager
+    def lock(self, *, shared: bool = False) -> Iterator[None]:
+        """Lock the cache against changes by other processes.
+
+        :param shared: Whether other processes can hold a shared lock at the
+            same time, to read from the cache.
+        """
+        self.path.mkdir(parents=True, exist_ok=True)
+        with self._lock_path.open("a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def get_image(
+        self, image_name: str, *, arch: str, offline: bool = False
+    ) -> tuple[oci.Image, bytes]:
+        """Get a base image from the cache, pulling it from the registry if needed.
+
+        The image name is resolved to its current digest in the registry,
+        unless ``offline`` is set: then the digest it last resolved to is used.
+
+        :param image_name: The base image, in ``name@tag`` format.
+        :param arch: The architecture of the image, in Debian format.
+        :param offline: Whether to use the cache without contacting the registry.
+
+        :returns: A tuple with the cached image and its digest.
+        :raises RockcraftError: If the image is needed offline but isn't cached.
+        """
+        if "@" not in image_name:
+            raise ValueError(f"Bad image name: {image_name}")
+        name = image_name.replace("@", ":")
+        repository = name.split(":", 1)[0]
+
+        with self.lock():
+            digests = self._read_digests()
+            if offline:
+                if name not in digests:
+                    raise _not_cached_error(image_name)
+                digest = bytes.fromhex(digests[name])
+            else:
+                digest = oci.Image.digest(f"docker://{oci.REGISTRY_URL}/{name}")
+
+            image = oci.Image(
+                image_name=f"{repository}:{digest.hex()}-{arch}", path=self.images_dir
+            )
+            if image.exists():
+                emit.debug(f"Using cached base image {image_name} ({digest.hex()})")
+            elif offline:
+                raise _not_cached_error(image_name)
+            else:
+                oci.Image.pull(
+                    f"docker://{oci.REGISTRY_URL}/{repository}@sha256:{digest.hex()}",
+                    image_name=image.image_name,
+                    image_dir=self.images_dir,
+                    arch=arch,
+                    source_digest=digest,
+                )
+
+            if digests.get(name) != digest.hex():
+                digests[name] = digest.hex()
+                self._write_digests(digests)
+
+        return image, digest
+
+    def _read_digests(self) -> dict[str, str]:
+        if not self._digests_path.exists():
+            return {}
+        digests: dict[str, str] = json.loads(self._digests_path.read_text())
+        return digests
+
+    def _write_digests(self, digests: dict[str, str]) -> None:
+        temp_path = self._digests_path.with_suffix(".tmp")
+        temp_path.write_text(json.dumps(digests, indent=2, sort_keys=True))
+        temp_path.replace(self._digests_path)
+
+
+def _not_cached_error(image_name: str) -> errors.RockcraftError:
+    return errors.RockcraftError(
+        f"Base image {image_name!r} is not cached and cannot be fetched offline",
+        resolution="Run Rockcraft once without offline mode to cache the image.",
+    )
@@ -0,0 +1,110 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright 2025 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Walking of the tarballs of OCI layers, following the OCI whiteout rules."""
+
+import abc
+import tarfile
+from collections.abc import Sequence
+from pathlib import PurePosixPath
+from typing import BinaryIO
+
+from craft_cli import emit
+
+# The prefix of the whiteout files of OCI layers, and the name of opaque whiteouts.
+WHITEOUT_PREFIX = ".wh."
+OPAQUE_WHITEOUT = ".wh..wh..opq"
+
+# The number of symlinks followed when resolving a path, like Linux's MAXSYMLINKS.
+MAX_SYMLINKS = 40
+
+
+class LayerWalker(abc.ABC):
+    """Apply the tarballs of OCI layers in order, over the previous ones.
+
+    The members of each layer are read once, as a stream, and dispatched to
+    the methods of the subclasses: whiteouts remove the paths of the previous
+    layers, and the other members add their paths. The paths of the members
+    are relative to the rootfs, as lists of names.
+    """
+
+    def __init__(self) -> None:
+        # The keys of the paths that the layer being applied adds, and of
+        # their parent directories, which its opaque whiteouts don't remove.
+        self._layer_keys: set[str] = set()
+
+    def apply(self, layer: BinaryIO) -> None:
+        """Apply the tarball ``layer`` over the previous ones."""
+        self._layer_keys = set()
+        with tarfile.open(fileobj=layer, mode="r|") as archive:
+            for member in archive:
+                self._apply_member(archive, member)
+
+    def _apply_member(self, archive: tarfile.TarFile, member: tarfile.TarInfo) -> None:
+        parts = relative_parts(member.name)
+        if ".." in parts:
+            emit.debug(f"Skipping layer member {member.name!r} outside the rootfs")
+            return
+        name = parts[-1] if parts else ""
+        if name == OPAQUE_WHITEOUT:
+            self._remove_lower(parts[:-1])
+            return
+        if name.startswith(WHITEOUT_PREFIX):
+            self._remove_path([*parts[:-1], name[len(WHITEOUT_PREFIX) :]])
+            return
+        self._mark_in_layer(parts)
+        self._add_member(archive, member, parts)
+
+    def _mark_in_layer(self, parts: Sequence[str]) -> None:
+        """Record that the layer being applied adds ``parts`` and its parents."""
+        for end in range(len(parts), 0, -1):
+            key = "/".join(parts[:end])
+            if key in self._layer_keys:
+                # Its parents were recorded with it.
+                break
+            self._layer_keys.add(key)
+
+    def _in_layer(self, key: str) -> bool:
+        """Whether the layer being applied adds the path ``key``, or paths under it.
+
+        :param key: The path relative to the rootfs, like ``usr/bin``.
+        """
+        return key in self._layer_keys
+
+    @abc.abstractmethod
+    def _add_member(
+        self, archive: tarfile.TarFile, member: tarfile.TarInfo, parts: list[str]
+    ) -> None:
+        """Add the member ``parts`` of a layer, which isn't a whiteout.
+
+        The rootfs itself has no parts.
+        """
+
+    @abc.abstractmethod
+    def _remove_path(self, parts: list[str]) -> None:
+        """Remove ``parts``, and everything under it, as a whiteout does."""
+
+    @abc.abstractmethod
+    def _remove_lower(self, parts: list[str]) -> None:
+        """Remove what the previous layers added under the directory ``parts``.
+
+        Use ``_in_layer()`` to keep what the layer being applied adds.
+        """
+
+
+def relative_parts(path: str) -> list[str]:
+    """Get the names in ``path``, relative to the rootfs."""
+    return [part for part in PurePosixPath(path).parts if part not in ("/", ".")]
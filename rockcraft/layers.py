@@ -16,17 +16,73 @@
 
 """Handling of files and directories for rocks image layers."""
 
+import concurrent.futures
+import dataclasses
+import errno
+import fnmatch
+import functools
+import grp
+import hashlib
+import io
 import os
+import pwd
+import stat
 import tarfile
+import time
 from collections import defaultdict
-from pathlib import Path
+from collections.abc import Sequence
+from pathlib import Path, PurePosixPath
+from typing import BinaryIO, cast
 
-from craft_cli import emit
+from craft_cli import EmitterMode, emit
 from craft_parts.executor.collisions import paths_collide
 from craft_parts.overlays import overlays
 from craft_parts.permissions import Permissions
 
-from rockcraft import errors
+from rockcraft import errors, utils
+from rockcraft.rootfs_index import IndexEntry, RootfsIndex, file_digest
+
+# The prefix of the names of the files marking deletions in OCI layers.
+_WHITEOUT_PREFIX = ".wh."
+
+# The name of the file marking a directory as opaque in OCI layers.
+_OPAQUE_DIR_MARKER = overlays.oci_opaque_dir(Path()).name
+
+# The size of the reads when comparing the contents of files.
+_COMPARE_BUFFER_SIZE = 1024 * 1024
+
+# The size of the reads and of the coalesced writes when archiving files.
+_COPY_BUFFER_SIZE = 1024 * 1024
+
+# The size from which files are copied by the kernel into tarballs written to
+# files or pipes; smaller files are cheaper to buffer with the headers around them.
+_ZERO_COPY_MIN_SIZE = 64 * 1024
+
+# The errors of os.sendfile() when it can't copy between two files.
+_NO_SENDFILE_ERRNOS = frozenset({errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP})
+
+
+@dataclasses.dataclass(frozen=True)
+class LayerEntry:
+    """A path to archive in a layer.
+
+    :param filepath: The path to archive.
+    :param info: The status of the path (not following symlinks) when it was
+        gathered, which is archived as is.
+    """
+
+    filepath: str
+    info: os.stat_result
+
+    @functools.cached_property
+    def path(self) -> Path:
+        """The path to archive."""
+        return Path(self.filepath)
+
+    @property
+    def is_dir(self) -> bool:
+        """Whether the path is a directory (and not a symlink to one)."""
+        return stat.S_ISDIR(self.info.st_mode)
 
 
 def archive_layer(
@@ -42,17 +98,459 @@ def archive_layer(
         base below this new layer. Used to preserve lower-level directory symlinks,
         like the ones from Debian/Ubuntu's usrmerge.
     """
+    with temp_tar_file.open("wb") as tar_stream:
+        write_layer(new_layer_dir, tar_stream, base_layer_dir)
+
+
+def write_layer(
+    new_layer_dir: Path,
+    tar_stream: BinaryIO,
+    base_layer_dir: Path | None = None,
+) -> None:
+    """Archive the content of a new OCI layer into a stream, in tar format.
+
+    The tarball is written sequentially, so ``tar_stream`` only needs to
+    support writing (it is never sought or read back).
+
+    :param new_layer_dir: path to the content to be archived into a layer.
+    :param tar_stream: the binary stream receiving the uncompressed tarball.
+    :param base_layer_dir: optional path to the filesystem containing the extracted
+        base below this new layer. Used to preserve lower-level directory symlinks,
+        like the ones from Debian/Ubuntu's usrmerge.
+    """
+    write_layer_paths(gather_layer_paths(new_layer_dir, base_layer_dir), tar_stream)
+
+
+def gather_layer_paths(
+    new_layer_dir: Path, base_layer_dir: Path | None = None
+) -> dict[str, LayerEntry]:
+    """Map the paths in ``new_layer_dir`` to their names in a layer.
+
+    Every path is only stat'ed once, and its status is reused to split,
+    fingerprint and archive the layer.
+
+    See ``write_layer()`` for the parameters.
+
+    :return: A dict where the keys are the names of the paths in the layer.
+    """
     candidates = _gather_layer_paths(new_layer_dir, base_layer_dir)
-    layer_paths = _merge_layer_paths(candidates)
+    return _merge_layer_paths(candidates)
 
-    with tarfile.open(temp_tar_file, mode="w") as tar_file:
-        # Iterate on sorted keys, so that the directories are always listed before
-        # any files that they contain (otherwise tools like Docker might choke on
-        # the layer tarball).
-        for arcname in sorted(layer_paths):
-            filepath = layer_paths[arcname]
-            emit.debug(f"Adding to layer: {filepath} as '{arcname}'")
-            tar_file.add(filepath, arcname=arcname, recursive=False)
+
+def write_layer_paths(
+    layer_paths: dict[str, LayerEntry],
+    tar_stream: BinaryIO,
+    *,
+    duplicates: dict[str, str] | None = None,
+) -> None:
+    """Archive paths into a stream, in tar format.
+
+    If ``SOURCE_DATE_EPOCH`` is set, the tarball is reproducible: its headers
+    only depend on the paths' names, contents, modes and numeric ownership,
+    and their modification times are clamped to that timestamp.
+
+    Files with several links are archived once, and their other links as
+    hardlinks to the first one.
+
+    :param layer_paths: The paths to archive, keyed by their names in the layer.
+    :param tar_stream: the binary stream receiving the uncompressed tarball.
+    :param duplicates: Files to archive as hardlinks to another file, as found
+        by ``find_duplicate_files()``.
+    """
+    epoch = utils.get_source_date_epoch()
+    tracing = emit.get_mode() == EmitterMode.TRACE
+    hardlinks: dict[tuple[int, int], str] = {}
+    tar_writer = TarWriter(tar_stream)
+    # Iterate on sorted keys, so that the directories are always listed before
+    # any files that they contain (otherwise tools like Docker might choke on
+    # the layer tarball).
+    for arcname in sorted(layer_paths):
+        entry = layer_paths[arcname]
+        if tracing:
+            emit.trace(f"Adding to layer: {entry.filepath} as '{arcname}'")
+        tarinfo = _tar_info(arcname, entry, hardlinks, duplicates or {})
+        if tarinfo is None:
+            emit.debug(f"Skipping {entry.filepath}: unsupported file type")
+            continue
+        if epoch is not None:
+            _normalise_tar_info(tarinfo, epoch)
+        tar_writer.add(tarinfo, entry.filepath if tarinfo.isreg() else None)
+    tar_writer.close()
+
+
+class TarWriter:
+    """A sequential writer of PAX tarballs, like ``tarfile.open(mode="w|")``.
+
+    The headers are created by ``tarfile``, so the tarballs are byte-identical
+    to the ones it writes, but the contents of the files are not copied in
+    small reads through Python. They are read into a reused buffer, and
+    coalesced with the headers into large writes to the stream. If the stream
+    writes to a regular file or a pipe, the contents of large files are copied
+    by the kernel instead, without going through Python at all.
+
+    :param stream: The binary stream receiving the tarball.
+    """
+
+    def __init__(self, stream: BinaryIO) -> None:
+        self._stream = stream
+        self._out_fd = _sendfile_descriptor(stream)
+        self._offset = 0
+        self._pending = bytearray()
+        self._buffer = memoryview(bytearray(_COPY_BUFFER_SIZE))
+
+    def add(self, tarinfo: tarfile.TarInfo, filepath: str | None = None) -> None:
+        """Add a member to the tarball.
+
+        :param tarinfo: The header of the member.
+        :param filepath: The file with the contents of a regular file member.
+        """
+        self._write(
+            tarinfo.tobuf(tarfile.PAX_FORMAT, tarfile.ENCODING, "surrogateescape")
+        )
+        if filepath is None or not tarinfo.size:
+            return
+
+        with open(filepath, "rb", buffering=0) as stream:  # noqa: PTH123
+            if not (
+                self._out_fd is not None
+                and tarinfo.size >= _ZERO_COPY_MIN_SIZE
+                and self._send(stream.fileno(), tarinfo.size)
+            ):
+                self._copy(stream, tarinfo.size)
+        remainder = tarinfo.size % tarfile.BLOCKSIZE
+        if remainder:
+            self._write(tarfile.NUL * (tarfile.BLOCKSIZE - remainder))
+
+    def add_data(self, tarinfo: tarfile.TarInfo, data: bytes) -> None:
+        """Add a regular file member with the contents ``data``.
+
+        :param tarinfo: The header of the member; its size is set to the data's.
+        :param data: The contents of the member.
+        """
+        tarinfo.size = len(data)
+        self._write(
+            tarinfo.tobuf(tarfile.PAX_FORMAT, tarfile.ENCODING, "surrogateescape")
+        )
+        self._write(data)
+        remainder = tarinfo.size % tarfile.BLOCKSIZE
+        if remainder:
+            self._write(tarfile.NUL * (tarfile.BLOCKSIZE - remainder))
+
+    def close(self) -> None:
+        """Finish the tarball, like ``TarFile.close()``.
+
+        The stream itself is left open.
+        """
+        end_size = 2 * tarfile.BLOCKSIZE
+        # Fill up the end with zero-blocks, like option -b20 for tar does.
+        end_size += -(self._offset + end_size) % tarfile.RECORDSIZE
+        self._write(tarfile.NUL * end_size)
+        self._flush()
+
+    def _write(self, data: bytes | memoryview) -> None:
+        self._offset += len(data)
+        self._pending += data
+        if len(self._pending) >= _COPY_BUFFER_SIZE:
+            self._flush()
+
+    def _flush(self) -> None:
+        if self._pending:
+            self._stream.write(self._pending)
+            self._pending.clear()
+
+    def _copy(self, stream: io.FileIO, size: int) -> None:
+        """Copy ``size`` bytes of ``stream`` into the tarball."""
+        remaining = size
+        while remaining:
+            read_size = stream.readinto(
+                self._buffer[: min(remaining, len(self._buffer))]
+            )
+            if not read_size:
+                raise OSError("unexpected end of data")
+            remaining -= read_size
+            if len(self._pending) + read_size >= _COPY_BUFFER_SIZE:
+                # Skip the pending buffer for large reads.
+                self._flush()
+                self._offset += read_size
+                self._stream.write(self._buffer[:read_size])
+            else:
+                self._write(self._buffer[:read_size])
+
+    def _send(self, in_fd: int, size: int) -> bool:
+        """Copy ``size`` bytes of the file ``in_fd`` into the tarball, in the kernel.
+
+        :returns: Whether the file was copied, or False if the kernel can't
+            copy it into the stream's file (nothing is written then).
+        """
+        out_fd = cast(int, self._out_fd)
+        self._flush()
+        self._stream.flush()
+        offset = 0
+        while offset < size:
+            try:
+                sent = os.sendfile(out_fd, in_fd, offset, size - offset)
+            except OSError as err:
+                if offset or err.errno not in _NO_SENDFILE_ERRNOS:
+                    raise
+                emit.debug(f"Copying files into the tarball without sendfile: {err}")
+                self._out_fd = None
+                return False
+            if not sent:
+                raise OSError("unexpected end of data")
+            offset += sent
+        self._offset += size
+        return True
+
+
+def _sendfile_descriptor(stream: BinaryIO) -> int | None:
+    """Get the file descriptor of ``stream``, if it writes to a file or a pipe."""
+    try:
+        out_fd = stream.fileno()
+    except (AttributeError, OSError):
+        return None
+    mode = os.fstat(out_fd).st_mode
+    return out_fd if stat.S_ISREG(mode) or stat.S_ISFIFO(mode) else None
+
+
+def fingerprint_layer_paths(layer_paths: dict[str, LayerEntry]) -> str:
+    """Get a digest of everything that ``write_layer_paths()`` archives.
+
+    The digest covers the name of each path in the layer and the metadata of
+    the path: its type, mode, ownership, size, modification time, symlink
+    target and the hardlinks between the files. Files are not read, so a
+    file that is rewritten with the same contents changes the digest too.
+
+    :param layer_paths: The paths to archive, keyed by their names in the layer.
+    """
+    hasher = hashlib.sha256()
+    hardlinks: dict[tuple[int, int], str] = {}
+    for arcname in sorted(layer_paths):
+        info = layer_paths[arcname].info
+        target = (
+            str(layer_paths[arcname].path.readlink())
+            if stat.S_ISLNK(info.st_mode)
+            else ""
+        )
+        link = ""
+        if stat.S_ISREG(info.st_mode) and info.st_nlink > 1:
+            link = hardlinks.setdefault((info.st_dev, info.st_ino), arcname)
+        entry = (
+            f"{arcname}\0{info.st_mode}\0{info.st_uid}\0{info.st_gid}\0"
+            f"{info.st_size}\0{info.st_mtime_ns}\0{info.st_rdev}\0{target}\0{link}"
+        )
+        hasher.update(entry.encode("utf-8", "surrogateescape") + b"\n")
+    return hasher.hexdigest()
+
+
+def find_duplicate_files(layer_paths: dict[str, LayerEntry]) -> dict[str, str]:
+    """Find the regular files of a layer that are copies of other files.
+
+    Files are only read if other files have the same size, permissions and
+    ownership, and those are hashed in parallel. Links to the same file are
+    left to ``write_layer_paths()``, which archives them as hardlinks already.
+
+    :param layer_paths: The paths in the layer, keyed by their names in it.
+    :return: The name of the first copy of each duplicate file, keyed by the
+        names of all the links to the duplicate files.
+    """
+    # The links to each file, by inode, grouped by the metadata copies share.
+    candidates: defaultdict[tuple[int, ...], dict[tuple[int, int], list[str]]] = (
+        defaultdict(dict)
+    )
+    for arcname in sorted(layer_paths):
+        info = layer_paths[arcname].info
+        if stat.S_ISREG(info.st_mode) and info.st_size:
+            key = (info.st_size, info.st_mode, info.st_uid, info.st_gid)
+            inode = (info.st_dev, info.st_ino)
+            candidates[key].setdefault(inode, []).append(arcname)
+    groups = [list(files.values()) for files in candidates.values() if len(files) > 1]
+
+    # Only the first link of each file is hashed.
+    first_links = [links[0] for group in groups for links in group]
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        results = executor.map(
+            lambda arcname: file_digest(layer_paths[arcname].path), first_links
+        )
+        digests = dict(zip(first_links, results))
+
+    duplicates: dict[str, str] = {}
+    for group in groups:
+        originals: dict[str, str] = {}
+        for links in group:
+            original = originals.setdefault(digests[links[0]], links[0])
+            if original != links[0]:
+                duplicates.update(dict.fromkeys(links, original.lstrip("/")))
+    emit.debug(
+        f"Found {len(duplicates)} duplicate files, from {len(first_links)} files hashed"
+    )
+    return duplicates
+
+
+def _tar_info(
+    arcname: str,
+    entry: LayerEntry,
+    hardlinks: dict[tuple[int, int], str],
+    duplicates: dict[str, str],
+) -> tarfile.TarInfo | None:
+    """Create the header of a path in a tarball, like ``TarFile.gettarinfo()``.
+
+    The status of the path is not read again, and the names of its owners are
+    only looked up once for each id.
+
+    :param arcname: The name of the path in the tarball.
+    :param entry: The path to archive.
+    :param hardlinks: The names of the files with several links that were
+        already archived, keyed by their device and inode numbers. Later links
+        to these files are archived as hardlinks.
+    :param duplicates: The names of already archived files, keyed by the names
+        of the files to archive as hardlinks to them.
+    :return: The header, or None if the path's type can't be archived.
+    """
+    info = entry.info
+    mode = info.st_mode
+    tarinfo = tarfile.TarInfo(arcname.lstrip("/"))
+    if stat.S_ISREG(mode):
+        inode = (info.st_dev, info.st_ino)
+        linkname = duplicates.get(arcname)
+        if linkname is None and info.st_nlink > 1:
+            linkname = hardlinks.get(inode)
+        if linkname is not None:
+            tarinfo.type = tarfile.LNKTYPE
+            tarinfo.linkname = linkname
+        else:
+            tarinfo.type = tarfile.REGTYPE
+            tarinfo.size = info.st_size
+            if info.st_nlink > 1:
+                hardlinks[inode] = tarinfo.name
+    elif stat.S_ISDIR(mode):
+        tarinfo.type = tarfile.DIRTYPE
+    elif stat.S_ISLNK(mode):
+        tarinfo.type = tarfile.SYMTYPE
+        tarinfo.linkname = str(entry.path.readlink())
+    elif stat.S_ISFIFO(mode):
+        tarinfo.type = tarfile.FIFOTYPE
+    elif stat.S_ISCHR(mode) or stat.S_ISBLK(mode):
+        tarinfo.type = tarfile.CHRTYPE if stat.S_ISCHR(mode) else tarfile.BLKTYPE
+        tarinfo.devmajor = os.major(info.st_rdev)
+        tarinfo.devminor = os.minor(info.st_rdev)
+    else:
+        return None
+
+    tarinfo.mode = mode
+    tarinfo.uid = info.st_uid
+    tarinfo.gid = info.st_gid
+    tarinfo.mtime = info.st_mtime
+    tarinfo.uname = _user_name(info.st_uid)
+    tarinfo.gname = _group_name(info.st_gid)
+    return tarinfo
+
+
+@functools.cache
+def _user_name(uid: int) -> str:
+    try:
+        return pwd.getpwuid(uid).pw_name
+    except KeyError:
+        return ""
+
+
+@functools.cache
+def _group_name(gid: int) -> str:
+    try:
+        return grp.getgrgid(gid).gr_name
+    except KeyError:
+        return ""
+
+
+def _normalise_tar_info(tarinfo: tarfile.TarInfo, epoch: int) -> None:
+    """Normalise the host-dependent fields of a header, for reproducible tarballs."""
+    # Whole seconds keep the fractional mtime out of the PAX headers.
+    tarinfo.mtime = min(int(tarinfo.mtime), epoch)
+    # The user and group names come from the host's databases: runtimes
+    # use the numeric ids.
+    tarinfo.uname = ""
+    tarinfo.gname = ""
+
+
+@dataclasses.dataclass(frozen=True)
+class LayerGroup:
+    """A selection of primed paths to pack in a layer of their own.
+
+    :param name: The name of the layer.
+    :param files: The paths primed by the parts in the layer, relative to the
+        prime directory.
+    :param patterns: Shell-style patterns of the paths in the layer. A path
+        is also selected when one of its parent directories matches.
+    """
+
+    name: str
+    files: frozenset[str] = frozenset()
+    patterns: tuple[str, ...] = ()
+
+    def matches(self, path: str) -> bool:
+        """Whether the path, relative to the prime directory, is in this group."""
+        if path in self.files:
+            return True
+        posix_path = PurePosixPath(path)
+        candidates = [str(posix_path), *map(str, posix_path.parents[:-1])]
+        return any(
+            fnmatch.fnmatchcase(candidate, pattern)
+            for pattern in self.patterns
+            for candidate in candidates
+        )
+
+
+def split_layer_paths(
+    layer_paths: dict[str, LayerEntry],
+    new_layer_dir: Path,
+    groups: Sequence[LayerGroup],
+) -> list[dict[str, LayerEntry]]:
+    """Split the paths of a layer into the layers of ``groups``.
+
+    Each path goes into the first group that selects it, either by its path
+    in ``new_layer_dir`` or by its name in the layer. The directories are
+    added to every layer with contents under them, so that they keep their
+    ownership and permissions. Whiteouts go in the first layer, so that they
+    never hide the contents of the other layers.
+
+    :param layer_paths: The paths to split, as returned by ``gather_layer_paths()``.
+    :param new_layer_dir: The directory holding the paths.
+    :param groups: The groups of paths, in the order of their layers.
+    :return: The paths of each group's layer, followed by the paths of a layer
+        with the paths that no group selected.
+    """
+    splits: list[dict[str, LayerEntry]] = [{} for _ in range(len(groups) + 1)]
+
+    def group_index(arcname: str, entry: LayerEntry) -> int:
+        if PurePosixPath(arcname).name.startswith(_WHITEOUT_PREFIX):
+            return 0
+        relative_path = entry.filepath.removeprefix(f"{new_layer_dir}/")
+        for index, group in enumerate(groups):
+            if group.matches(relative_path) or group.matches(arcname):
+                return index
+        return len(groups)
+
+    # Directories with nothing under them are split like files, and the others
+    # are added to the layers holding their contents.
+    parent_names = {
+        str(parent) for name in layer_paths for parent in PurePosixPath(name).parents
+    }
+    directories: dict[str, LayerEntry] = {}
+    for arcname, entry in layer_paths.items():
+        if arcname in parent_names and entry.is_dir:
+            directories[arcname] = entry
+        else:
+            splits[group_index(arcname, entry)][arcname] = entry
+
+    split_parents = [
+        {str(parent) for name in split for parent in PurePosixPath(name).parents}
+        for split in splits
+    ]
+    for arcname, entry in directories.items():
+        for split, parents in zip(splits, split_parents):
+            if arcname in parents:
+                split[arcname] = entry
+
+    return splits
 
 
 def prune_prime_files(prime_dir: Path, files: set[str], base_layer_dir: Path) -> None:
@@ -67,120 +565,245 @@ def prune_prime_files(prime_dir: Path, files: set[str], base_layer_dir: Path) ->
     "{base_layer_dir}/dir/subdir/file1" exists and has the same contents, owner,
     group, and permission bits.
 
+    Files whose type, ownership, permissions or size differ are ruled out first,
+    without reading them; the contents of the remaining files are compared in
+    parallel. If the base layer has a ``RootfsIndex``, its files are looked up
+    in the index and are never read: the digests of the primed files are
+    compared to the indexed ones instead.
+
     :param prime_dir: The directory containing the lifecycle's primed contents.
     :param files: The set of filenames added to ``prime_dir``, as provided by
         the corresponding post_step lifecycle callback.
     :param base_layer_dir: The directory where the base layer was extracted.
     """
     emit.debug("Pruning primed files that already exist on base layer...")
-    for filename in files:
+    start = time.monotonic()
+    index = RootfsIndex.for_rootfs(base_layer_dir)
+    pruned: list[Path] = []
+    candidates: list[tuple[Path, IndexEntry, Path]] = []
+    for filename in sorted(files):
         base_layer_file = base_layer_dir / filename
-        if base_layer_file.is_file():
-            prime_file = prime_dir / filename
-            if _all_compatible_files([base_layer_file, prime_file]):
-                emit.debug(f"Pruning: {prime_file} as it exists on the base")
-                prime_file.unlink()
+        base_entries = _base_entries(base_layer_file, filename, index)
+        if base_entries is None or not base_entries[1].is_file:
+            continue
+
+        prime_file = prime_dir / filename
+        compatible = _compatible_metadata(*base_entries, prime_file)
+        if compatible is None:
+            candidates.append((base_layer_file, base_entries[1], prime_file))
+        elif compatible:
+            pruned.append(prime_file)
+        else:
+            _emit_not_pruned(prime_file)
+
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        results = executor.map(lambda args: _same_contents(*args), candidates)
+        for (_, _, prime_file), same_contents in zip(candidates, results):
+            if same_contents:
+                pruned.append(prime_file)
             else:
-                emit.debug(
-                    f"{prime_file} exists on the base but with different contents or permissions"
-                )
+                _emit_not_pruned(prime_file)
 
+    for prime_file in pruned:
+        emit.debug(f"Pruning: {prime_file} as it exists on the base")
+        prime_file.unlink()
 
-def _gather_layer_paths(
-    new_layer_dir: Path, base_layer_dir: Path | None = None
-) -> dict[str, list[Path]]:
-    """Map paths in ``new_layer_dir`` to names in a layer file.
+    emit.debug(
+        f"Pruned {len(pruned)} of {len(files)} primed files "
+        f"({len(candidates)} compared by contents"
+        f"{', using the base index' if index else ''}) in "
+        f"{time.monotonic() - start:.3f}s"
+    )
 
-    See ``_archive_layer()`` for the parameters.
 
-    :return:
-      A dict where the value is a path (file or dir) in ``new_layer_dir`` and the
-      key is the name that this path should have in the tarball for the layer.
+def _emit_not_pruned(prime_file: Path) -> None:
+    emit.debug(
+        f"{prime_file} exists on the base but with different contents or permissions"
+    )
+
+
+def _base_entries(
+    base_layer_file: Path, filename: str, index: RootfsIndex | None
+) -> tuple[IndexEntry, IndexEntry] | None:
+    """Get the metadata of a file in the base layer, from its index if it has one.
+
+    :returns: The entries of the file and, if it is a symlink, of its target; or
+        None if the file doesn't exist.
+    """
+    if index is not None:
+        entry = index.lookup(filename, follow_symlinks=False)
+        if entry is None or not entry.is_symlink:
+            return None if entry is None else (entry, entry)
+        target_entry = index.lookup(filename)
+        return None if target_entry is None else (entry, target_entry)
+
+    try:
+        lstat, stat_ = _stat(base_layer_file)
+    except OSError:
+        return None
+    target = str(base_layer_file.readlink()) if _is_link(lstat) else ""
+    return IndexEntry.from_stat(lstat, target=target), IndexEntry.from_stat(stat_)
+
+
+def _stat(path: Path) -> tuple[os.stat_result, os.stat_result]:
+    """Get the status of a path and, if it is a symlink, of its target."""
+    lstat = path.lstat()
+    return lstat, path.stat() if _is_link(lstat) else lstat
+
+
+def _is_link(info: os.stat_result) -> bool:
+    return stat.S_ISLNK(info.st_mode)
+
+
+def _compatible_metadata(
+    base_entry: IndexEntry, base_target_entry: IndexEntry, prime_file: Path
+) -> bool | None:
+    """Check whether a primed file can be pruned, from the metadata of both files.
+
+    The checks match the ones of ``_all_compatible_files()``.
+
+    :param base_entry: The metadata of the file in the base layer.
+    :param base_target_entry: The metadata of the file in the base layer,
+        following symlinks.
+    :param prime_file: The primed file.
+    :return: Whether the files are compatible, or None if their contents must be
+        compared to know.
     """
-    # pylint: disable=too-many-locals
+    try:
+        prime_lstat, prime_stat = _stat(prime_file)
+    except OSError:
+        return False
+
+    if not stat.S_ISREG(prime_stat.st_mode):
+        return False
+
+    # Symlinks are compatible if they have the same target, and they are never
+    # compatible with regular files.
+    if base_entry.is_symlink and _is_link(prime_lstat):
+        return Path(base_entry.target) == prime_file.readlink()
+
+    if (
+        base_entry.is_symlink
+        or _is_link(prime_lstat)
+        or base_target_entry.uid != prime_stat.st_uid
+        or base_target_entry.gid != prime_stat.st_gid
+        or base_target_entry.mode != prime_stat.st_mode
+        # The prefix of pkgconfig files is ignored, so their sizes can differ.
+        or (base_target_entry.size != prime_stat.st_size and prime_file.suffix != ".pc")
+    ):
+        return False
 
-    class LayerLinker:
-        """Helper to keep track of paths between the upper and lower layer."""
+    return None
 
-        upper_prefix: str = ""
-        lower_prefix: str = ""
 
-        def reset(self, upper_prefix: str, lower_prefix: str) -> None:
-            """Set a correspondence between a path in the upper layer and a path the lower layer.
+def _same_contents(
+    base_layer_file: Path, base_entry: IndexEntry, prime_file: Path
+) -> bool:
+    """Whether two files, with compatible metadata, have the same contents.
 
-            For example, if in the lower layer `bin` is a symlink to `usr/bin`,
-            calling ``reset("bin", "usr/bin")`` will let this LayerLinker convert
-            upper layer paths in "bin" to "usr/bin" when calling ``get_target_path()``.
-            """
-            self.upper_prefix = upper_prefix
-            self.lower_prefix = lower_prefix
+    The base layer file is only read if its digest isn't known.
+    """
+    if prime_file.suffix == ".pc":
+        return _all_compatible_files([base_layer_file, prime_file])
 
-        def get_target_path(self, path: Path) -> Path:
-            """Get the path that should be used when adding ``path`` to the archive.
+    if base_entry.digest:
+        return file_digest(prime_file) == base_entry.digest
 
-            :return:
-                If ``path`` starts with ``upper_prefix``, the returned Path is ``path``
-                with that prefix replaced with ``lower_prefix``. Otherwise, the return
-                is ``path`` unchanged.
-            """
-            if not self.upper_prefix:
-                return path
+    with base_layer_file.open("rb") as base_stream, prime_file.open("rb") as stream:
+        while True:
+            base_data = base_stream.read(_COMPARE_BUFFER_SIZE)
+            if base_data != stream.read(_COMPARE_BUFFER_SIZE):
+                return False
+            if not base_data:
+                return True
 
-            str_path = str(path)
-            if str_path.startswith(self.upper_prefix):
-                return Path(str_path.replace(self.upper_prefix, self.lower_prefix, 1))
-            return path
 
-    layer_linker = LayerLinker()
-    result: defaultdict[str, list[Path]] = defaultdict(list)
-    for dirpath, subdirs, filenames in os.walk(new_layer_dir):
-        # Sort `subdirs` in-place, to ensure that `os.walk()` iterates on
-        # them in sorted order.
-        subdirs.sort()
+def _gather_layer_paths(
+    new_layer_dir: Path, base_layer_dir: Path | None = None
+) -> dict[str, list[LayerEntry]]:
+    """Map paths in ``new_layer_dir`` to names in a layer file.
 
-        upper_subpath = Path(dirpath)
+    The tree is scanned with ``os.scandir()``, in sorted order: each directory
+    is listed once, each path is stat'ed once, and only the directories are
+    looked up in ``base_layer_dir`` (or in its index, if it has one).
 
-        # The path with `new_layer_dir` as the "root"
-        relative_path = upper_subpath.relative_to(new_layer_dir)
+    See ``write_layer()`` for the parameters.
+
+    :return:
+      A dict where the value is a path (file or dir) in ``new_layer_dir`` and the
+      key is the name that this path should have in the tarball for the layer.
+    """
+    result: defaultdict[str, list[LayerEntry]] = defaultdict(list)
+    tracing = emit.get_mode() == EmitterMode.TRACE
+    base_index = (
+        None if base_layer_dir is None else RootfsIndex.for_rootfs(base_layer_dir)
+    )
+
+    # The directories left to scan, with their path relative to `new_layer_dir`,
+    # their name in the layer and their status (None for `new_layer_dir`).
+    pending: list[tuple[str, str, str, os.stat_result | None]] = [
+        (str(new_layer_dir), "", "", None)
+    ]
+    while pending:
+        dirpath, relative_path, archive_path, dir_info = pending.pop()
+        try:
+            with os.scandir(dirpath) as scanned:
+                entries = sorted(scanned, key=lambda e: e.name)
+        except OSError as err:
+            # Like os.walk(), skip the directories that can't be listed.
+            emit.debug(f"Skipping {dirpath}: {err}")
+            continue
 
         # Handle adding an entry for the directory. We skip this IF:
         # - The directory is the root (to skip a spurious "." entry), OR
         # - The directory is NOT an opaque OCI entry AND
         # - The directory's exists on ``base_layer_dir`` as a symlink to another
-        #   directory (like in usrmerge).
-        if upper_subpath != new_layer_dir:
-            upper_is_not_opaque_dir = not overlays.is_oci_opaque_dir(upper_subpath)
-            lower_symlink_target = _symlink_target_in_base_layer(
-                relative_path, base_layer_dir
+        #   directory (like in usrmerge). Its contents are then added under the
+        #   symlink's target.
+        if dir_info is not None:
+            is_opaque = any(e.name == _OPAQUE_DIR_MARKER for e in entries)
+            lower_symlink_target = (
+                None
+                if is_opaque
+                else _symlink_target_in_base_layer(
+                    Path(relative_path), base_layer_dir, base_index
+                )
             )
-            lower_is_symlink = lower_symlink_target is not None
-
-            if upper_is_not_opaque_dir and lower_is_symlink:
+            if lower_symlink_target is not None:
                 emit.debug(
-                    f"Skipping {upper_subpath} because it exists as a symlink on the lower layer"
+                    f"Skipping {dirpath} because it exists as a symlink on the lower layer"
                 )
-                layer_linker.reset(str(relative_path), str(lower_symlink_target))
+                archive_path = str(lower_symlink_target)
             else:
-                lower_path = layer_linker.get_target_path(relative_path)
-                result[f"{lower_path}"].append(upper_subpath)
-
-        # Add each file in the directory.
-        for name in filenames:
-            archive_path = layer_linker.get_target_path(relative_path / name)
-            result[f"{archive_path}"].append(upper_subpath / name)
-
-        # Add each subdir in the directory if it's a symlink, because the os.walk()
-        # call will not enter them.
-        for subdir in subdirs:
-            upper_subdir_path = upper_subpath / subdir
-            if upper_subdir_path.is_symlink():
-                archive_path = layer_linker.get_target_path(relative_path / subdir)
-                result[f"{archive_path}"].append(upper_subdir_path)
+                result[archive_path].append(LayerEntry(dirpath, dir_info))
+
+        subdirs: list[tuple[str, str, str, os.stat_result | None]] = []
+        for entry in entries:
+            info = entry.stat(follow_symlinks=False)
+            entry_relative_path = _join(relative_path, entry.name)
+            entry_archive_path = _join(archive_path, entry.name)
+            if stat.S_ISDIR(info.st_mode):
+                subdirs.append(
+                    (entry.path, entry_relative_path, entry_archive_path, info)
+                )
+            else:
+                if tracing:
+                    emit.trace(f"Gathered {entry.path} as '{entry_archive_path}'")
+                result[entry_archive_path].append(LayerEntry(entry.path, info))
+
+        # Scan the subdirectories in sorted order, depth-first.
+        pending.extend(reversed(subdirs))
 
     return result
 
 
-def _merge_layer_paths(candidate_paths: dict[str, list[Path]]) -> dict[str, Path]:
+def _join(parent: str, name: str) -> str:
+    return f"{parent}/{name}" if parent else name
+
+
+def _merge_layer_paths(
+    candidate_paths: dict[str, list[LayerEntry]],
+) -> dict[str, LayerEntry]:
     """Merge ``candidate_paths`` into a single path per name.
 
     This function handles the case where multiple paths refer to the same name
@@ -192,25 +815,26 @@ def _merge_layer_paths(candidate_paths: dict[str, list[Path]]) -> dict[str, Path
         A dict where the values are Paths and the keys are the names those paths
         correspond to in the new layer.
     """
-    result: dict[str, Path] = {}
+    result: dict[str, LayerEntry] = {}
 
-    for name, paths in candidate_paths.items():
-        if len(paths) == 1:
-            result[name] = paths[0]
+    for name, entries in candidate_paths.items():
+        if len(entries) == 1:
+            result[name] = entries[0]
             continue
 
+        paths = [entry.path for entry in entries]
         if _all_compatible_directories(paths):
             emit.debug(
                 f"Multiple directories pointing to '{name}': {', '.join(map(str, paths))}"
             )
-            result[name] = paths[0]
+            result[name] = entries[0]
             continue
 
         if _all_compatible_files(paths):
             emit.debug(
                 f"Multiple files pointing to '{name}': {', '.join(map(str, paths))}"
             )
-            result[name] = paths[0]
+            result[name] = entries[0]
             continue
 
         # We currently don't try to do any kind of path conflict resolution; if
@@ -224,7 +848,9 @@ def _merge_layer_paths(candidate_paths: dict[str, list[Path]]) -> dict[str, Path
 
 
 def _symlink_target_in_base_layer(
-    relative_path: Path, base_layer_dir: Path | None
+    relative_path: Path,
+    base_layer_dir: Path | None,
+    base_index: RootfsIndex | None = None,
 ) -> Path | None:
     """If `relative_path` is a dir symlink in `base_layer_dir`, return its 'target'.
 
@@ -234,10 +860,18 @@ def _symlink_target_in_base_layer(
 
     :param relative_path: The subpath to check.
     :param base_layer_dir: The directory with the contents of the base layer.
+    :param base_index: The index of ``base_layer_dir``, to look the subpath up
+        in instead of the filesystem.
     """
     if base_layer_dir is None:
         return None
 
+    if base_index is not None:
+        entry = base_index.lookup(str(relative_path), follow_symlinks=False)
+        if entry is not None and entry.is_symlink:
+            return Path(entry.target)
+        return None
+
     lower_path = base_layer_dir / relative_path
 
     if lower_path.is_symlink():
@@ -25,6 +25,7 @@ import craft_cli
 import pydantic
 import spdx_lookup  # type: ignore[import-untyped]
 from craft_application.models import (
+    CraftBaseModel,
     Platform,
 )
 from craft_application.models import Project as BaseProject
@@ -34,9 +35,10 @@ from craft_platforms import DebianArchitecture
 from craft_providers import bases
 from craft_providers.bases import BuilddBaseAlias
 from craft_providers.errors import BaseConfigurationError
-from typing_extensions import override
+from typing_extensions import Self, override
 
 from rockcraft.architectures import SUPPORTED_ARCHS
+from rockcraft.compression import Compression
 from rockcraft.parts import part_has_overlay
 from rockcraft.pebble import Check, Service
 from rockcraft.usernames import SUPPORTED_GLOBAL_USERNAMES
@@ -59,6 +61,30 @@ MESSAGE_ENTRYPOINT_CHANGED = (
 DEPRECATED_COLON_BASES = ["ubuntu:20.04", "ubuntu:22.04"]
 
 
+class Layer(CraftBaseModel):
+    """A group of primed files packed in a layer of their own."""
+
+    parts: list[str] = pydantic.Field(
+        default_factory=list,
+        description="The parts whose primed files go in the layer.",
+        examples=[["python-dependencies"]],
+    )
+    paths: list[str] = pydantic.Field(
+        default_factory=list,
+        description=(
+            "Shell-style patterns of the primed paths that go in the layer, "
+            "with the contents of the directories they match."
+        ),
+        examples=[["usr/lib/jvm", "app/node_modules"]],
+    )
+
+    @pydantic.model_validator(mode="after")
+    def _validate_not_empty(self) -> Self:
+        if not self.parts and not self.paths:
+            raise ValueError("A layer must select files with 'parts' or 'paths'.")
+        return self
+
+
 BaseT = Literal[
     "bare",
     "ubuntu@20.04",
@@ -150,6 +176,45 @@ class Project(BaseProject):
 
     This key is mutually incompatible with ``entrypoint-service``.
     """
+    compression: Compression = pydantic.Field(
+        default_factory=Compression,
+        description="Settings for the compression of the rock's layers.",
+    )
+    """Settings for the compression of the rock's layers.
+
+    The layers are gzip-compressed at level 6 by default, using as many
+    threads as there are CPUs available. These settings can be overridden
+    with the ``pack`` command's ``--compression-*`` options.
+    """
+    layers: dict[str, Layer] | None = pydantic.Field(
+        default=None,
+        description="Groups of primed files to pack in layers of their own.",
+        examples=[
+            {
+                "dependencies": {"parts": ["python-dependencies"]},
+                "assets": {"paths": ["srv/static"]},
+            }
+        ],
+    )
+    """Groups of primed files to pack in layers of their own.
+
+    The layers are added in the order they are declared, and followed by a layer
+    with the remaining files. Files that rarely change, like an application's
+    dependencies, can be kept apart from the frequently changing application,
+    so that updates to the rock only change its last layers.
+    """
+    deduplicate_files: bool = pydantic.Field(
+        default=False,
+        description="Whether identical primed files are stored once in each layer.",
+    )
+    """Whether identical primed files are stored once in each layer.
+
+    Files with the same contents, permissions and ownership are archived once,
+    and their copies are stored as hardlinks to it. This shrinks rocks that
+    contain many copies of the same files, like virtual environments and
+    vendored dependencies, but the copies share the modification time of the
+    first one when the rock is unpacked.
+    """
     base: BaseT = pydantic.Field(  # type: ignore[reportIncompatibleVariableOverride]
         description="The base system image for the rock.",
     )
@@ -308,6 +373,21 @@ class Project(BaseProject):
                 )
         return parts
 
+    @pydantic.field_validator("layers")
+    @classmethod
+    def _validate_layers(
+        cls, layers: dict[str, Layer] | None, info: pydantic.ValidationInfo
+    ) -> dict[str, Layer] | None:
+        """Verify that the layers only refer to the project's parts."""
+        parts = info.data.get("parts", {})
+        for layer_name, layer in (layers or {}).items():
+            for part_name in layer.parts:
+                if part_name not in parts:
+                    raise ValueError(
+                        f"Layer '{layer_name}' refers to unknown part '{part_name}'."
+                    )
+        return layers
+
     @pydantic.field_validator("entrypoint_service")
     @classmethod
     def _validate_entrypoint_service(
@@ -16,26 +16,34 @@
 
 """OCI image manipulation helpers."""
 
+import collections
+import concurrent.futures
+import contextlib
 import hashlib
 import json
 import logging
 import os
 import shutil
 import subprocess
+import tarfile
 import tempfile
-from dataclasses import dataclass
-from datetime import datetime
+from collections.abc import Callable, Iterator, Sequence
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any
+from typing import Any, BinaryIO, cast
 
 import yaml
+import zstandard
 from craft_cli import emit
 
-from rockcraft import errors, layers
+from rockcraft import errors, layers, oci_layout, unpacker
 from rockcraft.architectures import SUPPORTED_ARCHS
+from rockcraft.compression import Compression, open_layer
 from rockcraft.constants import ROCK_CONTROL_DIR
 from rockcraft.pebble import Pebble
-from rockcraft.utils import get_snap_command_path
+from rockcraft.rootfs_index import INDEX_FILE, RootfsIndex
+from rockcraft.utils import get_snap_command_path, get_source_date_epoch, utc_now
 
 logger = logging.getLogger(__name__)
 
@@ -48,7 +56,24 @@ REGISTRY_URL = ECR_URL
 # The number of times to try downloading an image from `REGISTRY_URL`.
 MAX_DOWNLOAD_RETRIES = 5
 
-MANIFEST_MEDIA_TYPE = "application/vnd.oci.image.manifest.v1+json"
+MANIFEST_MEDIA_TYPE = oci_layout.MANIFEST_MEDIA_TYPE
+
+_COPY_BUFFER_SIZE = 1024 * 1024
+
+# The errors raised by corrupted or unsupported layers.
+_LAYER_ERRORS = (OSError, EOFError, ValueError, tarfile.TarError, zstandard.ZstdError)
+
+
+@dataclass(frozen=True)
+class _LayerInfo:
+    """A layer of an image.
+
+    :param descriptor: The descriptor of the layer's blob.
+    :param diff_id: The digest of the layer's uncompressed tarball.
+    """
+
+    descriptor: dict[str, Any]
+    diff_id: str
 
 
 @dataclass(frozen=True)
@@ -57,10 +82,12 @@ class Image:
 
     :param image_name: The name of this image in ``name:tag`` format.
     :param path: The path to this image in the local filesystem.
+    :param compression: The settings for compressing the layers added to this image.
     """
 
     image_name: str
     path: Path
+    compression: Compression = field(default_factory=Compression, compare=False)
 
     @classmethod
     def from_docker_registry(
@@ -86,11 +113,46 @@ class Image:
             raise ValueError(f"Bad image name: {image_name}")
 
         image_name = image_name.replace("@", ":")
+        source_image = f"docker://{REGISTRY_URL}/{image_name}"
+
+        # The tag is resolved first, so the image is pulled by digest: what's
+        # pulled is exactly what the digest identifies.
+        digest = cls.digest(source_image)
+        repository = image_name.split(":", 1)[0]
+        image = cls.pull(
+            f"docker://{REGISTRY_URL}/{repository}@sha256:{digest.hex()}",
+            image_name=image_name,
+            image_dir=image_dir,
+            arch=arch,
+            source_digest=digest,
+        )
+        return image, source_image
+
+    @classmethod
+    def pull(
+        cls,
+        source_image: str,
+        *,
+        image_name: str,
+        image_dir: Path,
+        arch: str,
+        source_digest: bytes | None = None,
+    ) -> "Image":
+        """Copy an image from a registry into a local OCI image layout.
+
+        :param source_image: The image to retrieve, in its full form (e.g.
+            ``docker://registry/ubuntu@sha256:...``).
+        :param image_name: The name of the local image, in ``name:tag`` format.
+        :param image_dir: The directory to store local OCI images.
+        :param arch: The architecture of the image to fetch, in Debian format.
+        :param source_digest: The digest of ``source_image``, if it's known. It
+            is recorded in the local layout, for ``source_digest()``.
 
+        :returns: The downloaded image.
+        """
         image_dir.mkdir(parents=True, exist_ok=True)
         image_target = image_dir / image_name
 
-        source_image = f"docker://{REGISTRY_URL}/{image_name}"
         copy_params = ["--retry-times", str(MAX_DOWNLOAD_RETRIES)]
 
         mapping = SUPPORTED_ARCHS[arch]
@@ -109,7 +171,14 @@ class Image:
             copy_params=copy_params,
         )
 
-        return cls(image_name=image_name, path=image_dir), source_image
+        if source_digest is not None:
+            layout_dir, tag = oci_layout.split_image_path(image_target)
+            oci_layout.Layout(layout_dir).annotate_manifest(
+                tag,
+                {oci_layout.SOURCE_DIGEST_ANNOTATION: f"sha256:{source_digest.hex()}"},
+            )
+
+        return cls(image_name=image_name, path=image_dir)
 
     @classmethod
     def new_oci_image(
@@ -136,22 +205,15 @@ class Image:
         image_target_no_tag = str(image_target).split(":", maxsplit=1)[0]
 
         shutil.rmtree(image_target_no_tag, ignore_errors=True)
-        _process_run(["umoci", "init", "--layout", image_target_no_tag])
-        _process_run(["umoci", "new", "--image", str(image_target)])
 
-        # Note: umoci's docs aren't clear on this but we assume that arch-related
-        # calls must use GOARCH-format, following the OCI spec.
+        # Arch-related fields must use GOARCH-format, following the OCI spec.
         mapping = SUPPORTED_ARCHS[arch]
 
-        # Unfortunately, umoci does not allow initializing an image
-        # with arch and variant. We can configure the arch via
-        # umoci config, but not the variant. Need to do it manually
-        _config_image(image_target, ["--architecture", mapping.go_arch, "--no-history"])
-
-        _inject_oci_fields(
-            image_target,
-            arch_variant=mapping.go_variant,
-        )
+        # Initialize the layout, the empty image and its platform in a single
+        # pass over the config, manifest and index.
+        editor = oci_layout.ImageEditor(image_target, create=True)
+        editor.set_architecture(mapping.go_arch, mapping.go_variant)
+        editor.commit()
 
         # for new OCI images, the source image corresponds to the newly generated image
         return (
@@ -159,45 +221,177 @@ class Image:
             f"oci:{str(image_target)}",
         )
 
+    def exists(self) -> bool:
+        """Whether the image is present in its local OCI image layout."""
+        layout_dir, tag = oci_layout.split_image_path(self.path / self.image_name)
+        layout = oci_layout.Layout(layout_dir)
+        if not layout.index_path.exists():
+            return False
+        return bool(layout.tagged_manifests(layout.read_index(), tag))
+
+    def manifest_digest(self) -> str:
+        """Get the digest of the image's manifest, from its local OCI image layout.
+
+        Unlike the registry digest of the image's source, this identifies the
+        image's contents for a single architecture.
+
+        :returns: The digest, in ``algorithm:hex`` format.
+        """
+        layout_dir, tag = oci_layout.split_image_path(self.path / self.image_name)
+        layout = oci_layout.Layout(layout_dir)
+        _, descriptor = layout.find_manifest(layout.read_index(), tag)
+        return str(descriptor["digest"])
+
+    def source_digest(self) -> bytes:
+        """Get the digest of the image this image was pulled from.
+
+        The digest is recorded in the local layout when the image is pulled,
+        so the registry is not queried again. The source of images that were
+        not pulled, like new images, is their own manifest.
+
+        :returns: The digest bytes.
+        """
+        layout_dir, tag = oci_layout.split_image_path(self.path / self.image_name)
+        layout = oci_layout.Layout(layout_dir)
+        _, descriptor = layout.find_manifest(layout.read_index(), tag)
+        digest = descriptor.get("annotations", {}).get(
+            oci_layout.SOURCE_DIGEST_ANNOTATION, descriptor["digest"]
+        )
+        return bytes.fromhex(digest.split(":", 1)[-1])
+
+    @contextlib.contextmanager
+    def edit(self, tag: str | None = None) -> Iterator[oci_layout.ImageEditor]:
+        """Edit the image's config and manifest in a single transaction.
+
+        All the changes made through the yielded editor are written to the image
+        in one pass when the context exits without errors.
+
+        :param tag: The tag to write the edited image to, if it isn't the tag
+            of this image.
+        """
+        editor = oci_layout.ImageEditor(self.path / self.image_name)
+        yield editor
+        editor.commit(tag)
+
     def copy_to(self, image_name: str, *, image_dir: Path) -> "Image":
         """Make a copy of the current image.
 
+        The copy shares the image's blobs: in the same layout, it's only a new
+        tag, and blobs are hardlinked into other layouts when possible.
+
         :param image_name: The new image name, in ``name:tag`` format.
         :param image_dir: The new image directory.
 
         :returns: The newly created image.
         """
-        src_path = self.path / self.image_name
-        dest_path = image_dir / image_name
-        _copy_image(f"oci:{str(src_path)}", f"oci:{str(dest_path)}")
+        src_dir, src_tag = oci_layout.split_image_path(self.path / self.image_name)
+        dest_dir, dest_tag = oci_layout.split_image_path(image_dir / image_name)
+        dest_dir.mkdir(parents=True, exist_ok=True)
+        oci_layout.Layout(src_dir).copy_image(
+            src_tag, oci_layout.Layout(dest_dir), dest_tag
+        )
 
         return Image(image_name=image_name, path=image_dir)
 
     def extract_to(self, bundle_dir: Path, *, rootless: bool = False) -> Path:
-        """Unpack the image to an OCI runtime bundle.
+        """Unpack the image to a bundle.
+
+        The layers are decompressed concurrently, and applied in order as soon
+        as they are ready.
 
-        :param bundle_dir: The directory to store runtime bundles.
+        :param bundle_dir: The directory to store the bundles.
         :param rootless: Whether the image should be unpacked even without
             root; won't necessarily preserve ownership but is useful for
             testing.
+        :returns: The path to the unpacked rootfs.
         """
-        bundle_dir.mkdir(parents=True, exist_ok=True)
         bundle_path = bundle_dir / self.image_name.replace(":", "-")
-        image_path = self.path / self.image_name
         shutil.rmtree(bundle_path, ignore_errors=True)
-        command = ["umoci", "unpack"]
-        if rootless:
-            command.append("--rootless")
-        command.extend(["--image", str(image_path), str(bundle_path)])
-        _process_run(command)
+        rootfs = bundle_path / "rootfs"
+        rootfs.mkdir(parents=True)
+
+        try:
+            layout, image_layers = self._layers()
+            with _decompressed_layers(layout, image_layers, bundle_path) as streams:
+                unpacker.unpack_layers(streams, rootfs, rootless=rootless)
+        except _LAYER_ERRORS as err:
+            raise errors.RockcraftError(
+                f"Failed to unpack {self.image_name}: {err}"
+            ) from err
 
-        return bundle_path / "rootfs"
+        return rootfs
+
+    def index_to(
+        self,
+        bundle_dir: Path,
+        *,
+        extract: Callable[[str], bool],
+        rootless: bool = False,
+    ) -> Path:
+        """Index the image's filesystem, extracting only some of its files.
+
+        Unlike with ``extract_to()``, the rootfs only holds the files selected
+        by ``extract``: the rest of the filesystem can be looked up in the
+        ``RootfsIndex`` written next to it.
+
+        :param bundle_dir: The directory to store the indexed bundles.
+        :param extract: Whether to extract the file at a path, relative to the
+            rootfs.
+        :param rootless: Whether the paths are owned by the current user, like
+            in images extracted with ``rootless``.
+        :returns: The path to the partial rootfs.
+        """
+        bundle_path = bundle_dir / self.image_name.replace(":", "-")
+        shutil.rmtree(bundle_path, ignore_errors=True)
+        rootfs = bundle_path / "rootfs"
+        rootfs.mkdir(parents=True)
+
+        try:
+            layout, image_layers = self._layers()
+            with _decompressed_layers(layout, image_layers, bundle_path) as streams:
+                index = RootfsIndex.from_layers(
+                    streams, rootfs, extract=extract, rootless=rootless
+                )
+        except _LAYER_ERRORS as err:
+            raise errors.RockcraftError(
+                f"Failed to index {self.image_name}: {err}"
+            ) from err
+        index.write(bundle_path / INDEX_FILE)
+
+        return rootfs
+
+    def _layers(self) -> tuple[oci_layout.Layout, list[_LayerInfo]]:
+        """Get the layout of the image and the descriptors of its layers.
+
+        :raises ValueError: If the image's config doesn't list a diff ID for
+            each of its layers.
+        """
+        layout_dir, tag = oci_layout.split_image_path(self.path / self.image_name)
+        layout = oci_layout.Layout(layout_dir)
+        _, descriptor = layout.find_manifest(layout.read_index(), tag)
+        manifest = layout.read_json_blob(descriptor["digest"])
+        layer_descriptors: list[dict[str, Any]] = manifest["layers"]
+        diff_ids: list[str] = layout.read_json_blob(manifest["config"]["digest"])[
+            "rootfs"
+        ]["diff_ids"]
+        if len(diff_ids) != len(layer_descriptors):
+            raise ValueError(
+                f"The config of {self.image_name} has {len(diff_ids)} diff IDs "
+                f"for {len(layer_descriptors)} layers"
+            )
+        return layout, [
+            _LayerInfo(descriptor, diff_id)
+            for descriptor, diff_id in zip(layer_descriptors, diff_ids, strict=True)
+        ]
 
     def add_layer(
         self,
         tag: str,
         new_layer_dir: Path,
         base_layer_dir: Path | None = None,
+        *,
+        groups: Sequence[layers.LayerGroup] = (),
+        deduplicate: bool = False,
     ) -> "Image":
         """Add a layer to the image.
 
@@ -205,20 +399,37 @@ class Image:
         :param new_layer_dir: The path to the new layer root filesystem.
         :param base_layer_dir: An optional path to the extracted contents of the
           new layer's base layer. Used to preserve lower-layer symlinks.
+        :param groups: Groups of paths to split into layers of their own, added
+          in order before the layer with the remaining paths.
+        :param deduplicate: Whether to store the identical files of each layer
+          once, as hardlinks to the first copy.
         """
-        image_path = self.path / self.image_name
-
-        temp_file = Path(self.path, f".temp_layer.{os.getpid()}.tar")
-        temp_file.unlink(missing_ok=True)
-
-        try:
-            layers.archive_layer(new_layer_dir, temp_file, base_layer_dir)
-            _add_layer_into_image(image_path, temp_file, **{"--tag": tag})
-        finally:
-            temp_file.unlink(missing_ok=True)
+        layer_paths = layers.gather_layer_paths(new_layer_dir, base_layer_dir)
+        splits = layers.split_layer_paths(layer_paths, new_layer_dir, groups)
+        with self.edit(tag) as editor:
+            for group, group_paths in zip(groups, splits):
+                if not group_paths:
+                    emit.debug(f"Skipping empty layer {group.name!r}")
+                    continue
+                emit.progress(f"Creating layer {group.name!r}")
+                _add_layer_into_image(
+                    editor,
+                    group_paths,
+                    compression=self.compression,
+                    comment=group.name,
+                    deduplicate=deduplicate,
+                )
+            _add_layer_into_image(
+                editor,
+                splits[-1],
+                compression=self.compression,
+                deduplicate=deduplicate,
+            )
 
         name = self.image_name.split(":", 1)[0]
-        return self.__class__(image_name=f"{name}:{tag}", path=self.path)
+        return self.__class__(
+            image_name=f"{name}:{tag}", path=self.path, compression=self.compression
+        )
 
     def add_user(
         self,
@@ -227,6 +438,8 @@ class Image:
         tag: str,
         username: str,
         uid: int,
+        *,
+        layer_dir: Path | None = None,
     ) -> None:
         """Create a new rock user.
 
@@ -235,6 +448,8 @@ class Image:
         :param tag: The rock's image tag.
         :param username: Username to be created. Same as group name.
         :param uid: UID of the username to be created. Same as GID.
+        :param layer_dir: The directory of a layer being prepared, to write the
+            user database into instead of adding a layer of its own.
         """
         # pylint: disable=too-many-arguments
         user_files = {"passwd": "", "group": "", "shadow": ""}
@@ -248,12 +463,15 @@ class Image:
         #  - if it doesn't exist in prime AND isn't "whiteout", use the base,
         #  - if it is "whiteout" or doesn't exist anywhere, use an empty file.
         # NOTE: "shadow" is only modified if it already exists.
+        base_index = RootfsIndex.for_rootfs(base_layer_dir)
         for u_file in user_files:
+            if base_index is not None:
+                in_base = base_index.lookup(f"etc/{u_file}") is not None
+            else:
+                in_base = (base_layer_dir_etc / u_file).exists()
             if (prime_dir_etc / u_file).exists():
                 user_files[u_file] = (prime_dir_etc / u_file).read_text()
-            elif (base_layer_dir_etc / u_file).exists() and not (
-                prime_dir_etc / f".wh.{u_file}"
-            ).exists():
+            elif in_base and not (prime_dir_etc / f".wh.{u_file}").exists():
                 user_files[u_file] = (base_layer_dir_etc / u_file).read_text()
 
         if (  # pylint: disable=too-many-boolean-expressions
@@ -277,37 +495,15 @@ class Image:
         )
         user_files["group"] += f"{username}:x:{uid}:\n"
 
-        with tempfile.TemporaryDirectory() as tmpfs:
-            tmpfs_etc = Path(tmpfs) / "etc"
-            tmpfs_etc.mkdir(parents=True, exist_ok=True)
-            with (tmpfs_etc / "passwd").open("a+") as passwdf:
-                passwdf.write(user_files["passwd"])
-
-            with (tmpfs_etc / "group").open("a+") as groupf:
-                groupf.write(user_files["group"])
-
-            if user_files["shadow"]:
-                days_since_epoch = (datetime.utcnow() - datetime(1970, 1, 1)).days  # type: ignore[reportDeprecated]
-
-                # only add the shadow file if there's already one in the base image
-                with (tmpfs_etc / "shadow").open("a+") as shadowf:
-                    shadowf.write(
-                        user_files["shadow"]
-                        + f"{username}:!:{days_since_epoch}::::::\n"
-                    )
+        emit.progress(f"Adding user {username}:{uid} with group {username}:{uid}")
+        if layer_dir is not None:
+            _write_user_files(layer_dir, user_files, username)
+            return
 
-            emit.progress(f"Adding user {username}:{uid} with group {username}:{uid}")
+        with tempfile.TemporaryDirectory() as tmpfs:
+            _write_user_files(Path(tmpfs), user_files, username)
             self.add_layer(tag, Path(tmpfs))
 
-    def stat(self) -> dict[str, Any]:
-        """Obtain the image statistics, as reported by "umoci stat --json"."""
-        image_path = self.path / self.image_name
-        output: bytes = _process_run(
-            ["umoci", "stat", "--json", "--image", str(image_path)]
-        ).stdout
-        result: dict[str, Any] = json.loads(output)
-        return result
-
     def get_manifest(self) -> dict[str, Any]:
         """Obtain the image manifest, as reported by "skopeo inspect --raw"."""
         image_path = self.path / self.image_name
@@ -321,22 +517,32 @@ class Image:
     def digest(source_image: str) -> bytes:
         """Obtain the image digest, given its full form name {transport}:{name}.
 
+        The digest of ``oci:`` images is read from their local layout. For
+        other images, only the raw manifest is fetched, and hashed locally.
+
         :param source_image: the source image name, it its full form (e.g. docker://ubuntu:22.04)
         :returns: The image digest bytes.
         """
-        output = subprocess.check_output(
+        if source_image.startswith("oci:"):
+            layout_dir, tag = oci_layout.split_image_path(
+                Path(source_image.removeprefix("oci:"))
+            )
+            layout = oci_layout.Layout(layout_dir)
+            _, descriptor = layout.find_manifest(layout.read_index(), tag)
+            return bytes.fromhex(descriptor["digest"].split(":", 1)[-1])
+
+        raw_manifest = subprocess.check_output(
             [
                 get_snap_command_path("skopeo"),
                 "inspect",
-                "--format",
-                "{{.Digest}}",
+                "--raw",
+                "--retry-times",
+                str(MAX_DOWNLOAD_RETRIES),
                 "-n",
                 source_image,
-            ],
-            text=True,
+            ]
         )
-        parts = output.split(":", 1)
-        return bytes.fromhex(parts[-1])
+        return hashlib.sha256(raw_manifest).digest()
 
     def to_docker_daemon(self, tag: str) -> None:
         """Export the current image to the local docker daemon.
@@ -350,11 +556,42 @@ class Image:
     def to_oci_archive(self, tag: str, filename: str) -> None:
         """Export the current image to a tar archive in OCI format.
 
+        The archive is written straight from the image's layout, with the
+        compressed layers as they are. ``filename`` can also be a named pipe.
+
         :param tag: The tag to export.
+        :param filename: The path of the archive.
         """
-        name = self.image_name.split(":", 1)[0]
-        src_path = self.path / f"{name}:{tag}"
-        _copy_image(f"oci:{str(src_path)}", f"oci-archive:{filename}:{tag}")
+        archive_path = Path(filename)
+        try:
+            with archive_path.open("wb") as archive:
+                self.write_oci_archive(tag, archive)
+        except BaseException:
+            if archive_path.is_file():
+                archive_path.unlink()
+            raise
+
+    def write_oci_archive(self, tag: str, stream: BinaryIO) -> None:
+        """Write the current image to a stream, as a tar archive in OCI format.
+
+        :param tag: The tag to export.
+        :param stream: The binary stream receiving the archive, like the
+            standard output.
+        """
+        layout = oci_layout.Layout(self.path / self.image_name.split(":", 1)[0])
+        layout.write_archive(tag, stream)
+
+    def to_oci_layout(self, tag: str, directory: Path) -> None:
+        """Export the current image to a new OCI image layout directory.
+
+        The image's blobs are hardlinked into the new layout when possible.
+
+        :param tag: The tag to export.
+        :param directory: The path of the new layout, which is replaced if it
+            exists.
+        """
+        layout = oci_layout.Layout(self.path / self.image_name.split(":", 1)[0])
+        layout.export(tag, directory)
 
     def set_default_user(self, userid: int, username: str) -> None:
         """Set the default runtime user for the OCI image.
@@ -362,49 +599,23 @@ class Image:
         :param userid: userid of the default user (must already exist)
         :param username: username of the default user (must already exist)
         """
-        image_path = self.path / self.image_name
-        params = ["--clear=config.entrypoint", "--config.user", str(userid)]
-        _config_image(image_path, params)
-        emit.progress(f"Default user set to {userid} ({username})")
+        with self.edit() as editor:
+            editor.set_default_user(userid, username)
 
     def set_entrypoint(self, entrypoint: list[str]) -> None:
         """Set the OCI image entrypoint. It is always Pebble."""
-        emit.progress("Configuring entrypoint...")
-        image_path = self.path / self.image_name
-
-        params = ["--clear=config.entrypoint"]
-        for entry in entrypoint:
-            params.extend(["--config.entrypoint", entry])
-
-        params.extend(["--clear=config.cmd"])
-        _config_image(image_path, params)
-        emit.progress(f"Entrypoint set to {entrypoint}")
+        with self.edit() as editor:
+            editor.set_entrypoint(entrypoint)
 
     def set_cmd(self, command: list[str]) -> None:
         """Set the OCI image CMD."""
-        emit.progress("Configuring CMD...")
-        image_path = self.path / self.image_name
-        cmd_params = ["--clear=config.cmd"]
-
-        for arg in command:
-            cmd_params.extend(["--config.cmd", arg])
-        _config_image(image_path, cmd_params)
-        emit.progress(f"CMD set to {command}")
+        with self.edit() as editor:
+            editor.set_cmd(command)
 
     def set_default_path(self, base: str) -> None:
         """Set the default PATH on the image (only for bare rocks)."""
-        if base != "bare":
-            emit.debug(f"Not setting a PATH on the image as base is {base!r}")
-            return
-
-        # Follow Pebble's lead here: if PATH is empty, use the standard one.
-        # This means that containers that bypass the pebble entrypoint will
-        # have the same behavior as PATH-less pebble services.
-        pebble_path = Pebble.DEFAULT_ENV_PATH
-        image_path = self.path / self.image_name
-
-        emit.debug(f"Setting bare-based rock PATH to {pebble_path!r}")
-        _config_image(image_path, ["--config.env", f"PATH={pebble_path}"])
+        with self.edit() as editor:
+            editor.set_default_path(base)
 
     def set_pebble_layer(
         self,
@@ -415,6 +626,8 @@ class Image:
         summary: str,
         description: str,
         base_layer_dir: Path,
+        *,
+        layer_dir: Path | None = None,
     ) -> None:
         """Write the provided services and checks into a Pebble layer in the filesystem.
 
@@ -425,6 +638,8 @@ class Image:
         :param summary: The summary for the Pebble layer
         :param description: The description for the Pebble layer
         :param base_layer_dir: Path to the base layer's root filesystem
+        :param layer_dir: The directory of a layer being prepared, to write the
+            Pebble layer into instead of adding an image layer of its own.
         """
         # pylint: disable=too-many-arguments
         pebble_layer_content: dict[str, Any] = {
@@ -443,6 +658,12 @@ class Image:
             pebble_layer_content["checks"] = checks
 
         pebble = Pebble()
+        if layer_dir is not None:
+            pebble.define_pebble_layer(
+                layer_dir, base_layer_dir, pebble_layer_content, name
+            )
+            return
+
         with tempfile.TemporaryDirectory() as tmpfs:
             tmpfs_path = Path(tmpfs)
             pebble.define_pebble_layer(
@@ -458,43 +679,32 @@ class Image:
         :param env: A dictionary mapping environment variables to
             their values.
         """
-        emit.progress("Configuring OCI environment...")
-        image_path = self.path / self.image_name
-        params: list[str] = []
-        env_list: list[str] = []
-
-        for name, value in env.items():
-            env_item = f"{name}={value}"
-            env_list.append(env_item)
-            params.extend(["--config.env", env_item])
-        _config_image(image_path, params)
-        emit.progress(f"Environment set to {env_list}")
+        with self.edit() as editor:
+            editor.set_environment(env)
 
-    def set_control_data(self, metadata: dict[str, Any]) -> None:
+    def set_control_data(
+        self, metadata: dict[str, Any], *, layer_dir: Path | None = None
+    ) -> None:
         """Create and populate the rock's control data folder.
 
         :param metadata: content for the rock's metadata YAML file
+        :param layer_dir: The directory of a layer being prepared, to write the
+            control data into instead of adding a layer of its own.
         """
         emit.progress("Setting the rock's control data")
-        local_control_data_path = Path(tempfile.mkdtemp())
-
-        # the rock control data structure starts with the folder ".rock"
-        control_data_rock_folder = local_control_data_path / ROCK_CONTROL_DIR
-        control_data_rock_folder.mkdir()
-
-        rock_metadata_file = control_data_rock_folder / "metadata.yaml"
-        with rock_metadata_file.open("w", encoding="utf-8") as rock_meta:
-            yaml.dump(metadata, rock_meta)
-        rock_metadata_file.chmod(0o644)
+        if layer_dir is not None:
+            _write_control_data(layer_dir, metadata)
+            return
 
-        temp_tar_file = Path(self.path, f".temp_layer.control_data.{os.getpid()}.tar")
-        temp_tar_file.unlink(missing_ok=True)
+        local_control_data_path = Path(tempfile.mkdtemp())
+        _write_control_data(local_control_data_path, metadata)
 
-        try:
-            layers.archive_layer(local_control_data_path, temp_tar_file)
-            _add_layer_into_image(self.path / self.image_name, temp_tar_file)
-        finally:
-            temp_tar_file.unlink(missing_ok=True)
+        with self.edit() as editor:
+            _add_layer_into_image(
+                editor,
+                layers.gather_layer_paths(local_control_data_path),
+                compression=self.compression,
+            )
 
         emit.progress("Control data written")
         shutil.rmtree(local_control_data_path)
@@ -504,33 +714,216 @@ class Image:
 
         :param annotations: A dictionary with each annotation/label and its value
         """
-        emit.progress("Configuring labels and annotations...")
-        image_path = self.path / self.image_name
-        label_params = ["--clear=config.labels"]
-        annotation_params = ["--clear=manifest.annotations"]
-
-        labels_list: list[str] = []
-        for label_key, label_value in annotations.items():
-            label_item = f"{label_key}={label_value}"
-            labels_list.append(label_item)
-            label_params.extend(["--config.label", label_item])
-            annotation_params.extend(["--manifest.annotation", label_item])
-        # Set the labels
-        _config_image(image_path, label_params)
-        # Set the annotations as a copy of these labels (for OCI compliance only)
-        _config_image(image_path, annotation_params)
-        emit.progress(f"Labels and annotations set to {labels_list}")
+        with self.edit() as editor:
+            editor.set_annotations(annotations)
 
     def set_media_type(
         self,
     ) -> None:
-        """Set the media type in the target image's manifest."""
-        image_path = self.path / self.image_name
-        _inject_oci_fields(
-            image_path,
-            arch_variant=None,
+        """Set the media type in the target image's manifest.
+
+        Every committed edit sets the manifest's media type, so this is an empty
+        transaction.
+        """
+        with self.edit():
+            pass
+
+
+def create_multi_arch_rock(rocks: Sequence[Path], filename: Path, *, tag: str) -> None:
+    """Write a rock with the images of several single-platform rocks.
+
+    The rock's image is an image index (a manifest list) of the images, so that
+    container runtimes pull the image of their own platform. The blobs of the
+    rocks, which are read concurrently, are stored once even when several
+    images share them, like the layers of architecture-independent files.
+
+    :param rocks: The single-platform rocks, for different platforms.
+    :param filename: The path of the new rock.
+    :param tag: The tag of the image index in the new rock.
+    """
+    with tempfile.TemporaryDirectory(dir=filename.parent, prefix=".rock-") as temp:
+        layout = oci_layout.Layout(Path(temp))
+        layout.init()
+        with concurrent.futures.ThreadPoolExecutor() as executor:
+            imported = list(executor.map(layout.import_archive, rocks))
+        layout.write_image_index(
+            [descriptor for descriptors in imported for descriptor in descriptors],
+            tag,
+        )
+        with filename.open("wb") as archive:
+            layout.write_archive(tag, archive)
+
+
+@contextlib.contextmanager
+def _decompressed_layers(
+    layout: oci_layout.Layout, layers: list[_LayerInfo], temp_dir: Path
+) -> Iterator[Iterator[BinaryIO]]:
+    """Get the uncompressed tarballs of ``layers``, decompressing them concurrently.
+
+    The first layer is decompressed as it is read, while the next ones are
+    decompressed in the background into temporary files in ``temp_dir``, each
+    of them removed once read. The background decompression only runs ahead
+    of the reader by as many layers as there are workers, so that at most that
+    many uncompressed tarballs are on disk next to the rootfs being written.
+
+    Each layer is checked against its digests as it's decompressed: the first
+    one once it's read, before the next layer is returned, and the next ones
+    before they are returned. A mismatch raises a ``ValueError``.
+    """
+    max_workers = max(1, min(len(layers) - 1, os.cpu_count() or 1))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures: collections.deque[concurrent.futures.Future[Path]] = (
+            collections.deque()
         )
 
+        def submit(number: int) -> None:
+            if number < len(layers):
+                futures.append(
+                    executor.submit(
+                        _decompress_layer,
+                        layout,
+                        layers[number],
+                        temp_dir / f".layer-{number}.tar",
+                    )
+                )
+
+        for number in range(1, max_workers + 1):
+            submit(number)
+
+        def streams() -> Iterator[BinaryIO]:
+            if layers:
+                with _open_verified_layer(layout, layers[0]) as stream:
+                    yield stream
+            for number in range(1, len(layers)):
+                path = futures.popleft().result()
+                try:
+                    with path.open("rb") as stream:
+                        yield stream
+                finally:
+                    path.unlink()
+                submit(number + max_workers)
+
+        try:
+            yield streams()
+        finally:
+            for future in futures:
+                future.cancel()
+            for future in futures:
+                if not future.cancelled() and future.exception() is None:
+                    future.result().unlink(missing_ok=True)
+
+
+def _decompress_layer(layout: oci_layout.Layout, layer: _LayerInfo, path: Path) -> Path:
+    try:
+        with (
+            _open_verified_layer(layout, layer) as stream,
+            path.open("wb") as output,
+        ):
+            shutil.copyfileobj(stream, output, _COPY_BUFFER_SIZE)
+    except BaseException:
+        path.unlink(missing_ok=True)
+        raise
+    return path
+
+
+@contextlib.contextmanager
+def _open_verified_layer(
+    layout: oci_layout.Layout, layer: _LayerInfo
+) -> Iterator[BinaryIO]:
+    """Open the uncompressed tarball of a layer, checking it once it's read.
+
+    Once the tarball has been read, the rest of it and of the layer's blob
+    are read, and checked against the layer's diff ID and digest.
+
+    :raises ValueError: If the blob or the tarball don't match their digests.
+    """
+    digest = layer.descriptor["digest"]
+    with layout.blob_path(digest).open("rb") as blob_file:
+        blob = _DigestReader(blob_file, digest, f"Blob of layer {digest}")
+        tarball = _DigestReader(
+            open_layer(cast(BinaryIO, blob), layer.descriptor["mediaType"]),
+            layer.diff_id,
+            f"Uncompressed layer {digest}",
+        )
+        yield cast(BinaryIO, tarball)
+        tarball.verify()
+        blob.verify()
+
+
+class _DigestReader:
+    """A stream reader that hashes what it reads.
+
+    :param stream: The stream to read.
+    :param digest: The digest that the whole stream should have.
+    :param name: The name of the stream, for errors.
+    """
+
+    def __init__(self, stream: BinaryIO, digest: str, name: str) -> None:
+        self._stream = stream
+        self._digest = digest
+        self._name = name
+        self._hasher = hashlib.sha256()
+
+    def read(self, size: int = -1) -> bytes:
+        """Read up to ``size`` bytes from the stream."""
+        data = self._stream.read(size)
+        self._hasher.update(data)
+        return data
+
+    def verify(self) -> None:
+        """Read the rest of the stream, and check that it matches its digest.
+
+        :raises ValueError: If it doesn't.
+        """
+        while self.read(_COPY_BUFFER_SIZE):
+            pass
+        actual = f"sha256:{self._hasher.hexdigest()}"
+        if actual != self._digest:
+            raise ValueError(
+                f"{self._name} doesn't match its digest: expected "
+                f"{self._digest}, got {actual}"
+            )
+
+
+def _write_user_files(
+    layer_dir: Path, user_files: dict[str, str], username: str
+) -> None:
+    """Write the user database, with a new user, into a layer's directory.
+
+    :param layer_dir: The directory of the layer.
+    :param user_files: The contents of ``etc/passwd``, ``etc/group`` and
+        ``etc/shadow``; the shadow file is only written if it has contents.
+    :param username: The name of the new user, to add to the shadow file.
+    """
+    layer_etc = layer_dir / "etc"
+    layer_etc.mkdir(parents=True, exist_ok=True)
+    with (layer_etc / "passwd").open("a+") as passwdf:
+        passwdf.write(user_files["passwd"])
+
+    with (layer_etc / "group").open("a+") as groupf:
+        groupf.write(user_files["group"])
+
+    if user_files["shadow"]:
+        days_since_epoch = (utc_now() - datetime(1970, 1, 1, tzinfo=timezone.utc)).days
+
+        # only add the shadow file if there's already one in the base image
+        with (layer_etc / "shadow").open("a+") as shadowf:
+            shadowf.write(
+                user_files["shadow"] + f"{username}:!:{days_since_epoch}::::::\n"
+            )
+
+
+def _write_control_data(layer_dir: Path, metadata: dict[str, Any]) -> None:
+    """Write the rock's control data into a layer's directory."""
+    # the rock control data structure starts with the folder ".rock"
+    control_data_rock_folder = layer_dir / ROCK_CONTROL_DIR
+    control_data_rock_folder.mkdir()
+
+    rock_metadata_file = control_data_rock_folder / "metadata.yaml"
+    with rock_metadata_file.open("w", encoding="utf-8") as rock_meta:
+        yaml.dump(metadata, rock_meta)
+    rock_metadata_file.chmod(0o644)
+
 
 def _copy_image(
     source: str,
@@ -557,96 +950,65 @@ def _copy_image(
     )
 
 
-def _config_image(image_path: Path, params: list[str]) -> None:
-    """Configure the OCI image."""
-    _process_run(["umoci", "config", "--image", str(image_path), *params])
-
-
 def _add_layer_into_image(
-    image_path: Path, archived_content: Path, **kwargs: str
+    editor: oci_layout.ImageEditor,
+    layer_paths: dict[str, layers.LayerEntry],
+    *,
+    compression: Compression | None = None,
+    comment: str | None = None,
+    deduplicate: bool = False,
 ) -> None:
-    """Add raw layer (archived) into the OCI image.
-
-    :param image_path: path of the OCI image, in the format <image>:<tar>
-    :param archived_content: path to the archived content to be added
+    """Archive paths as a new layer of the image being edited.
+
+    The layer is tarred, compressed and hashed in a single pass, straight into
+    the image layout's blob store. If a layer was already built from the same
+    paths, with the same metadata and settings, its blob is reused instead.
+
+    :param editor: The transaction editing the image.
+    :param layer_paths: The paths in the new layer, keyed by their names in it.
+    :param compression: The settings for compressing the layer.
+    :param comment: An optional description of the layer, for the image's history.
+    :param deduplicate: Whether to store identical files once, as hardlinks to
+        the first copy.
     """
-    cmd = [
-        "umoci",
-        "raw",
-        "add-layer",
-        "--image",
-        str(image_path),
-        str(archived_content),
-    ] + [arg_val for k, v in kwargs.items() for arg_val in [k, v]]
-    _process_run([*cmd, "--history.created_by", " ".join(cmd)])
-
-
-def _inject_oci_fields(image_path: Path, arch_variant: str | None = None) -> None:
-    """Inject architecture variant and mediaType into existing OCI Image config.
-
-    :param image_path: path of the OCI image
-    :param arch_variant: name of the variant to inject in the OCI config
-    """
-    image_path_no_tag, image_tag = str(image_path).split(":", maxsplit=1)
-    # pylint: disable=too-many-locals
-    blobs_path = Path(image_path_no_tag) / "blobs" / "sha256"
-    # Get the top level OCI index
-    tl_index_path = Path(image_path_no_tag) / "index.json"
-    tl_index = json.loads(tl_index_path.read_bytes())
-
-    # The manifest of the image being built contains both the base image
-    # and the target image. We need to find the manifest that matches the
-    # tag of the target image, and ensure the tag is not ambiguous.
-    manifest_digests: list[tuple[str, int]] = [
-        (manifest["digest"].split(":")[-1], i)
-        for i, manifest in enumerate(tl_index["manifests"])
-        if (a := manifest.get("annotations"))
-        and a.get("org.opencontainers.image.ref.name") == image_tag
-    ]
-    if not manifest_digests:
-        raise errors.RockcraftError(
-            f"Cannot find manifest for {image_tag} in {tl_index_path}"
-        )
-    if len(manifest_digests) > 1:
-        raise errors.RockcraftError(
-            f"Found multiple manifests for {image_tag} in {tl_index_path}"
-        )
-    manifest_digest, idx = manifest_digests[0]
-    manifest_path = blobs_path / manifest_digest
-    manifest_content = json.loads(manifest_path.read_bytes())
-
-    if "mediaType" not in manifest_content:
-        # Set the mediaType
-        manifest_content["mediaType"] = MANIFEST_MEDIA_TYPE
-
-    if arch_variant:
-        # Get the current OCI Image Config
-        image_config_digest = manifest_content["config"]["digest"].split(":")[-1]
-        image_config_path = blobs_path / image_config_digest
-        image_config_content = json.loads(image_config_path.read_bytes())
-        # Set the variant
-        image_config_content["variant"] = arch_variant
-
-        # The OCI image config has changed, so now we need to
-        # regenerate the digests
-        new_image_config_bytes = json.dumps(image_config_content).encode("utf-8")
-        new_image_config_digest = hashlib.sha256(new_image_config_bytes).hexdigest()
-        new_image_config_path = blobs_path / new_image_config_digest
-        new_image_config_path.write_bytes(new_image_config_bytes)
-        image_config_path.unlink()
-
-        manifest_content["config"]["digest"] = f"sha256:{new_image_config_digest}"
-        manifest_content["config"]["size"] = len(new_image_config_bytes)
-
-    new_manifest_bytes = json.dumps(manifest_content).encode("utf-8")
-    new_manifest_digest = hashlib.sha256(new_manifest_bytes).hexdigest()
-    new_manifest_path = blobs_path / new_manifest_digest
-    new_manifest_path.write_bytes(new_manifest_bytes)
-    manifest_path.unlink()
-
-    tl_index["manifests"][idx]["digest"] = f"sha256:{new_manifest_digest}"
-    tl_index["manifests"][idx]["size"] = len(new_manifest_bytes)
-    tl_index_path.write_bytes(json.dumps(tl_index).encode("utf-8"))
+    compression = compression or Compression()
+    cache = oci_layout.LayerCache(editor.layout)
+    cache_key = _layer_cache_key(layer_paths, compression, deduplicate=deduplicate)
+    layer = cache.get(cache_key)
+    if layer is not None:
+        emit.debug(f"Reusing unchanged layer {layer.digest}")
+    else:
+        duplicates = layers.find_duplicate_files(layer_paths) if deduplicate else {}
+        writer = oci_layout.LayerWriter(editor.layout, compression)
+        try:
+            layers.write_layer_paths(
+                layer_paths, cast(BinaryIO, writer), duplicates=duplicates
+            )
+        except BaseException:
+            writer.discard()
+            raise
+        layer = writer.close()
+        cache.put(cache_key, layer)
+
+    editor.add_layer(layer, created_by="rockcraft add-layer", comment=comment)
+    emit.debug(f"Added layer {layer.digest} ({layer.size} bytes)")
+
+
+def _layer_cache_key(
+    layer_paths: dict[str, layers.LayerEntry],
+    compression: Compression,
+    *,
+    deduplicate: bool = False,
+) -> str:
+    """Identify everything that the blob of a layer with ``layer_paths`` depends on."""
+    inputs = {
+        "paths": layers.fingerprint_layer_paths(layer_paths),
+        "codec": compression.codec,
+        "level": compression.get_level(),
+        "source-date-epoch": get_source_date_epoch(),
+        "deduplicate": deduplicate,
+    }
+    return hashlib.sha256(oci_layout.dump_json(inputs)).hexdigest()
 
 
 def _process_run(command: list[str], **kwargs: Any) -> subprocess.CompletedProcess[Any]:
@@ -0,0 +1,763 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright 2025 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""In-process manipulation of OCI image layouts.
+
+An OCI image layout is a directory containing an ``oci-layout`` marker file,
+an ``index.json`` listing the (tagged) manifests in the layout and a
+``blobs/sha256`` directory with every manifest, config and layer blob.
+"""
+
+import copy
+import hashlib
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+from dataclasses import asdict, dataclass
+from pathlib import Path, PurePosixPath
+from typing import Any, BinaryIO, cast
+
+from craft_cli import emit
+
+from rockcraft import compression, errors, layers, utils
+from rockcraft.pebble import Pebble
+
+INDEX_MEDIA_TYPE = "application/vnd.oci.image.index.v1+json"
+MANIFEST_MEDIA_TYPE = "application/vnd.oci.image.manifest.v1+json"
+CONFIG_MEDIA_TYPE = "application/vnd.oci.image.config.v1+json"
+
+REF_NAME_ANNOTATION = "org.opencontainers.image.ref.name"
+
+# The digest of the registry manifest (or manifest list) an image was pulled
+# from, recorded in the descriptor of its tag.
+SOURCE_DIGEST_ANNOTATION = "com.canonical.rockcraft.source.digest"
+
+OCI_LAYOUT_VERSION = "1.0.0"
+
+_COPY_BUFFER_SIZE = 1024 * 1024
+
+
+def split_image_path(image_path: Path) -> tuple[Path, str]:
+    """Split an image path in the ``<layout dir>:<tag>`` format.
+
+    :param image_path: The path to the image, as used by skopeo.
+    :returns: A tuple with the layout directory and the image's tag.
+    """
+    layout_dir, tag = str(image_path).split(":", maxsplit=1)
+    return Path(layout_dir), tag
+
+
+def dump_json(content: dict[str, Any]) -> bytes:
+    """Serialize ``content`` as the bytes of a JSON blob.
+
+    The JSON is canonical (sorted keys, no whitespace), so that the digest of
+    a blob only depends on its content.
+    """
+    return json.dumps(content, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+
+def utc_timestamp() -> str:
+    """Get the current time in the RFC 3339 format used by OCI configs.
+
+    With ``SOURCE_DATE_EPOCH`` set, that time is used instead of the current one.
+    """
+    return utils.utc_now().strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+class Layout:
+    """An OCI image layout directory.
+
+    :param path: The path to the layout directory.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+
+    @property
+    def blobs_dir(self) -> Path:
+        """The directory holding the layout's sha256 blobs."""
+        return self.path / "blobs" / "sha256"
+
+    @property
+    def index_path(self) -> Path:
+        """The path to the layout's top level index."""
+        return self.path / "index.json"
+
+    def init(self) -> None:
+        """Create an empty image layout in this layout's path."""
+        self.blobs_dir.mkdir(parents=True, exist_ok=True)
+        (self.path / "oci-layout").write_bytes(
+            dump_json({"imageLayoutVersion": OCI_LAYOUT_VERSION})
+        )
+        self.write_index({"schemaVersion": 2, "manifests": []})
+
+    def read_index(self) -> dict[str, Any]:
+        """Read the layout's top level index."""
+        index: dict[str, Any] = json.loads(self.index_path.read_bytes())
+        return index
+
+    def write_index(self, index: dict[str, Any]) -> None:
+        """Replace the layout's top level index with ``index``."""
+        self.index_path.write_bytes(dump_json(index))
+
+    def blob_path(self, digest: str) -> Path:
+        """Get the path of the blob with the given ``sha256:...`` digest."""
+        return self.blobs_dir / digest.rsplit(":", maxsplit=1)[-1]
+
+    def read_json_blob(self, digest: str) -> dict[str, Any]:
+        """Read and parse the JSON blob with the given digest."""
+        content: dict[str, Any] = json.loads(self.blob_path(digest).read_bytes())
+        return content
+
+    def write_json_blob(self, content: dict[str, Any]) -> tuple[str, int]:
+        """Write ``content`` as a new JSON blob.
+
+        :returns: A tuple with the new blob's digest and size.
+        """
+        data = dump_json(content)
+        digest = f"sha256:{hashlib.sha256(data).hexdigest()}"
+        self.blob_path(digest).write_bytes(data)
+        return digest, len(data)
+
+    def tagged_manifests(
+        self, index: dict[str, Any], tag: str
+    ) -> list[tuple[int, dict[str, Any]]]:
+        """Get the manifest descriptors in ``index`` that are tagged with ``tag``.
+
+        :returns: A list of tuples with the position of each descriptor in the
+            index and the descriptor itself.
+        """
+        return [
+            (i, manifest)
+            for i, manifest in enumerate(index["manifests"])
+            if (a := manifest.get("annotations")) and a.get(REF_NAME_ANNOTATION) == tag
+        ]
+
+    def find_manifest(
+        self, index: dict[str, Any], tag: str
+    ) -> tuple[int, dict[str, Any]]:
+        """Find the manifest descriptor in ``index`` that is tagged with ``tag``.
+
+        :returns: A tuple with the position of the descriptor in the index and
+            the descriptor itself.
+        :raises RockcraftError: If there isn't exactly one manifest with ``tag``.
+        """
+        matches = self.tagged_manifests(index, tag)
+        if not matches:
+            raise errors.RockcraftError(
+                f"Cannot find manifest for {tag} in {self.index_path}"
+            )
+        if len(matches) > 1:
+            raise errors.RockcraftError(
+                f"Found multiple manifests for {tag} in {self.index_path}"
+            )
+        return matches[0]
+
+    def tag_manifest(self, descriptor: dict[str, Any], tag: str) -> None:
+        """Point ``tag`` to the manifest ``descriptor`` in the layout's index.
+
+        If the tag pointed to another manifest, that manifest and its config
+        are removed when nothing else refers to them.
+
+        :param descriptor: The descriptor of a manifest in the layout. Its
+            annotations are replaced by the tag.
+        :param tag: The tag to add or move.
+        """
+        index = self.read_index()
+        descriptor = {**descriptor, "annotations": {REF_NAME_ANNOTATION: tag}}
+        replaced_digest: str | None = None
+        if self.tagged_manifests(index, tag):
+            idx, old_descriptor = self.find_manifest(index, tag)
+            replaced_digest = old_descriptor["digest"]
+            index["manifests"][idx] = {**old_descriptor, **descriptor}
+        else:
+            index["manifests"].append(descriptor)
+        self.write_index(index)
+
+        if replaced_digest is not None and replaced_digest != descriptor["digest"]:
+            self.remove_unreferenced_blobs(index, replaced_digest)
+
+    def copy_image(self, tag: str, dest: "Layout", dest_tag: str) -> None:
+        """Copy the image tagged with ``tag`` to the ``dest_tag`` tag of ``dest``.
+
+        No blob is written: within a layout, only the new tag is added to its
+        index, and the blobs are linked from other layouts when possible.
+
+        :param tag: The tag of the image to copy.
+        :param dest: The layout to copy the image to, created if needed.
+        :param dest_tag: The tag of the copy.
+        """
+        blobs = self.image_blobs(tag)
+        if not dest.index_path.exists():
+            dest.init()
+        if not dest.path.samefile(self.path):
+            for blob in blobs:
+                dest.link_blob(self, blob["digest"])
+        dest.tag_manifest(blobs[0], dest_tag)
+
+    def annotate_manifest(self, tag: str, annotations: dict[str, str]) -> None:
+        """Add ``annotations`` to the descriptor of the manifest tagged with ``tag``.
+
+        The annotations are kept in the layout's index, not in the manifest, so
+        the image's digest doesn't change.
+        """
+        index = self.read_index()
+        _, descriptor = self.find_manifest(index, tag)
+        descriptor.setdefault("annotations", {}).update(annotations)
+        self.write_index(index)
+
+    def remove_unreferenced_blobs(
+        self, index: dict[str, Any], manifest_digest: str
+    ) -> None:
+        """Remove a replaced manifest and its config if nothing else refers to them.
+
+        Layer blobs are kept: they are usually shared with the manifest that
+        replaced this one.
+        """
+        referenced = {manifest["digest"] for manifest in index["manifests"]}
+        if manifest_digest in referenced:
+            return
+        replaced = self.read_json_blob(manifest_digest)
+        self.blob_path(manifest_digest).unlink(missing_ok=True)
+        config_digest = replaced.get("config", {}).get("digest")
+        if config_digest is None:
+            # Image indexes only refer to manifests, which are kept too.
+            return
+
+        for manifest in index["manifests"]:
+            if any(
+                blob["digest"] == config_digest
+                for blob in self._referenced_blobs(manifest)
+            ):
+                return
+        self.blob_path(config_digest).unlink(missing_ok=True)
+
+    def image_blobs(self, tag: str) -> list[dict[str, Any]]:
+        """Get the descriptors of every blob of the image tagged with ``tag``.
+
+        :returns: The descriptors of the image's manifest, config and layers,
+            in that order. For image indexes, the index is followed by the
+            blobs of each of its images.
+        """
+        _, descriptor = self.find_manifest(self.read_index(), tag)
+        blobs = self._referenced_blobs(descriptor)
+        # Layers with the same contents, even in different images, are stored once.
+        return list({blob["digest"]: blob for blob in blobs}.values())
+
+    def _referenced_blobs(self, descriptor: dict[str, Any]) -> list[dict[str, Any]]:
+        content = self.read_json_blob(descriptor["digest"])
+        if descriptor.get("mediaType") == INDEX_MEDIA_TYPE:
+            blobs = [descriptor]
+            for manifest in content["manifests"]:
+                blobs.extend(self._referenced_blobs(manifest))
+            return blobs
+        return [descriptor, content["config"], *content.get("layers", [])]
+
+    def import_archive(self, archive_path: Path) -> list[dict[str, Any]]:
+        """Add the blobs of an OCI archive to this layout.
+
+        Blobs that are already in the layout are skipped, and the digest of
+        the others is checked as they are copied. Several archives can be
+        imported at the same time.
+
+        :param archive_path: The OCI archive, like a ``.rock`` file.
+        :returns: The descriptors of the manifests in the archive's index.
+        :raises RockcraftError: If a blob doesn't match its digest.
+        """
+        index: dict[str, Any] | None = None
+        with tarfile.open(archive_path) as archive:
+            for member in archive:
+                name = PurePosixPath(member.name)
+                if not member.isfile():
+                    continue
+                if name == PurePosixPath("index.json"):
+                    index = json.load(cast(BinaryIO, archive.extractfile(member)))
+                    continue
+                if name.parent != PurePosixPath("blobs/sha256"):
+                    continue
+                digest = f"sha256:{name.name}"
+                if not self.blob_path(digest).exists():
+                    self._write_blob(
+                        digest, cast(BinaryIO, archive.extractfile(member))
+                    )
+        if index is None:
+            raise errors.RockcraftError(f"{archive_path} is not an OCI archive")
+        return list(index["manifests"])
+
+    def _write_blob(self, digest: str, stream: BinaryIO) -> None:
+        """Copy a blob from ``stream``, checking that it matches ``digest``."""
+        hasher = hashlib.sha256()
+        with tempfile.NamedTemporaryFile(
+            dir=self.blobs_dir, prefix=".blob-", delete=False
+        ) as temp_file:
+            while data := stream.read(_COPY_BUFFER_SIZE):
+                hasher.update(data)
+                temp_file.write(data)
+        temp_path = Path(temp_file.name)
+        if f"sha256:{hasher.hexdigest()}" != digest:
+            temp_path.unlink()
+            raise errors.RockcraftError(f"Blob {digest} doesn't match its digest")
+        temp_path.chmod(0o644)
+        temp_path.replace(self.blob_path(digest))
+
+    def write_image_index(self, manifests: list[dict[str, Any]], tag: str) -> None:
+        """Tag a new image index of the images with the ``manifests`` descriptors.
+
+        Each image is listed with the platform of its config, so that clients
+        pick the image of their own platform.
+
+        :param manifests: The descriptors of the images' manifests, which must
+            be in the layout.
+        :param tag: The tag of the image index.
+        :raises RockcraftError: If several images are for the same platform.
+        """
+        entries: list[dict[str, Any]] = []
+        platforms: set[str] = set()
+        for descriptor in manifests:
+            manifest = self.read_json_blob(descriptor["digest"])
+            config = self.read_json_blob(manifest["config"]["digest"])
+            platform = {"architecture": config["architecture"], "os": config["os"]}
+            name = f"{config['os']}/{config['architecture']}"
+            if "variant" in config:
+                platform["variant"] = config["variant"]
+                name += f"/{config['variant']}"
+            if name in platforms:
+                raise errors.RockcraftError(f"Found several images for {name}")
+            platforms.add(name)
+            entries.append(
+                {
+                    "mediaType": descriptor.get("mediaType", MANIFEST_MEDIA_TYPE),
+                    "digest": descriptor["digest"],
+                    "size": descriptor["size"],
+                    "platform": platform,
+                }
+            )
+
+        digest, size = self.write_json_blob(
+            {"schemaVersion": 2, "mediaType": INDEX_MEDIA_TYPE, "manifests": entries}
+        )
+        self.tag_manifest(
+            {"mediaType": INDEX_MEDIA_TYPE, "digest": digest, "size": size}, tag
+        )
+
+    def link_blob(self, source: "Layout", digest: str) -> None:
+        """Add the blob with ``digest`` from the ``source`` layout to this one.
+
+        Blobs are never modified in place, so the blob is hardlinked when both
+        layouts are in the same filesystem, and only copied otherwise.
+        """
+        dest_path = self.blob_path(digest)
+        if dest_path.exists():
+            return
+        source_path = source.blob_path(digest)
+        try:
+            os.link(source_path, dest_path)
+        except OSError as err:
+            emit.debug(f"Copying blob {digest} instead of linking it: {err}")
+            shutil.copyfile(source_path, dest_path)
+
+    def write_archive(self, tag: str, stream: BinaryIO) -> None:
+        """Write the image tagged with ``tag`` to ``stream`` as an OCI archive.
+
+        The archive is a tarball of an image layout with only this image, as
+        written by ``skopeo copy oci-archive:...``. Its blobs are streamed as
+        they are from this layout: layers are not recompressed, and nothing is
+        written to disk besides the archive itself.
+
+        :param tag: The tag of the image to archive, which it keeps in the archive.
+        :param stream: The binary stream receiving the archive, like a file or
+            a pipe to ``podman load``.
+        """
+        blobs = self.image_blobs(tag)
+        index = {"schemaVersion": 2, "manifests": [blobs[0]]}
+        mtime = int(utils.utc_now().timestamp())
+
+        tar_writer = layers.TarWriter(stream)
+        tar_writer.add_data(
+            _archive_info("oci-layout", mtime),
+            dump_json({"imageLayoutVersion": OCI_LAYOUT_VERSION}),
+        )
+        tar_writer.add_data(_archive_info("index.json", mtime), dump_json(index))
+        tar_writer.add(_archive_info("blobs", mtime, directory=True))
+        tar_writer.add(_archive_info("blobs/sha256", mtime, directory=True))
+        for blob in blobs:
+            blob_path = self.blob_path(blob["digest"])
+            tarinfo = _archive_info(f"blobs/sha256/{blob_path.name}", mtime)
+            tarinfo.size = blob_path.stat().st_size
+            if tarinfo.size != blob["size"]:
+                raise errors.RockcraftError(
+                    f"Blob {blob['digest']} in {self.path} has an unexpected size"
+                )
+            tar_writer.add(tarinfo, str(blob_path))
+        tar_writer.close()
+        stream.flush()
+
+    def export(self, tag: str, dest: Path) -> None:
+        """Write the image tagged with ``tag`` to a new image layout in ``dest``.
+
+        The new layout only has this image, under the same tag, and its blobs
+        are linked from this layout when possible. Anything that was in
+        ``dest`` is removed.
+        """
+        blobs = self.image_blobs(tag)
+        shutil.rmtree(dest, ignore_errors=True)
+        dest_layout = Layout(dest)
+        dest_layout.init()
+        for blob in blobs:
+            dest_layout.link_blob(self, blob["digest"])
+        dest_layout.write_index({"schemaVersion": 2, "manifests": [blobs[0]]})
+
+
+@dataclass(frozen=True)
+class LayerBlob:
+    """A compressed layer that was written to a layout's blob store.
+
+    :param digest: The digest of the compressed blob.
+    :param size: The size of the compressed blob, in bytes.
+    :param diff_id: The digest of the uncompressed tarball.
+    :param media_type: The media type of the blob.
+    """
+
+    digest: str
+    size: int
+    diff_id: str
+    media_type: str
+
+    @property
+    def descriptor(self) -> dict[str, Any]:
+        """The descriptor referencing this blob from a manifest."""
+        return {"mediaType": self.media_type, "digest": self.digest, "size": self.size}
+
+
+class LayerCache:
+    """An index of the layers written to a layout, keyed by their inputs.
+
+    Layers are only archived and compressed again when their inputs change:
+    the blobs of unchanged layers, which stay in the layout's blob store, are
+    reused instead. Only the most recently used layers are indexed.
+
+    :param layout: The layout whose layer blobs are indexed.
+    :param max_entries: The maximum number of layers in the index.
+    """
+
+    FILE_NAME = "rockcraft-layers.json"
+
+    def __init__(self, layout: Layout, max_entries: int = 64) -> None:
+        self.layout = layout
+        self.max_entries = max_entries
+        self._path = layout.path / self.FILE_NAME
+
+    def get(self, key: str) -> LayerBlob | None:
+        """Get the layer built from the inputs identified by ``key``, if any."""
+        entries = self._read()
+        entry = entries.get(key)
+        if entry is None:
+            return None
+        layer = LayerBlob(**entry)
+        try:
+            size = self.layout.blob_path(layer.digest).stat().st_size
+        except FileNotFoundError:
+            return None
+        if size != layer.size:
+            return None
+        if next(reversed(entries)) != key:
+            # Entries are kept from the least to the most recently used.
+            entries[key] = entries.pop(key)
+            self._write(entries)
+        return layer
+
+    def put(self, key: str, layer: LayerBlob) -> None:
+        """Record ``layer`` as built from the inputs identified by ``key``."""
+        entries = self._read()
+        entries.pop(key, None)
+        entries[key] = asdict(layer)
+        while len(entries) > self.max_entries:
+            del entries[next(iter(entries))]
+        self._write(entries)
+
+    def _read(self) -> dict[str, dict[str, Any]]:
+        try:
+            entries: dict[str, dict[str, Any]] = json.loads(self._path.read_text())
+        except (OSError, ValueError):
+            return {}
+        return entries
+
+    def _write(self, entries: dict[str, dict[str, Any]]) -> None:
+        temp_path = self._path.with_suffix(".tmp")
+        temp_path.write_text(json.dumps(entries, indent=2))
+        temp_path.replace(self._path)
+
+
+class LayerWriter:
+    """A binary stream that writes a layer tarball into a layout's blob store.
+
+    The uncompressed data is hashed (for the layer's diffID) and compressed as
+    it is written; the compressed data is hashed and written to a temporary
+    file in the blobs directory, which is renamed to its digest when the
+    writer is closed. The uncompressed tarball is never stored anywhere.
+
+    Call ``close()`` to finish the blob once the whole tarball was written, or
+    ``discard()`` to abandon it.
+
+    :param layout: The layout to write the layer blob into.
+    :param layer_compression: The settings for compressing the layer.
+    """
+
+    def __init__(
+        self,
+        layout: Layout,
+        layer_compression: compression.Compression | None = None,
+    ) -> None:
+        self.layout = layout
+        self._compression = layer_compression or compression.Compression()
+        self._diff_id = hashlib.sha256()
+        self._digest = hashlib.sha256()
+        self._size = 0
+        self._compressor = compression.new_compressor(self._compression)
+        self._temp_file = tempfile.NamedTemporaryFile(  # noqa: SIM115
+            dir=layout.blobs_dir, prefix=".layer-", delete=False
+        )
+
+    def write(self, data: bytes) -> int:
+        """Add uncompressed tarball data to the layer."""
+        self._diff_id.update(data)
+        self._write_compressed(self._compressor.compress(data))
+        return len(data)
+
+    def _write_compressed(self, data: bytes) -> None:
+        if data:
+            self._digest.update(data)
+            self._size += len(data)
+            self._temp_file.write(data)
+
+    def close(self) -> LayerBlob:
+        """Finish the compressed blob and move it to its final location.
+
+        :returns: The written layer blob.
+        """
+        self._write_compressed(self._compressor.flush())
+        self._compressor.close()
+        self._temp_file.close()
+        digest = f"sha256:{self._digest.hexdigest()}"
+        temp_path = Path(self._temp_file.name)
+        temp_path.chmod(0o644)
+        temp_path.replace(self.layout.blob_path(digest))
+        return LayerBlob(
+            digest=digest,
+            size=self._size,
+            diff_id=f"sha256:{self._diff_id.hexdigest()}",
+            media_type=self._compression.media_type,
+        )
+
+    def discard(self) -> None:
+        """Abandon the layer, removing its partially written blob."""
+        self._compressor.close()
+        self._temp_file.close()
+        Path(self._temp_file.name).unlink(missing_ok=True)
+
+
+class ImageEditor:
+    """A transaction that edits an image's config and manifest.
+
+    Changes are collected in memory and only written to the layout when
+    ``commit()`` is called: one new config blob, one new manifest blob and
+    a single rewrite of the layout's ``index.json``. New layers are streamed
+    into the blob store with a ``LayerWriter`` beforehand, and only become
+    part of the image on commit.
+
+    :param image_path: The path to the image, in the ``<layout dir>:<tag>`` format.
+    :param create: Whether to start from a new, empty image instead of an existing
+        one. The layout directory is initialized if needed, and the image itself
+        is only added to it when the transaction is committed.
+    """
+
+    def __init__(self, image_path: Path, *, create: bool = False) -> None:
+        layout_dir, self.tag = split_image_path(image_path)
+        self.layout = Layout(layout_dir)
+
+        if create:
+            if not self.layout.index_path.exists():
+                self.layout.init()
+            self.config: dict[str, Any] = {
+                "created": utc_timestamp(),
+                "architecture": "",
+                "os": "linux",
+                "config": {},
+                "rootfs": {"type": "layers", "diff_ids": []},
+            }
+            self.manifest: dict[str, Any] = {
+                "schemaVersion": 2,
+                "mediaType": MANIFEST_MEDIA_TYPE,
+                "config": {"mediaType": CONFIG_MEDIA_TYPE, "digest": "", "size": 0},
+                "layers": [],
+            }
+            return
+
+        index = self.layout.read_index()
+        _, descriptor = self.layout.find_manifest(index, self.tag)
+        self.manifest = self.layout.read_json_blob(descriptor["digest"])
+        self.config = self.layout.read_json_blob(self.manifest["config"]["digest"])
+
+    @property
+    def _image_config(self) -> dict[str, Any]:
+        """The runtime configuration ("config" key) of the image config."""
+        image_config: dict[str, Any] = self.config.setdefault("config", {})
+        return image_config
+
+    def set_architecture(self, arch: str, variant: str | None = None) -> None:
+        """Set the image's architecture and, optionally, its variant.
+
+        :param arch: The architecture, in GOARCH format.
+        :param variant: The architecture variant, if any.
+        """
+        self.config["architecture"] = arch
+        if variant:
+            self.config["variant"] = variant
+        else:
+            self.config.pop("variant", None)
+
+    def set_default_user(self, userid: int, username: str) -> None:
+        """Set the default runtime user for the OCI image.
+
+        :param userid: userid of the default user (must already exist)
+        :param username: username of the default user (must already exist)
+        """
+        self._image_config["User"] = str(userid)
+        emit.progress(f"Default user set to {userid} ({username})")
+
+    def set_entrypoint(self, entrypoint: list[str]) -> None:
+        """Set the OCI image entrypoint, clearing the CMD."""
+        emit.progress("Configuring entrypoint...")
+        self._image_config["Entrypoint"] = list(entrypoint)
+        self._image_config.pop("Cmd", None)
+        emit.progress(f"Entrypoint set to {entrypoint}")
+
+    def set_cmd(self, command: list[str]) -> None:
+        """Set the OCI image CMD."""
+        emit.progress("Configuring CMD...")
+        self._image_config["Cmd"] = list(command)
+        emit.progress(f"CMD set to {command}")
+
+    def set_env(self, name: str, value: str) -> None:
+        """Set a single environment variable, replacing any previous value."""
+        env_item = f"{name}={value}"
+        env: list[str] = self._image_config.setdefault("Env", [])
+        for i, existing in enumerate(env):
+            if existing.split("=", 1)[0] == name:
+                env[i] = env_item
+                return
+        env.append(env_item)
+
+    def set_default_path(self, base: str) -> None:
+        """Set the default PATH on the image (only for bare rocks)."""
+        if base != "bare":
+            emit.debug(f"Not setting a PATH on the image as base is {base!r}")
+            return
+
+        # Follow Pebble's lead here: if PATH is empty, use the standard one.
+        # This means that containers that bypass the pebble entrypoint will
+        # have the same behavior as PATH-less pebble services.
+        pebble_path = Pebble.DEFAULT_ENV_PATH
+
+        emit.debug(f"Setting bare-based rock PATH to {pebble_path!r}")
+        self.set_env("PATH", pebble_path)
+
+    def set_environment(self, env: dict[str, str]) -> None:
+        """Set the OCI image environment.
+
+        :param env: A dictionary mapping environment variables to
+            their values.
+        """
+        emit.progress("Configuring OCI environment...")
+        env_list: list[str] = []
+        for name, value in env.items():
+            self.set_env(name, value)
+            env_list.append(f"{name}={value}")
+        emit.progress(f"Environment set to {env_list}")
+
+    def set_annotations(self, annotations: dict[str, Any]) -> None:
+        """Set the image's labels and, as a copy, its manifest annotations.
+
+        :param annotations: A dictionary with each annotation/label and its value
+        """
+        emit.progress("Configuring labels and annotations...")
+        labels = {key: str(value) for key, value in annotations.items()}
+        self._image_config["Labels"] = labels
+        # The annotations are a copy of the labels (for OCI compliance only)
+        self.manifest["annotations"] = dict(labels)
+        labels_list = [f"{key}={value}" for key, value in labels.items()]
+        emit.progress(f"Labels and annotations set to {labels_list}")
+
+    def add_layer(
+        self, layer: LayerBlob, *, created_by: str, comment: str | None = None
+    ) -> None:
+        """Append a layer, previously written to the layout, to the image.
+
+        :param layer: The layer blob to add.
+        :param created_by: The description of the layer in the image's history.
+        :param comment: An optional comment on the layer in the image's history.
+        """
+        self.manifest.setdefault("layers", []).append(layer.descriptor)
+        rootfs = self.config.setdefault("rootfs", {"type": "layers"})
+        rootfs.setdefault("diff_ids", []).append(layer.diff_id)
+        history: dict[str, str] = {"created": utc_timestamp(), "created_by": created_by}
+        if comment:
+            history["comment"] = comment
+        self.config.setdefault("history", []).append(history)
+
+    def commit(self, tag: str | None = None) -> None:
+        """Write the edited config, manifest and index to the layout.
+
+        :param tag: The tag to write the edited image to. Defaults to the tag of
+            the image being edited, which is then replaced; with a different tag
+            the original image is left untouched and the other tag is created
+            (or replaced).
+        """
+        tag = tag or self.tag
+        self.config["created"] = utc_timestamp()
+        config_digest, config_size = self.layout.write_json_blob(self.config)
+
+        manifest = copy.deepcopy(self.manifest)
+        manifest.setdefault("mediaType", MANIFEST_MEDIA_TYPE)
+        manifest["config"]["digest"] = config_digest
+        manifest["config"]["size"] = config_size
+        manifest_digest, manifest_size = self.layout.write_json_blob(manifest)
+
+        self.layout.tag_manifest(
+            {
+                "mediaType": MANIFEST_MEDIA_TYPE,
+                "digest": manifest_digest,
+                "size": manifest_size,
+            },
+            tag,
+        )
+
+        self.tag = tag
+        self.manifest = manifest
+
+
+def _archive_info(name: str, mtime: int, *, directory: bool = False) -> tarfile.TarInfo:
+    """Get the header of a member of an OCI archive, owned by root."""
+    tarinfo = tarfile.TarInfo(name)
+    tarinfo.mtime = mtime
+    if directory:
+        tarinfo.type = tarfile.DIRTYPE
+        tarinfo.mode = 0o755
+    else:
+        tarinfo.mode = 0o644
+    return tarinfo
@@ -0,0 +1,205 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright 2025 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""User-level cache of the outputs of helper parts, shared by every project."""
+
+import hashlib
+import json
+import shutil
+import subprocess
+import tempfile
+from pathlib import Path, PurePosixPath
+from typing import Any
+
+from craft_cli import emit
+from craft_parts.errors import PartsError
+from craft_parts.packages.snaps import SnapPackage
+
+from rockcraft.extensions.gunicorn import STATSD_EXPORTER_PART_SPEC
+from rockcraft.pebble import Pebble
+
+# The name of the part cache in the application's cache directory.
+PART_CACHE_DIR = "part-outputs"
+
+# Where the host's part cache is mounted in managed instances, matching the
+# cache directory of the root user that runs Rockcraft in them.
+MANAGED_PART_CACHE_DIR = PurePosixPath("/root/.cache/rockcraft") / PART_CACHE_DIR
+
+# The parts that Rockcraft adds to projects, which are built the same way in
+# every project.
+HELPER_PART_SPECS: tuple[dict[str, Any], ...] = (
+    STATSD_EXPORTER_PART_SPEC,
+    Pebble.PEBBLE_PART_SPEC,
+    Pebble.PEBBLE_PART_SPEC_2404,
+    Pebble.PEBBLE_PART_SPEC_2204_2004,
+)
+
+# The keys of a part that still apply to its cached output.
+_RESTORED_KEYS = (
+    "after",
+    "stage",
+    "prime",
+    "override-stage",
+    "override-prime",
+    "permissions",
+)
+
+# How long resolving the revision of a source can take, in seconds.
+_RESOLVE_TIMEOUT = 30
+
+
+class PartCache:
+    """A cache of the install directories of built parts.
+
+    Each entry is keyed by everything the part is built from: its spec, the
+    revisions that its source, build snaps and stage snaps resolve to, the
+    build base and the architecture. Parts whose sources or build dependencies
+    can't be pinned to a revision are not cached. Entries are written once,
+    and never modified.
+
+    :param path: The directory holding the cache.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+
+    def get_key(
+        self, spec: dict[str, Any], *, build_base: str, arch: str
+    ) -> str | None:
+        """Get the key of the output of the part defined by ``spec``.
+
+        :returns: The key, or None if the part's sources couldn't be resolved.
+        """
+        try:
+            revisions = _resolve_revisions(spec)
+        except (
+            OSError,
+            KeyError,
+            TypeError,
+            subprocess.SubprocessError,
+            PartsError,
+        ) as err:
+            emit.debug(f"Not caching part: could not resolve its sources: {err}")
+            return None
+        if revisions is None:
+            return None
+
+        inputs = {
+            "spec": spec,
+            "revisions": revisions,
+            "build-base": build_base,
+            "arch": arch,
+        }
+        return hashlib.sha256(
+            json.dumps(inputs, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+
+    def get(self, key: str) -> Path | None:
+        """Get the cached install directory of a part, if there is one."""
+        install_dir = self.path / key / "install"
+        return install_dir if install_dir.is_dir() else None
+
+    def store(self, key: str, install_dir: Path) -> None:
+        """Add the install directory of a built part to the cache."""
+        if (self.path / key).exists():
+            return
+        self.path.mkdir(parents=True, exist_ok=True)
+        temp_dir = Path(tempfile.mkdtemp(dir=self.path, prefix=f".{key}-"))
+        try:
+            shutil.copytree(install_dir, temp_dir / "install", symlinks=True)
+            temp_dir.rename(self.path / key)
+            emit.debug(f"Cached the output of {install_dir.parent.name} as {key}")
+        except OSError as err:
+            # The entry may have been added by another build in the meantime.
+            emit.debug(f"Could not cache the output of {install_dir}: {err}")
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def is_helper_part(spec: dict[str, Any]) -> bool:
+    """Whether ``spec`` is one of the helper parts that Rockcraft adds to projects."""
+    return spec in HELPER_PART_SPECS
+
+
+def get_restored_spec(spec: dict[str, Any], install_dir: Path) -> dict[str, Any]:
+    """Get a part that installs the cached output of the part defined by ``spec``.
+
+    The output of parts is cached once it's organized, so only the keys that
+    apply to the following steps are kept.
+    """
+    return {
+        "plugin": "dump",
+        "source": str(install_dir),
+        "source-type": "local",
+        **{key: spec[key] for key in _RESTORED_KEYS if key in spec},
+    }
+
+
+def _resolve_revisions(spec: dict[str, Any]) -> list[str] | None:
+    """Get the revisions that the sources and snaps of a part resolve to.
+
+    :returns: The revisions, or None if the part's source or its build
+        dependencies aren't pinned.
+    """
+    if spec.get("build-packages"):
+        # Their versions depend on the package lists of the build environment,
+        # which are only updated when the part is built.
+        emit.debug("Not caching part: its build packages can't be pinned")
+        return None
+
+    revisions: list[str] = []
+    source = spec.get("source")
+    if source is not None:
+        source_type = spec.get("source-type", "git" if source.endswith(".git") else "")
+        if source_type != "git":
+            return None
+        if "source-commit" in spec:
+            revisions.append(spec["source-commit"])
+        elif "source-tag" in spec:
+            revisions.append(_resolve_git_tag(source, spec["source-tag"]))
+        else:
+            return None
+
+    for key in ("build-snaps", "stage-snaps"):
+        for snap in spec.get(key, []):
+            package = SnapPackage(snap)
+            snap_info = package.get_store_snap_info()
+            if snap_info is None:
+                return None
+            revision = snap_info["channels"][package.channel]["revision"]
+            revisions.append(f"{key}:{package.name}={revision}")
+
+    return revisions
+
+
+def _resolve_git_tag(repository: str, tag: str) -> str:
+    """Get the commit that a tag of a remote git repository points to."""
+    output = subprocess.run(
+        ["git", "ls-remote", repository, f"refs/tags/{tag}", f"refs/tags/{tag}^{{}}"],
+        capture_output=True,
+        check=True,
+        text=True,
+        timeout=_RESOLVE_TIMEOUT,
+    ).stdout
+    commits: dict[str, str] = {}
+    for line in output.splitlines():
+        sha, _, ref = line.partition("\t")
+        commits[ref] = sha
+    # Annotated tags point to a tag object, and their peeled ref to the commit.
+    commit = commits.get(f"refs/tags/{tag}^{{}}") or commits.get(f"refs/tags/{tag}")
+    if commit is None:
+        raise KeyError(f"tag {tag!r} not found in {repository}")
+    return commit
@@ -17,6 +17,7 @@
 """Pebble metadata and configuration helpers."""
 
 import enum
+import fnmatch
 from collections.abc import Mapping
 from pathlib import Path
 from typing import Annotated, Any, Literal
@@ -28,6 +29,8 @@ from craft_application.errors import CraftValidationError
 from craft_application.models import CraftBaseModel
 from craft_cli import emit
 
+from rockcraft.rootfs_index import RootfsIndex
+
 
 class SuccessExitState(enum.Enum):
     """What to do on exit success."""
@@ -412,14 +415,14 @@ class Pebble:
         """
         # NOTE: the layer's filename prefix will always be "001-" when using
         # "bare" and "ubuntu" bases
-        pebble_layers_path_in_base = ref_fs / self.PEBBLE_LAYERS_PATH
-
-        existing_pebble_layers: list[Path] = [
-            *pebble_layers_path_in_base.glob("[0-9][0-9][0-9]-???*.yaml"),
-            *pebble_layers_path_in_base.glob("[0-9][0-9][0-9]-???*.yml"),
+        existing_pebble_layers = [
+            name
+            for name in _list_dir(ref_fs, self.PEBBLE_LAYERS_PATH)
+            if fnmatch.fnmatchcase(name, "[0-9][0-9][0-9]-???*.yaml")
+            or fnmatch.fnmatchcase(name, "[0-9][0-9][0-9]-???*.yml")
         ]
 
-        prefixes = [Path(layer).name[:3] for layer in existing_pebble_layers]
+        prefixes = [name[:3] for name in existing_pebble_layers]
         prefixes.sort()
         emit.progress(
             f"Found {len(existing_pebble_layers)} Pebble layers in the base's root filesystem"
@@ -508,3 +511,12 @@ def add_pebble_part(project: dict[str, Any]) -> None:
         raise CraftValidationError('Cannot change the default "pebble" part')
 
     parts["pebble"] = pebble_part
+
+
+def _list_dir(ref_fs: Path, path: str) -> list[str]:
+    """Get the names in the directory ``path`` of ``ref_fs``, from its index if any."""
+    index = RootfsIndex.for_rootfs(ref_fs)
+    if index is not None:
+        return index.list_dir(path)
+    directory = ref_fs / path
+    return sorted(p.name for p in directory.iterdir()) if directory.is_dir() else []
@@ -0,0 +1,202 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright 2025 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Cache of extracted base image root filesystems."""
+
+import hashlib
+import json
+import os
+import shutil
+import stat
+from pathlib import Path
+from typing import Any
+
+from craft_cli import emit
+
+from rockcraft import oci
+from rockcraft.rootfs_index import INDEX_FILE, RootfsIndex
+
+# The file recording what a cached bundle holds, and the fingerprint of its rootfs.
+_METADATA_FILE = "rockcraft-rootfs.json"
+
+# The permissions of the top-level directory of the cached bundles, which keep
+# their rootfs, index and metadata from being replaced.
+_READ_ONLY_MODE = 0o555
+
+# The files of the base that index-only bundles extract, along with pkgconfig files.
+_READ_FILES = frozenset({"etc/passwd", "etc/group", "etc/shadow"})
+
+
+class RootfsCache:
+    """A cache of base images unpacked to OCI runtime bundles.
+
+    Each bundle is keyed by the digest of the image's manifest and by the
+    unpacking mode (rootful or rootless), so that an image is only unpacked
+    again when it changes. The rootfs keeps the permissions of the image, so
+    it can still be written to: a fingerprint of its metadata is checked every
+    time the bundle is reused, and a bundle whose rootfs was modified is
+    unpacked again. Each bundle also holds a ``RootfsIndex`` of its rootfs.
+
+    Images can also be indexed without unpacking them, into bundles where the
+    rootfs only has the few files that are read when packing a rock.
+
+    :param bundle_dir: The directory holding the bundles.
+    """
+
+    def __init__(self, bundle_dir: Path) -> None:
+        self.bundle_dir = bundle_dir
+
+    def get_rootfs(
+        self, image: oci.Image, *, rootless: bool = False, index_only: bool = False
+    ) -> Path:
+        """Get the extracted root filesystem of ``image``, unpacking it if needed.
+
+        :param image: The image to extract.
+        :param rootless: Whether the image should be unpacked without root
+            privileges.
+        :param index_only: Whether only the index of the rootfs, and the files
+            that are read when packing a rock, are needed. An unpacked rootfs
+            is still returned if there is one.
+
+        :returns: The path to the image's rootfs, which must not be modified.
+        """
+        digest = image.manifest_digest()
+        mode = "rootless" if rootless else "rootful"
+        unpacked_path = self.bundle_dir / _bundle_name(digest, mode)
+        if index_only and _is_valid(unpacked_path):
+            emit.debug(f"Reusing extracted {image.image_name} ({digest})")
+            return unpacked_path / "rootfs"
+
+        kind = f"{mode}-index" if index_only else mode
+        bundle_path = self.bundle_dir / _bundle_name(digest, kind)
+        if _read_metadata(bundle_path) is not None:
+            if _is_valid(bundle_path):
+                emit.debug(f"Reusing extracted {image.image_name} ({digest})")
+                return bundle_path / "rootfs"
+            emit.progress(
+                f"Extracted {image.image_name} was modified, extracting it again",
+                permanent=True,
+            )
+
+        temp_path = self.bundle_dir / f".{bundle_path.name}.tmp"
+        _remove_bundle(temp_path)
+        if index_only:
+            new_path = image.index_to(
+                temp_path, extract=_is_read_when_packing, rootless=rootless
+            ).parent
+        else:
+            new_path = image.extract_to(temp_path, rootless=rootless).parent
+            _write_index(new_path)
+        _write_metadata(
+            new_path,
+            {
+                "digest": digest,
+                "mode": kind,
+                "fingerprint": fingerprint(new_path / "rootfs"),
+            },
+        )
+
+        _remove_bundle(bundle_path)
+        new_path.rename(bundle_path)
+        bundle_path.chmod(_READ_ONLY_MODE)
+        _remove_bundle(temp_path)
+
+        # Only the bundle of the current image is kept for each kind.
+        for stale_path in self.bundle_dir.glob(f"*-{kind}"):
+            if stale_path != bundle_path and _read_metadata(stale_path) is not None:
+                emit.debug(f"Removing stale extracted base {stale_path.name}")
+                _remove_bundle(stale_path)
+
+        return bundle_path / "rootfs"
+
+
+def fingerprint(rootfs: Path) -> str:
+    """Get a digest of the metadata of every entry in ``rootfs``.
+
+    Any change to the tree, like adding, removing or writing to a file or
+    changing its ownership or permissions, changes the fingerprint.
+    """
+    entries: list[str] = []
+    for dirpath, dirnames, filenames in os.walk(rootfs):
+        for name in (*dirnames, *filenames):
+            path = Path(dirpath, name)
+            info = path.lstat()
+            target = path.readlink() if stat.S_ISLNK(info.st_mode) else ""
+            entries.append(
+                f"{path.relative_to(rootfs)}\0{info.st_mode}\0{info.st_uid}\0"
+                f"{info.st_gid}\0{info.st_size}\0{info.st_mtime_ns}\0{target}"
+            )
+
+    hasher = hashlib.sha256()
+    for entry in sorted(entries):
+        hasher.update(entry.encode("utf-8", "surrogateescape") + b"\n")
+    return hasher.hexdigest()
+
+
+def _bundle_name(digest: str, kind: str) -> str:
+    return f"{digest.replace(':', '-')}-{kind}"
+
+
+def _is_valid(bundle_path: Path) -> bool:
+    """Whether ``bundle_path`` is a cached bundle whose rootfs wasn't modified."""
+    metadata = _read_metadata(bundle_path)
+    if metadata is None or not (bundle_path / INDEX_FILE).exists():
+        return False
+    return bool(metadata.get("fingerprint") == fingerprint(bundle_path / "rootfs"))
+
+
+def _is_read_when_packing(path: str) -> bool:
+    """Whether the file ``path`` of a base is read, not only looked up, when packing.
+
+    The user database is read to add the rock's users to it, and the prefix of
+    pkgconfig files is ignored when pruning the primed files.
+    """
+    return path in _READ_FILES or path.endswith(".pc")
+
+
+def _read_metadata(bundle_path: Path) -> dict[str, Any] | None:
+    try:
+        metadata: dict[str, Any] = json.loads(
+            (bundle_path / _METADATA_FILE).read_text()
+        )
+    except (OSError, ValueError):
+        return None
+    return metadata
+
+
+def _write_metadata(bundle_path: Path, metadata: dict[str, Any]) -> None:
+    (bundle_path / _METADATA_FILE).write_text(json.dumps(metadata, indent=2))
+
+
+def _write_index(bundle_path: Path) -> None:
+    index = RootfsIndex.build(bundle_path / "rootfs")
+    index.write(bundle_path / INDEX_FILE)
+    emit.debug(f"Indexed {len(index)} paths of {bundle_path.name}")
+
+
+def _remove_bundle(bundle_path: Path) -> None:
+    """Remove a bundle, including read-only ones."""
+    if not bundle_path.exists():
+        return
+    # Rootless bundles and the cached bundles have directories that can't
+    # be written to, which would keep their contents from being removed.
+    bundle_path.chmod(0o755)
+    for dirpath, dirnames, _ in os.walk(bundle_path):
+        for name in dirnames:
+            path = Path(dirpath, name)
+            if not path.is_symlink():
+                path.chmod(path.lstat().st_mode | stat.S_IRWXU)
+    shutil.rmtree(bundle_path)
@@ -0,0 +1,454 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright 2025 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Metadata index of the root filesystems of base images."""
+
+import collections
+import contextlib
+import dataclasses
+import functools
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import stat
+import tarfile
+from collections.abc import Callable, Iterable
+from pathlib import Path
+from typing import Any, BinaryIO
+
+from craft_cli import emit
+
+from rockcraft.layer_walker import MAX_SYMLINKS, LayerWalker, relative_parts
+
+# The name of the index, stored in a bundle next to its rootfs.
+INDEX_FILE = "rockcraft-rootfs-index.json.gz"
+
+# The version of the index format, bumped on incompatible changes.
+_VERSION = 1
+
+# The key of the rootfs itself in the index.
+_ROOT = "."
+
+_READ_BUFFER_SIZE = 1024 * 1024
+
+# The file types of the tarball members, as in ``st_mode``.
+_MEMBER_TYPES = {
+    tarfile.REGTYPE: stat.S_IFREG,
+    tarfile.AREGTYPE: stat.S_IFREG,
+    tarfile.CONTTYPE: stat.S_IFREG,
+    tarfile.SYMTYPE: stat.S_IFLNK,
+    tarfile.DIRTYPE: stat.S_IFDIR,
+    tarfile.CHRTYPE: stat.S_IFCHR,
+    tarfile.BLKTYPE: stat.S_IFBLK,
+    tarfile.FIFOTYPE: stat.S_IFIFO,
+}
+
+
+@dataclasses.dataclass(frozen=True)
+class IndexEntry:
+    """The metadata of a path in a root filesystem.
+
+    :param mode: The path's ``st_mode``, with its type and permissions.
+    :param uid: The path's owner.
+    :param gid: The path's group.
+    :param size: The path's size.
+    :param target: The target of a symlink.
+    :param digest: The sha256 of the contents of a regular file, or an empty
+        string if they couldn't be read.
+    """
+
+    mode: int
+    uid: int
+    gid: int
+    size: int
+    target: str = ""
+    digest: str = ""
+
+    @classmethod
+    def from_stat(
+        cls, info: os.stat_result, *, target: str = "", digest: str = ""
+    ) -> "IndexEntry":
+        """Create an entry from the status of a path."""
+        return cls(
+            mode=info.st_mode,
+            uid=info.st_uid,
+            gid=info.st_gid,
+            size=info.st_size,
+            target=target,
+            digest=digest,
+        )
+
+    @property
+    def is_dir(self) -> bool:
+        """Whether the entry is a directory."""
+        return stat.S_ISDIR(self.mode)
+
+    @property
+    def is_file(self) -> bool:
+        """Whether the entry is a regular file."""
+        return stat.S_ISREG(self.mode)
+
+    @property
+    def is_symlink(self) -> bool:
+        """Whether the entry is a symbolic link."""
+        return stat.S_ISLNK(self.mode)
+
+
+class RootfsIndex:
+    """The metadata of every path in the root filesystem of a base image.
+
+    The index is built once, when the base is extracted, and stored next to
+    its rootfs. Looking a path up in it replaces the system calls (and, for
+    the contents of regular files, the reads) on the rootfs itself. Symlinks
+    are resolved within the rootfs, as they would be in a container.
+
+    :param entries: The entries of the rootfs, keyed by their path relative
+        to it.
+    """
+
+    def __init__(self, entries: dict[str, IndexEntry]) -> None:
+        self._entries = entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @classmethod
+    def build(cls, rootfs: Path) -> "RootfsIndex":
+        """Index the paths in ``rootfs``, and the contents of its regular files."""
+        entries = {_ROOT: IndexEntry.from_stat(rootfs.lstat())}
+        for dirpath, dirnames, filenames in os.walk(rootfs):
+            relative_dir = Path(dirpath).relative_to(rootfs).as_posix()
+            for name in (*dirnames, *filenames):
+                path = Path(dirpath, name)
+                info = path.lstat()
+                target = str(path.readlink()) if stat.S_ISLNK(info.st_mode) else ""
+                digest = ""
+                if stat.S_ISREG(info.st_mode):
+                    try:
+                        digest = file_digest(path)
+                    except OSError as err:
+                        emit.debug(f"Not indexing the contents of {path}: {err}")
+                key = name if relative_dir == _ROOT else f"{relative_dir}/{name}"
+                entries[key] = IndexEntry.from_stat(info, target=target, digest=digest)
+        return cls(entries)
+
+    @classmethod
+    def from_layers(
+        cls,
+        layers: Iterable[BinaryIO],
+        rootfs: Path,
+        *,
+        extract: Callable[[str], bool],
+        rootless: bool = False,
+    ) -> "RootfsIndex":
+        """Index the filesystem of an image from the tarballs of its layers.
+
+        The layers are applied in order, following the OCI whiteout rules, and
+        each one is read once, as a stream. Only the files selected by
+        ``extract`` are written to ``rootfs``; the rest of the filesystem is
+        only indexed.
+
+        :param layers: The uncompressed tarballs of the layers, from the lowest
+            one up.
+        :param rootfs: The directory to write the extracted files into.
+        :param extract: Whether to extract the file at a path, relative to the
+            rootfs.
+        :param rootless: Whether the paths are owned by the current user, like
+            in images unpacked without root privileges.
+        """
+        builder = _LayerIndexBuilder(rootfs, extract=extract, rootless=rootless)
+        for layer in layers:
+            builder.apply(layer)
+        return cls(builder.entries)
+
+    @classmethod
+    def read(cls, path: Path) -> "RootfsIndex":
+        """Read an index written with ``write()``.
+
+        :raises ValueError: If the file is not an index of a supported version.
+        """
+        with gzip.open(path, "rt", encoding="utf-8") as index_file:
+            data: dict[str, Any] = json.load(index_file)
+        if data.get("version") != _VERSION:
+            raise ValueError(f"Unsupported rootfs index version in {path}")
+        return cls(
+            {key: IndexEntry(*values) for key, values in data["entries"].items()}
+        )
+
+    def write(self, path: Path) -> None:
+        """Write the index to ``path``, atomically."""
+        data = {
+            "version": _VERSION,
+            "entries": {
+                key: dataclasses.astuple(entry)
+                for key, entry in sorted(self._entries.items())
+            },
+        }
+        temp_path = path.with_name(f".{path.name}.tmp")
+        # The index is rebuilt from the rootfs, so the timestamp of its gzip
+        # header is left out.
+        with gzip.GzipFile(temp_path, "wb", mtime=0) as index_file:
+            index_file.write(json.dumps(data, separators=(",", ":")).encode())
+        temp_path.replace(path)
+
+    @classmethod
+    def for_rootfs(cls, rootfs: Path) -> "RootfsIndex | None":
+        """Get the index stored next to ``rootfs``, if there is one.
+
+        Indexes are only read once per process, unless they are rewritten.
+        """
+        index_path = rootfs.parent / INDEX_FILE
+        try:
+            mtime = index_path.stat().st_mtime_ns
+        except OSError:
+            return None
+        try:
+            return _read_index(index_path, mtime)
+        except (OSError, ValueError, KeyError, TypeError) as err:
+            emit.debug(f"Ignoring unreadable rootfs index {index_path}: {err}")
+            return None
+
+    def lookup(self, path: str, *, follow_symlinks: bool = True) -> IndexEntry | None:
+        """Get the entry of ``path``, relative to the rootfs.
+
+        :param path: The path to look up. Absolute paths are relative to the
+            root of the rootfs.
+        :param follow_symlinks: Whether to get the entry of the target when
+            ``path`` is a symlink. Symlinks in its parents are always followed.
+
+        :returns: The entry, or None if ``path`` doesn't exist in the rootfs.
+        """
+        key = self._resolve(path, follow_symlinks=follow_symlinks)
+        return None if key is None else self._entries[key]
+
+    def list_dir(self, path: str) -> list[str]:
+        """Get the sorted names of the entries of the directory ``path``.
+
+        :returns: The names, or an empty list if ``path`` is not a directory in
+            the rootfs.
+        """
+        key = self._resolve(path, follow_symlinks=True)
+        if key is None:
+            return []
+        return self._children.get(key, [])
+
+    @functools.cached_property
+    def _children(self) -> dict[str, list[str]]:
+        children: collections.defaultdict[str, list[str]] = collections.defaultdict(
+            list
+        )
+        for key in sorted(self._entries):
+            if key != _ROOT:
+                parent, _, name = key.rpartition("/")
+                children[parent or _ROOT].append(name)
+        return children
+
+    def _resolve(self, path: str, *, follow_symlinks: bool) -> str | None:
+        """Get the key of the entry ``path`` resolves to."""
+        parts = collections.deque(relative_parts(path))
+        resolved: list[str] = []
+        links = 0
+        while parts:
+            name = parts.popleft()
+            if name == "..":
+                if resolved:
+                    resolved.pop()
+                continue
+            key = "/".join([*resolved, name])
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.is_symlink and (parts or follow_symlinks):
+                links += 1
+                if links > MAX_SYMLINKS:
+                    return None
+                if entry.target.startswith("/"):
+                    resolved = []
+                parts.extendleft(reversed(relative_parts(entry.target)))
+                continue
+            if parts and not entry.is_dir:
+                return None
+            resolved.append(name)
+        return "/".join(resolved) or _ROOT
+
+
+class _LayerIndexBuilder(LayerWalker):
+    """Apply the tarballs of OCI layers to index entries, and to a partial rootfs.
+
+    See ``RootfsIndex.from_layers()`` for the parameters.
+    """
+
+    def __init__(
+        self, rootfs: Path, *, extract: Callable[[str], bool], rootless: bool
+    ) -> None:
+        super().__init__()
+        self._rootfs = rootfs
+        self._extract = extract
+        self._owner = (os.getuid(), os.getgid()) if rootless else None
+        self.entries = {_ROOT: self._new_dir_entry()}
+        # The extracted paths, which are all files or symlinks.
+        self._extracted: set[str] = set()
+
+    def _add_member(
+        self, archive: tarfile.TarFile, member: tarfile.TarInfo, parts: list[str]
+    ) -> None:
+        key = "/".join(parts) or _ROOT
+        if member.islnk():
+            target_key = "/".join(relative_parts(member.linkname))
+            entry = self.entries.get(target_key)
+            if entry is None or entry.is_dir:
+                emit.debug(f"Not indexing hardlink {key!r} to missing {target_key!r}")
+                return
+            self._replace(key, entry)
+            if self._should_extract(key):
+                self._extract_hardlink(key, target_key)
+            return
+
+        file_type = _MEMBER_TYPES.get(member.type)
+        if file_type is None:
+            emit.debug(f"Not indexing layer member {key!r} of unknown type")
+            return
+        uid, gid = self._owner or (member.uid, member.gid)
+        if file_type == stat.S_IFLNK:
+            entry = IndexEntry(
+                mode=stat.S_IFLNK | 0o777,
+                uid=uid,
+                gid=gid,
+                size=len(os.fsencode(member.linkname)),
+                target=member.linkname,
+            )
+        else:
+            entry = IndexEntry(
+                mode=file_type | (member.mode & 0o7777),
+                uid=uid,
+                gid=gid,
+                size=member.size if file_type == stat.S_IFREG else 0,
+            )
+        self._replace(key, entry)
+
+        if file_type == stat.S_IFREG:
+            digest = self._read_file(archive, member, key)
+            self.entries[key] = dataclasses.replace(entry, digest=digest)
+        elif file_type == stat.S_IFLNK and self._should_extract(key):
+            path = self._rootfs / key
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.symlink_to(member.linkname)
+            self._extracted.add(key)
+
+    def _replace(self, key: str, entry: IndexEntry) -> None:
+        """Set the entry of ``key``, replacing what it was unless both are dirs."""
+        existing = self.entries.get(key)
+        if existing is not None and not (existing.is_dir and entry.is_dir):
+            self._remove(key)
+        parent = key
+        while key != _ROOT and (parent := parent.rpartition("/")[0]):
+            if parent in self.entries:
+                break
+            self.entries[parent] = self._new_dir_entry()
+        self.entries[key] = entry
+
+    def _should_extract(self, key: str) -> bool:
+        """Whether to extract ``key``, which must not be under a symlink."""
+        if not self._extract(key):
+            return False
+        parent = key
+        while parent := parent.rpartition("/")[0]:
+            if not self.entries[parent].is_dir:
+                emit.debug(f"Not extracting {key!r}, which is under a symlink")
+                return False
+        return True
+
+    def _remove(self, key: str) -> None:
+        """Remove ``key`` and everything under it."""
+        entry = self.entries.pop(key, None)
+        self._remove_extracted(key)
+        if entry is not None and entry.is_dir:
+            prefix = f"{key}/"
+            for child in [k for k in self.entries if k.startswith(prefix)]:
+                del self.entries[child]
+                self._remove_extracted(child)
+
+    def _remove_path(self, parts: list[str]) -> None:
+        self._remove("/".join(parts))
+
+    def _remove_lower(self, parts: list[str]) -> None:
+        prefix = "".join(f"{name}/" for name in parts)
+        for child in [
+            k
+            for k in self.entries
+            if k != _ROOT and k.startswith(prefix) and not self._in_layer(k)
+        ]:
+            del self.entries[child]
+            self._remove_extracted(child)
+
+    def _read_file(
+        self, archive: tarfile.TarFile, member: tarfile.TarInfo, key: str
+    ) -> str:
+        """Get the digest of a regular file, extracting it if it's selected."""
+        hasher = hashlib.sha256()
+        stream = archive.extractfile(member)
+        if stream is None:
+            return ""
+        path = self._rootfs / key
+        with contextlib.ExitStack() as stack:
+            output = None
+            if self._should_extract(key):
+                path.parent.mkdir(parents=True, exist_ok=True)
+                output = stack.enter_context(path.open("wb"))
+                self._extracted.add(key)
+            while data := stream.read(_READ_BUFFER_SIZE):
+                hasher.update(data)
+                if output is not None:
+                    output.write(data)
+        if output is not None:
+            path.chmod(member.mode & 0o7777)
+        return hasher.hexdigest()
+
+    def _extract_hardlink(self, key: str, target_key: str) -> None:
+        target = self._rootfs / target_key
+        if target_key not in self._extracted or target.is_symlink():
+            emit.debug(f"Not extracting hardlink {key!r} to unextracted {target_key!r}")
+            return
+        path = self._rootfs / key
+        path.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy2(target, path)
+        self._extracted.add(key)
+
+    def _new_dir_entry(self) -> IndexEntry:
+        uid, gid = self._owner or (0, 0)
+        return IndexEntry(mode=stat.S_IFDIR | 0o755, uid=uid, gid=gid, size=0)
+
+    def _remove_extracted(self, key: str) -> None:
+        if key in self._extracted:
+            self._extracted.remove(key)
+            (self._rootfs / key).unlink()
+
+
+def file_digest(path: Path) -> str:
+    """Get the sha256 of the contents of the file ``path``."""
+    hasher = hashlib.sha256()
+    with path.open("rb") as stream:
+        while data := stream.read(_READ_BUFFER_SIZE):
+            hasher.update(data)
+    return hasher.hexdigest()
+
+
+@functools.lru_cache(maxsize=4)
+def _read_index(path: Path, mtime: int) -> RootfsIndex:  # noqa: ARG001 (cache key)
+    emit.debug(f"Reading rootfs index {path}")
+    return RootfsIndex.read(path)
@@ -0,0 +1,102 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright 2025 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Concurrent execution of the lifecycle actions of independent parts."""
+
+import concurrent.futures
+from collections.abc import Callable, Collection, Mapping, Sequence
+
+from craft_parts import Action, Step
+
+
+def run_actions(
+    actions: Sequence[Action],
+    execute: Callable[[Action], None],
+    *,
+    concurrent_action: Callable[[Action], bool],
+    dependencies: Mapping[str, Collection[str]],
+    jobs: int,
+) -> None:
+    """Execute the planned ``actions``, running independent ones concurrently.
+
+    The actions selected by ``concurrent_action`` run in up to ``jobs`` threads,
+    each one once the previous actions of its part, and for the build step of
+    its dependencies, are done. The other actions, like staging and priming,
+    are executed one at a time in the order of the plan, once every previous
+    action is done, so that their results don't depend on the scheduling.
+
+    :param actions: The planned actions, in an order they can be executed in.
+    :param execute: Execute an action.
+    :param concurrent_action: Whether an action can run along with others.
+    :param dependencies: The names of the parts each part depends on.
+    :param jobs: The maximum number of actions running at the same time.
+    :raises: The error of the first failed action, once the running actions
+        are done.
+    """
+    group: list[Action] = []
+    for action in actions:
+        if jobs > 1 and concurrent_action(action):
+            group.append(action)
+            continue
+        _run_group(group, execute, dependencies=dependencies, jobs=jobs)
+        group = []
+        execute(action)
+    _run_group(group, execute, dependencies=dependencies, jobs=jobs)
+
+
+def _run_group(
+    actions: Sequence[Action],
+    execute: Callable[[Action], None],
+    *,
+    dependencies: Mapping[str, Collection[str]],
+    jobs: int,
+) -> None:
+    """Execute a group of concurrent actions, in the order of the plan when possible."""
+    if not actions:
+        return
+
+    prerequisites = [
+        {
+            index
+            for index, previous in enumerate(actions[:position])
+            if previous.part_name == action.part_name
+            or (
+                action.step >= Step.BUILD
+                and previous.part_name in dependencies.get(action.part_name, ())
+            )
+        }
+        for position, action in enumerate(actions)
+    ]
+    pending = list(range(len(actions)))
+    done: set[int] = set()
+    running: dict[concurrent.futures.Future[None], int] = {}
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        while pending or running:
+            for index in [index for index in pending if prerequisites[index] <= done]:
+                if len(running) >= jobs:
+                    break
+                pending.remove(index)
+                running[executor.submit(execute, actions[index])] = index
+
+            finished, _ = concurrent.futures.wait(
+                running, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in finished:
+                index = running.pop(future)
+                # Leaving the executor waits for the running actions to finish.
+                future.result()
+                done.add(index)
@@ -16,6 +16,8 @@
 
 """Rockcraft Image Service."""
 
+import concurrent.futures
+import threading
 from dataclasses import dataclass
 from pathlib import Path
 from typing import cast
@@ -29,6 +31,8 @@ from craft_application import (
 from craft_cli import emit
 
 from rockcraft import oci
+from rockcraft.image_cache import BaseImageCache
+from rockcraft.rootfs_cache import RootfsCache
 
 
 @dataclass(frozen=True)
@@ -50,20 +54,68 @@ class RockcraftImageService(ProjectService):
         *,
         project_dir: Path,
         work_dir: Path,
+        cache_dir: Path | None = None,
     ) -> None:
         super().__init__(app, services, project_dir=project_dir)
 
         self._work_dir = work_dir
+        self._cache = BaseImageCache(cache_dir) if cache_dir else None
         self._image_info: ImageInfo | None = None
+        self._image_future: concurrent.futures.Future[ImageInfo] | None = None
+
+    def prefetch_image(self, *, index_only: bool = False) -> None:
+        """Start fetching and extracting the project's base in the background.
+
+        The base is then ready (or closer to it) when ``obtain_image()`` is
+        called, which waits for the background fetch to finish. The fetch runs
+        in a daemon thread, so that a build that fails before the base is
+        needed exits without waiting for it.
+
+        :param index_only: Whether the base is only indexed, instead of fully
+            extracted, for projects that don't mount it as an overlay.
+        """
+        if self._image_info is not None or self._image_future is not None:
+            return
+
+        # The service factory isn't thread-safe, so the services used to get
+        # the base are created here rather than in the background thread.
+        self._services.get("build_plan").plan()
+        self._services.get("project").get()
+        self._services.get("config")
+
+        future: concurrent.futures.Future[ImageInfo] = concurrent.futures.Future()
+
+        def fetch() -> None:
+            future.set_running_or_notify_cancel()
+            try:
+                future.set_result(self._create_image_info(index_only=index_only))
+            except BaseException as exc:  # noqa: BLE001 (raised by the future)
+                future.set_exception(exc)
+
+        self._image_future = future
+        threading.Thread(target=fetch, name="rockcraft-base", daemon=True).start()
+
+    def check_prefetched_image(self) -> None:
+        """Raise the error of the background fetch of the base, if it failed.
+
+        This lets builds fail as soon as the base can't be fetched, instead of
+        once the base is needed.
+        """
+        if self._image_future is not None and self._image_future.done():
+            self.obtain_image()
 
     def obtain_image(self) -> ImageInfo:
         """Return the ImageInfo for the project's base, possibly fetching it."""
         if self._image_info is None:
-            self._image_info = self._create_image_info()
+            if self._image_future is not None:
+                emit.debug("Waiting for the base to be fetched")
+                self._image_info = self._image_future.result()
+            else:
+                self._image_info = self._create_image_info()
 
         return self._image_info
 
-    def _create_image_info(self) -> ImageInfo:
+    def _create_image_info(self, *, index_only: bool = False) -> ImageInfo:
         image_dir = self._work_dir / "images"
         bundle_dir = self._work_dir / "bundles"
 
@@ -76,14 +128,18 @@ class RockcraftImageService(ProjectService):
         project = self._services.get("project").get()
         base = cast(str, project.base)
         if base == "bare":
-            base_image, source_image = oci.Image.new_oci_image(
+            base_image, _ = oci.Image.new_oci_image(
                 f"{base}@latest",
                 image_dir=image_dir,
                 arch=build_for,
             )
+        elif self._cache is not None:
+            return self._create_cached_image_info(
+                base, project_name=project.name, arch=build_for, index_only=index_only
+            )
         else:
             emit.progress(f"Retrieving base {base} for {build_for}")
-            base_image, source_image = oci.Image.from_docker_registry(
+            base_image, _ = oci.Image.from_docker_registry(
                 base,
                 image_dir=image_dir,
                 arch=build_for,
@@ -91,14 +147,48 @@ class RockcraftImageService(ProjectService):
             emit.progress(f"Retrieved base {base} for {build_for}")
 
         emit.progress(f"Extracting {base_image.image_name}")
-        rootfs = base_image.extract_to(bundle_dir)
+        rootfs = RootfsCache(bundle_dir).get_rootfs(base_image, index_only=index_only)
         emit.progress(f"Extracted {base_image.image_name}")
 
+        # The digest was recorded when the base was pulled.
+        base_digest = base_image.source_digest()
+
         project_base_image = base_image.copy_to(
             f"{project.name}:rockcraft-base", image_dir=image_dir
         )
 
-        base_digest = project_base_image.digest(source_image)
+        return ImageInfo(
+            base_image=project_base_image,
+            base_layer_dir=rootfs,
+            base_digest=base_digest,
+        )
+
+    def _create_cached_image_info(
+        self, base: str, *, project_name: str, arch: str, index_only: bool = False
+    ) -> ImageInfo:
+        """Get the ImageInfo for a base from the user's base image cache.
+
+        The base is only pulled if the digest it resolves to isn't cached yet,
+        and its digest is not resolved at all in offline mode.
+        """
+        cache = cast(BaseImageCache, self._cache)
+        offline = self._services.get("config").get("offline")
+
+        emit.progress(f"Retrieving base {base} for {arch}")
+        cached_image, base_digest = cache.get_image(base, arch=arch, offline=offline)
+        emit.progress(f"Retrieved base {base} for {arch}")
+
+        # Prevent concurrent builds from changing the cache while it's read.
+        with cache.lock(shared=True):
+            emit.progress(f"Extracting {base}")
+            rootfs = RootfsCache(self._work_dir / "bundles").get_rootfs(
+                cached_image, index_only=index_only
+            )
+            emit.progress(f"Extracted {base}")
+
+            project_base_image = cached_image.copy_to(
+                f"{project_name}:rockcraft-base", image_dir=self._work_dir / "images"
+            )
 
         return ImageInfo(
             base_image=project_base_image,
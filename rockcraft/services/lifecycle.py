@@ -16,20 +16,81 @@
 
 """Rockcraft Lifecycle service."""
 
+import json
 import re
+import shutil
+import tempfile
+import threading
 from pathlib import Path
-from typing import cast
+from typing import Any, cast
 
-from craft_application import LifecycleService
+from craft_application import AppMetadata, LifecycleService, ServiceFactory
+from craft_application.errors import PartsLifecycleError
+from craft_application.services.lifecycle import ACTION_MESSAGES
+from craft_cli import emit
+from craft_parts import Action, ActionType, ProjectDirs, Step, callbacks, plugins
+from craft_parts.errors import PartsError
+from craft_parts.executor import ExecutionContext
 from craft_parts.infos import StepInfo
+from craft_parts.parts import Part, part_by_name, part_dependencies
+from craft_parts.state_manager import states
 from overrides import override  # type: ignore[reportUnknownVariableType]
 
-from rockcraft import layers
+from rockcraft import errors, layers, part_cache, scheduler
+from rockcraft.dependency_cache import DEPENDENCY_CACHE_DIR, DependencyCache
+from rockcraft.models import Project
+from rockcraft.part_cache import PART_CACHE_DIR, PartCache
+from rockcraft.parts import part_has_overlay
 from rockcraft.plugins.python_common import get_python_plugins
 
+# The file that records how the helper parts were looked up in the part cache,
+# in the directory of the project's parts, which cleaning every part removes.
+PART_CACHE_RECORDS_FILE = ".part-cache.json"
+
 
 class RockcraftLifecycleService(LifecycleService):
-    """Rockcraft-specific lifecycle service."""
+    """Rockcraft-specific lifecycle service.
+
+    The helper parts that Rockcraft adds to projects are restored from the
+    part cache when they were already built, in any project, and added to it
+    otherwise. Their sources are only resolved when they are about to be pulled
+    or built, and the outcome is recorded with the project's parts, so that
+    their specs don't change with the network once they are pulled. The
+    package managers of the parts use the dependency caches.
+    """
+
+    def __init__(
+        self,
+        app: AppMetadata,
+        services: ServiceFactory,
+        *,
+        work_dir: Path | str,
+        cache_dir: Path | str,
+        **lifecycle_kwargs: Any,
+    ) -> None:
+        super().__init__(
+            app, services, work_dir=work_dir, cache_dir=cache_dir, **lifecycle_kwargs
+        )
+        self._jobs: int | None = None
+        self._part_cache = PartCache(Path(cache_dir) / PART_CACHE_DIR)
+        self._dependency_cache = DependencyCache(Path(cache_dir) / DEPENDENCY_CACHE_DIR)
+        # The specs of the parts restored from the part cache, the keys of the
+        # parts to add to it once built, the specs of the helper parts still to
+        # look up in it, and how the parts were looked up, by part name.
+        self._restored_parts: dict[str, dict[str, Any]] = {}
+        self._cached_part_keys: dict[str, str] = {}
+        self._unresolved_parts: dict[str, dict[str, Any]] = {}
+        self._part_cache_records: dict[str, dict[str, Any]] = {}
+        # The parts run by the lifecycle manager, once they are needed.
+        self._part_list: list[Part] | None = None
+
+    def set_jobs(self, jobs: int) -> None:
+        """Set how many parts can be pulled and built at the same time.
+
+        :param jobs: The maximum number of concurrent actions, overriding the
+            ``jobs`` configuration.
+        """
+        self._jobs = jobs
 
     @override
     def setup(self) -> None:
@@ -39,11 +100,23 @@ class RockcraftLifecycleService(LifecycleService):
         from rockcraft.services import RockcraftServiceFactory
 
         # Configure extra args to the LifecycleManager
-        project = self._services.get("project").get()
+        project = cast(Project, self._services.get("project").get())
 
         services = cast(RockcraftServiceFactory, self._services)
         image_service = services.image
-        image_info = image_service.obtain_image()
+        base_layer_dir: Path | None = None
+        base_layer_hash: bytes | None = None
+        if any(part_has_overlay(part) for part in project.parts.values()):
+            # The overlay step mounts the base, so it's needed before any step runs.
+            image_info = image_service.obtain_image()
+            base_layer_dir = image_info.base_layer_dir
+            base_layer_hash = image_info.base_digest
+        else:
+            # The base is only needed to prune the primed files, so it is fetched
+            # while the parts are pulled and built, and its files are only indexed.
+            image_service.prefetch_image(index_only=True)
+            # A base that can't be fetched fails the build before the next step.
+            callbacks.register_pre_step(self._check_base)
 
         base = project.effective_base
         usrmerged_by_default = True
@@ -53,21 +126,280 @@ class RockcraftLifecycleService(LifecycleService):
             usrmerged_by_default = False
 
         self._manager_kwargs.update(
-            base_layer_dir=image_info.base_layer_dir,
-            base_layer_hash=image_info.base_digest,
+            base_layer_dir=base_layer_dir,
+            base_layer_hash=base_layer_hash,
             base=project.base,
             build_base=project.build_base,
             project_name=project.name,
-            rootfs_dir=image_info.base_layer_dir,
             usrmerged_by_default=usrmerged_by_default,
         )
+        self._use_part_cache(project)
         super().setup()
+        callbacks.register_post_step(self._cache_part, step_list=[Step.BUILD])
+
+    @override
+    def run(self, step_name: str | None, part_names: list[str] | None = None) -> None:
+        """Run the lifecycle, looking up the helper parts that it pulls or builds."""
+        if step_name and self._unresolved_parts:
+            try:
+                self._resolve_parts(step_name, part_names)
+            except PartsError as err:
+                raise PartsLifecycleError.from_parts_error(err) from err
+        super().run(step_name, part_names)
+
+    @property
+    @override
+    def _project(self) -> Project:
+        """The project, as the parts are run.
+
+        The helper parts are restored from the part cache, and the build
+        environment of the parts points their package managers to the
+        dependency caches, ahead of the parts' own build environment.
+        """
+        project = cast(Project, super()._project)
+        parts = {**project.parts, **self._restored_parts}
+        for name, spec in parts.items():
+            environment = self._dependency_cache.get_build_environment(
+                spec, part_name=name
+            )
+            if environment:
+                parts[name] = {
+                    **spec,
+                    "build-environment": [
+                        *environment,
+                        *spec.get("build-environment", []),
+                    ],
+                }
+        return project.model_copy(update={"parts": parts})
+
+    def _get_part_list(self) -> list[Part]:
+        """Get the parts of the project, as the lifecycle manager runs them."""
+        if self._part_list is not None:
+            return self._part_list
+        project_info = self.project_info
+        self._part_list = [
+            Part(
+                name,
+                plugins.extract_part_properties(
+                    spec, plugin_name=spec.get("plugin", name)
+                ),
+                project_dirs=project_info.dirs,
+                partitions=project_info.partitions,
+            )
+            for name, spec in self._project.parts.items()
+        ]
+        return self._part_list
+
+    def _use_part_cache(self, project: Project) -> None:
+        """Use the outcome of looking up the helper parts of ``project`` before.
+
+        The outcome recorded for a part is used as long as the part was pulled
+        since, so that its spec doesn't change with the network. The other
+        helper parts are only looked up once they are about to be pulled or
+        built, unless offline, as the revisions that their sources resolve to
+        can't be known then.
+        """
+        records = self._load_part_cache_records()
+        offline = self._services.get("config").get("offline")
+        for name, spec in project.parts.items():
+            if not part_cache.is_helper_part(spec):
+                continue
+            record = records.get(name)
+            if (
+                record is not None
+                and record["inputs"] == self._get_part_cache_inputs(spec)
+                and self._is_pulled(name)
+                and self._use_part_cache_record(name, spec, record)
+            ):
+                continue
+            if not offline:
+                self._unresolved_parts[name] = spec
+
+    def _use_part_cache_record(
+        self, name: str, spec: dict[str, Any], record: dict[str, Any]
+    ) -> bool:
+        """Restore a part, or get it cached, as recorded.
+
+        :returns: Whether the record could be used, which it can't once the
+            restored output of the part has been removed from the part cache.
+        """
+        key: str = record["key"]
+        if record["restored"]:
+            install_dir = self._part_cache.get(key)
+            if install_dir is None:
+                return False
+            emit.debug(f"Restoring part {name!r} from the part cache ({key})")
+            self._restored_parts[name] = part_cache.get_restored_spec(spec, install_dir)
+        else:
+            self._cached_part_keys[name] = key
+        self._part_cache_records[name] = record
+        return True
+
+    def _resolve_parts(self, step_name: str, part_names: list[str] | None) -> None:
+        """Look up the helper parts that running up to ``step_name`` pulls or builds.
+
+        The lifecycle manager is created again if any of them is restored from
+        the part cache.
+        """
+        actions = self._lcm.plan(Step[step_name.upper()], part_names=part_names)
+        planned = {
+            action.part_name
+            for action in actions
+            if action.step in (Step.PULL, Step.BUILD)
+            and action.action_type != ActionType.SKIP
+        }
+        restored = False
+        for name in sorted(planned & self._unresolved_parts.keys()):
+            spec = self._unresolved_parts.pop(name)
+            inputs = self._get_part_cache_inputs(spec)
+            key = self._part_cache.get_key(
+                spec, build_base=inputs["build-base"], arch=inputs["arch"]
+            )
+            if key is None:
+                continue
+            install_dir = self._part_cache.get(key)
+            self._part_cache_records[name] = {
+                "inputs": inputs,
+                "key": key,
+                "restored": install_dir is not None,
+            }
+            if install_dir is None:
+                self._cached_part_keys[name] = key
+            else:
+                emit.debug(f"Restoring part {name!r} from the part cache ({key})")
+                self._restored_parts[name] = part_cache.get_restored_spec(
+                    spec, install_dir
+                )
+                restored = True
+        self._save_part_cache_records()
+        if restored:
+            self._lcm = self._init_lifecycle_manager()
+            self._part_list = None
+
+    def _get_part_cache_inputs(self, spec: dict[str, Any]) -> dict[str, Any]:
+        """Get what looking up a part in the part cache depends on, in the project."""
+        project = cast(Project, self._services.get("project").get())
+        return {
+            "spec": spec,
+            "build-base": str(project.effective_base),
+            "arch": self._get_build_for(),
+        }
+
+    @property
+    def _project_dirs(self) -> ProjectDirs:
+        """The directories of the project, without the lifecycle manager."""
+        return ProjectDirs(
+            work_dir=self._work_dir,
+            partitions=self._services.get("project").partitions,
+        )
+
+    def _is_pulled(self, part_name: str) -> bool:
+        """Whether the part ``part_name`` was pulled, and not cleaned since."""
+        # The state of a part only depends on its name.
+        part = Part(part_name, {}, project_dirs=self._project_dirs)
+        return states.get_step_state_path(part, Step.PULL).exists()
+
+    def _load_part_cache_records(self) -> dict[str, dict[str, Any]]:
+        """Load how the helper parts were looked up in the part cache."""
+        records_file = self._project_dirs.parts_dir / PART_CACHE_RECORDS_FILE
+        if not records_file.exists():
+            return {}
+        try:
+            return cast(dict[str, dict[str, Any]], json.loads(records_file.read_text()))
+        except (OSError, ValueError) as err:
+            emit.debug(f"Not using the records of the part cache: {err}")
+            return {}
+
+    def _save_part_cache_records(self) -> None:
+        """Record how the helper parts were looked up in the part cache."""
+        records_file = self._project_dirs.parts_dir / PART_CACHE_RECORDS_FILE
+        records_file.parent.mkdir(parents=True, exist_ok=True)
+        records_file.write_text(json.dumps(self._part_cache_records, sort_keys=True))
+
+    def _check_base(self, step_info: StepInfo) -> bool:  # noqa: ARG002 (unused arg)
+        """Raise the error of the background fetch of the base, if it failed."""
+        # pylint: disable=import-outside-toplevel
+        from rockcraft.services import RockcraftServiceFactory
+
+        cast(RockcraftServiceFactory, self._services).image.check_prefetched_image()
+        return False
+
+    def _cache_part(self, step_info: StepInfo) -> bool:
+        """Add a helper part to the part cache once it's built."""
+        key = self._cached_part_keys.get(step_info.part_name)
+        if key is None:
+            return False
+        self._part_cache.store(key, step_info.part_install_dir)
+        return True
+
+    @override
+    def _exec(self, actions: list[Action]) -> None:
+        """Execute the actions, pulling and building independent parts concurrently."""
+        jobs: int = (
+            self._jobs
+            if self._jobs is not None
+            else self._services.get("config").get("jobs")
+        )
+        if jobs < 1:
+            raise errors.RockcraftError(
+                f"Invalid number of jobs: {jobs}",
+                resolution="Run at least one job at a time.",
+            )
+        if jobs == 1:
+            super()._exec(actions)
+            return
+
+        part_list = self._get_part_list()
+        dependencies = {
+            part.name: {
+                dependency.name
+                for dependency in part_dependencies(
+                    part, part_list=part_list, recursive=True
+                )
+            }
+            for part in part_list
+        }
+        output_lock = threading.Lock()
+
+        with self._lcm.action_executor() as aex:
+
+            def execute(action: Action) -> None:
+                emit.progress(_get_action_message(action))
+                if not _is_concurrent(action, part_list):
+                    with emit.open_stream() as stream:
+                        aex.execute(action, stdout=stream, stderr=stream)
+                else:
+                    _execute_buffered(aex, action, output_lock)
+
+            scheduler.run_actions(
+                actions,
+                execute,
+                concurrent_action=lambda action: _is_concurrent(action, part_list),
+                dependencies=dependencies,
+                jobs=jobs,
+            )
+
+    def get_primed_files(self, *, part_name: str) -> set[str]:
+        """Get the files and directories primed by a part.
+
+        :param part_name: The name of the part.
+        :returns: The primed paths, relative to the prime directory.
+        """
+        part = part_by_name(part_name, self._get_part_list())
+        state = states.load_step_state(part, Step.PRIME)
+        if state is None:
+            return set()
+        return state.files | state.directories
 
     @override
     def post_prime(self, step_info: StepInfo) -> bool:
         """Perform base-layer pruning on primed files."""
+        # pylint: disable=import-outside-toplevel
+        from rockcraft.services import RockcraftServiceFactory
+
         prime_dir = step_info.prime_dir
-        base_layer_dir = step_info.rootfs_dir
+        services = cast(RockcraftServiceFactory, self._services)
+        base_layer_dir = services.image.obtain_image().base_layer_dir
         files: set[str]
 
         files = step_info.state.files if step_info.state else set()
@@ -79,6 +411,51 @@ class RockcraftLifecycleService(LifecycleService):
         return True
 
 
+def _get_action_message(action: Action) -> str:
+    message = f"{ACTION_MESSAGES[action.step][action.action_type]} {action.part_name}"
+    if action.reason:
+        return f"{message} ({action.reason})"
+    return message
+
+
+def _is_concurrent(action: Action, part_list: list[Part]) -> bool:
+    """Whether ``action`` can run along with the actions of other parts.
+
+    Only the pull and build steps run concurrently. Stage packages and snaps are
+    still fetched one part at a time, as they share the package caches.
+    """
+    if action.action_type == ActionType.SKIP or action.step not in (
+        Step.PULL,
+        Step.BUILD,
+    ):
+        return False
+    part = part_by_name(action.part_name, part_list)
+    return action.step != Step.PULL or not (
+        part.spec.stage_packages or part.spec.stage_snaps
+    )
+
+
+def _execute_buffered(
+    aex: ExecutionContext, action: Action, output_lock: threading.Lock
+) -> None:
+    """Execute ``action``, showing its output at once when it's done.
+
+    The output of concurrent actions is buffered, so that it isn't interleaved
+    with the output of the others.
+    """
+    with tempfile.TemporaryFile() as output:
+        try:
+            aex.execute(action, stdout=output.fileno(), stderr=output.fileno())
+        finally:
+            output.seek(0)
+            with (
+                output_lock,
+                emit.open_stream() as stream,
+                open(stream, "wb", closefd=False) as pipe,
+            ):
+                shutil.copyfileobj(output, pipe)
+
+
 def _python_usrmerge_fix(step_info: StepInfo) -> None:
     """Fix 'lib64' symlinks created by the Python plugin on ubuntu@24.04 projects."""
     build_base = step_info.project_info.build_base
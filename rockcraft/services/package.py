@@ -16,25 +16,74 @@
 
 """Rockcraft Package service."""
 
-import datetime
+import dataclasses
 import pathlib
+import sys
+import tempfile
 import typing
 from typing import cast
 
-from craft_application import PackageService, errors, models
+import pydantic
+from craft_application import (
+    AppMetadata,
+    PackageService,
+    ServiceFactory,
+    errors,
+    models,
+)
 from craft_cli import emit
 from overrides import override  # type: ignore[reportUnknownVariableType]
 
-from rockcraft import oci
+from rockcraft import layers, oci
+from rockcraft.compression import Compression
 from rockcraft.models import Project
 from rockcraft.pebble import Pebble
 from rockcraft.usernames import SUPPORTED_GLOBAL_USERNAMES
-from rockcraft.utils import parse_command
+from rockcraft.utils import parse_command, utc_now
+
+# How packed rocks are written: as a ``.rock`` archive, as an OCI image layout
+# directory, or as an archive written to the standard output.
+OutputFormat = typing.Literal["rock", "oci-layout", "stdout"]
 
 
 class RockcraftPackageService(PackageService):
     """Package service subclass for Rockcraft."""
 
+    def __init__(self, app: AppMetadata, services: ServiceFactory) -> None:
+        super().__init__(app, services)
+        self._compression_overrides: dict[str, typing.Any] = {}
+        self._output_format: OutputFormat = "rock"
+
+    def override_compression(self, **settings: typing.Any) -> None:
+        """Override the project's layer compression settings.
+
+        :param settings: The compression settings to override, by name. Settings
+            with a ``None`` value are not overridden.
+        """
+        self._compression_overrides.update(
+            {name: value for name, value in settings.items() if value is not None}
+        )
+
+    def set_output_format(self, output_format: OutputFormat) -> None:
+        """Set how the packed rock is written.
+
+        :param output_format: The format of the rock, ``rock`` by default.
+        """
+        self._output_format = output_format
+
+    @property
+    def compression(self) -> Compression:
+        """The layer compression settings, from the project and its overrides."""
+        project = cast(Project, self._services.get("project").get())
+        try:
+            return Compression.model_validate(
+                {**project.compression.model_dump(), **self._compression_overrides}
+            )
+        except pydantic.ValidationError as err:
+            raise errors.CraftValidationError.from_pydantic(
+                err, file_name="compression settings"
+            ) from None
+
     @override
     def pack(self, prime_dir: pathlib.Path, dest: pathlib.Path) -> list[pathlib.Path]:
         """Create one or more packages as appropriate.
@@ -56,18 +105,79 @@ class RockcraftPackageService(PackageService):
 
         platform = build_plan[0].platform
         build_for = build_plan[0].build_for
+        project = cast(Project, self._services.get("project").get())
 
+        if self._output_format != "stdout":
+            dest.mkdir(parents=True, exist_ok=True)
         archive_name = _pack(
             prime_dir=prime_dir,
-            project=cast(Project, self._services.get("project").get()),
-            project_base_image=image_info.base_image,
+            project=project,
+            project_base_image=dataclasses.replace(
+                image_info.base_image, compression=self.compression
+            ),
             base_digest=image_info.base_digest,
             rock_suffix=platform,
             build_for=build_for,
             base_layer_dir=image_info.base_layer_dir,
+            layer_groups=self._get_layer_groups(project),
+            output_format=self._output_format,
+            dest=dest,
+        )
+
+        return [dest / archive_name] if archive_name else []
+
+    def pack_multi_arch(
+        self, platforms: typing.Sequence[str], dest: pathlib.Path
+    ) -> pathlib.Path:
+        """Combine the rocks packed for ``platforms`` in a multi-architecture rock.
+
+        :param platforms: The platforms whose rocks were packed.
+        :param dest: The directory with the packed rocks, where the new rock is
+            written too.
+        :returns: The path to the new rock.
+        """
+        project = cast(Project, self._services.get("project").get())
+        rocks = [
+            dest / f"{project.name}_{project.version}_{platform}.rock"
+            for platform in platforms
+        ]
+        missing = [rock.name for rock in rocks if not rock.is_file()]
+        if missing:
+            raise errors.ArtifactCreationError(
+                "Cannot create a multi-architecture rock without the rock of "
+                "every platform.",
+                details=f"Missing rocks: {', '.join(missing)}",
+            )
+
+        archive = dest / f"{project.name}_{project.version}.rock"
+        emit.progress(f"Creating multi-architecture rock '{archive.name}'")
+        oci.create_multi_arch_rock(rocks, archive, tag=cast(str, project.version))
+        emit.progress(
+            f"Created multi-architecture rock '{archive.name}'", permanent=True
         )
+        return archive
 
-        return [dest / archive_name]
+    def _get_layer_groups(self, project: Project) -> list[layers.LayerGroup]:
+        """Get the groups of primed paths declared in the project's ``layers``."""
+        if not project.layers:
+            return []
+
+        # This inner import is necessary to resolve a cyclic import
+        # pylint: disable=import-outside-toplevel
+        from rockcraft.services import RockcraftLifecycleService
+
+        lifecycle = cast(RockcraftLifecycleService, self._services.get("lifecycle"))
+        groups: list[layers.LayerGroup] = []
+        for name, layer in project.layers.items():
+            files: set[str] = set()
+            for part_name in layer.parts:
+                files |= lifecycle.get_primed_files(part_name=part_name)
+            groups.append(
+                layers.LayerGroup(
+                    name=name, files=frozenset(files), patterns=tuple(layer.paths)
+                )
+            )
+        return groups
 
     @override
     def write_metadata(self, path: pathlib.Path) -> None:
@@ -84,7 +194,7 @@ class RockcraftPackageService(PackageService):
         return models.BaseMetadata()
 
 
-def _pack(
+def _pack(  # noqa: PLR0913 (keyword-only settings)
     *,
     prime_dir: pathlib.Path,
     project: Project,
@@ -93,7 +203,10 @@ def _pack(
     rock_suffix: str,
     build_for: str,
     base_layer_dir: pathlib.Path,
-) -> str:
+    layer_groups: typing.Sequence[layers.LayerGroup] = (),
+    output_format: OutputFormat = "rock",
+    dest: pathlib.Path = pathlib.Path(),
+) -> str | None:
     """Create the rock image for a given architecture.
 
     :param lifecycle:
@@ -108,8 +221,17 @@ def _pack(
       The architecture of the built rock, to add as metadata.
     :param base_layer_dir:
       The directory where the rock's base image was extracted.
+    :param layer_groups:
+      The groups of primed paths to pack in layers of their own.
+    :param output_format:
+      How the rock is written.
+    :param dest:
+      The directory where the rock is written.
+    :returns:
+      The name of the written rock, or None if it was written to the standard
+      output.
     """
-    emit.progress("Creating new layer")
+    emit.progress("Creating new layers" if layer_groups else "Creating new layer")
 
     # At this point the version must be set, otherwise it would have failed earlier.
     version = cast(str, project.version)
@@ -118,21 +240,10 @@ def _pack(
         tag=version,
         new_layer_dir=prime_dir,
         base_layer_dir=base_layer_dir,
+        groups=layer_groups,
+        deduplicate=project.deduplicate_files,
     )
-    emit.progress("Created new layer")
-    if project.run_user:
-        emit.progress(f"Creating new user {project.run_user}")
-        userid = SUPPORTED_GLOBAL_USERNAMES[project.run_user]["uid"]
-        new_image.add_user(
-            prime_dir=prime_dir,
-            base_layer_dir=base_layer_dir,
-            tag=version,
-            username=project.run_user,
-            uid=userid,
-        )
-
-        emit.progress(f"Setting the default OCI user to be {project.run_user}")
-        new_image.set_default_user(userid, project.run_user)
+    emit.progress("Created new layers" if layer_groups else "Created new layer")
 
     if project.entrypoint_command:
         emit.progress("Setting OCI entrypoint")
@@ -150,48 +261,107 @@ def _pack(
             command = project.services[project.entrypoint_service].command
             cmd = parse_command(command or "")[1]
 
-    new_image.set_entrypoint(entrypoint)
-    new_image.set_cmd(cmd)
-    new_image.set_default_path(project.base)
-
     dumped = project.marshal()
     services = cast(dict[str, typing.Any], dumped.get("services", {}))
     checks = cast(dict[str, typing.Any], dumped.get("checks", {}))
 
-    if services or checks:
-        new_image.set_pebble_layer(
-            services=services,
-            checks=checks,
-            name=project.name,
-            tag=version,
-            summary=project.summary,
-            description=project.description,
-            base_layer_dir=base_layer_dir,
-        )
-
-    if project.environment:
-        new_image.set_environment(project.environment)
-
     # Set annotations and metadata, both dynamic and the ones based on user-provided properties
-    # Also include the "created" timestamp, just before packing the image
+    # Also include the "created" timestamp, just before packing the image (or
+    # SOURCE_DATE_EPOCH, for reproducible rocks)
     emit.progress("Adding metadata")
     oci_annotations, rock_metadata = project.generate_metadata(
-        datetime.datetime.now(datetime.timezone.utc).isoformat(), base_digest, build_for
+        utc_now().isoformat(), base_digest, build_for
     )
-    new_image.set_annotations(oci_annotations)
-    new_image.set_control_data(rock_metadata)
+
+    # The user database, the Pebble layer and the control data are small files
+    # that are archived together, in a single final layer.
+    with tempfile.TemporaryDirectory() as final_layer_dir:
+        final_layer_path = pathlib.Path(final_layer_dir)
+        if project.run_user:
+            emit.progress(f"Creating new user {project.run_user}")
+            userid = SUPPORTED_GLOBAL_USERNAMES[project.run_user]["uid"]
+            new_image.add_user(
+                prime_dir=prime_dir,
+                base_layer_dir=base_layer_dir,
+                tag=version,
+                username=project.run_user,
+                uid=userid,
+                layer_dir=final_layer_path,
+            )
+
+        if services or checks:
+            new_image.set_pebble_layer(
+                services=services,
+                checks=checks,
+                name=project.name,
+                tag=version,
+                summary=project.summary,
+                description=project.description,
+                base_layer_dir=base_layer_dir,
+                layer_dir=final_layer_path,
+            )
+
+        new_image.set_control_data(rock_metadata, layer_dir=final_layer_path)
+        new_image.add_layer(tag=version, new_layer_dir=final_layer_path)
+
+    # All the changes to the image's config and manifest are collected and
+    # written in one go, which also sets the media type in the manifest.
+    with new_image.edit() as image_edit:
+        if project.run_user:
+            emit.progress(f"Setting the default OCI user to be {project.run_user}")
+            image_edit.set_default_user(
+                SUPPORTED_GLOBAL_USERNAMES[project.run_user]["uid"], project.run_user
+            )
+
+        image_edit.set_entrypoint(entrypoint)
+        image_edit.set_cmd(cmd)
+        image_edit.set_default_path(project.base)
+
+        if project.environment:
+            image_edit.set_environment(project.environment)
+
+        image_edit.set_annotations(oci_annotations)
     emit.progress("Metadata added")
 
-    # Set the media type in the target images's manifest.
-    # This is different than calling _inject_oci_fields in oci.Image.new_oci_image,
-    # since _inject_oci_fields is called in the context of creating the base image.
-    emit.progress("Adding manifest media type")
-    new_image.set_media_type()
-    emit.progress("Manifest media type added")
+    return _export(
+        new_image,
+        tag=version,
+        rock_name=f"{project.name}_{project.version}_{rock_suffix}",
+        output_format=output_format,
+        dest=dest,
+    )
+
+
+def _export(
+    image: oci.Image,
+    *,
+    tag: str,
+    rock_name: str,
+    output_format: OutputFormat,
+    dest: pathlib.Path = pathlib.Path(),
+) -> str | None:
+    """Write the packed rock in the requested format.
+
+    :returns: The name of the written rock, or None if it was written to the
+      standard output.
+    """
+    if output_format == "stdout":
+        emit.progress("Writing OCI archive to the standard output")
+        sys.stdout.flush()
+        image.write_oci_archive(tag=tag, stream=sys.stdout.buffer)
+        # The pack command reports that no package was created, as no file was.
+        emit.progress("Wrote OCI archive to the standard output", permanent=True)
+        return None
+
+    if output_format == "oci-layout":
+        emit.progress("Exporting to OCI image layout")
+        image.to_oci_layout(tag=tag, directory=dest / rock_name)
+        emit.progress(f"Exported to OCI image layout '{rock_name}'")
+        return rock_name
 
     emit.progress("Exporting to OCI archive")
-    archive_name = f"{project.name}_{project.version}_{rock_suffix}.rock"
-    new_image.to_oci_archive(tag=version, filename=archive_name)
+    archive_name = f"{rock_name}.rock"
+    image.to_oci_archive(tag=tag, filename=str(dest / archive_name))
     emit.progress(f"Exported to OCI archive '{archive_name}'")
 
     return archive_name
@@ -18,14 +18,59 @@
 
 from __future__ import annotations
 
+import contextlib
 import os
+from typing import TYPE_CHECKING, Any
 
-from craft_application import ProviderService
+from craft_application import AppMetadata, ProviderService, ServiceFactory
+from craft_cli import emit
 from overrides import override  # type: ignore[reportUnknownVariableType]
 
+from rockcraft.dependency_cache import MANAGED_DEPENDENCY_CACHE_DIR
+from rockcraft.image_cache import MANAGED_BASE_IMAGE_CACHE_DIR
+from rockcraft.part_cache import MANAGED_PART_CACHE_DIR
+
+if TYPE_CHECKING:
+    import pathlib
+    from collections.abc import Generator
+
+    import craft_platforms
+    import craft_providers
+
 
 class RockcraftProviderService(ProviderService):
-    """ProviderService specialization to configure the APT packages."""
+    """ProviderService specialization to configure the APT packages.
+
+    :param base_image_cache_dir: The host's base image cache, to share with
+        the provider instances.
+    :param part_cache_dir: The host's part cache, to share with the provider
+        instances.
+    :param dependency_cache_dir: The host's dependency caches, to share with
+        the provider instances.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        app: AppMetadata,
+        services: ServiceFactory,
+        *,
+        work_dir: pathlib.Path,
+        provider_name: str | None = None,
+        install_snap: bool = True,
+        base_image_cache_dir: pathlib.Path | None = None,
+        part_cache_dir: pathlib.Path | None = None,
+        dependency_cache_dir: pathlib.Path | None = None,
+    ) -> None:
+        super().__init__(
+            app,
+            services,
+            work_dir=work_dir,
+            provider_name=provider_name,
+            install_snap=install_snap,
+        )
+        self._base_image_cache_dir = base_image_cache_dir
+        self._part_cache_dir = part_cache_dir
+        self._dependency_cache_dir = dependency_cache_dir
 
     @override
     def setup(self) -> None:
@@ -38,6 +83,43 @@ class RockcraftProviderService(ProviderService):
             "https_proxy",
             "no_proxy",
             "ROCKCRAFT_ENABLE_EXPERIMENTAL_EXTENSIONS",
+            "ROCKCRAFT_OFFLINE",
+            "SOURCE_DATE_EPOCH",
         ]:
             if env_key in os.environ:
                 self.environment[env_key] = os.environ[env_key]
+
+    @contextlib.contextmanager
+    @override
+    def instance(
+        self,
+        build_info: craft_platforms.BuildInfo,
+        *,
+        work_dir: pathlib.Path,
+        **kwargs: Any,
+    ) -> Generator[craft_providers.Executor, None, None]:
+        """Get a provider instance, with the host's caches mounted."""
+        caches = [
+            (
+                "Base image cache",
+                self._base_image_cache_dir,
+                MANAGED_BASE_IMAGE_CACHE_DIR,
+            ),
+            ("Part cache", self._part_cache_dir, MANAGED_PART_CACHE_DIR),
+            (
+                "Dependency cache",
+                self._dependency_cache_dir,
+                MANAGED_DEPENDENCY_CACHE_DIR,
+            ),
+        ]
+        with super().instance(build_info, work_dir=work_dir, **kwargs) as instance:
+            for name, host_dir, managed_dir in caches:
+                if host_dir is None:
+                    continue
+                host_dir.mkdir(parents=True, exist_ok=True)
+                instance.mount(
+                    host_source=host_dir,
+                    target=managed_dir,  # type: ignore[arg-type]
+                )
+                emit.debug(f"{name} mounted")
+            yield instance
@@ -0,0 +1,260 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright 2025 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Unpacking of the layers of OCI images into a root filesystem."""
+
+import collections
+import errno
+import os
+import shutil
+import stat
+import tarfile
+from collections.abc import Iterable
+from pathlib import Path
+from typing import BinaryIO
+
+from craft_cli import emit
+
+from rockcraft.layer_walker import MAX_SYMLINKS, LayerWalker, relative_parts
+
+# The prefix of the PAX headers holding extended attributes.
+_XATTR_PREFIX = "SCHILY.xattr."
+
+# The permissions of the directories that are implied by a layer's paths.
+_IMPLICIT_DIR_MODE = 0o755
+
+_COPY_BUFFER_SIZE = 1024 * 1024
+
+
+def unpack_layers(
+    layers: Iterable[BinaryIO], rootfs: Path, *, rootless: bool = False
+) -> None:
+    """Unpack the tarballs of OCI layers into ``rootfs``.
+
+    The layers are applied in order, following the OCI whiteout rules, and
+    each one is read once, as a stream. Like in a container, the symlinks in
+    the paths of the layers are resolved within ``rootfs``, so that no layer
+    writes outside of it.
+
+    :param layers: The uncompressed tarballs of the layers, from the lowest
+        one up.
+    :param rootfs: The directory to unpack the layers into, which must exist.
+    :param rootless: Whether to unpack the layers without root privileges:
+        the paths are then owned by the current user, and device nodes and
+        extended attributes are skipped.
+    """
+    unpacker = _Unpacker(rootfs, rootless=rootless)
+    for layer in layers:
+        unpacker.apply(layer)
+    unpacker.finish()
+
+
+class _Unpacker(LayerWalker):
+    """Apply the tarballs of OCI layers to a directory.
+
+    See ``unpack_layers()`` for the parameters.
+    """
+
+    def __init__(self, rootfs: Path, *, rootless: bool) -> None:
+        super().__init__()
+        self._rootfs = rootfs
+        self._rootless = rootless
+        # The attributes of the directories, which are set once every layer is
+        # unpacked so that read-only directories can still be written to. The
+        # directories implied by the layers' paths have no member.
+        self._directories: dict[Path, tarfile.TarInfo | None] = {}
+        # The last resolved parent directory, as most members share it with
+        # the previous one.
+        self._last_parent: tuple[tuple[str, ...], Path] | None = None
+
+    def finish(self) -> None:
+        """Set the attributes of the directories, the deepest ones first."""
+        for path, member in sorted(
+            self._directories.items(), key=lambda item: len(item[0].parts), reverse=True
+        ):
+            if not path.is_dir() or path.is_symlink():
+                continue
+            if member is None:
+                path.chmod(_IMPLICIT_DIR_MODE)
+            else:
+                self._set_attributes(path, member)
+
+    def _add_member(
+        self, archive: tarfile.TarFile, member: tarfile.TarInfo, parts: list[str]
+    ) -> None:
+        if not parts:
+            if member.isdir():
+                self._directories[self._rootfs] = member
+            return
+
+        path = self._resolve_parent(tuple(parts[:-1])) / parts[-1]
+        # The symlinks in the member's path lead to other directories, which
+        # the layer adds as well, even when they are created implicitly.
+        self._mark_in_layer(path.relative_to(self._rootfs).parts)
+        if member.isdir():
+            if not _is_real_dir(path):
+                self._remove(path)
+                path.mkdir(mode=0o700)
+            self._directories[path] = member
+            return
+
+        self._remove(path)
+        if self._create(archive, member, path):
+            self._set_attributes(path, member)
+
+    def _create(
+        self, archive: tarfile.TarFile, member: tarfile.TarInfo, path: Path
+    ) -> bool:
+        """Create the non-directory ``member`` at ``path``.
+
+        :returns: Whether ``path`` was created, with attributes of its own.
+        """
+        if member.isreg():
+            source = archive.extractfile(member)
+            with path.open("xb") as output:
+                if source is not None:
+                    shutil.copyfileobj(source, output, _COPY_BUFFER_SIZE)
+        elif member.issym():
+            path.symlink_to(member.linkname)
+        elif member.islnk():
+            # The link shares the target's inode, and so its attributes.
+            self._link(member, path)
+            return False
+        elif member.isfifo():
+            os.mkfifo(path)
+        elif member.ischr() or member.isblk():
+            if self._rootless:
+                emit.debug(
+                    f"Not creating device {member.name!r} without root privileges"
+                )
+                return False
+            file_type = stat.S_IFCHR if member.ischr() else stat.S_IFBLK
+            os.mknod(
+                path,
+                file_type | (member.mode & 0o7777),
+                os.makedev(member.devmajor, member.devminor),
+            )
+        else:
+            emit.debug(f"Not unpacking layer member {member.name!r} of unknown type")
+            return False
+        return True
+
+    def _link(self, member: tarfile.TarInfo, path: Path) -> None:
+        target_parts = relative_parts(member.linkname)
+        if not target_parts or ".." in target_parts:
+            emit.debug(f"Not linking {member.name!r} to {member.linkname!r}")
+            return
+        target = self._resolve_parent(tuple(target_parts[:-1])) / target_parts[-1]
+        os.link(target, path, follow_symlinks=False)
+
+    def _set_attributes(self, path: Path, member: tarfile.TarInfo) -> None:
+        if not self._rootless:
+            # Changing the owner clears the setuid bits and the capabilities,
+            # so it goes first.
+            os.lchown(path, member.uid, member.gid)
+            for key, value in member.pax_headers.items():
+                if key.startswith(_XATTR_PREFIX):
+                    try:
+                        os.setxattr(
+                            path,
+                            key[len(_XATTR_PREFIX) :],
+                            value.encode("utf-8", "surrogateescape"),
+                            follow_symlinks=False,
+                        )
+                    except OSError as err:
+                        emit.debug(f"Not setting {key!r} on {path}: {err}")
+        if not member.issym():
+            path.chmod(member.mode & 0o7777)
+        mtime = int(member.mtime * 1_000_000_000)
+        os.utime(path, ns=(mtime, mtime), follow_symlinks=False)
+
+    def _resolve_parent(self, parts: tuple[str, ...]) -> Path:
+        """Get the directory that ``parts`` lead to, creating the missing ones.
+
+        Symlinks are followed within the rootfs, and absolute ones are relative
+        to it.
+        """
+        if self._last_parent is not None and self._last_parent[0] == parts:
+            return self._last_parent[1]
+
+        pending = collections.deque(parts)
+        resolved: list[str] = []
+        links = 0
+        while pending:
+            name = pending.popleft()
+            if name == "..":
+                if resolved:
+                    resolved.pop()
+                continue
+            path = self._rootfs.joinpath(*resolved, name)
+            try:
+                info = path.lstat()
+            except FileNotFoundError:
+                path.mkdir(mode=0o700)
+                self._directories.setdefault(path, None)
+                resolved.append(name)
+                continue
+            if stat.S_ISLNK(info.st_mode):
+                links += 1
+                if links > MAX_SYMLINKS:
+                    raise OSError(
+                        errno.ELOOP, "Too many levels of symbolic links", path
+                    )
+                target = str(path.readlink())
+                if target.startswith("/"):
+                    resolved = []
+                pending.extendleft(reversed(relative_parts(target)))
+                continue
+            if not stat.S_ISDIR(info.st_mode):
+                raise NotADirectoryError(errno.ENOTDIR, "Not a directory", path)
+            resolved.append(name)
+
+        parent = self._rootfs.joinpath(*resolved)
+        self._last_parent = (parts, parent)
+        return parent
+
+    def _remove(self, path: Path) -> None:
+        """Remove ``path``, and everything under it."""
+        self._last_parent = None
+        if _is_real_dir(path):
+            shutil.rmtree(path)
+            for directory in [d for d in self._directories if d.is_relative_to(path)]:
+                del self._directories[directory]
+        elif os.path.lexists(path):
+            path.unlink()
+
+    def _remove_path(self, parts: list[str]) -> None:
+        self._remove(self._resolve_parent(tuple(parts[:-1])) / parts[-1])
+
+    def _remove_lower(self, parts: list[str]) -> None:
+        self._remove_lower_paths(self._resolve_parent(tuple(parts)))
+
+    def _remove_lower_paths(self, directory: Path) -> None:
+        """Remove what the previous layers added under ``directory``."""
+        with os.scandir(directory) as entries:
+            paths = [directory / entry.name for entry in entries]
+        for path in paths:
+            if not self._in_layer(path.relative_to(self._rootfs).as_posix()):
+                self._remove(path)
+            elif _is_real_dir(path):
+                self._remove_lower_paths(path)
+
+
+def _is_real_dir(path: Path) -> bool:
+    try:
+        return stat.S_ISDIR(path.lstat().st_mode)
+    except FileNotFoundError:
+        return False
@@ -21,6 +21,7 @@ import os
 import pathlib
 import shlex
 import shutil
+from datetime import datetime, timezone
 from typing import NamedTuple
 
 import rockcraft.errors
@@ -59,6 +60,34 @@ def get_managed_environment_snap_channel() -> str | None:
     return os.getenv("ROCKCRAFT_INSTALL_SNAP_CHANNEL")
 
 
+def get_source_date_epoch() -> int | None:
+    """Get the timestamp that reproducible builds are clamped to, if any.
+
+    Reproducible builds are enabled by setting the ``SOURCE_DATE_EPOCH``
+    environment variable to a number of seconds since the Unix epoch.
+
+    :return: The timestamp, or None if reproducible builds are not enabled.
+    :raises RockcraftError: If the variable is not a valid timestamp.
+    """
+    value = os.getenv("SOURCE_DATE_EPOCH")
+    if not value:
+        return None
+    if not value.isdigit():
+        raise rockcraft.errors.RockcraftError(
+            f"Invalid SOURCE_DATE_EPOCH: {value!r}",
+            resolution="Set it to a number of seconds since the Unix epoch.",
+        )
+    return int(value)
+
+
+def utc_now() -> datetime:
+    """Get the current UTC time, or the time of ``SOURCE_DATE_EPOCH`` if set."""
+    epoch = get_source_date_epoch()
+    if epoch is None:
+        return datetime.now(timezone.utc)
+    return datetime.fromtimestamp(epoch, timezone.utc)
+
+
 def _find_command_path_in_root(root: str, command_name: str) -> str | None:
     """Find the path of a command in a given root path."""
     for bin_directory in (
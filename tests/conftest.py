@@ -258,7 +258,7 @@ def fake_services(
         "lifecycle", work_dir=in_project_path, cache_dir=in_project_path / "cache"
     )
 
-    # Mock out image info to avoid a umoci call requiring root privileges
+    # Mock out image info to avoid fetching and unpacking the base
     mocker.patch.object(
         services.RockcraftImageService,
         "_create_image_info",
@@ -74,10 +74,8 @@ def create_base_image(
 
 def get_names_in_layer(image: oci.Image, layer_number: int = -1) -> list[str]:
     """Get the list of file/dir names contained in the given layer, sorted."""
-    umoci_stat = image.stat()
-
-    layers = umoci_stat["history"]
-    new_layer = layers[layer_number]["layer"]
+    layers = image.get_manifest()["layers"]
+    new_layer = layers[layer_number]
     assert new_layer["mediaType"] == "application/vnd.oci.image.layer.v1.tar+gzip"
     layer_basename = new_layer["digest"][len("sha256:") :]
     layer_file = Path(f"images/bare/blobs/sha256/{layer_basename}")
@@ -201,36 +199,33 @@ def test_add_layer_with_overlay(new_dir, mocker, fake_services, mock_obtain_imag
     ]
 
 
-def test_stat(new_dir):
+def test_manifest_layers(new_dir):
     image = oci.Image.new_oci_image(
         image_name="bare@original",
         image_dir=Path("images"),
         arch="amd64",
     )[0]
 
-    # Empty stat for an empty image
-    stat = image.stat()
-    assert stat == {"history": None}
+    # No layers for an empty image
+    assert image.get_manifest()["layers"] == []
 
-    # Add a few layers and check the history
+    # Add a few layers and check the manifest
     layer1 = Path("layer1")
     layer1.mkdir()
     (layer1 / "file.txt").touch()
     layer1_image = image.add_layer("layer1", layer1)
-    layer1_stat = layer1_image.stat()
-    layer1_history = layer1_stat["history"]
+    layer1_layers = layer1_image.get_manifest()["layers"]
     # Exactly 1 entry, for the 1 layer
-    assert len(layer1_history) == 1
+    assert len(layer1_layers) == 1
 
     layer2 = Path("layer2")
     layer2.mkdir()
     (layer2 / "file2.txt").touch()
     layer2_image = layer1_image.add_layer("layer2", layer2)
-    layer2_stat = layer2_image.stat()
-    layer2_history = layer2_stat["history"]
-    assert len(layer2_history) == 2
-    # The first layer in the ``layer2_history`` list is layer1
-    assert layer2_history[0] == layer1_history[0]
+    layer2_layers = layer2_image.get_manifest()["layers"]
+    assert len(layer2_layers) == 2
+    # The first layer in the ``layer2_layers`` list is layer1
+    assert layer2_layers[0] == layer1_layers[0]
 
 
 @pytest.mark.usefixtures("new_dir")
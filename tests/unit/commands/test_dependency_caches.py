@@ -0,0 +1,75 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright 2025 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import argparse
+from textwrap import dedent
+
+import pytest
+from rockcraft.commands import DependencyCachesCommand, PruneDependencyCachesCommand
+
+
+@pytest.fixture
+def app_config(fake_app_config, tmp_path):
+    return {**fake_app_config, "cache_dir": tmp_path}
+
+
+@pytest.fixture
+def dependencies_dir(tmp_path):
+    dependencies_dir = tmp_path / "dependencies"
+    (dependencies_dir / "pip").mkdir(parents=True)
+    (dependencies_dir / "pip/wheel").write_bytes(b"x" * 2048)
+    (dependencies_dir / "npm").mkdir()
+    (dependencies_dir / "npm/package").write_bytes(b"x" * 10)
+    return dependencies_dir
+
+
+def test_dependency_caches(emitter, app_config, dependencies_dir):
+    command = DependencyCachesCommand(app_config)
+    command.run(argparse.Namespace())
+
+    emitter.assert_message(
+        dedent(
+            f"""\
+        Ecosystem    Size     Path
+        -----------  -------  {"-" * len(str(dependencies_dir / "pip"))}
+        pip          2.0 KiB  {dependencies_dir / "pip"}
+        npm          10 B     {dependencies_dir / "npm"}"""
+        )
+    )
+
+
+def test_dependency_caches_empty(emitter, app_config):
+    command = DependencyCachesCommand(app_config)
+    command.run(argparse.Namespace())
+
+    emitter.assert_message("The dependency caches are empty.")
+
+
+@pytest.mark.parametrize(
+    ("ecosystems", "expected"),
+    [
+        (["pip"], ["npm"]),
+        ([], []),
+    ],
+)
+def test_prune_dependency_caches(
+    emitter, app_config, dependencies_dir, ecosystems, expected
+):
+    command = PruneDependencyCachesCommand(app_config)
+    command.run(argparse.Namespace(ecosystems=ecosystems))
+
+    assert sorted(path.name for path in dependencies_dir.iterdir()) == expected
+    emitter.assert_message("Dependency caches removed.")
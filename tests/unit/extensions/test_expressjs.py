@@ -71,6 +71,15 @@ def package_json_file(app_path):
                     "amd64": {},
                 },
                 "run-user": "_daemon_",
+                "layers": {
+                    "runtime": {
+                        "parts": [
+                            "expressjs-framework/runtime",
+                            "expressjs-framework/logging",
+                        ]
+                    },
+                    "dependencies": {"paths": ["app/node_modules"]},
+                },
                 "parts": {
                     "expressjs-framework/install-app": {
                         "plugin": "npm",
@@ -163,6 +172,14 @@ def package_json_file(app_path):
                     "amd64": {},
                 },
                 "run-user": "_daemon_",
+                "layers": {
+                    "runtime": {
+                        "parts": [
+                            "expressjs-framework/logging",
+                        ]
+                    },
+                    "dependencies": {"paths": ["app/node_modules"]},
+                },
                 "services": {
                     "expressjs": {
                         "command": "npm start",
@@ -237,6 +254,15 @@ def package_json_file(app_path):
                     "amd64": {},
                 },
                 "run-user": "_daemon_",
+                "layers": {
+                    "runtime": {
+                        "parts": [
+                            "expressjs-framework/runtime",
+                            "expressjs-framework/logging",
+                        ]
+                    },
+                    "dependencies": {"paths": ["app/node_modules"]},
+                },
                 "services": {
                     "expressjs": {
                         "command": "npm start",
@@ -303,6 +329,15 @@ def package_json_file(app_path):
                     "amd64": {},
                 },
                 "run-user": "_daemon_",
+                "layers": {
+                    "runtime": {
+                        "parts": [
+                            "expressjs-framework/runtime",
+                            "expressjs-framework/logging",
+                        ]
+                    },
+                    "dependencies": {"paths": ["app/node_modules"]},
+                },
                 "services": {
                     "expressjs": {
                         "command": "npm start",
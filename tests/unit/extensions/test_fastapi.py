@@ -48,6 +48,15 @@ def test_fastapi_extension_default(tmp_path, fastapi_input_yaml, packages):
         "name": "foo-bar",
         "platforms": {"amd64": {}},
         "run_user": "_daemon_",
+        "layers": {
+            "runtime": {
+                "parts": [
+                    "fastapi-framework/runtime",
+                    "fastapi-framework/logging",
+                ]
+            },
+            "dependencies": {"parts": ["fastapi-framework/dependencies"]},
+        },
         "parts": {
             "fastapi-framework/dependencies": {
                 "plugin": "python",
@@ -45,6 +45,15 @@ def test_go_extension_default(tmp_path, go_input_yaml):
         "name": "goprojectname",
         "platforms": {"amd64": {}},
         "run_user": "_daemon_",
+        "layers": {
+            "runtime": {
+                "parts": [
+                    "go-framework/base-layout",
+                    "go-framework/runtime",
+                    "go-framework/logging",
+                ]
+            },
+        },
         "parts": {
             "go-framework/base-layout": {
                 "override-build": "mkdir -p ${CRAFT_PART_INSTALL}/app",
@@ -270,3 +279,14 @@ def test_go_extension_extra_assets_overridden(tmp_path, go_input_yaml):
         },
         "stage": ["app/foobar"],
     }
+
+
+@pytest.mark.usefixtures("go_extension")
+def test_go_extension_user_layers(tmp_path, go_input_yaml):
+    """The default layers are not added when the project defines its own."""
+    (tmp_path / "go.mod").write_text("module projectname\n\ngo 1.22.4")
+    go_input_yaml["layers"] = {"app": {"parts": ["go-framework/install-app"]}}
+
+    applied = extensions.apply_extensions(tmp_path, go_input_yaml)
+
+    assert applied["layers"] == {"app": {"parts": ["go-framework/install-app"]}}
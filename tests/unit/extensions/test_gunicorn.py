@@ -140,6 +140,16 @@ def test_flask_extension_default(
         },
         "platforms": {"amd64": {}},
         "run_user": "_daemon_",
+        "layers": {
+            "runtime": {
+                "parts": [
+                    "flask-framework/runtime",
+                    "flask-framework/statsd-exporter",
+                    "flask-framework/logging",
+                ]
+            },
+            "dependencies": {"parts": ["flask-framework/dependencies"]},
+        },
         "services": {
             "flask": {
                 "after": ["statsd-exporter"],
@@ -608,6 +618,16 @@ def test_django_extension_default(
         },
         "platforms": {"amd64": {}},
         "run_user": "_daemon_",
+        "layers": {
+            "runtime": {
+                "parts": [
+                    "django-framework/runtime",
+                    "django-framework/statsd-exporter",
+                    "django-framework/logging",
+                ]
+            },
+            "dependencies": {"parts": ["django-framework/dependencies"]},
+        },
         "services": {
             "django": {
                 "after": ["statsd-exporter"],
@@ -124,6 +124,13 @@ def use_gradlew_non_executable(tmp_path, request):
                 "name": "springbootprojectname",
                 "platforms": {"amd64": {}},
                 "run-user": "_daemon_",
+                "layers": {
+                    "runtime": {
+                        "parts": [
+                            "spring-boot-framework/runtime",
+                        ]
+                    },
+                },
                 "parts": {
                     "spring-boot-framework/install-app": {
                         "plugin": "maven",
@@ -167,6 +174,13 @@ def use_gradlew_non_executable(tmp_path, request):
                 "name": "springbootprojectname",
                 "platforms": {"amd64": {}},
                 "run-user": "_daemon_",
+                "layers": {
+                    "runtime": {
+                        "parts": [
+                            "spring-boot-framework/runtime",
+                        ]
+                    },
+                },
                 "parts": {
                     "spring-boot-framework/install-app": {
                         "plugin": "maven",
@@ -208,6 +222,13 @@ def use_gradlew_non_executable(tmp_path, request):
                 "name": "springbootprojectname",
                 "platforms": {"amd64": {}},
                 "run-user": "_daemon_",
+                "layers": {
+                    "runtime": {
+                        "parts": [
+                            "spring-boot-framework/runtime",
+                        ]
+                    },
+                },
                 "parts": {
                     "spring-boot-framework/install-app": {
                         "plugin": "gradle",
@@ -252,6 +273,13 @@ def use_gradlew_non_executable(tmp_path, request):
                 "name": "springbootprojectname",
                 "platforms": {"amd64": {}},
                 "run-user": "_daemon_",
+                "layers": {
+                    "runtime": {
+                        "parts": [
+                            "spring-boot-framework/runtime",
+                        ]
+                    },
+                },
                 "parts": {
                     "spring-boot-framework/install-app": {
                         "plugin": "gradle",
@@ -293,6 +321,13 @@ def use_gradlew_non_executable(tmp_path, request):
                 "name": "springbootprojectname",
                 "platforms": {"amd64": {}},
                 "run-user": "_daemon_",
+                "layers": {
+                    "runtime": {
+                        "parts": [
+                            "spring-boot-framework/runtime",
+                        ]
+                    },
+                },
                 "parts": {
                     "spring-boot-framework/gradle-init-script": {
                         "override-build": "cp *init.gradle* ${CRAFT_STAGE}/",
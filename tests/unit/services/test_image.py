@@ -14,8 +14,14 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import threading
 from typing import cast
 
+import pytest
+from craft_application import errors
+from rockcraft import oci
+from rockcraft.image_cache import BaseImageCache
+from rockcraft.rootfs_cache import RootfsCache
 from rockcraft.services import RockcraftImageService
 
 
@@ -33,3 +39,107 @@ def test_image_service_cache(default_image_info, mocker, fake_services):
     assert info2 is default_image_info
 
     mock_create.assert_called_once_with()
+
+
+@pytest.mark.usefixtures("configured_project")
+def test_image_service_prefetch(default_image_info, mocker, fake_services):
+    """Test that obtaining a prefetched base waits for it."""
+    image_service = cast(RockcraftImageService, fake_services.get("image"))
+    fetched = threading.Event()
+
+    def fake_create_image_info(*, index_only):
+        assert index_only
+        assert fetched.wait(timeout=10)
+        return default_image_info
+
+    mock_create = mocker.patch.object(
+        image_service, "_create_image_info", side_effect=fake_create_image_info
+    )
+
+    image_service.prefetch_image(index_only=True)
+    image_service.prefetch_image(index_only=True)
+    fetched.set()
+
+    assert image_service.obtain_image() is default_image_info
+    assert image_service.obtain_image() is default_image_info
+    mock_create.assert_called_once_with(index_only=True)
+
+
+@pytest.mark.usefixtures("configured_project")
+def test_image_service_prefetch_error(mocker, fake_services):
+    """Errors fetching the base are raised when it is obtained."""
+    image_service = cast(RockcraftImageService, fake_services.get("image"))
+    mocker.patch.object(
+        image_service,
+        "_create_image_info",
+        side_effect=errors.CraftError("Base not found"),
+    )
+
+    image_service.prefetch_image()
+
+    with pytest.raises(errors.CraftError, match="Base not found"):
+        image_service.obtain_image()
+
+
+@pytest.mark.usefixtures("configured_project")
+def test_image_service_check_prefetched_image(mocker, fake_services):
+    """Errors fetching the base are raised once it failed, without waiting for it."""
+    image_service = cast(RockcraftImageService, fake_services.get("image"))
+    fetching = threading.Event()
+    failed = threading.Event()
+
+    def fake_create_image_info(*, index_only):
+        assert fetching.wait(timeout=10)
+        raise errors.CraftError("Base not found")
+
+    mocker.patch.object(
+        image_service, "_create_image_info", side_effect=fake_create_image_info
+    )
+    image_service.prefetch_image()
+    # The build doesn't wait for the fetch at exit.
+    [thread] = [t for t in threading.enumerate() if t.name == "rockcraft-base"]
+    assert thread.daemon
+
+    image_service.check_prefetched_image()
+    image_service._image_future.add_done_callback(lambda _: failed.set())
+    fetching.set()
+    assert failed.wait(timeout=10)
+
+    with pytest.raises(errors.CraftError, match="Base not found"):
+        image_service.check_prefetched_image()
+
+
+@pytest.mark.parametrize("index_only", [False, True])
+@pytest.mark.parametrize("offline", [False, True])
+def test_image_service_base_image_cache(
+    tmp_path, mocker, monkeypatch, fake_services, offline, index_only
+):
+    """Test that bases are taken from the base image cache, offline if configured."""
+    if offline:
+        monkeypatch.setenv("ROCKCRAFT_OFFLINE", "1")
+    fake_services.update_kwargs("image", cache_dir=tmp_path / "base-images")
+    image_service = cast(RockcraftImageService, fake_services.get("image"))
+    cached_image = oci.Image("ubuntu:abcd-amd64", tmp_path / "base-images/oci")
+    mock_get_image = mocker.patch.object(
+        BaseImageCache, "get_image", return_value=(cached_image, b"\xab\xcd")
+    )
+    mock_get_rootfs = mocker.patch.object(
+        RootfsCache, "get_rootfs", return_value=tmp_path / "rootfs"
+    )
+    project_image = oci.Image("my-rock:rockcraft-base", tmp_path / "images")
+    mocker.patch.object(oci.Image, "copy_to", return_value=project_image)
+    mock_digest = mocker.patch.object(oci.Image, "digest")
+
+    info = image_service._create_cached_image_info(
+        "ubuntu@24.04", project_name="my-rock", arch="amd64", index_only=index_only
+    )
+
+    assert info.base_image == project_image
+    assert info.base_layer_dir == tmp_path / "rootfs"
+    assert info.base_digest == b"\xab\xcd"
+    mock_get_image.assert_called_once_with(
+        "ubuntu@24.04", arch="amd64", offline=offline
+    )
+    mock_get_rootfs.assert_called_once_with(cached_image, index_only=index_only)
+    # The digest is resolved by the cache, so the registry isn't queried again.
+    mock_digest.assert_not_called()
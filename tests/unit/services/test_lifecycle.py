@@ -13,6 +13,7 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import json
 import os
 import shutil
 from pathlib import Path
@@ -23,6 +24,8 @@ import pytest
 from craft_application import services, util
 from craft_application.util import repositories
 from craft_parts import (
+    Action,
+    ActionType,
     LifecycleManager,
     Part,
     PartInfo,
@@ -35,6 +38,9 @@ from craft_parts import (
     callbacks,
 )
 from craft_parts.state_manager.prime_state import PrimeState
+from rockcraft import errors, part_cache
+from rockcraft.part_cache import PartCache
+from rockcraft.pebble import Pebble
 from rockcraft.plugins.python_common import get_python_plugins
 from rockcraft.services import lifecycle as lifecycle_module
 
@@ -53,6 +59,9 @@ def test_lifecycle_args(
     mock_obtain_image = mocker.patch.object(
         fake_services.get("image"), "obtain_image", return_value=default_image_info
     )
+    mock_prefetch_image = mocker.patch.object(
+        fake_services.get("image"), "prefetch_image"
+    )
     mock_lifecycle = mocker.patch.object(
         LifecycleManager, "__init__", return_value=None
     )
@@ -60,15 +69,17 @@ def test_lifecycle_args(
     # Initialize the lifecycle service
     fake_services.get("lifecycle")
 
-    mock_obtain_image.assert_called_once_with()
+    # The base isn't needed until the files are primed, and only its index is.
+    mock_prefetch_image.assert_called_once_with(index_only=True)
+    mock_obtain_image.assert_not_called()
     mock_lifecycle.assert_called_once_with(
         mock.ANY,
         application_name="rockcraft",
         arch="riscv64",
         base="ubuntu@24.04",
         build_base="ubuntu@24.04",
-        base_layer_dir=Path(),
-        base_layer_hash=b"deadbeef",
+        base_layer_dir=None,
+        base_layer_hash=None,
         cache_dir=project_path / "cache",
         ignore_local_sources=[".craft", "*.rock"],
         parallel_build_count=4,
@@ -84,12 +95,360 @@ def test_lifecycle_args(
             }
         ),
         work_dir=project_path,
-        rootfs_dir=Path(),
         track_stage_packages=True,
         usrmerged_by_default=False,
     )
 
 
+@pytest.mark.usefixtures("enable_overlay_feature", "configured_project", "project_keys")
+@pytest.mark.parametrize(
+    "project_keys",
+    [{"parts": {"my-part": {"plugin": "nil", "overlay-script": "true"}}}],
+)
+def test_lifecycle_args_overlay(default_image_info, mocker, fake_services):
+    """Projects with overlays need the base before running any step."""
+    mock_obtain_image = mocker.patch.object(
+        fake_services.get("image"), "obtain_image", return_value=default_image_info
+    )
+    mock_prefetch_image = mocker.patch.object(
+        fake_services.get("image"), "prefetch_image"
+    )
+    mock_lifecycle = mocker.patch.object(
+        LifecycleManager, "__init__", return_value=None
+    )
+
+    fake_services.get("lifecycle")
+
+    mock_obtain_image.assert_called_once_with()
+    mock_prefetch_image.assert_not_called()
+    call = mock_lifecycle.mock_calls[0]
+    assert call.kwargs["base_layer_dir"] == Path()
+    assert call.kwargs["base_layer_hash"] == b"deadbeef"
+
+
+@pytest.mark.usefixtures("configured_project")
+def test_lifecycle_check_base(mocker, fake_services):
+    """A base that can't be fetched fails the build before the next step."""
+    mocker.patch.object(fake_services.get("image"), "prefetch_image")
+    mock_check = mocker.patch.object(
+        fake_services.get("image"),
+        "check_prefetched_image",
+        side_effect=errors.RockcraftError("Base not found"),
+    )
+    mock_register = mocker.patch.object(callbacks, "register_pre_step")
+    mocker.patch.object(LifecycleManager, "__init__", return_value=None)
+    lifecycle_service = fake_services.get("lifecycle")
+
+    mock_register.assert_called_once_with(lifecycle_service._check_base)
+    with pytest.raises(errors.RockcraftError, match="Base not found"):
+        lifecycle_service._check_base(mock.Mock())
+    mock_check.assert_called_once_with()
+
+
+@pytest.mark.usefixtures("configured_project")
+def test_post_prime_prunes_base_files(
+    default_image_info, mocker, fake_services, tmp_path
+):
+    mocker.patch.object(fake_services.get("image"), "prefetch_image")
+    mocker.patch.object(LifecycleManager, "__init__", return_value=None)
+    lifecycle_service = fake_services.get("lifecycle")
+    mock_obtain_image = mocker.patch.object(
+        fake_services.get("image"), "obtain_image", return_value=default_image_info
+    )
+    mock_prune = mocker.patch.object(lifecycle_module.layers, "prune_prime_files")
+    step_info, prime_dir = _create_step_info(
+        tmp_path, "nil", "ubuntu@24.04", "ubuntu@24.04"
+    )
+
+    assert lifecycle_service.post_prime(step_info)
+
+    mock_obtain_image.assert_called_once_with()
+    mock_prune.assert_called_once_with(prime_dir, set(), Path())
+
+
+@pytest.fixture
+def part_cache_service(mocker, fake_services):
+    """A lifecycle service whose lifecycle manager plans to pull Pebble."""
+    mocker.patch.object(fake_services.get("image"), "prefetch_image")
+    mock_lifecycle = mocker.patch.object(
+        LifecycleManager, "__init__", return_value=None
+    )
+    mocker.patch.object(
+        LifecycleManager,
+        "plan",
+        return_value=[Action("pebble", Step.PULL), Action("pebble", Step.BUILD)],
+    )
+    mocker.patch.object(services.LifecycleService, "run")
+    return mock_lifecycle
+
+
+def _lifecycle_parts(mock_lifecycle) -> list[dict]:
+    """Get the parts that each lifecycle manager was created with."""
+    return [call.args[0]["parts"] for call in mock_lifecycle.call_args_list]
+
+
+@pytest.mark.usefixtures("configured_project")
+def test_lifecycle_part_cache_setup(mocker, fake_services, part_cache_service):
+    """Helper parts aren't looked up in the part cache until they are pulled."""
+    mock_get_key = mocker.patch.object(PartCache, "get_key", return_value="key")
+
+    fake_services.get("lifecycle")
+
+    mock_get_key.assert_not_called()
+    [parts] = _lifecycle_parts(part_cache_service)
+    assert parts["pebble"] == Pebble.PEBBLE_PART_SPEC_2404
+
+
+@pytest.mark.usefixtures("configured_project")
+def test_lifecycle_part_cache_hit(
+    mocker, fake_services, project_path, part_cache_service
+):
+    """Helper parts that are in the part cache are restored from it."""
+    mocker.patch.object(PartCache, "get_key", return_value="key")
+    install_dir = project_path / "cache/part-outputs/key/install"
+    install_dir.mkdir(parents=True)
+    lifecycle_service = fake_services.get("lifecycle")
+
+    lifecycle_service.run("prime")
+
+    # The lifecycle manager is created again, with the restored part.
+    assert [parts["pebble"] for parts in _lifecycle_parts(part_cache_service)] == [
+        Pebble.PEBBLE_PART_SPEC_2404,
+        part_cache.get_restored_spec(Pebble.PEBBLE_PART_SPEC_2404, install_dir),
+    ]
+    records_file = project_path / "parts" / lifecycle_module.PART_CACHE_RECORDS_FILE
+    assert json.loads(records_file.read_text())["pebble"]["restored"]
+
+
+@pytest.mark.usefixtures("configured_project")
+def test_lifecycle_part_cache_miss(
+    mocker, fake_services, project_path, tmp_path, part_cache_service
+):
+    """Helper parts that aren't in the part cache are added to it once built."""
+    mocker.patch.object(PartCache, "get_key", return_value="key")
+    lifecycle_service = fake_services.get("lifecycle")
+
+    lifecycle_service.run("prime")
+
+    [parts] = _lifecycle_parts(part_cache_service)
+    assert parts["pebble"] == Pebble.PEBBLE_PART_SPEC_2404
+    install_dir = tmp_path / "parts/pebble/install"
+    install_dir.mkdir(parents=True)
+    (install_dir / "pebble").write_text("pebble")
+    step_info = mock.Mock(part_name="pebble", part_install_dir=install_dir)
+    assert lifecycle_service._cache_part(step_info)
+    cached = project_path / "cache/part-outputs/key/install/pebble"
+    assert cached.read_text() == "pebble"
+
+
+@pytest.mark.usefixtures("configured_project")
+def test_lifecycle_part_cache_not_planned(mocker, fake_services, part_cache_service):
+    """Helper parts that are already built aren't looked up in the part cache."""
+    mocker.patch.object(
+        LifecycleManager,
+        "plan",
+        return_value=[Action("pebble", Step.PULL, action_type=ActionType.SKIP)],
+    )
+    mock_get_key = mocker.patch.object(PartCache, "get_key")
+    lifecycle_service = fake_services.get("lifecycle")
+
+    lifecycle_service.run("stage")
+    lifecycle_service.run(None)
+
+    mock_get_key.assert_not_called()
+    assert len(_lifecycle_parts(part_cache_service)) == 1
+
+
+def _set_up_again(fake_services):
+    """Set up a new lifecycle service, as the next command does."""
+    fake_services._services.pop("lifecycle")
+    callbacks.unregister_all()
+    return fake_services.get("lifecycle")
+
+
+@pytest.mark.usefixtures("configured_project")
+@pytest.mark.parametrize("pulled", [True, False])
+def test_lifecycle_part_cache_recorded(
+    mocker, fake_services, project_path, part_cache_service, pulled
+):
+    """The parts pulled since they were looked up are restored without lookups."""
+    mocker.patch.object(PartCache, "get_key", return_value="key")
+    install_dir = project_path / "cache/part-outputs/key/install"
+    install_dir.mkdir(parents=True)
+    fake_services.get("lifecycle").run("prime")
+    if pulled:
+        (project_path / "parts/pebble/state").mkdir(parents=True)
+        (project_path / "parts/pebble/state/pull").touch()
+    # The network is down.
+    mock_get_key = mocker.patch.object(PartCache, "get_key", return_value=None)
+    part_cache_service.reset_mock()
+
+    _set_up_again(fake_services).run("prime")
+
+    [parts] = _lifecycle_parts(part_cache_service)
+    if pulled:
+        mock_get_key.assert_not_called()
+        assert parts["pebble"] == part_cache.get_restored_spec(
+            Pebble.PEBBLE_PART_SPEC_2404, install_dir
+        )
+    else:
+        # The part was cleaned, so it's looked up again.
+        mock_get_key.assert_called_once()
+        assert parts["pebble"] == Pebble.PEBBLE_PART_SPEC_2404
+
+
+@pytest.mark.usefixtures("configured_project")
+def test_lifecycle_part_cache_offline(
+    mocker, monkeypatch, fake_services, part_cache_service
+):
+    monkeypatch.setenv("ROCKCRAFT_OFFLINE", "1")
+    mock_get_key = mocker.patch.object(PartCache, "get_key")
+
+    fake_services.get("lifecycle").run("prime")
+
+    mock_get_key.assert_not_called()
+
+
+@pytest.mark.usefixtures("configured_project", "project_keys")
+@pytest.mark.parametrize(
+    "project_keys",
+    [
+        {
+            "parts": {
+                "my-part": {
+                    "plugin": "python",
+                    "source": ".",
+                    "build-environment": [{"PIP_CACHE_DIR": "/my/cache"}],
+                },
+                "other-part": {"plugin": "nil"},
+            }
+        }
+    ],
+)
+def test_lifecycle_dependency_cache(mocker, fake_services, project_path):
+    """The parts' package managers use the dependency caches, unless overridden."""
+    mocker.patch.object(fake_services.get("image"), "prefetch_image")
+    mock_lifecycle = mocker.patch.object(
+        LifecycleManager, "__init__", return_value=None
+    )
+
+    fake_services.get("lifecycle")
+
+    parts = mock_lifecycle.mock_calls[0].args[0]["parts"]
+    assert parts["my-part"]["build-environment"] == [
+        {"PIP_CACHE_DIR": str(project_path / "cache/dependencies/pip")},
+        {"PIP_CACHE_DIR": "/my/cache"},
+    ]
+    assert "build-environment" not in parts["other-part"]
+
+
+@pytest.fixture
+def exec_lifecycle_service(mocker, fake_services):
+    """A lifecycle service with a mocked lifecycle manager and three parts."""
+    mocker.patch.object(fake_services.get("image"), "prefetch_image")
+    mocker.patch.object(LifecycleManager, "__init__", return_value=None)
+    lifecycle_service = fake_services.get("lifecycle")
+    lifecycle_service._lcm = mock.MagicMock()
+    lifecycle_service._part_list = [
+        Part("a", {"plugin": "nil"}),
+        Part("b", {"plugin": "nil", "after": ["a"]}),
+        Part("c", {"plugin": "nil", "stage-packages": ["hello"]}),
+    ]
+    return lifecycle_service
+
+
+@pytest.mark.usefixtures("configured_project", "project_keys")
+@pytest.mark.parametrize(
+    "project_keys",
+    [
+        {
+            "parts": {
+                "a": {"plugin": "python", "source": ".", "python-packages": ["x"]},
+                "b": {"plugin": "nil", "after": ["a"]},
+            }
+        }
+    ],
+)
+def test_get_primed_files(fake_services, mocker, tmp_path):
+    mocker.patch.object(fake_services.get("image"), "prefetch_image")
+    mocker.patch.object(LifecycleManager, "__init__", return_value=None)
+    lifecycle_service = fake_services.get("lifecycle")
+    project_info = ProjectInfo(
+        project_dirs=ProjectDirs(work_dir=tmp_path),
+        application_name="test",
+        cache_dir=tmp_path,
+    )
+    mocker.patch.object(
+        type(lifecycle_service),
+        "project_info",
+        new_callable=mocker.PropertyMock,
+        return_value=project_info,
+    )
+    PrimeState(files={"bin/a"}, directories={"bin"}).write(
+        tmp_path / "parts/a/state/prime"
+    )
+
+    assert lifecycle_service.get_primed_files(part_name="a") == {"bin", "bin/a"}
+    assert lifecycle_service.get_primed_files(part_name="b") == set()
+
+
+EXEC_ACTIONS = [
+    Action(part, step)
+    for step in (Step.PULL, Step.BUILD, Step.STAGE)
+    for part in ("a", "b", "c")
+]
+
+
+@pytest.mark.usefixtures("configured_project")
+def test_exec_jobs(exec_lifecycle_service, mocker):
+    spy_run_actions = mocker.spy(lifecycle_module.scheduler, "run_actions")
+    exec_lifecycle_service.set_jobs(2)
+
+    exec_lifecycle_service._exec(EXEC_ACTIONS)
+
+    aex = exec_lifecycle_service._lcm.action_executor.return_value.__enter__()
+    executed = [call.args[0] for call in aex.execute.mock_calls]
+    assert sorted(executed, key=EXEC_ACTIONS.index) == EXEC_ACTIONS
+    kwargs = spy_run_actions.call_args.kwargs
+    assert kwargs["jobs"] == 2
+    assert kwargs["dependencies"] == {"a": set(), "b": {"a"}, "c": set()}
+    # Stage packages are fetched one part at a time.
+    assert [kwargs["concurrent_action"](action) for action in EXEC_ACTIONS] == [
+        *(True, True, False),
+        *(True, True, True),
+        *(False, False, False),
+    ]
+
+
+@pytest.mark.usefixtures("configured_project")
+def test_exec_jobs_config(exec_lifecycle_service, mocker, monkeypatch):
+    monkeypatch.setenv("ROCKCRAFT_JOBS", "3")
+    mock_run_actions = mocker.patch.object(lifecycle_module.scheduler, "run_actions")
+
+    exec_lifecycle_service._exec(EXEC_ACTIONS)
+
+    assert mock_run_actions.call_args.kwargs["jobs"] == 3
+
+
+@pytest.mark.usefixtures("configured_project")
+def test_exec_serial(exec_lifecycle_service, mocker):
+    mock_run_actions = mocker.patch.object(lifecycle_module.scheduler, "run_actions")
+
+    exec_lifecycle_service._exec(EXEC_ACTIONS)
+
+    mock_run_actions.assert_not_called()
+    aex = exec_lifecycle_service._lcm.action_executor.return_value.__enter__()
+    assert [call.args[0] for call in aex.execute.mock_calls] == EXEC_ACTIONS
+
+
+@pytest.mark.usefixtures("configured_project")
+def test_exec_invalid_jobs(exec_lifecycle_service):
+    exec_lifecycle_service.set_jobs(0)
+
+    with pytest.raises(errors.RockcraftError, match="Invalid number of jobs: 0"):
+        exec_lifecycle_service._exec(EXEC_ACTIONS)
+
+
 @pytest.mark.usefixtures("configured_project", "project_keys")
 @pytest.mark.parametrize(
     "project_keys",
@@ -15,13 +15,22 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 from pathlib import Path
 from typing import cast
+from unittest.mock import call
 
 import pytest
 from craft_application import ServiceFactory
+from craft_application.errors import ArtifactCreationError, CraftValidationError
 from craft_platforms import DebianArchitecture
+from rockcraft import layers, oci
+from rockcraft.compression import Compression
 from rockcraft.models import Project
 from rockcraft.oci import Image
-from rockcraft.services import RockcraftImageService, package
+from rockcraft.services import (
+    RockcraftImageService,
+    RockcraftLifecycleService,
+    RockcraftPackageService,
+    package,
+)
 
 
 @pytest.mark.usefixtures("fake_project_file", "project_keys")
@@ -62,9 +71,132 @@ def test_pack(fake_services: ServiceFactory, default_image_info, mocker):
         project=fake_services.get("project").get(),
         project_base_image=default_image_info.base_image,
         rock_suffix="bob",
+        layer_groups=[],
+        output_format="rock",
+        dest=Path(),
+    )
+
+
+@pytest.mark.usefixtures("fake_project_file", "project_keys")
+@pytest.mark.parametrize("project_keys", [{"compression": {"level": 3, "threads": 4}}])
+def test_pack_compression(fake_services: ServiceFactory, default_image_info, mocker):
+    image_service = cast(RockcraftImageService, fake_services.get("image"))
+    mocker.patch.object(image_service, "obtain_image", return_value=default_image_info)
+    mock_inner_pack = mocker.patch.object(package, "_pack")
+
+    fake_services.get("project").configure(platform=None, build_for=None)
+    package_service = cast(RockcraftPackageService, fake_services.get("package"))
+    package_service.override_compression(codec=None, level=9, threads=None)
+    package_service.pack(prime_dir=Path("prime"), dest=Path())
+
+    image = mock_inner_pack.call_args.kwargs["project_base_image"]
+    assert image.compression == Compression(level=9, threads=4)
+
+
+@pytest.mark.usefixtures("fake_project_file", "project_keys")
+@pytest.mark.parametrize(
+    "project_keys",
+    [
+        {
+            "parts": {"my-part": {"plugin": "nil"}},
+            "layers": {
+                "dependencies": {"parts": ["my-part"]},
+                "assets": {"paths": ["srv/*"]},
+            },
+        }
+    ],
+)
+def test_pack_layer_groups(fake_services: ServiceFactory, default_image_info, mocker):
+    image_service = cast(RockcraftImageService, fake_services.get("image"))
+    mocker.patch.object(image_service, "obtain_image", return_value=default_image_info)
+    mock_inner_pack = mocker.patch.object(package, "_pack")
+    mocker.patch.object(RockcraftLifecycleService, "setup")
+    mock_get_primed_files = mocker.patch.object(
+        RockcraftLifecycleService,
+        "get_primed_files",
+        return_value={"usr", "usr/lib/libfoo.so"},
+    )
+
+    fake_services.get("project").configure(platform=None, build_for=None)
+    fake_services.get("package").pack(prime_dir=Path("prime"), dest=Path())
+
+    assert mock_inner_pack.call_args.kwargs["layer_groups"] == [
+        layers.LayerGroup(
+            name="dependencies", files=frozenset({"usr", "usr/lib/libfoo.so"})
+        ),
+        layers.LayerGroup(name="assets", patterns=("srv/*",)),
+    ]
+    mock_get_primed_files.assert_called_once_with(part_name="my-part")
+
+
+@pytest.mark.usefixtures("fake_project_file", "configured_project")
+@pytest.mark.parametrize(
+    ("output_format", "archive_name", "expected"),
+    [
+        ("rock", "test_1.0_amd64.rock", [Path("out/test_1.0_amd64.rock")]),
+        ("oci-layout", "test_1.0_amd64", [Path("out/test_1.0_amd64")]),
+        ("stdout", None, []),
+    ],
+)
+def test_pack_output_format(
+    fake_services: ServiceFactory,
+    default_image_info,
+    mocker,
+    output_format,
+    archive_name,
+    expected,
+):
+    image_service = cast(RockcraftImageService, fake_services.get("image"))
+    mocker.patch.object(image_service, "obtain_image", return_value=default_image_info)
+    mock_inner_pack = mocker.patch.object(package, "_pack", return_value=archive_name)
+    package_service = cast(RockcraftPackageService, fake_services.get("package"))
+
+    package_service.set_output_format(output_format)
+    packages = package_service.pack(prime_dir=Path("prime"), dest=Path("out"))
+
+    assert packages == expected
+    assert mock_inner_pack.call_args.kwargs["output_format"] == output_format
+
+
+@pytest.mark.usefixtures("fake_project_file", "configured_project")
+def test_pack_multi_arch(fake_services: ServiceFactory, tmp_path, mocker):
+    mock_create = mocker.patch.object(oci, "create_multi_arch_rock")
+    for platform in ("amd64", "arm64"):
+        (tmp_path / f"test-rock_0.1_{platform}.rock").touch()
+    package_service = cast(RockcraftPackageService, fake_services.get("package"))
+
+    archive = package_service.pack_multi_arch(["amd64", "arm64"], tmp_path)
+
+    assert archive == tmp_path / "test-rock_0.1.rock"
+    mock_create.assert_called_once_with(
+        [tmp_path / "test-rock_0.1_amd64.rock", tmp_path / "test-rock_0.1_arm64.rock"],
+        archive,
+        tag="0.1",
     )
 
 
+@pytest.mark.usefixtures("fake_project_file", "configured_project")
+def test_pack_multi_arch_missing(fake_services: ServiceFactory, tmp_path, mocker):
+    mock_create = mocker.patch.object(oci, "create_multi_arch_rock")
+    (tmp_path / "test-rock_0.1_amd64.rock").touch()
+    package_service = cast(RockcraftPackageService, fake_services.get("package"))
+
+    with pytest.raises(ArtifactCreationError) as raised:
+        package_service.pack_multi_arch(["amd64", "arm64"], tmp_path)
+
+    assert raised.value.details == "Missing rocks: test-rock_0.1_arm64.rock"
+    mock_create.assert_not_called()
+
+
+@pytest.mark.usefixtures("fake_project_file", "configured_project")
+def test_pack_compression_invalid_override(fake_services: ServiceFactory):
+    package_service = cast(RockcraftPackageService, fake_services.get("package"))
+    package_service.override_compression(level=42)
+
+    with pytest.raises(CraftValidationError, match="level"):
+        _ = package_service.compression
+
+
 @pytest.mark.usefixtures("fake_project_file", "project_keys")
 @pytest.mark.parametrize(
     ("project_keys", "expected_entrypoint", "expected_cmd"),
@@ -194,9 +326,18 @@ def test_inner_pack(
     )
 
     # Assertions
-    image.add_layer.assert_called_once_with(
-        tag=tag, new_layer_dir=prime_dir, base_layer_dir=base_layer_dir
-    )
+    # The user, Pebble layer and control data go in a single final layer.
+    final_layer_dir = image.set_control_data.call_args.kwargs["layer_dir"]
+    assert image.add_layer.mock_calls == [
+        call(
+            tag=tag,
+            new_layer_dir=prime_dir,
+            base_layer_dir=base_layer_dir,
+            groups=(),
+            deduplicate=False,
+        ),
+        call(tag=tag, new_layer_dir=final_layer_dir),
+    ]
 
     image.add_user.assert_called_once_with(
         prime_dir=prime_dir,
@@ -204,11 +345,8 @@ def test_inner_pack(
         tag=tag,
         username=project.run_user,
         uid=584792,
+        layer_dir=final_layer_dir,
     )
-    image.set_default_user.assert_called_once_with(584792, project.run_user)
-    image.set_entrypoint.assert_called_once_with(expected_entrypoint)
-    image.set_cmd.assert_called_once_with(expected_cmd)
-    image.set_default_path.assert_called_once_with(project.base)
     image.set_pebble_layer.assert_called_once_with(
         services=project.marshal().get("services", {}),
         checks=project.marshal().get("checks", {}),
@@ -217,11 +355,79 @@ def test_inner_pack(
         summary=project.summary,
         description=project.description,
         base_layer_dir=base_layer_dir,
+        layer_dir=final_layer_dir,
     )
-    image.set_environment.assert_called_once_with(project.environment)
-    image.set_annotations.assert_called_once_with(annotations)
-    image.set_control_data.assert_called_once_with(metadata)
-    image.set_media_type.assert_called_once_with()
+    image.set_control_data.assert_called_once_with(metadata, layer_dir=final_layer_dir)
+
+    # All the config and manifest changes happen in a single edit transaction.
+    image.edit.assert_called_once_with()
+    image_edit = image.edit.return_value.__enter__.return_value
+    image_edit.set_default_user.assert_called_once_with(584792, project.run_user)
+    image_edit.set_entrypoint.assert_called_once_with(expected_entrypoint)
+    image_edit.set_cmd.assert_called_once_with(expected_cmd)
+    image_edit.set_default_path.assert_called_once_with(project.base)
+    image_edit.set_environment.assert_called_once_with(project.environment)
+    image_edit.set_annotations.assert_called_once_with(annotations)
     image.to_oci_archive.assert_called_once_with(
         tag=project.version, filename=f"{project.name}_{project.version}_test-rock.rock"
     )
+
+
+def test_export_rock(mocker):
+    image = mocker.create_autospec(Image, instance=True)
+
+    name = package._export(
+        image, tag="1.0", rock_name="test_1.0_amd64", output_format="rock"
+    )
+
+    assert name == "test_1.0_amd64.rock"
+    image.to_oci_archive.assert_called_once_with(
+        tag="1.0", filename="test_1.0_amd64.rock"
+    )
+
+
+def test_export_dest(mocker, tmp_path):
+    image = mocker.create_autospec(Image, instance=True)
+
+    name = package._export(
+        image,
+        tag="1.0",
+        rock_name="test_1.0_amd64",
+        output_format="rock",
+        dest=tmp_path,
+    )
+
+    assert name == "test_1.0_amd64.rock"
+    image.to_oci_archive.assert_called_once_with(
+        tag="1.0", filename=str(tmp_path / "test_1.0_amd64.rock")
+    )
+
+
+def test_export_oci_layout(mocker):
+    image = mocker.create_autospec(Image, instance=True)
+
+    name = package._export(
+        image, tag="1.0", rock_name="test_1.0_amd64", output_format="oci-layout"
+    )
+
+    assert name == "test_1.0_amd64"
+    image.to_oci_layout.assert_called_once_with(
+        tag="1.0", directory=Path("test_1.0_amd64")
+    )
+    image.to_oci_archive.assert_not_called()
+
+
+def test_export_stdout(mocker, emitter):
+    image = mocker.create_autospec(Image, instance=True)
+    mock_stdout = mocker.patch("sys.stdout")
+
+    name = package._export(
+        image, tag="1.0", rock_name="test_1.0_amd64", output_format="stdout"
+    )
+
+    assert name is None
+    image.write_oci_archive.assert_called_once_with(
+        tag="1.0", stream=mock_stdout.buffer
+    )
+    image.to_oci_archive.assert_not_called()
+    emitter.assert_progress("Wrote OCI archive to the standard output", permanent=True)
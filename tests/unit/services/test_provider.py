@@ -14,7 +14,88 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import contextlib
+from pathlib import PurePosixPath
+from unittest import mock
+
+import pytest
+from craft_application import ProviderService
+from rockcraft import services
+from rockcraft.application import APP_METADATA
+
 
 def test_packages(fake_services):
     provider_service = fake_services.get("provider")
     assert provider_service.packages == ["gpg", "dirmngr"]
+
+
+@pytest.mark.parametrize("cache_dir", [None, "base-images"])
+def test_instance_base_image_cache(
+    tmp_path, mocker, fake_services, mock_instance, cache_dir
+):
+    """Test that the host's base image cache is mounted in the instance."""
+    base_image_cache_dir = tmp_path / cache_dir if cache_dir else None
+    provider_service = services.RockcraftProviderService(
+        APP_METADATA,
+        fake_services,
+        work_dir=tmp_path,
+        base_image_cache_dir=base_image_cache_dir,
+    )
+
+    @contextlib.contextmanager
+    def fake_instance(*args, **kwargs):
+        yield mock_instance
+
+    mocker.patch.object(ProviderService, "instance", side_effect=fake_instance)
+
+    with provider_service.instance(mock.Mock(), work_dir=tmp_path) as instance:
+        assert instance is mock_instance
+
+    if base_image_cache_dir:
+        assert base_image_cache_dir.is_dir()
+        mock_instance.mount.assert_called_once_with(
+            host_source=base_image_cache_dir,
+            target=PurePosixPath("/root/.cache/rockcraft/base-images"),
+        )
+    else:
+        mock_instance.mount.assert_not_called()
+
+
+@pytest.mark.parametrize(
+    ("kwarg", "target"),
+    [
+        ("part_cache_dir", "/root/.cache/rockcraft/part-outputs"),
+        ("dependency_cache_dir", "/root/.cache/rockcraft/dependencies"),
+    ],
+)
+def test_instance_caches(tmp_path, mocker, fake_services, mock_instance, kwarg, target):
+    """Test that the host's part and dependency caches are mounted in the instance."""
+    cache_dir = tmp_path / "cache"
+    provider_service = services.RockcraftProviderService(
+        APP_METADATA,
+        fake_services,
+        work_dir=tmp_path,
+        **{kwarg: cache_dir},
+    )
+
+    @contextlib.contextmanager
+    def fake_instance(*args, **kwargs):
+        yield mock_instance
+
+    mocker.patch.object(ProviderService, "instance", side_effect=fake_instance)
+
+    with provider_service.instance(mock.Mock(), work_dir=tmp_path):
+        pass
+
+    assert cache_dir.is_dir()
+    mock_instance.mount.assert_called_once_with(
+        host_source=cache_dir, target=PurePosixPath(target)
+    )
+
+
+@pytest.mark.parametrize("env_key", ["ROCKCRAFT_OFFLINE", "SOURCE_DATE_EPOCH"])
+def test_environment_forwarded(monkeypatch, fake_services, env_key):
+    monkeypatch.setenv(env_key, "1")
+    provider_service = fake_services.get("provider")
+
+    assert provider_service.environment[env_key] == "1"
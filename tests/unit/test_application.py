@@ -13,10 +13,23 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import argparse
+import contextlib
+import io
+import sys
+import threading
+from pathlib import Path
 from textwrap import dedent
+from unittest import mock
 
+import craft_platforms
+import craft_providers
 import pytest
+from craft_application import Application
+from craft_application.services.fetch import FetchService
+from craft_cli import emit
 from rockcraft import cli, plugins
+from rockcraft.errors import RockcraftError
 
 
 @pytest.mark.parametrize("build_base", ["ubuntu@20.04", "ubuntu@24.04", "ubuntu@25.10"])
@@ -71,3 +84,246 @@ def test_get_app_plugins_missing_project(tmp_path, monkeypatch, mocker):
     app._configure_early_services()
     _ = app._get_app_plugins()
     spied_get_plugins.assert_called_once_with(None)
+
+
+def pack_args(**kwargs) -> argparse.Namespace:
+    return argparse.Namespace(
+        **{"multi_arch": True, "output": Path(), "destructive_mode": False, **kwargs}
+    )
+
+
+def build_info(platform: str) -> craft_platforms.BuildInfo:
+    return craft_platforms.BuildInfo(
+        platform=platform,
+        build_on=craft_platforms.DebianArchitecture.AMD64,
+        build_for=craft_platforms.DebianArchitecture(platform),
+        build_base=craft_platforms.DistroBase("ubuntu", "24.04"),
+    )
+
+
+def test_pre_run_multi_arch(fake_app, mocker):
+    dispatcher = mocker.Mock(**{"parsed_args.return_value": pack_args()})
+
+    fake_app._pre_run(dispatcher)
+
+    assert fake_app._multi_arch
+
+
+@pytest.mark.parametrize(
+    ("args", "build_environment"),
+    [(pack_args(destructive_mode=True), None), (pack_args(), "host")],
+)
+def test_pre_run_multi_arch_destructive(
+    fake_app, mocker, monkeypatch, args, build_environment
+):
+    if build_environment:
+        monkeypatch.setenv("CRAFT_BUILD_ENVIRONMENT", build_environment)
+    dispatcher = mocker.Mock(**{"parsed_args.return_value": args})
+
+    with pytest.raises(RockcraftError, match="destructive mode"):
+        fake_app._pre_run(dispatcher)
+
+
+@pytest.fixture
+def mock_fetch_active(mocker):
+    mocker.patch.object(FetchService, "setup")
+    return mocker.patch.object(FetchService, "is_active", return_value=False)
+
+
+@pytest.mark.parametrize(
+    ("plan_size", "fetch_active", "concurrent"),
+    [(1, False, False), (2, False, True), (2, True, False)],
+)
+def test_run_managed_multi_arch(
+    fake_app,
+    fake_services,
+    mocker,
+    tmp_path,
+    mock_fetch_active,
+    plan_size,
+    fetch_active,
+    concurrent,
+):
+    """Several platforms are built concurrently, unless a fetch session is used."""
+    mock_fetch_active.return_value = fetch_active
+    platforms = ["amd64", "arm64"][:plan_size]
+    mocker.patch.object(
+        fake_services.get("build_plan"),
+        "plan",
+        return_value=[build_info(platform) for platform in platforms],
+    )
+    mock_run_managed = mocker.patch.object(Application, "run_managed")
+    mock_run_instances = mocker.patch.object(fake_app, "_run_instances")
+    mock_pack_multi_arch = mocker.patch.object(
+        fake_services.get("package"), "pack_multi_arch"
+    )
+    fake_app.project_dir = tmp_path
+    fake_app._pre_run(
+        mocker.Mock(**{"parsed_args.return_value": pack_args(output=Path("dist"))})
+    )
+
+    fake_app.run_managed(None, None)
+
+    assert mock_run_instances.called == concurrent
+    assert mock_run_managed.called != concurrent
+    mock_pack_multi_arch.assert_called_once_with(platforms, tmp_path / "dist")
+
+
+def test_run_managed_single_arch(fake_app, fake_services, mocker):
+    mock_run_managed = mocker.patch.object(Application, "run_managed")
+    mock_pack_multi_arch = mocker.patch.object(
+        fake_services.get("package"), "pack_multi_arch"
+    )
+
+    fake_app.run_managed(None, None)
+
+    mock_run_managed.assert_called_once_with(None, None)
+    mock_pack_multi_arch.assert_not_called()
+
+
+@pytest.fixture
+def mock_instance_context(fake_services, mocker, mock_instance, mock_fetch_active):
+    mocker.patch.object(
+        fake_services.get("proxy"), "configure_instance", return_value={}
+    )
+    mock_instance_context = mocker.patch.object(
+        fake_services.get("provider"), "instance"
+    )
+    mock_instance_context.return_value.__enter__.return_value = mock_instance
+    return mock_instance_context
+
+
+@pytest.fixture
+def stream_output(mocker, tmp_path) -> Path:
+    """Write what the instances stream through the emitter to a file."""
+    output = tmp_path / "stream"
+
+    @contextlib.contextmanager
+    def open_stream(*args, **kwargs):
+        with output.open("ab") as file:
+            yield file.fileno()
+
+    mocker.patch.object(emit, "open_stream", open_stream)
+    return output
+
+
+def fake_popen(outputs: dict[str, bytes], returncodes: dict[str, int]):
+    def execute_popen(cmd, *, env, **kwargs):
+        platform = env["CRAFT_PLATFORM"]
+        return mock.Mock(
+            stdout=io.BytesIO(outputs.get(platform, b"")),
+            **{"wait.return_value": returncodes.get(platform, 0)},
+        )
+
+    return execute_popen
+
+
+@pytest.mark.usefixtures("stream_output")
+def test_run_instances(fake_app, mocker, mock_instance, mock_instance_context):
+    mocker.patch.object(sys, "argv", ["rockcraft", "pack", "--multi-arch"])
+    mock_instance.execute_popen.side_effect = fake_popen({}, {})
+
+    fake_app._run_instances([build_info("amd64"), build_info("arm64")])
+
+    # The instances run concurrently, so they start in any order.
+    assert sorted(
+        call.args[0].platform for call in mock_instance_context.call_args_list
+    ) == ["amd64", "arm64"]
+    for call in mock_instance_context.call_args_list:
+        assert call.kwargs["use_base_instance"]
+    assert sorted(
+        call.kwargs["env"]["CRAFT_PLATFORM"]
+        for call in mock_instance.execute_popen.call_args_list
+    ) == ["amd64", "arm64"]
+    for call in mock_instance.execute_popen.call_args_list:
+        assert call.args[0] == ["rockcraft", "pack", "--multi-arch"]
+        assert call.kwargs["cwd"] == fake_app.app.managed_instance_project_path
+
+
+@pytest.mark.usefixtures("mock_instance_context")
+def test_run_instances_output(fake_app, mock_instance, stream_output):
+    """The output of each instance is prefixed by its platform."""
+    mock_instance.execute_popen.side_effect = fake_popen(
+        {"amd64": b"Pulling\nPacked\n", "arm64": b"Pulling\n"}, {}
+    )
+
+    fake_app._run_instances([build_info("amd64"), build_info("arm64")])
+
+    assert sorted(stream_output.read_bytes().splitlines()) == [
+        b"[amd64] Packed",
+        b"[amd64] Pulling",
+        b"[arm64] Pulling",
+    ]
+
+
+@pytest.mark.usefixtures("mock_instance_context", "stream_output")
+def test_run_instances_failed(fake_app, mocker, mock_instance, emitter):
+    """The first failure is reported while the other instances keep running."""
+    arm64_done = threading.Event()
+    popen = fake_popen({}, {"amd64": 1})
+
+    def execute_popen(cmd, *, env, **kwargs):
+        if env["CRAFT_PLATFORM"] == "arm64":
+            # Only finishes once the failure of amd64 has been reported.
+            assert arm64_done.wait(timeout=5)
+        return popen(cmd, env=env, **kwargs)
+
+    def progress(*args, **kwargs):
+        emitter.record("progress", args, kwargs)
+        arm64_done.set()
+
+    mocker.patch.object(emit, "progress", progress)
+    mock_instance.execute_popen.side_effect = execute_popen
+
+    with pytest.raises(craft_providers.ProviderError, match="amd64 instance"):
+        fake_app._run_instances([build_info("amd64"), build_info("arm64")])
+
+    emitter.assert_progress(
+        "Failed to build amd64, waiting for the other platforms", permanent=True
+    )
+    assert mock_instance.execute_popen.call_count == 2
+
+
+@pytest.mark.usefixtures("configured_project", "mock_fetch_active")
+def test_run_managed_stdout(fake_app, fake_services, mocker, mock_instance):
+    """The rock that the instance writes to its standard output is forwarded."""
+    mocker.patch.object(sys, "argv", ["rockcraft", "pack", "--stdout"])
+    mocker.patch.object(
+        fake_services.get("build_plan"), "plan", return_value=[build_info("amd64")]
+    )
+    mock_instance_context = mocker.patch.object(
+        fake_services.get("provider"), "instance"
+    )
+    mock_instance_context.return_value.__enter__.return_value = mock_instance
+    fake_app._pre_run(
+        mocker.Mock(
+            **{"parsed_args.return_value": pack_args(multi_arch=False, stdout=True)}
+        )
+    )
+
+    fake_app.run_managed(None, None)
+
+    mock_instance.execute_run.assert_called_once()
+    call = mock_instance.execute_run.call_args
+    assert call.args[0] == ["rockcraft", "pack", "--stdout"]
+    # The instance's standard output is the host's.
+    assert "stdout" not in call.kwargs
+
+
+def test_run_managed_stdout_several_platforms(fake_app, fake_services, mocker):
+    mocker.patch.object(
+        fake_services.get("build_plan"),
+        "plan",
+        return_value=[build_info("amd64"), build_info("arm64")],
+    )
+    mock_run_managed = mocker.patch.object(Application, "run_managed")
+    fake_app._pre_run(
+        mocker.Mock(
+            **{"parsed_args.return_value": pack_args(multi_arch=False, stdout=True)}
+        )
+    )
+
+    with pytest.raises(RockcraftError, match="several platforms"):
+        fake_app.run_managed(None, None)
+
+    mock_run_managed.assert_not_called()
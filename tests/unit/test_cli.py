@@ -80,6 +80,53 @@ def test_run_pack_services(mocker, monkeypatch, tmp_path):
     assert log_path.is_file()
 
 
+@pytest.mark.usefixtures("fake_project_file")
+def test_run_pack_options(mocker, monkeypatch, tmp_path):
+    # Pretend it's running inside the managed instance
+    monkeypatch.setenv("CRAFT_MANAGED_MODE", "1")
+
+    mocker.patch.object(Rockcraft, "get_project")
+    mocker.patch.object(Rockcraft, "log_path", new=tmp_path / "rockcraft.log")
+    state_dir = tmp_path / "craft-state"
+    state_dir.mkdir()
+    mocker.patch.object(StateService, "_get_state_dir", return_value=state_dir)
+    lifecycle_mocks = mocker.patch.multiple(
+        services.RockcraftLifecycleService,
+        setup=DEFAULT,
+        prime_dir=Path("/fake/prime/dir"),
+        run=DEFAULT,
+        project_info=DEFAULT,
+        set_jobs=DEFAULT,
+    )
+    package_mocks = mocker.patch.multiple(
+        services.RockcraftPackageService,
+        write_metadata=DEFAULT,
+        pack=DEFAULT,
+        override_compression=DEFAULT,
+    )
+    package_mocks["pack"].return_value = [tmp_path / "project/my-rock.rock"]
+
+    command_line = [
+        "rockcraft",
+        "pack",
+        "--compression-level",
+        "9",
+        "--compression-threads",
+        "2",
+        "--jobs",
+        "4",
+    ]
+    mocker.patch.object(sys, "argv", command_line)
+
+    cli.run()
+
+    package_mocks["override_compression"].assert_called_once_with(
+        codec=None, level=9, threads=2
+    )
+    lifecycle_mocks["set_jobs"].assert_called_once_with(4)
+    package_mocks["pack"].assert_called_once()
+
+
 @pytest.fixture
 def valid_dir(new_dir, monkeypatch):
     valid = pathlib.Path(new_dir) / "valid"
@@ -0,0 +1,212 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright 2025 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import gzip
+import io
+import random
+import zlib
+
+import pydantic
+import pytest
+import zstandard
+from rockcraft import compression
+
+BLOCK_SIZE = 64 * 1024
+
+
+def sample_data(size: int) -> bytes:
+    """Get somewhat compressible data of the given size."""
+    rng = random.Random(size)  # noqa: S311 (not used for cryptography)
+    words = [rng.randbytes(rng.randint(1, 12)) for _ in range(256)]
+    data = bytearray()
+    while len(data) < size:
+        data += rng.choice(words)
+    return bytes(data[:size])
+
+
+def compress_in_chunks(
+    compressor: compression.Compressor, data: bytes, chunk_size: int = 10240
+) -> bytes:
+    chunks = [
+        compressor.compress(data[i : i + chunk_size])
+        for i in range(0, len(data), chunk_size)
+    ]
+    return b"".join(chunks) + compressor.flush()
+
+
+@pytest.mark.parametrize(
+    "size", [0, 1, BLOCK_SIZE - 1, BLOCK_SIZE, 3 * BLOCK_SIZE, 10 * BLOCK_SIZE + 7]
+)
+@pytest.mark.parametrize("threads", [1, 2, 4])
+def test_parallel_gzip_roundtrip(size, threads):
+    data = sample_data(size)
+    compressor = compression.ParallelGzipCompressor(
+        level=6, threads=threads, block_size=BLOCK_SIZE
+    )
+
+    compressed = compress_in_chunks(compressor, data)
+
+    assert gzip.decompress(compressed) == data
+    # A single gzip member that standard decoders read with no leftovers
+    decompressor = zlib.decompressobj(wbits=31)
+    assert decompressor.decompress(compressed) == data
+    assert decompressor.eof
+    assert decompressor.unused_data == b""
+
+
+def test_parallel_gzip_ratio():
+    """Priming each block with its predecessor keeps the ratio close to zlib's."""
+    data = sample_data(8 * BLOCK_SIZE)
+    compressor = compression.ParallelGzipCompressor(
+        level=6, threads=4, block_size=BLOCK_SIZE
+    )
+
+    parallel = compress_in_chunks(compressor, data)
+    serial = gzip.compress(data, compresslevel=6, mtime=0)
+
+    assert len(parallel) < len(serial) * 1.01
+
+
+def test_parallel_gzip_deterministic():
+    data = sample_data(5 * BLOCK_SIZE)
+
+    outputs = {
+        compress_in_chunks(
+            compression.ParallelGzipCompressor(
+                level=6, threads=threads, block_size=BLOCK_SIZE
+            ),
+            data,
+        )
+        for threads in (1, 2, 3, 4)
+    }
+
+    assert len(outputs) == 1
+
+
+def test_parallel_gzip_close_unfinished():
+    compressor = compression.ParallelGzipCompressor(threads=2, block_size=BLOCK_SIZE)
+    compressor.compress(sample_data(4 * BLOCK_SIZE))
+
+    compressor.close()
+
+    assert compressor._executor._shutdown
+
+
+@pytest.mark.parametrize("size", [0, 1, 3 * BLOCK_SIZE + 7])
+@pytest.mark.parametrize("threads", [1, 2])
+def test_zstd_roundtrip(size, threads):
+    data = sample_data(size)
+    compressor = compression.ZstdCompressor(level=3, threads=threads)
+
+    compressed = compress_in_chunks(compressor, data)
+
+    decompressor = zstandard.ZstdDecompressor().decompressobj()
+    assert decompressor.decompress(compressed) == data
+    assert decompressor.eof
+
+
+@pytest.mark.parametrize(
+    ("settings", "expected"),
+    [
+        ({"threads": 1}, compression.ParallelGzipCompressor),
+        ({"threads": 2}, compression.ParallelGzipCompressor),
+        ({"codec": "zstd", "threads": 1}, compression.ZstdCompressor),
+        ({"codec": "zstd", "threads": 2}, compression.ZstdCompressor),
+    ],
+)
+def test_new_compressor(settings, expected):
+    compressor = compression.new_compressor(compression.Compression(**settings))
+    try:
+        assert isinstance(compressor, expected)
+    finally:
+        compressor.close()
+
+
+@pytest.mark.parametrize("codec", ["gzip", "zstd"])
+def test_new_compressor_threads_reproducible(codec):
+    """The compressed data doesn't depend on the number of threads."""
+    data = sample_data(5 * compression.DEFAULT_BLOCK_SIZE + 7)
+
+    outputs = {
+        compress_in_chunks(
+            compression.new_compressor(
+                compression.Compression(codec=codec, threads=threads)
+            ),
+            data,
+        )
+        for threads in (1, 2, 8)
+    }
+
+    assert len(outputs) == 1
+
+
+@pytest.mark.parametrize(
+    ("codec", "level", "media_type"),
+    [
+        ("gzip", 6, "application/vnd.oci.image.layer.v1.tar+gzip"),
+        ("zstd", 3, "application/vnd.oci.image.layer.v1.tar+zstd"),
+    ],
+)
+def test_compression_defaults(mocker, codec, level, media_type):
+    mocker.patch("os.cpu_count", return_value=12)
+
+    settings = compression.Compression(codec=codec)
+
+    assert settings.get_level() == level
+    assert settings.get_threads() == 12
+    assert settings.media_type == media_type
+
+
+def test_compression_default_codec():
+    assert compression.Compression().codec == "gzip"
+
+
+@pytest.mark.parametrize(
+    "settings",
+    [
+        {"level": 0},
+        {"level": 10},
+        {"codec": "zstd", "level": 23},
+        {"threads": 0},
+        {"codec": "lz4"},
+    ],
+)
+def test_compression_invalid(settings):
+    with pytest.raises(pydantic.ValidationError):
+        compression.Compression.unmarshal(settings)
+
+
+@pytest.mark.parametrize(
+    ("media_type", "compress"),
+    [
+        (compression.GZIP_LAYER_MEDIA_TYPE, gzip.compress),
+        (compression.ZSTD_LAYER_MEDIA_TYPE, zstandard.ZstdCompressor().compress),
+        ("application/vnd.oci.image.layer.v1.tar", bytes),
+        ("application/vnd.docker.image.rootfs.diff.tar.gzip", gzip.compress),
+    ],
+)
+def test_open_layer(media_type, compress):
+    data = random.Random(0).randbytes(100_000)  # noqa: S311 (not used for cryptography)
+
+    with compression.open_layer(io.BytesIO(compress(data)), media_type) as stream:
+        assert stream.read() == data
+
+
+def test_open_layer_unsupported():
+    with pytest.raises(ValueError, match="Unsupported layer media type"):
+        compression.open_layer(
+            io.BytesIO(), "application/vnd.oci.image.layer.v1.tar+lz4"
+        )
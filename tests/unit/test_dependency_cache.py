@@ -0,0 +1,107 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright 2025 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+
+import pytest
+from rockcraft import errors
+from rockcraft.dependency_cache import DependencyCache
+
+
+@pytest.fixture
+def cache(tmp_path) -> DependencyCache:
+    return DependencyCache(tmp_path / "dependencies")
+
+
+def test_get_build_environment(cache):
+    environment = cache.get_build_environment(
+        {"plugin": "poetry", "source": "."}, part_name="my-part"
+    )
+
+    assert environment == [
+        {"POETRY_CACHE_DIR": f"{cache.path}/poetry"},
+        {"PIP_CACHE_DIR": f"{cache.path}/pip"},
+    ]
+
+
+def test_get_build_environment_go(cache):
+    environment = cache.get_build_environment({"plugin": "go"}, part_name="my-part")
+
+    assert environment == [
+        {"GOMODCACHE": f"{cache.path}/go/mod"},
+        {"GOCACHE": f"{cache.path}/go/build"},
+    ]
+
+
+def test_get_build_environment_part_name(cache):
+    """Parts without a plugin use the plugin named after them."""
+    environment = cache.get_build_environment({"source": "."}, part_name="npm")
+
+    assert environment == [{"npm_config_cache": f"{cache.path}/npm"}]
+
+
+@pytest.mark.parametrize("plugin", ["nil", "dump", "make"])
+def test_get_build_environment_no_cache(cache, plugin):
+    assert cache.get_build_environment({"plugin": plugin}, part_name="my-part") == []
+
+
+def test_get_sizes(cache):
+    (cache.path / "pip").mkdir(parents=True)
+    (cache.path / "pip/wheel").write_bytes(b"x" * 100)
+    (cache.path / "go/mod").mkdir(parents=True)
+    (cache.path / "go/mod/module").write_bytes(b"x" * 10)
+    # Hardlinked files are only counted once.
+    os.link(cache.path / "go/mod/module", cache.path / "go/mod/link")
+    (cache.path / "go/mod/symlink").symlink_to("module")
+    (cache.path / "unknown").mkdir()
+
+    sizes = cache.get_sizes()
+
+    assert sizes == {"pip": 100, "go": 10 + len("module")}
+
+
+def test_get_sizes_empty(cache):
+    assert cache.get_sizes() == {}
+
+
+def test_evict(cache):
+    for ecosystem in ("pip", "npm", "maven"):
+        (cache.path / ecosystem).mkdir(parents=True)
+
+    cache.evict(["pip", "maven", "uv"])
+
+    assert sorted(path.name for path in cache.path.iterdir()) == ["npm"]
+
+
+def test_evict_all(cache):
+    (cache.path / "go/mod/example.com/module@v1.0.0").mkdir(parents=True)
+    (cache.path / "go/mod/example.com/module@v1.0.0/go.mod").write_text("module")
+    (cache.path / "uv").mkdir()
+    # Go makes its module cache read-only.
+    (cache.path / "go/mod/example.com/module@v1.0.0").chmod(0o555)
+
+    cache.evict()
+
+    assert list(cache.path.iterdir()) == []
+
+
+def test_evict_unknown(cache):
+    (cache.path / "pip").mkdir(parents=True)
+
+    with pytest.raises(errors.RockcraftError, match="Unknown dependency caches: foo"):
+        cache.evict(["pip", "foo"])
+
+    assert (cache.path / "pip").is_dir()
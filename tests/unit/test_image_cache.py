@@ -0,0 +1,154 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright 2025 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import fcntl
+import json
+
+import pytest
+from rockcraft import errors, oci, oci_layout
+from rockcraft.image_cache import BaseImageCache
+
+DIGEST = bytes.fromhex("ab" * 32)
+NEW_DIGEST = bytes.fromhex("cd" * 32)
+
+
+def fake_pull(source_image, *, image_name, image_dir, arch, source_digest):
+    """Create an empty image in place of the pulled one."""
+    oci_layout.ImageEditor(image_dir / image_name, create=True).commit()
+    return oci.Image(image_name=image_name, path=image_dir)
+
+
+@pytest.fixture
+def mock_digest(mocker):
+    return mocker.patch.object(oci.Image, "digest", return_value=DIGEST)
+
+
+@pytest.fixture
+def mock_pull(mocker):
+    return mocker.patch.object(oci.Image, "pull", side_effect=fake_pull)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return BaseImageCache(tmp_path / "base-images")
+
+
+def test_get_image(cache, mock_digest, mock_pull):
+    image, digest = cache.get_image("ubuntu@24.04", arch="amd64")
+
+    assert digest == DIGEST
+    assert image == oci.Image(f"ubuntu:{DIGEST.hex()}-amd64", cache.images_dir)
+    assert image.exists()
+    mock_digest.assert_called_once_with(f"docker://{oci.REGISTRY_URL}/ubuntu:24.04")
+    mock_pull.assert_called_once_with(
+        f"docker://{oci.REGISTRY_URL}/ubuntu@sha256:{DIGEST.hex()}",
+        image_name=image.image_name,
+        image_dir=cache.images_dir,
+        arch="amd64",
+        source_digest=DIGEST,
+    )
+    digests = json.loads((cache.path / "digests.json").read_text())
+    assert digests == {"ubuntu:24.04": DIGEST.hex()}
+
+
+def test_get_image_cached(cache, mock_digest, mock_pull):
+    cache.get_image("ubuntu@24.04", arch="amd64")
+    mock_pull.reset_mock()
+
+    image, digest = cache.get_image("ubuntu@24.04", arch="amd64")
+
+    assert digest == DIGEST
+    assert image.exists()
+    mock_pull.assert_not_called()
+
+
+def test_get_image_updated(cache, mock_digest, mock_pull):
+    """A base that resolves to a new digest is pulled again, next to the old one."""
+    old_image, _ = cache.get_image("ubuntu@24.04", arch="amd64")
+    mock_digest.return_value = NEW_DIGEST
+
+    image, digest = cache.get_image("ubuntu@24.04", arch="amd64")
+
+    assert digest == NEW_DIGEST
+    assert image.image_name == f"ubuntu:{NEW_DIGEST.hex()}-amd64"
+    assert mock_pull.call_count == 2
+    assert old_image.exists()
+    digests = json.loads((cache.path / "digests.json").read_text())
+    assert digests == {"ubuntu:24.04": NEW_DIGEST.hex()}
+
+
+def test_get_image_arches(cache, mock_digest, mock_pull):
+    amd64_image, _ = cache.get_image("ubuntu@24.04", arch="amd64")
+    arm64_image, _ = cache.get_image("ubuntu@24.04", arch="arm64")
+
+    assert amd64_image != arm64_image
+    assert mock_pull.call_count == 2
+
+
+def test_get_image_offline(cache, mock_digest, mock_pull):
+    cache.get_image("ubuntu@24.04", arch="amd64")
+    mock_digest.reset_mock()
+    mock_pull.reset_mock()
+
+    image, digest = cache.get_image("ubuntu@24.04", arch="amd64", offline=True)
+
+    assert digest == DIGEST
+    assert image.exists()
+    mock_digest.assert_not_called()
+    mock_pull.assert_not_called()
+
+
+def test_get_image_offline_not_cached(cache, mock_digest, mock_pull):
+    with pytest.raises(errors.RockcraftError, match="not cached"):
+        cache.get_image("ubuntu@24.04", arch="amd64", offline=True)
+
+    mock_digest.assert_not_called()
+    mock_pull.assert_not_called()
+
+
+def test_get_image_offline_other_arch(cache, mock_digest, mock_pull):
+    cache.get_image("ubuntu@24.04", arch="amd64")
+    mock_pull.reset_mock()
+
+    with pytest.raises(errors.RockcraftError, match="not cached"):
+        cache.get_image("ubuntu@24.04", arch="arm64", offline=True)
+
+    mock_pull.assert_not_called()
+
+
+def test_get_image_bad_name(cache):
+    with pytest.raises(ValueError, match="Bad image name"):
+        cache.get_image("ubuntu:24.04", arch="amd64")
+
+
+@pytest.mark.parametrize(
+    ("shared", "operation"), [(False, fcntl.LOCK_EX), (True, fcntl.LOCK_SH)]
+)
+def test_lock(cache, mocker, shared, operation):
+    mock_flock = mocker.patch("fcntl.flock")
+
+    with cache.lock(shared=shared):
+        assert mock_flock.call_args.args[1] == operation
+
+    assert mock_flock.call_args.args[1] == fcntl.LOCK_UN
+    assert (cache.path / ".lock").exists()
+
+
+def test_lock_exclusive(cache):
+    """The exclusive lock keeps other processes from locking the cache."""
+    with cache.lock(), (cache.path / ".lock").open() as other:
+        with pytest.raises(BlockingIOError):
+            fcntl.flock(other, fcntl.LOCK_SH | fcntl.LOCK_NB)
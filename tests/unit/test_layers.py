@@ -13,6 +13,8 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import errno
+import io
 import os
 import re
 import stat
@@ -23,6 +25,7 @@ from pathlib import Path
 import pytest
 from craft_parts.overlays import overlays
 from rockcraft import errors, layers
+from rockcraft.rootfs_index import INDEX_FILE, RootfsIndex
 
 
 def get_tar_contents(tar_path: Path) -> list[str]:
@@ -85,6 +88,209 @@ def test_archive_layer_directories(tmp_path):
     assert temp_tar_contents == expected_tar_contents
 
 
+def test_archive_layer_reproducible(tmp_path, monkeypatch):
+    """With SOURCE_DATE_EPOCH, the tarball only depends on the layer's contents."""
+    monkeypatch.setenv("SOURCE_DATE_EPOCH", "1000")
+    layer_dir = tmp_path / "layer_dir"
+    (layer_dir / "dir").mkdir(parents=True)
+    (layer_dir / "dir/file.txt").write_text("content")
+    (layer_dir / "old.txt").write_text("old")
+    os.utime(layer_dir / "old.txt", (10.5, 10.5))
+
+    first_tar_path = tmp_path / "first.tar"
+    layers.archive_layer(layer_dir, first_tar_path)
+    os.utime(layer_dir / "dir/file.txt", (2000, 2000))
+    second_tar_path = tmp_path / "second.tar"
+    layers.archive_layer(layer_dir, second_tar_path)
+
+    assert first_tar_path.read_bytes() == second_tar_path.read_bytes()
+    with tarfile.open(first_tar_path) as tar_file:
+        members = {member.name: member for member in tar_file.getmembers()}
+    # Later mtimes are clamped, earlier ones are kept.
+    assert members["dir/file.txt"].mtime == 1000
+    assert members["old.txt"].mtime == 10
+    assert all(not member.uname and not member.gname for member in members.values())
+    assert all(not member.pax_headers for member in members.values())
+
+
+def test_write_layer_paths_headers(tmp_path):
+    """The headers are the same as the ones created by tarfile."""
+    layer_dir = tmp_path / "layer_dir"
+    (layer_dir / "dir").mkdir(parents=True)
+    (layer_dir / "dir/file.txt").write_text("content")
+    (layer_dir / "dir/file.txt").chmod(0o640)
+    (layer_dir / "hardlink.txt").hardlink_to(layer_dir / "dir/file.txt")
+    (layer_dir / "symlink").symlink_to("dir/file.txt")
+    os.mkfifo(layer_dir / "fifo")
+    layer_paths = layers.gather_layer_paths(layer_dir)
+
+    tar_path = tmp_path / "layer.tar"
+    with tar_path.open("wb") as tar_stream:
+        layers.write_layer_paths(layer_paths, tar_stream)
+    expected_tar_path = tmp_path / "expected.tar"
+    with tarfile.open(expected_tar_path, "w") as tar_file:
+        for arcname in sorted(layer_paths):
+            tar_file.add(layer_paths[arcname].path, arcname=arcname, recursive=False)
+
+    assert tar_path.read_bytes() == expected_tar_path.read_bytes()
+
+
+@pytest.fixture
+def large_layer_dir(tmp_path):
+    """A layer with files copied in one read, in several reads and by the kernel."""
+    layer_dir = tmp_path / "layer_dir"
+    layer_dir.mkdir()
+    (layer_dir / "empty").touch()
+    (layer_dir / "small").write_bytes(os.urandom(1000))
+    (layer_dir / "medium").write_bytes(os.urandom(layers._ZERO_COPY_MIN_SIZE + 1))
+    (layer_dir / "large").write_bytes(os.urandom(layers._COPY_BUFFER_SIZE * 2 + 3))
+    return layer_dir
+
+
+def expected_tar_bytes(layer_paths):
+    """Archive ``layer_paths`` with tarfile."""
+    expected = io.BytesIO()
+    with tarfile.open(fileobj=expected, mode="w|", format=tarfile.PAX_FORMAT) as tar:
+        for arcname in sorted(layer_paths):
+            tar.add(layer_paths[arcname].path, arcname=arcname, recursive=False)
+    return expected.getvalue()
+
+
+def test_write_layer_paths_file(tmp_path, large_layer_dir, mocker):
+    """The files are copied by the kernel into tarballs written to files."""
+    layer_paths = layers.gather_layer_paths(large_layer_dir)
+    spy_sendfile = mocker.spy(os, "sendfile")
+
+    tar_path = tmp_path / "layer.tar"
+    with tar_path.open("wb") as tar_stream:
+        layers.write_layer_paths(layer_paths, tar_stream)
+
+    assert tar_path.read_bytes() == expected_tar_bytes(layer_paths)
+    assert spy_sendfile.call_count >= 2
+
+
+def test_write_layer_paths_stream(large_layer_dir, mocker):
+    """Tarballs written to other streams are written in large chunks."""
+    layer_paths = layers.gather_layer_paths(large_layer_dir)
+    tar_stream = io.BytesIO()
+    spy_write = mocker.spy(tar_stream, "write")
+
+    layers.write_layer_paths(layer_paths, tar_stream)
+
+    assert tar_stream.getvalue() == expected_tar_bytes(layer_paths)
+    assert spy_write.call_count <= 4
+
+
+def test_write_layer_paths_no_sendfile(tmp_path, large_layer_dir, mocker):
+    """Files are still copied if the kernel can't copy them."""
+    layer_paths = layers.gather_layer_paths(large_layer_dir)
+    mock_sendfile = mocker.patch.object(
+        os, "sendfile", side_effect=OSError(errno.EINVAL, "Invalid argument")
+    )
+
+    tar_path = tmp_path / "layer.tar"
+    with tar_path.open("wb") as tar_stream:
+        layers.write_layer_paths(layer_paths, tar_stream)
+
+    assert tar_path.read_bytes() == expected_tar_bytes(layer_paths)
+    mock_sendfile.assert_called_once()
+
+
+def test_write_layer_paths_truncated(large_layer_dir):
+    """Files that shrink while they are archived are an error, like with tarfile."""
+    layer_paths = layers.gather_layer_paths(large_layer_dir)
+    (large_layer_dir / "large").write_bytes(b"short")
+
+    with pytest.raises(OSError, match="unexpected end of data"):
+        layers.write_layer_paths(layer_paths, io.BytesIO())
+
+
+def test_write_layer_paths_hardlinks(tmp_path):
+    """Files with several links are archived once."""
+    layer_dir = tmp_path / "layer_dir"
+    layer_dir.mkdir()
+    (layer_dir / "a.txt").write_text("content")
+    (layer_dir / "b.txt").hardlink_to(layer_dir / "a.txt")
+    tar_stream = io.BytesIO()
+
+    layers.write_layer_paths(layers.gather_layer_paths(layer_dir), tar_stream)
+
+    tar_stream.seek(0)
+    with tarfile.open(fileobj=tar_stream) as tar_file:
+        members = {member.name: member for member in tar_file.getmembers()}
+    assert members["a.txt"].isreg()
+    assert members["b.txt"].islnk()
+    assert members["b.txt"].linkname == "a.txt"
+
+
+def test_find_duplicate_files(tmp_path, mocker):
+    layer_dir = tmp_path / "layer_dir"
+    (layer_dir / "venv1").mkdir(parents=True)
+    (layer_dir / "venv2").mkdir()
+    (layer_dir / "venv1/module.py").write_text("same")
+    (layer_dir / "venv2/module.py").write_text("same")
+    (layer_dir / "venv2/link.py").hardlink_to(layer_dir / "venv2/module.py")
+    (layer_dir / "venv2/other.py").write_text("diff")
+    (layer_dir / "venv2/script.py").write_text("same")
+    (layer_dir / "venv2/script.py").chmod(0o755)
+    (layer_dir / "venv2/unique.py").write_text("unique")
+    spy_digest = mocker.spy(layers, "file_digest")
+
+    duplicates = layers.find_duplicate_files(layers.gather_layer_paths(layer_dir))
+
+    # The hardlinks of a duplicate are archived as links to the first copy too.
+    assert duplicates == {
+        "venv2/link.py": "venv1/module.py",
+        "venv2/module.py": "venv1/module.py",
+    }
+    # Files with a unique size, permissions and ownership are not read.
+    hashed = {call.args[0].name for call in spy_digest.call_args_list}
+    assert sorted(hashed) == ["link.py", "module.py", "other.py"]
+
+
+def test_write_layer_paths_duplicates(tmp_path):
+    layer_dir = tmp_path / "layer_dir"
+    layer_dir.mkdir()
+    content = os.urandom(100_000)
+    (layer_dir / "a.bin").write_bytes(content)
+    (layer_dir / "b.bin").write_bytes(content)
+    layer_paths = layers.gather_layer_paths(layer_dir)
+    tar_stream = io.BytesIO()
+
+    layers.write_layer_paths(
+        layer_paths,
+        tar_stream,
+        duplicates=layers.find_duplicate_files(layer_paths),
+    )
+
+    assert len(tar_stream.getvalue()) < len(content) * 2
+    tar_stream.seek(0)
+    extract_dir = tmp_path / "extracted"
+    with tarfile.open(fileobj=tar_stream) as tar_file:
+        assert tar_file.getmember("b.bin").linkname == "a.bin"
+        tar_file.extractall(extract_dir, filter="tar")
+    assert (extract_dir / "b.bin").read_bytes() == content
+    assert (extract_dir / "b.bin").samefile(extract_dir / "a.bin")
+
+
+def test_gather_layer_paths_stats_once(tmp_path, mocker):
+    """Paths are only stat'ed while they are gathered."""
+    layer_dir = tmp_path / "layer_dir"
+    (layer_dir / "dir").mkdir(parents=True)
+    (layer_dir / "dir/file.txt").write_text("content")
+    (layer_dir / "symlink").symlink_to("dir")
+    layer_paths = layers.gather_layer_paths(layer_dir)
+    spy_lstat = mocker.spy(os, "lstat")
+    spy_stat = mocker.spy(os, "stat")
+
+    layers.split_layer_paths(layer_paths, layer_dir, [layers.LayerGroup("dir")])
+    layers.fingerprint_layer_paths(layer_paths)
+    layers.write_layer_paths(layer_paths, io.BytesIO())
+
+    spy_lstat.assert_not_called()
+    spy_stat.assert_not_called()
+
+
 def test_archive_layer_symlinks(tmp_path):
     """
     Test creating a new layer with symlinks (both file and dir).
@@ -356,3 +562,280 @@ def test_prune_prime_files(tmp_path):
 
     # "file1.txt" gets pruned, the other files remain.
     assert sorted(os.listdir(prime_dir)) == ["file2.txt", "file3.txt"]  # noqa: PTH208 (use Path.iterdir())
+
+
+def test_prune_prime_files_short_circuit(tmp_path, mocker):
+    """Files with different sizes or permissions are never read."""
+    base_layer_dir = tmp_path / "base"
+    base_layer_dir.mkdir()
+    (base_layer_dir / "size.txt").write_text("file")
+    (base_layer_dir / "mode.txt").write_text("file")
+    prime_dir = tmp_path / "prime"
+    prime_dir.mkdir()
+    (prime_dir / "size.txt").write_text("longer file")
+    (prime_dir / "mode.txt").write_text("file")
+    (prime_dir / "mode.txt").chmod(0o600)
+    (prime_dir / "new.txt").write_text("new")
+    spy_same_contents = mocker.spy(layers, "_same_contents")
+
+    layers.prune_prime_files(
+        prime_dir, {"size.txt", "mode.txt", "new.txt"}, base_layer_dir
+    )
+
+    spy_same_contents.assert_not_called()
+    assert sorted(os.listdir(prime_dir)) == ["mode.txt", "new.txt", "size.txt"]  # noqa: PTH208 (use Path.iterdir())
+
+
+def test_prune_prime_files_large(tmp_path):
+    """Files are compared past the first read."""
+    base_layer_dir = tmp_path / "base"
+    base_layer_dir.mkdir()
+    prime_dir = tmp_path / "prime"
+    prime_dir.mkdir()
+    content = os.urandom(layers._COMPARE_BUFFER_SIZE * 2)
+    (base_layer_dir / "same.bin").write_bytes(content)
+    (prime_dir / "same.bin").write_bytes(content)
+    (base_layer_dir / "different.bin").write_bytes(content)
+    (prime_dir / "different.bin").write_bytes(content[:-1] + b"x")
+
+    layers.prune_prime_files(prime_dir, {"same.bin", "different.bin"}, base_layer_dir)
+
+    assert sorted(os.listdir(prime_dir)) == ["different.bin"]  # noqa: PTH208 (use Path.iterdir())
+
+
+def test_prune_prime_files_symlinks(tmp_path):
+    base_layer_dir = tmp_path / "base"
+    base_layer_dir.mkdir()
+    (base_layer_dir / "target").write_text("target")
+    (base_layer_dir / "same").symlink_to("target")
+    (base_layer_dir / "other").symlink_to("target")
+    (base_layer_dir / "file").write_text("target")
+    prime_dir = tmp_path / "prime"
+    prime_dir.mkdir()
+    (prime_dir / "target").write_text("target")
+    (prime_dir / "other-target").write_text("target")
+    (prime_dir / "same").symlink_to("target")
+    (prime_dir / "other").symlink_to("other-target")
+    (prime_dir / "file").symlink_to("target")
+
+    layers.prune_prime_files(prime_dir, {"same", "other", "file"}, base_layer_dir)
+
+    assert sorted(os.listdir(prime_dir)) == ["file", "other", "other-target", "target"]  # noqa: PTH208 (use Path.iterdir())
+
+
+def test_prune_prime_files_index(tmp_path, mocker):
+    """With an index of the base, the files of the base are never read."""
+    base_layer_dir = tmp_path / "base"
+    (base_layer_dir / "usr/lib").mkdir(parents=True)
+    (base_layer_dir / "lib").symlink_to("usr/lib")
+    (base_layer_dir / "usr/lib/same.so").write_text("same")
+    (base_layer_dir / "usr/lib/different.so").write_text("base")
+    (base_layer_dir / "link.so").symlink_to("usr/lib/same.so")
+    RootfsIndex.build(base_layer_dir).write(tmp_path / INDEX_FILE)
+    prime_dir = tmp_path / "prime"
+    (prime_dir / "lib").mkdir(parents=True)
+    (prime_dir / "lib/same.so").write_text("same")
+    (prime_dir / "lib/different.so").write_text("prim")
+    (prime_dir / "usr/lib").mkdir(parents=True)
+    (prime_dir / "usr/lib/same.so").write_text("same")
+    (prime_dir / "link.so").symlink_to("usr/lib/same.so")
+    # The files of the base would have to be read to compare them.
+    for path in (base_layer_dir / "usr/lib").iterdir():
+        path.write_text("gone")
+    spy_open = mocker.spy(Path, "open")
+
+    layers.prune_prime_files(
+        prime_dir, {"lib/same.so", "lib/different.so", "link.so"}, base_layer_dir
+    )
+
+    assert sorted(os.listdir(prime_dir / "lib")) == ["different.so"]  # noqa: PTH208 (use Path.iterdir())
+    assert not (prime_dir / "link.so").is_symlink()
+    opened = {call.args[0] for call in spy_open.call_args_list}
+    assert opened == {prime_dir / "lib/same.so", prime_dir / "lib/different.so"}
+
+
+def test_archive_layer_with_base_layer_index(tmp_path):
+    """The usrmerge symlinks of the base are looked up in its index."""
+    base_layer_dir = tmp_path / "base"
+    (base_layer_dir / "usr/bin").mkdir(parents=True)
+    (base_layer_dir / "bin").symlink_to("usr/bin")
+    RootfsIndex.build(base_layer_dir).write(tmp_path / INDEX_FILE)
+    (base_layer_dir / "bin").unlink()
+    layer_dir = tmp_path / "layer"
+    (layer_dir / "bin").mkdir(parents=True)
+    (layer_dir / "bin/tool").write_text("tool")
+
+    layer_paths = layers.gather_layer_paths(layer_dir, base_layer_dir)
+
+    assert list(layer_paths) == ["usr/bin/tool"]
+
+
+def test_prune_prime_files_pkgconfig(tmp_path):
+    """The prefix of pkgconfig files is ignored, even if it changes their size."""
+    base_layer_dir = tmp_path / "base"
+    base_layer_dir.mkdir()
+    (base_layer_dir / "foo.pc").write_text("prefix=/usr\nName: foo\n")
+    prime_dir = tmp_path / "prime"
+    prime_dir.mkdir()
+    (prime_dir / "foo.pc").write_text("prefix=/root/prime/usr\nName: foo\n")
+
+    layers.prune_prime_files(prime_dir, {"foo.pc"}, base_layer_dir)
+
+    assert not (prime_dir / "foo.pc").exists()
+
+
+@pytest.mark.parametrize(
+    ("group", "path", "expected"),
+    [
+        (
+            layers.LayerGroup("deps", files=frozenset({"lib/foo.so"})),
+            "lib/foo.so",
+            True,
+        ),
+        (
+            layers.LayerGroup("deps", files=frozenset({"lib/foo.so"})),
+            "lib/bar.so",
+            False,
+        ),
+        (layers.LayerGroup("deps", patterns=("lib/*.so",)), "lib/bar.so", True),
+        (
+            layers.LayerGroup("deps", patterns=("app/node_modules",)),
+            "app/node_modules/a/b",
+            True,
+        ),
+        (
+            layers.LayerGroup("deps", patterns=("app/node_modules",)),
+            "app/main.js",
+            False,
+        ),
+        (layers.LayerGroup("deps", patterns=("lib",)), "usr/lib/foo", False),
+    ],
+)
+def test_layer_group_matches(group, path, expected):
+    assert group.matches(path) is expected
+
+
+def test_split_layer_paths(tmp_path):
+    layer_dir = tmp_path / "layer_dir"
+    (layer_dir / "usr/lib/python3/site-packages/flask").mkdir(parents=True)
+    (layer_dir / "usr/lib/python3/site-packages/flask/app.py").touch()
+    (layer_dir / "usr/bin").mkdir(parents=True)
+    (layer_dir / "usr/bin/python3").touch()
+    (layer_dir / "app").mkdir()
+    (layer_dir / "app/app.py").touch()
+    (layer_dir / "app/static").mkdir()
+    (layer_dir / "var/log/app").mkdir(parents=True)
+
+    groups = [
+        layers.LayerGroup(
+            "runtime", files=frozenset({"usr/bin/python3", "var/log/app"})
+        ),
+        layers.LayerGroup("dependencies", patterns=("usr/lib/python3/site-packages",)),
+        layers.LayerGroup("unused", patterns=("srv",)),
+    ]
+    layer_paths = layers.gather_layer_paths(layer_dir)
+    runtime, dependencies, unused, remainder = layers.split_layer_paths(
+        layer_paths, layer_dir, groups
+    )
+
+    assert sorted(runtime) == [
+        "usr",
+        "usr/bin",
+        "usr/bin/python3",
+        "var",
+        "var/log",
+        "var/log/app",
+    ]
+    assert sorted(dependencies) == [
+        "usr",
+        "usr/lib",
+        "usr/lib/python3",
+        "usr/lib/python3/site-packages",
+        "usr/lib/python3/site-packages/flask",
+        "usr/lib/python3/site-packages/flask/app.py",
+    ]
+    assert unused == {}
+    assert sorted(remainder) == ["app", "app/app.py", "app/static"]
+    assert remainder["app/app.py"].path == layer_dir / "app/app.py"
+
+
+def test_split_layer_paths_no_groups(tmp_path):
+    layer_dir = tmp_path / "layer_dir"
+    (layer_dir / "first").mkdir(parents=True)
+    (layer_dir / "first/first.txt").touch()
+    (layer_dir / "empty").mkdir()
+
+    layer_paths = layers.gather_layer_paths(layer_dir)
+
+    assert layers.split_layer_paths(layer_paths, layer_dir, []) == [layer_paths]
+
+
+def test_split_layer_paths_whiteouts(tmp_path):
+    """Whiteouts go in the first layer, so they don't hide the other layers' files."""
+    layer_dir = tmp_path / "layer_dir"
+    (layer_dir / "etc/app").mkdir(parents=True)
+    (layer_dir / "etc/app/.wh..wh..opq").touch()
+    (layer_dir / "etc/app/app.conf").touch()
+    (layer_dir / "opt/app").mkdir(parents=True)
+    (layer_dir / "opt/app/lib.so").touch()
+
+    groups = [layers.LayerGroup("dependencies", patterns=("opt/app",))]
+    layer_paths = layers.gather_layer_paths(layer_dir)
+    dependencies, remainder = layers.split_layer_paths(layer_paths, layer_dir, groups)
+
+    assert sorted(dependencies) == [
+        "etc",
+        "etc/app",
+        "etc/app/.wh..wh..opq",
+        "opt",
+        "opt/app",
+        "opt/app/lib.so",
+    ]
+    assert sorted(remainder) == ["etc", "etc/app", "etc/app/app.conf"]
+
+
+def test_split_layer_paths_usrmerge(tmp_path):
+    """Groups select paths by their primed path or by their name in the layer."""
+    layer_dir, rootfs_dir = duplicate_dirs_setup(tmp_path)
+    groups = [
+        layers.LayerGroup("primed", files=frozenset({"bin/dir1/a.txt"})),
+        layers.LayerGroup("named", patterns=("usr/bin/dir1/b.txt",)),
+    ]
+
+    layer_paths = layers.gather_layer_paths(layer_dir, rootfs_dir)
+    primed, named, remainder = layers.split_layer_paths(layer_paths, layer_dir, groups)
+
+    assert sorted(primed) == ["usr", "usr/bin", "usr/bin/dir1", "usr/bin/dir1/a.txt"]
+    assert sorted(named) == ["usr", "usr/bin", "usr/bin/dir1", "usr/bin/dir1/b.txt"]
+    assert remainder == {}
+
+
+def test_fingerprint_layer_paths(tmp_path):
+    (tmp_path / "dir").mkdir()
+    (tmp_path / "dir/file").write_text("content")
+    (tmp_path / "link").symlink_to("dir")
+    layer_paths = layers.gather_layer_paths(tmp_path)
+    original = layers.fingerprint_layer_paths(layer_paths)
+
+    assert layers.fingerprint_layer_paths(layer_paths) == original
+    # The names in the layer are part of the fingerprint
+    renamed = {f"usr/{name}": path for name, path in layer_paths.items()}
+    assert layers.fingerprint_layer_paths(renamed) != original
+
+    (tmp_path / "dir/file").chmod(0o600)
+    layer_paths = layers.gather_layer_paths(tmp_path)
+    assert layers.fingerprint_layer_paths(layer_paths) != original
+
+
+def test_fingerprint_layer_paths_hardlinks(tmp_path):
+    (tmp_path / "a").write_text("content")
+    (tmp_path / "b").write_text("content")
+    os.utime(tmp_path / "a", (0, 0))
+    os.utime(tmp_path / "b", (0, 0))
+    copied = layers.fingerprint_layer_paths(layers.gather_layer_paths(tmp_path))
+
+    (tmp_path / "b").unlink()
+    (tmp_path / "b").hardlink_to(tmp_path / "a")
+
+    linked = layers.fingerprint_layer_paths(layers.gather_layer_paths(tmp_path))
+    assert linked != copied
@@ -13,19 +13,25 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import dataclasses
 import datetime
+import gzip
 import hashlib
+import io
 import json
 import os
 import tarfile
 from pathlib import Path
 from typing import NamedTuple
-from unittest.mock import ANY, call, mock_open, patch
+from unittest.mock import call
 
 import pytest
-from rockcraft import errors, oci
+import yaml
+import zstandard
+from rockcraft import compression, errors, layers, oci, oci_layout
 from rockcraft.architectures import SUPPORTED_ARCHS
 from rockcraft.pebble import Pebble
+from rockcraft.rootfs_index import RootfsIndex
 
 import tests
 
@@ -48,8 +54,10 @@ def mock_run(mocker):
 
 
 @pytest.fixture
-def mock_archive_layer(mocker):
-    return mocker.patch("rockcraft.layers.archive_layer")
+def mock_source_digest(mocker):
+    """Resolve images to a fake digest, and don't record it in their layouts."""
+    mocker.patch.object(oci.Image, "digest", return_value=bytes.fromhex("ab" * 32))
+    return mocker.patch.object(oci_layout.Layout, "annotate_manifest")
 
 
 @pytest.fixture
@@ -73,28 +81,33 @@ def mock_tmpdir(mocker):
 
 
 @pytest.fixture
-def mock_inject_oci_fields(mocker):
-    return mocker.patch("rockcraft.oci._inject_oci_fields")
-
-
-@pytest.fixture
-def mock_read_bytes(mocker):
-    return mocker.patch("pathlib.Path.read_bytes")
+def mock_add_layer(mocker):
+    return mocker.patch("rockcraft.oci.Image.add_layer")
 
 
 @pytest.fixture
-def mock_write_bytes(mocker):
-    return mocker.patch("pathlib.Path.write_bytes")
+def bare_image(tmp_path) -> oci.Image:
+    """A real, empty image in a temporary layout."""
+    image, _ = oci.Image.new_oci_image(
+        "a@b", image_dir=tmp_path / "images", arch="amd64"
+    )
+    return image
 
 
-@pytest.fixture
-def mock_unlink(mocker):
-    return mocker.patch("pathlib.Path.unlink")
+def image_layout(image: oci.Image) -> oci_layout.Layout:
+    """Get the layout holding ``image``."""
+    layout_dir, _ = oci_layout.split_image_path(image.path / image.image_name)
+    return oci_layout.Layout(layout_dir)
 
 
-@pytest.fixture
-def mock_add_layer(mocker):
-    return mocker.patch("rockcraft.oci.Image.add_layer")
+def read_image(image: oci.Image) -> tuple[dict, dict]:
+    """Read the manifest and config of ``image`` from its layout."""
+    _, tag = oci_layout.split_image_path(image.path / image.image_name)
+    layout = image_layout(image)
+    _, descriptor = layout.find_manifest(layout.read_index(), tag)
+    manifest = layout.read_json_blob(descriptor["digest"])
+    config = layout.read_json_blob(manifest["config"]["digest"])
+    return manifest, config
 
 
 @tests.linux_only
@@ -106,7 +119,7 @@ class TestImage:
         assert image.image_name == "a:b"
         assert image.path == Path("/c")
 
-    def test_from_docker_registry(self, mock_run, new_dir):
+    def test_from_docker_registry(self, mock_run, mock_source_digest, new_dir):
         image, source_image = oci.Image.from_docker_registry(
             "a@b", image_dir=Path("images/dir"), arch="amd64"
         )
@@ -114,6 +127,12 @@ class TestImage:
         assert image.image_name == "a:b"
         assert source_image == f"docker://{oci.REGISTRY_URL}/a:b"
         assert image.path == Path("images/dir")
+        oci.Image.digest.assert_called_once_with(source_image)  # type: ignore[attr-defined]
+        # The image is pulled by the digest its tag resolved to, and the
+        # digest is recorded in the local layout.
+        mock_source_digest.assert_called_once_with(
+            "b", {oci_layout.SOURCE_DIGEST_ANNOTATION: "sha256:" + "ab" * 32}
+        )
         assert mock_run.mock_calls == [
             call(
                 [
@@ -124,7 +143,7 @@ class TestImage:
                     "copy",
                     "--retry-times",
                     str(oci.MAX_DOWNLOAD_RETRIES),
-                    f"docker://{oci.REGISTRY_URL}/a:b",
+                    f"docker://{oci.REGISTRY_URL}/a@sha256:{'ab' * 32}",
                     "oci:images/dir/a:b",
                 ]
             )
@@ -145,12 +164,44 @@ class TestImage:
                     "copy",
                     "--retry-times",
                     str(oci.MAX_DOWNLOAD_RETRIES),
-                    f"docker://{oci.REGISTRY_URL}/a:b",
+                    f"docker://{oci.REGISTRY_URL}/a@sha256:{'ab' * 32}",
                     "oci:images/dir/a:b",
                 ]
             )
         ]
 
+    def test_exists(self, bare_image):
+        assert bare_image.exists()
+        assert not oci.Image("a:other", bare_image.path).exists()
+        assert not oci.Image("other:b", bare_image.path).exists()
+
+    def test_manifest_digest(self, bare_image):
+        layout = image_layout(bare_image)
+        (descriptor,) = layout.read_index()["manifests"]
+
+        assert bare_image.manifest_digest() == descriptor["digest"]
+
+    def test_source_digest(self, bare_image):
+        """Images that weren't pulled are their own source."""
+        assert bare_image.source_digest() == bytes.fromhex(
+            bare_image.manifest_digest()[7:]
+        )
+
+    def test_source_digest_pulled(self, bare_image, mock_run):
+        oci.Image.pull(
+            "docker://registry/a@sha256:" + "cd" * 32,
+            image_name=bare_image.image_name,
+            image_dir=bare_image.path,
+            arch="amd64",
+            source_digest=bytes.fromhex("cd" * 32),
+        )
+
+        assert bare_image.source_digest() == bytes.fromhex("cd" * 32)
+        # The manifest itself is unchanged.
+        layout = image_layout(bare_image)
+        (descriptor,) = layout.read_index()["manifests"]
+        assert descriptor["digest"] == bare_image.manifest_digest()
+
     def _get_arch_from_call(self, mock_call):
         class ArchData(NamedTuple):
             override_arch: str
@@ -182,7 +233,13 @@ class TestImage:
         ],
     )
     def test_from_docker_registry_arch(
-        self, mock_run, new_dir, deb_arch, expected_arch, expected_variant
+        self,
+        mock_run,
+        mock_source_digest,
+        new_dir,
+        deb_arch,
+        expected_arch,
+        expected_variant,
     ):
         """Test that the correct arch-related parameters are passed to skopeo."""
         oci.Image.from_docker_registry(
@@ -194,7 +251,7 @@ class TestImage:
         assert arch_data.override_variant == expected_variant
 
     @pytest.mark.parametrize("deb_arch", list(SUPPORTED_ARCHS))
-    def test_new_oci_image(self, mock_inject_oci_fields, mock_run, deb_arch):
+    def test_new_oci_image(self, mock_run, new_dir, deb_arch):
         """Test that new blank images are created with the correct GOARCH values."""
         expected = SUPPORTED_ARCHS[deb_arch]
 
@@ -206,108 +263,478 @@ class TestImage:
         assert image.image_name == "bare:latest"
         assert source_image == f"oci:{str(image_dir)}/bare:latest"
         assert image.path == Path("images/dir")
-        assert mock_run.mock_calls == [
-            call(["umoci", "init", "--layout", f"{image_dir}/bare"]),
-            call(["umoci", "new", "--image", f"{image_dir}/bare:latest"]),
-            call(
-                [
-                    "umoci",
-                    "config",
-                    "--image",
-                    f"{image_dir}/bare:latest",
-                    "--architecture",
-                    expected.go_arch,
-                    "--no-history",
-                ]
-            ),
-        ]
-        mock_inject_oci_fields.assert_called_once_with(
-            image_dir / "bare:latest", arch_variant=expected.go_variant
+
+        # The image is created in-process, without calling umoci.
+        assert mock_run.mock_calls == []
+        layout_dir = image_dir / "bare"
+        assert json.loads((layout_dir / "oci-layout").read_text()) == {
+            "imageLayoutVersion": "1.0.0"
+        }
+
+        index = json.loads((layout_dir / "index.json").read_text())
+        assert len(index["manifests"]) == 1
+        assert index["manifests"][0]["annotations"] == {
+            "org.opencontainers.image.ref.name": "latest"
+        }
+
+        manifest, config = read_image(image)
+        assert manifest["mediaType"] == oci.MANIFEST_MEDIA_TYPE
+        assert manifest["layers"] == []
+        assert config["architecture"] == expected.go_arch
+        assert config.get("variant") == expected.go_variant
+        assert config["os"] == "linux"
+        assert config["rootfs"] == {"type": "layers", "diff_ids": []}
+
+        # Only the manifest and config blobs exist in the layout.
+        blobs = sorted(p.name for p in (layout_dir / "blobs/sha256").iterdir())
+        assert blobs == sorted(
+            [
+                index["manifests"][0]["digest"].split(":")[1],
+                manifest["config"]["digest"].split(":")[1],
+            ]
         )
 
-    def test_copy_to(self, mock_run):
-        image = oci.Image("a:b", Path("/c"))
-        new_image = image.copy_to("d:e", image_dir=Path("/f"))
+    def test_edit_single_pass(self, bare_image, mocker):
+        """All the changes in an edit transaction are written in one go."""
+        spy_write_blob = mocker.spy(oci_layout.Layout, "write_json_blob")
+        spy_write_index = mocker.spy(oci_layout.Layout, "write_index")
+
+        with bare_image.edit() as editor:
+            editor.set_default_user(584792, "_daemon_")
+            editor.set_entrypoint(["/bin/pebble", "enter"])
+            editor.set_cmd(["foo"])
+            editor.set_default_path("bare")
+            editor.set_environment({"NAME1": "VALUE1"})
+            editor.set_annotations({"NAME2": "VALUE2"})
+
+        # One config blob, one manifest blob, one index rewrite.
+        assert spy_write_blob.call_count == 2
+        assert spy_write_index.call_count == 1
+
+        manifest, config = read_image(bare_image)
+        assert manifest["annotations"] == {"NAME2": "VALUE2"}
+        assert config["config"] == {
+            "User": "584792",
+            "Entrypoint": ["/bin/pebble", "enter"],
+            "Cmd": ["foo"],
+            "Env": [f"PATH={Pebble.DEFAULT_ENV_PATH}", "NAME1=VALUE1"],
+            "Labels": {"NAME2": "VALUE2"},
+        }
+
+    def test_edit_error(self, bare_image):
+        """Nothing is written if the transaction fails."""
+        manifest, config = read_image(bare_image)
+
+        def failed_edit() -> None:
+            with bare_image.edit() as editor:
+                editor.set_cmd(["foo"])
+                raise RuntimeError("oops")
+
+        with pytest.raises(RuntimeError):
+            failed_edit()
+
+        assert read_image(bare_image) == (manifest, config)
+
+    def test_edit_removes_replaced_blobs(self, bare_image):
+        layout_dir = bare_image.path / "a"
+        old_blobs = set((layout_dir / "blobs/sha256").iterdir())
+
+        with bare_image.edit() as editor:
+            editor.set_cmd(["foo"])
+
+        new_blobs = set((layout_dir / "blobs/sha256").iterdir())
+        assert len(new_blobs) == 2
+        assert not old_blobs & new_blobs
+
+    def test_copy_to(self, bare_image, mock_run):
+        new_image = bare_image.copy_to("d:e", image_dir=bare_image.path / "other")
+
         assert new_image.image_name == "d:e"
-        assert new_image.path == Path("/f")
-        assert mock_run.mock_calls == [
-            call(
-                [
-                    "skopeo",
-                    "--insecure-policy",
-                    "copy",
-                    "oci:/c/a:b",
-                    "oci:/f/d:e",
-                ]
-            )
+        assert new_image.path == bare_image.path / "other"
+        assert new_image.manifest_digest() == bare_image.manifest_digest()
+        mock_run.assert_not_called()
+
+    def test_copy_to_same_layout(self, bare_image):
+        """Copies in the same layout are only new tags."""
+        layout = image_layout(bare_image)
+        blobs = sorted(layout.blobs_dir.iterdir())
+
+        new_image = bare_image.copy_to("a:copy", image_dir=bare_image.path)
+
+        assert new_image.manifest_digest() == bare_image.manifest_digest()
+        assert bare_image.exists()
+        assert sorted(layout.blobs_dir.iterdir()) == blobs
+
+    @pytest.mark.parametrize("codec", ["gzip", "zstd"])
+    def test_extract_to(self, bare_image, new_dir, codec):
+        Path("lower/etc").mkdir(parents=True)
+        Path("lower/etc/passwd").write_text("root:x:0:0::/root:/bin/bash\n")
+        Path("lower/etc/hostname").write_text("lower")
+        Path("middle/usr/bin").mkdir(parents=True)
+        Path("middle/usr/bin/tool").write_text("tool")
+        Path("upper/etc").mkdir(parents=True)
+        Path("upper/etc/hostname").write_text("upper")
+        image = dataclasses.replace(
+            bare_image, compression=compression.Compression(codec=codec)
+        )
+        for name in ("lower", "middle", "upper"):
+            image = image.add_layer(name, Path(name))
+
+        rootfs = image.extract_to(Path("bundle/dir"), rootless=True)
+
+        assert rootfs == Path("bundle/dir/a-upper/rootfs")
+        assert (rootfs / "etc/passwd").read_text() == "root:x:0:0::/root:/bin/bash\n"
+        assert (rootfs / "etc/hostname").read_text() == "upper"
+        assert (rootfs / "usr/bin/tool").read_text() == "tool"
+        # The decompressed layers are removed once applied.
+        assert [path.name for path in rootfs.parent.iterdir()] == ["rootfs"]
+
+    def test_extract_to_read_ahead(self, bare_image, new_dir, mocker):
+        """Only as many layers as there are workers are decompressed ahead."""
+        for number in range(6):
+            Path(f"layer{number}").mkdir()
+            Path(f"layer{number}/file{number}").write_text(str(number))
+            bare_image = bare_image.add_layer(f"layer{number}", Path(f"layer{number}"))
+        mocker.patch.object(os, "cpu_count", return_value=2)
+        bundle_dir = Path("bundle/dir/a-layer5")
+        decompress_layer = oci._decompress_layer
+        started: list[Path] = []
+
+        def record_decompress_layer(layout, layer, path):
+            started.append(path)
+            return decompress_layer(layout, layer, path)
+
+        mocker.patch.object(oci, "_decompress_layer", record_decompress_layer)
+        apply = oci.unpacker._Unpacker.apply
+        temp_files: list[int] = []
+
+        def record_apply(self, layer):
+            temp_files.append(len(list(bundle_dir.glob(".layer-*.tar"))))
+            # The layers read so far, and the two decompressed ahead of them.
+            assert len(started) <= len(temp_files) + 1
+            apply(self, layer)
+
+        mocker.patch.object(oci.unpacker._Unpacker, "apply", record_apply)
+
+        rootfs = bare_image.extract_to(Path("bundle/dir"), rootless=True)
+
+        assert sorted(path.name for path in rootfs.iterdir()) == [
+            f"file{number}" for number in range(6)
         ]
+        assert len(started) == 5
+        assert len(temp_files) == 6
+        assert max(temp_files) <= 2
 
-    def test_extract_to(self, mock_run, new_dir):
-        image = oci.Image("a:b", Path("/c"))
-        bundle_path = image.extract_to(Path("bundle/dir"))
-        assert Path("bundle/dir").is_dir()
-        assert bundle_path == Path("bundle/dir/a-b/rootfs")
-        assert mock_run.mock_calls == [
-            call(["umoci", "unpack", "--image", "/c/a:b", "bundle/dir/a-b"])
-        ]
+    @pytest.mark.skipif(os.geteuid() != 0, reason="requires root permissions")
+    def test_extract_to_ownership(self, bare_image, new_dir):
+        Path("layer_dir").mkdir()
+        Path("layer_dir/foo.txt").write_text("foo")
+        os.chown("layer_dir/foo.txt", 1234, 5678)
+        image = bare_image.add_layer("tag", Path("layer_dir"))
 
-    def test_extract_to_rootless(self, mock_run, new_dir):
-        image = oci.Image("a:b", Path("/c"))
-        bundle_path = image.extract_to(Path("bundle/dir"), rootless=True)
-        assert Path("bundle/dir").is_dir()
-        assert bundle_path == Path("bundle/dir/a-b/rootfs")
-        assert mock_run.mock_calls == [
-            call(
-                [
-                    "umoci",
-                    "unpack",
-                    "--rootless",
-                    "--image",
-                    "/c/a:b",
-                    "bundle/dir/a-b",
-                ]
-            )
-        ]
+        rootfs = image.extract_to(Path("bundle/dir"))
+
+        info = (rootfs / "foo.txt").stat()
+        assert (info.st_uid, info.st_gid) == (1234, 5678)
 
-    def test_extract_to_existing_dir(self, mock_run, new_dir):
-        image = oci.Image("a:b", Path("c"))
+    def test_extract_to_existing_dir(self, bare_image, new_dir):
         Path("bundle/dir/a-b").mkdir(parents=True)
         Path("bundle/dir/a-b/foo.txt").touch()
 
-        bundle_path = image.extract_to(Path("bundle/dir"))
+        bundle_path = bare_image.extract_to(Path("bundle/dir"), rootless=True)
         assert Path("bundle/dir/a-b/foo.txt").exists() is False
         assert bundle_path == Path("bundle/dir/a-b/rootfs")
+        assert list(bundle_path.iterdir()) == []
 
-    def test_add_layer(self, mocker, mock_run, new_dir):
-        image = oci.Image("a:b", new_dir / "c")
-        Path("c").mkdir()
+    def test_extract_to_unsupported_layer(self, bare_image, new_dir, mocker):
         Path("layer_dir").mkdir()
-        Path("layer_dir/foo.txt").touch()
-        pid = os.getpid()
-
-        spy_add = mocker.spy(tarfile.TarFile, "add")
-
-        image.add_layer("tag", Path("layer_dir"))
-        # The `Tarfile.add()` on the directory ends up calling the method multiple
-        # times (due to the recursion), but we're mainly interested that the first
-        # call was to add `layer_dir`.
-        assert spy_add.mock_calls[0] == call(
-            ANY, Path("layer_dir/foo.txt"), arcname="foo.txt", recursive=False
-        )
-
-        expected_cmd = [
-            "umoci",
-            "raw",
-            "add-layer",
-            "--image",
-            str(new_dir / "c/a:b"),
-            str(new_dir / f"c/.temp_layer.{pid}.tar"),
-            "--tag",
-            "tag",
+        image = bare_image.add_layer("lower", Path("layer_dir"))
+        image = image.add_layer("upper", Path("layer_dir"))
+        mocker.patch.object(
+            oci, "open_layer", side_effect=ValueError("Unsupported layer")
+        )
+
+        with pytest.raises(errors.RockcraftError, match="Failed to unpack a:upper"):
+            image.extract_to(Path("bundle/dir"), rootless=True)
+
+    def _make_layered_image(self, bare_image):
+        for name in ("lower", "upper"):
+            Path(name).mkdir()
+            Path(name, "file").write_text(name)
+            bare_image = bare_image.add_layer(name, Path(name))
+        return bare_image
+
+    @pytest.mark.parametrize("layer", [0, 1])
+    def test_extract_to_corrupted_blob(self, bare_image, new_dir, mocker, layer):
+        image = self._make_layered_image(bare_image)
+        manifest, _ = read_image(image)
+        layout = image_layout(image)
+        blob_path = layout.blob_path(manifest["layers"][layer]["digest"])
+        other_blob = layout.blob_path(manifest["layers"][1 - layer]["digest"])
+        blob_path.chmod(0o644)
+        blob_path.write_bytes(other_blob.read_bytes())
+        spy_finish = mocker.spy(oci.unpacker._Unpacker, "finish")
+
+        with pytest.raises(errors.RockcraftError, match="doesn't match its digest"):
+            image.extract_to(Path("bundle/dir"), rootless=True)
+
+        spy_finish.assert_not_called()
+
+    @pytest.mark.parametrize("layer", [0, 1])
+    def test_extract_to_wrong_diff_id(self, bare_image, new_dir, mocker, layer):
+        image = self._make_layered_image(bare_image)
+        get_layers = oci.Image._layers
+
+        def wrong_layers(self):
+            layout, image_layers = get_layers(self)
+            image_layers[layer] = dataclasses.replace(
+                image_layers[layer], diff_id=f"sha256:{'0' * 64}"
+            )
+            return layout, image_layers
+
+        mocker.patch.object(oci.Image, "_layers", wrong_layers)
+        spy_finish = mocker.spy(oci.unpacker._Unpacker, "finish")
+
+        with pytest.raises(
+            errors.RockcraftError, match="Uncompressed layer .* doesn't match"
+        ):
+            image.extract_to(Path("bundle/dir"), rootless=True)
+
+        spy_finish.assert_not_called()
+
+    def test_index_to_corrupted_blob(self, bare_image, new_dir):
+        image = self._make_layered_image(bare_image)
+        manifest, _ = read_image(image)
+        blob_path = image_layout(image).blob_path(manifest["layers"][1]["digest"])
+        blob_path.chmod(0o644)
+        blob_path.write_bytes(blob_path.read_bytes()[:-8])
+
+        with pytest.raises(errors.RockcraftError, match="Failed to index a:upper"):
+            image.index_to(Path("bundle/dir"), extract=lambda _: True, rootless=True)
+
+    def test_add_layer(self, mocker, mock_run, bare_image, new_dir):
+        Path("layer_dir").mkdir()
+        Path("layer_dir/foo.txt").write_text("foo")
+
+        spy_add = mocker.spy(layers.TarWriter, "add")
+
+        new_image = bare_image.add_layer("tag", Path("layer_dir"))
+        (tarinfo_call,) = spy_add.mock_calls
+        tarinfo = tarinfo_call.args[1]
+        assert tarinfo.name == "foo.txt"
+        assert tarinfo.size == 3
+        assert new_image.image_name == "a:tag"
+        mock_run.assert_not_called()
+
+        # The original image is untouched
+        manifest, config = read_image(bare_image)
+        assert manifest["layers"] == []
+        assert config["rootfs"]["diff_ids"] == []
+
+        manifest, config = read_image(new_image)
+        layout = image_layout(new_image)
+        (layer,) = manifest["layers"]
+        assert layer["mediaType"] == compression.GZIP_LAYER_MEDIA_TYPE
+        blob = layout.blob_path(layer["digest"]).read_bytes()
+        assert layer["size"] == len(blob)
+        assert layer["digest"] == f"sha256:{hashlib.sha256(blob).hexdigest()}"
+
+        tarball = gzip.decompress(blob)
+        (diff_id,) = config["rootfs"]["diff_ids"]
+        assert diff_id == f"sha256:{hashlib.sha256(tarball).hexdigest()}"
+        assert config["history"][-1]["created_by"] == "rockcraft add-layer"
+        with tarfile.open(fileobj=io.BytesIO(tarball)) as tar:
+            assert tar.getnames() == ["foo.txt"]
+            assert tar.extractfile("foo.txt").read() == b"foo"  # type: ignore[union-attr]
+
+        # No intermediate files are left behind
+        assert sorted(p.name for p in layout.blobs_dir.iterdir()) == sorted(
+            digest.split(":")[1]
+            for digest in [
+                layer["digest"],
+                manifest["config"]["digest"],
+                *[m["digest"] for m in layout.read_index()["manifests"]],
+                read_image(bare_image)[0]["config"]["digest"],
+            ]
+        )
+
+    def test_add_layer_zstd(self, bare_image, new_dir):
+        Path("layer_dir").mkdir()
+        Path("layer_dir/foo.txt").write_text("foo")
+        image = dataclasses.replace(
+            bare_image, compression=compression.Compression(codec="zstd", level=19)
+        )
+
+        new_image = image.add_layer("tag", Path("layer_dir"))
+
+        assert new_image.compression == image.compression
+        manifest, config = read_image(new_image)
+        (layer,) = manifest["layers"]
+        assert layer["mediaType"] == "application/vnd.oci.image.layer.v1.tar+zstd"
+        blob = image_layout(new_image).blob_path(layer["digest"]).read_bytes()
+        tarball = zstandard.ZstdDecompressor().decompressobj().decompress(blob)
+        (diff_id,) = config["rootfs"]["diff_ids"]
+        assert diff_id == f"sha256:{hashlib.sha256(tarball).hexdigest()}"
+        with tarfile.open(fileobj=io.BytesIO(tarball)) as tar:
+            assert tar.getnames() == ["foo.txt"]
+
+    @pytest.mark.parametrize("codec", ["gzip", "zstd"])
+    def test_index_to(self, bare_image, new_dir, codec):
+        Path("lower/etc").mkdir(parents=True)
+        Path("lower/etc/passwd").write_text("root:x:0:0::/root:/bin/bash\n")
+        Path("lower/etc/hostname").write_text("lower")
+        Path("upper/etc").mkdir(parents=True)
+        Path("upper/etc/hostname").write_text("upper")
+        image = dataclasses.replace(
+            bare_image, compression=compression.Compression(codec=codec)
+        )
+        image = image.add_layer("lower", Path("lower"))
+        image = image.add_layer("upper", Path("upper"))
+
+        rootfs = image.index_to(
+            Path("bundles"), extract=lambda path: path == "etc/passwd"
+        )
+
+        assert rootfs == Path("bundles/a-upper/rootfs")
+        assert [path.name for path in (rootfs / "etc").iterdir()] == ["passwd"]
+        index = RootfsIndex.for_rootfs(rootfs)
+        assert index is not None
+        entry = index.lookup("etc/hostname")
+        assert entry is not None
+        assert entry.digest == hashlib.sha256(b"upper").hexdigest()
+
+    def test_index_to_unsupported_layer(self, bare_image, new_dir, mocker):
+        Path("layer_dir").mkdir()
+        image = bare_image.add_layer("tag", Path("layer_dir"))
+        mocker.patch.object(
+            oci, "open_layer", side_effect=ValueError("Unsupported layer")
+        )
+
+        with pytest.raises(errors.RockcraftError, match="Failed to index a:tag"):
+            image.index_to(Path("bundles"), extract=lambda _: False)
+
+    def test_add_layer_groups(self, bare_image, new_dir):
+        Path("layer_dir/lib").mkdir(parents=True)
+        Path("layer_dir/lib/libfoo.so").write_text("foo")
+        Path("layer_dir/app").mkdir()
+        Path("layer_dir/app/main.py").write_text("main")
+        groups = [
+            layers.LayerGroup("dependencies", patterns=("lib",)),
+            layers.LayerGroup("empty", patterns=("srv",)),
         ]
-        assert mock_run.mock_calls == [
-            call([*expected_cmd, "--history.created_by", " ".join(expected_cmd)])
+
+        new_image = bare_image.add_layer("tag", Path("layer_dir"), groups=groups)
+
+        manifest, config = read_image(new_image)
+        layout = image_layout(new_image)
+        assert len(manifest["layers"]) == 2
+        assert len(config["rootfs"]["diff_ids"]) == 2
+        assert [entry.get("comment") for entry in config["history"]] == [
+            "dependencies",
+            None,
         ]
+        contents = []
+        for layer in manifest["layers"]:
+            blob = gzip.decompress(layout.blob_path(layer["digest"]).read_bytes())
+            with tarfile.open(fileobj=io.BytesIO(blob)) as tar:
+                contents.append(tar.getnames())
+        assert contents == [["lib", "lib/libfoo.so"], ["app", "app/main.py"]]
+
+    def test_add_layer_reused(self, mocker, bare_image, new_dir):
+        """An unchanged layer is not archived again."""
+        Path("layer_dir").mkdir()
+        Path("layer_dir/foo.txt").write_text("foo")
+        first_image = bare_image.add_layer("first", Path("layer_dir"))
+        spy_write = mocker.spy(oci.layers, "write_layer_paths")
+
+        second_image = bare_image.add_layer("second", Path("layer_dir"))
+
+        spy_write.assert_not_called()
+        first_manifest, first_config = read_image(first_image)
+        second_manifest, second_config = read_image(second_image)
+        assert first_manifest["layers"] == second_manifest["layers"]
+        assert first_config["rootfs"] == second_config["rootfs"]
+
+    @pytest.mark.parametrize(
+        "change",
+        [
+            pytest.param(
+                lambda: Path("layer_dir/foo.txt").write_text("bar"), id="file"
+            ),
+            pytest.param(lambda: Path("layer_dir/foo.txt").chmod(0o600), id="mode"),
+            pytest.param(lambda: Path("layer_dir/new").mkdir(), id="new"),
+        ],
+    )
+    def test_add_layer_changed(self, mocker, bare_image, new_dir, change):
+        Path("layer_dir").mkdir()
+        Path("layer_dir/foo.txt").write_text("foo")
+        os.utime("layer_dir/foo.txt", (0, 0))
+        first_image = bare_image.add_layer("first", Path("layer_dir"))
+        change()
+        spy_write = mocker.spy(oci.layers, "write_layer_paths")
+
+        second_image = bare_image.add_layer("second", Path("layer_dir"))
+
+        spy_write.assert_called_once()
+        first_manifest, _ = read_image(first_image)
+        second_manifest, _ = read_image(second_image)
+        assert first_manifest["layers"] != second_manifest["layers"]
+
+    def test_add_layer_reused_other_compression(self, mocker, bare_image, new_dir):
+        Path("layer_dir").mkdir()
+        Path("layer_dir/foo.txt").write_text("foo")
+        bare_image.add_layer("first", Path("layer_dir"))
+        image = dataclasses.replace(
+            bare_image, compression=compression.Compression(level=1)
+        )
+        spy_write = mocker.spy(oci.layers, "write_layer_paths")
+
+        image.add_layer("second", Path("layer_dir"))
+
+        spy_write.assert_called_once()
+
+    def test_add_layer_reused_other_threads(self, mocker, bare_image, new_dir):
+        """The number of threads doesn't change the compressed layers."""
+        Path("layer_dir").mkdir()
+        Path("layer_dir/foo.txt").write_text("foo")
+        bare_image.add_layer("first", Path("layer_dir"))
+        image = dataclasses.replace(
+            bare_image, compression=compression.Compression(threads=3)
+        )
+        spy_write = mocker.spy(oci.layers, "write_layer_paths")
+
+        image.add_layer("second", Path("layer_dir"))
+
+        spy_write.assert_not_called()
+
+    def test_add_layer_deduplicate(self, mocker, bare_image, new_dir):
+        Path("layer_dir").mkdir()
+        Path("layer_dir/a.txt").write_text("foo")
+        Path("layer_dir/b.txt").write_text("foo")
+        plain_image = bare_image.add_layer("plain", Path("layer_dir"))
+        spy_write = mocker.spy(oci.layers, "write_layer_paths")
+
+        new_image = bare_image.add_layer("tag", Path("layer_dir"), deduplicate=True)
+
+        # The layer without duplicates is not reused.
+        spy_write.assert_called_once()
+        assert spy_write.call_args.kwargs["duplicates"] == {"b.txt": "a.txt"}
+        plain_manifest, _ = read_image(plain_image)
+        manifest, _ = read_image(new_image)
+        assert manifest["layers"] != plain_manifest["layers"]
+
+    def test_add_layer_error(self, mocker, bare_image, new_dir):
+        mocker.patch.object(
+            oci.layers, "write_layer_paths", side_effect=OSError("boom")
+        )
+        Path("layer_dir").mkdir()
+
+        with pytest.raises(OSError, match="boom"):
+            bare_image.add_layer("tag", Path("layer_dir"))
+
+        layout = image_layout(bare_image)
+        assert not [p for p in layout.blobs_dir.iterdir() if p.name.startswith(".")]
+        assert len(layout.read_index()["manifests"]) == 1
 
     def test_add_new_user(
         self,
@@ -367,6 +794,26 @@ class TestImage:
             "conflict with existing user/group in the base filesystem", str(err)
         )
 
+    def test_add_new_user_layer_dir(self, mock_tmpdir, mock_add_layer, tmp_path):
+        """The user database can be written into a layer being prepared."""
+        layer_dir = tmp_path / "layer"
+        layer_dir.mkdir()
+
+        image = oci.Image("a:b", Path("/c"))
+        image.add_user(
+            tmp_path / "prime",
+            tmp_path,
+            "mock-tag",
+            MOCK_NEW_USER["user"],
+            MOCK_NEW_USER["uid"],
+            layer_dir=layer_dir,
+        )
+
+        assert (layer_dir / "etc/passwd").read_text() == MOCK_NEW_USER["passwd"]
+        assert (layer_dir / "etc/group").read_text() == MOCK_NEW_USER["group"]
+        mock_tmpdir.assert_not_called()
+        mock_add_layer.assert_not_called()
+
     @pytest.mark.parametrize(
         (
             "base_user_files",
@@ -505,27 +952,37 @@ class TestImage:
             )
         ]
 
-    def test_to_oci_archive(self, mock_run):
-        image = oci.Image("a:b", Path("/c"))
-        image.to_oci_archive("tag", filename="foobar")
-        assert mock_run.mock_calls == [
-            call(
-                [
-                    "skopeo",
-                    "--insecure-policy",
-                    "copy",
-                    "oci:/c/a:tag",
-                    "oci-archive:foobar:tag",
-                ]
-            )
-        ]
+    def test_to_oci_archive(self, bare_image, tmp_path, mock_run):
+        bare_image.to_oci_archive("b", filename=str(tmp_path / "foobar"))
+
+        with tarfile.open(tmp_path / "foobar") as tar:
+            index = json.loads(tar.extractfile("index.json").read())  # type: ignore[union-attr]
+            names = tar.getnames()
+        assert index["manifests"][0]["digest"] == bare_image.manifest_digest()
+        assert index["manifests"][0]["annotations"] == {
+            oci_layout.REF_NAME_ANNOTATION: "b"
+        }
+        assert "oci-layout" in names
+        mock_run.assert_not_called()
+
+    def test_to_oci_archive_error(self, bare_image, tmp_path):
+        """No partial archive is left behind."""
+        with pytest.raises(errors.RockcraftError, match="Cannot find manifest"):
+            bare_image.to_oci_archive("missing", filename=str(tmp_path / "foobar"))
+
+        assert not (tmp_path / "foobar").exists()
+
+    def test_to_oci_layout(self, bare_image, tmp_path):
+        bare_image.to_oci_layout("b", tmp_path / "layout")
+
+        exported = oci.Image("layout:b", tmp_path)
+        assert exported.manifest_digest() == bare_image.manifest_digest()
 
     def test_digest(self, mocker):
         source_image = "docker://ubuntu:22.04"
         image = oci.Image("a:b", Path("/c"))
         mock_output = mocker.patch(
-            "subprocess.check_output",
-            return_value="000102030405060708090a0b0c0d0e0f",
+            "subprocess.check_output", return_value=b'{"manifests":[]}'
         )
         mock_skopeo = mocker.patch(
             "shutil.which",
@@ -539,85 +996,54 @@ class TestImage:
                 [
                     "/usr/bin/skopeo",
                     "inspect",
-                    "--format",
-                    "{{.Digest}}",
+                    "--raw",
+                    "--retry-times",
+                    str(oci.MAX_DOWNLOAD_RETRIES),
                     "-n",
                     source_image,
-                ],
-                text=True,
+                ]
             )
         ]
-        assert digest == bytes([0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15])
+        assert digest == hashlib.sha256(b'{"manifests":[]}').digest()
 
-    def test_set_default_user(self, mock_run):
-        image = oci.Image("a:b", Path("/c"))
+    def test_digest_oci(self, bare_image, mocker):
+        """The digest of local images is read from their layout."""
+        mock_output = mocker.patch("subprocess.check_output")
 
-        image.set_default_user(584792, "_daemon_")
+        digest = oci.Image.digest(f"oci:{bare_image.path / bare_image.image_name}")
 
-        assert mock_run.mock_calls == [
-            call(
-                [
-                    "umoci",
-                    "config",
-                    "--image",
-                    "/c/a:b",
-                    "--clear=config.entrypoint",
-                    "--config.user",
-                    "584792",
-                ]
-            )
-        ]
+        assert digest == bytes.fromhex(bare_image.manifest_digest()[7:])
+        mock_output.assert_not_called()
+
+    def test_set_default_user(self, bare_image):
+        bare_image.set_default_user(584792, "_daemon_")
+
+        _, config = read_image(bare_image)
+        assert config["config"]["User"] == "584792"
 
     @pytest.mark.parametrize(
         ("entrypoint"),
         [
-            ([Pebble.PEBBLE_BINARY_PATH_PREVIOUS, "enter"],),
-            ([Pebble.PEBBLE_BINARY_PATH, "enter"],),
-            (["echo", "Test"],),
-            ([],),
+            [Pebble.PEBBLE_BINARY_PATH_PREVIOUS, "enter"],
+            [Pebble.PEBBLE_BINARY_PATH, "enter"],
+            ["echo", "Test"],
+            [],
         ],
     )
-    def test_set_entrypoint_default(self, mock_run, entrypoint):
-        image = oci.Image("a:b", Path("/tmp"))
-
-        image.set_entrypoint(entrypoint)
-
-        arg_list = [
-            "umoci",
-            "config",
-            "--image",
-            "/tmp/a:b",
-            "--clear=config.entrypoint",
-        ]
-
-        for e in entrypoint:
-            arg_list.extend(["--config.entrypoint", e])
+    def test_set_entrypoint_default(self, bare_image, entrypoint):
+        bare_image.set_cmd(["foo"])
+        bare_image.set_entrypoint(entrypoint)
 
-        arg_list.append("--clear=config.cmd")
-
-        assert mock_run.mock_calls == [
-            call(arg_list),
-        ]
+        # Setting the entrypoint clears the CMD.
+        _, config = read_image(bare_image)
+        assert config["config"] == {"Entrypoint": entrypoint}
 
     @pytest.mark.parametrize(("cmd"), [(["echo", "Test"]), ([])])
-    def test_set_cmd(self, mock_run, cmd):
-        image = oci.Image("a:b", Path("/c"))
-        image.set_cmd(cmd)
-
-        arg_list = [
-            "umoci",
-            "config",
-            "--image",
-            "/c/a:b",
-            "--clear=config.cmd",
-        ]
+    def test_set_cmd(self, bare_image, cmd):
+        bare_image.set_cmd(cmd)
 
-        for arg in cmd:
-            arg_list.extend(["--config.cmd", arg])
-
-        assert mock_run.mock_calls == [
-            call(arg_list),
-        ]
+        _, config = read_image(bare_image)
+        assert config["config"]["Cmd"] == cmd
 
     @pytest.mark.parametrize(
         ("mock_services", "mock_checks"),
@@ -708,39 +1134,38 @@ class TestImage:
             fake_tmpfs, mock_base_layer_dir, expected_layer, mock_name
         )
 
-    def test_set_environment(self, mock_run):
+    def test_set_pebble_layer_layer_dir(self, mock_add_layer, mock_tmpdir, tmp_path):
+        """The Pebble layer can be written into a layer being prepared."""
+        layer_dir = tmp_path / "layer"
+        layer_dir.mkdir()
         image = oci.Image("a:b", Path("/c"))
 
-        image.set_environment({"NAME1": "VALUE1", "NAME2": "VALUE2"})
+        image.set_pebble_layer(
+            {"svc": {"override": "replace", "command": "foo"}},
+            {},
+            "rock",
+            "tag",
+            "summary",
+            "description",
+            tmp_path / "base",
+            layer_dir=layer_dir,
+        )
 
-        assert mock_run.mock_calls == [
-            call(
-                [
-                    "umoci",
-                    "config",
-                    "--image",
-                    "/c/a:b",
-                    "--config.env",
-                    "NAME1=VALUE1",
-                    "--config.env",
-                    "NAME2=VALUE2",
-                ]
-            )
-        ]
+        pebble_layer = layer_dir / Pebble.PEBBLE_LAYERS_PATH / "001-rockcraft-rock.yaml"
+        assert yaml.safe_load(pebble_layer.read_text())["services"] == {
+            "svc": {"override": "replace", "command": "foo"}
+        }
+        mock_tmpdir.assert_not_called()
+        mock_add_layer.assert_not_called()
 
-    def test_set_control_data(
-        self,
-        mock_archive_layer,
-        mock_rmtree,
-        mock_mkdir,
-        mock_mkdtemp,
-        mock_run,
-    ):
-        image = oci.Image("a:b", Path("/c"))
+    def test_set_environment(self, bare_image):
+        bare_image.set_environment({"NAME1": "VALUE1", "NAME2": "VALUE2"})
+        bare_image.set_environment({"NAME2": "VALUE3"})
 
-        mock_control_data_path = "layer_dir"
-        mock_mkdtemp.return_value = mock_control_data_path
+        _, config = read_image(bare_image)
+        assert config["config"]["Env"] == ["NAME1=VALUE1", "NAME2=VALUE3"]
 
+    def test_set_control_data(self, mock_run, bare_image):
         now = datetime.datetime.now(datetime.timezone.utc).isoformat()
         metadata = {"name": "rock-name", "version": 1, "created": now}
 
@@ -748,178 +1173,63 @@ class TestImage:
             n=os.linesep
         )
 
-        mocked_data = {"writes": ""}
-
-        def mock_write(s):
-            mocked_data["writes"] += s
-
-        m = mock_open()
-        with patch("pathlib.Path.open", m):
-            with patch("pathlib.Path.chmod") as local_mock_chmod:
-                m.return_value.write = mock_write
-                image.set_control_data(metadata)
-
-        local_mock_chmod.assert_called_once_with(0o644)
-        assert mocked_data["writes"] == expected
-        mock_mkdtemp.assert_called_once()
-        mock_mkdir.assert_called_once()
-        mock_archive_layer.assert_called_once_with(
-            Path(mock_control_data_path),
-            Path(f"/c/.temp_layer.control_data.{os.getpid()}.tar"),
-        )
-        expected_cmd = [
-            "umoci",
-            "raw",
-            "add-layer",
-            "--image",
-            "/c/a:b",
-            str(f"/c/.temp_layer.control_data.{os.getpid()}.tar"),
-        ]
-        assert mock_run.mock_calls == [
-            call(
-                [*expected_cmd, "--history.created_by", " ".join(expected_cmd)],
-            )
-        ]
-        mock_rmtree.assert_called_once_with(Path(mock_control_data_path))
-
-    def test_set_annotations(self, mocker):
-        mocker.patch("rockcraft.utils.get_host_command").return_value = "umoci"
-        mock_run = mocker.patch("subprocess.run")
-        image = oci.Image("a:b", Path("/c"))
-
-        image.set_annotations({"NAME1": "VALUE1", "NAME2": "VALUE2"})
-
-        assert mock_run.mock_calls == [
-            call(
-                [
-                    "umoci",
-                    "config",
-                    "--image",
-                    "/c/a:b",
-                    "--clear=config.labels",
-                    "--config.label",
-                    "NAME1=VALUE1",
-                    "--config.label",
-                    "NAME2=VALUE2",
-                ],
-                capture_output=True,
-                check=True,
-                text=True,
-            ),
-            call(
-                [
-                    "umoci",
-                    "config",
-                    "--image",
-                    "/c/a:b",
-                    "--clear=manifest.annotations",
-                    "--manifest.annotation",
-                    "NAME1=VALUE1",
-                    "--manifest.annotation",
-                    "NAME2=VALUE2",
-                ],
-                capture_output=True,
-                check=True,
-                text=True,
-            ),
-        ]
-
-    def test_inject_oci_fields(self, mock_read_bytes, mock_write_bytes, mock_unlink):
-        test_index = {
-            "manifests": [
-                {
-                    "digest": "sha256:foomanifest",
-                    "annotations": {
-                        "org.opencontainers.image.ref.name": "latest",
-                    },
-                }
-            ]
-        }
-        test_manifest = {"config": {"digest": "sha256:fooconfig"}}
-        test_config = {}
-        mock_read_bytes.side_effect = [
-            json.dumps(test_index),
-            json.dumps(test_manifest),
-            json.dumps(test_config),
-        ]
-        test_variant = "v0"
-
-        new_test_config = {**test_config, **{"variant": test_variant}}
-        new_test_config_bytes = json.dumps(new_test_config).encode("utf-8")
-
-        new_image_config_digest = hashlib.sha256(new_test_config_bytes).hexdigest()
-        new_test_manifest = {
-            **test_manifest,
-            **{
-                "mediaType": "application/vnd.oci.image.manifest.v1+json",
-                "config": {
-                    "digest": f"sha256:{new_image_config_digest}",
-                    "size": len(new_test_config_bytes),
-                },
-            },
-        }
-        new_test_manifest_bytes = json.dumps(new_test_manifest).encode("utf-8")
-        new_test_manifest_digest = hashlib.sha256(new_test_manifest_bytes).hexdigest()
-
-        new_test_index = {
-            **test_index,
-            **{
-                "manifests": [
-                    {
-                        "digest": f"sha256:{new_test_manifest_digest}",
-                        "annotations": {
-                            "org.opencontainers.image.ref.name": "latest",
-                        },
-                        "size": len(new_test_manifest_bytes),
-                    }
-                ]
-            },
-        }
-
-        # pylint: disable=protected-access
-        oci._inject_oci_fields(Path("img:latest"), test_variant)
-        assert mock_read_bytes.call_count == 3
-        assert mock_write_bytes.mock_calls == [
-            call(new_test_config_bytes),
-            call(new_test_manifest_bytes),
-            call(json.dumps(new_test_index).encode("utf-8")),
-        ]
-        assert mock_unlink.call_count == 2
-
-    def test_stat(self, new_dir, mock_inject_oci_fields, mock_run, mocker):
+        bare_image.set_control_data(metadata)
+
+        mock_run.assert_not_called()
+        manifest, config = read_image(bare_image)
+        (layer,) = manifest["layers"]
+        assert len(config["rootfs"]["diff_ids"]) == 1
+        blob = image_layout(bare_image).blob_path(layer["digest"])
+        with tarfile.open(blob) as tar:
+            assert tar.getnames() == [".rock", ".rock/metadata.yaml"]
+            metadata_file = tar.getmember(".rock/metadata.yaml")
+            assert metadata_file.mode == 0o644
+            assert tar.extractfile(metadata_file).read().decode() == expected  # type: ignore[union-attr]
+
+    def test_set_control_data_layer_dir(self, bare_image, tmp_path):
+        """The control data can be written into a layer being prepared."""
+        layer_dir = tmp_path / "layer"
+        layer_dir.mkdir()
+
+        bare_image.set_control_data({"name": "rock-name"}, layer_dir=layer_dir)
+
+        metadata_file = layer_dir / ".rock/metadata.yaml"
+        assert metadata_file.read_text() == "name: rock-name\n"
+        assert metadata_file.stat().st_mode & 0o777 == 0o644
+        manifest, _ = read_image(bare_image)
+        assert manifest["layers"] == []
+
+    def test_set_annotations(self, bare_image):
+        bare_image.set_annotations({"NAME1": "VALUE1", "NAME2": "VALUE2"})
+        bare_image.set_annotations({"NAME1": "VALUE1", "NAME3": 3})
+
+        manifest, config = read_image(bare_image)
+        expected = {"NAME1": "VALUE1", "NAME3": "3"}
+        assert config["config"]["Labels"] == expected
+        assert manifest["annotations"] == expected
+
+    def test_set_media_type(self, bare_image):
+        layout = oci_layout.Layout(bare_image.path / "a")
+        index = layout.read_index()
+        manifest = layout.read_json_blob(index["manifests"][0]["digest"])
+        del manifest["mediaType"]
+        digest, size = layout.write_json_blob(manifest)
+        index["manifests"][0].update(digest=digest, size=size)
+        layout.write_index(index)
+
+        bare_image.set_media_type()
+
+        manifest, _ = read_image(bare_image)
+        assert manifest["mediaType"] == oci.MANIFEST_MEDIA_TYPE
+
+    def test_get_manifest(self, new_dir, mock_run, mocker):
         image_dir = Path("images/dir")
-        mock_loads = mocker.patch("json.loads")
 
         image, _ = oci.Image.new_oci_image(
             "bare@latest", image_dir=image_dir, arch="amd64"
         )
 
-        mock_run.reset_mock()
-
-        image.stat()
-
-        assert mock_inject_oci_fields.call_count == 1
-        assert mock_run.mock_calls == [
-            call(
-                [
-                    "umoci",
-                    "stat",
-                    "--json",
-                    "--image",
-                    "images/dir/bare:latest",
-                ]
-            )
-        ]
-        assert mock_loads.called
-
-    def test_get_manifest(self, new_dir, mock_inject_oci_fields, mock_run, mocker):
-        image_dir = Path("images/dir")
         mock_loads = mocker.patch("json.loads")
-
-        image, _ = oci.Image.new_oci_image(
-            "bare@latest", image_dir=image_dir, arch="amd64"
-        )
-
         mock_run.reset_mock()
 
         image.get_manifest()
@@ -936,32 +1246,53 @@ class TestImage:
         ]
         assert mock_loads.called
 
-    def test_set_path_bare(self, mock_run):
-        image = oci.Image("a:b", Path("/c"))
-
-        image.set_default_path("bare")
+    def test_set_path_bare(self, bare_image):
+        bare_image.set_default_path("bare")
 
         expected = "/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin"
-        assert mock_run.mock_calls == [
-            call(
-                [
-                    "umoci",
-                    "config",
-                    "--image",
-                    "/c/a:b",
-                    "--config.env",
-                    f"PATH={expected}",
-                ]
-            )
-        ]
+        _, config = read_image(bare_image)
+        assert config["config"]["Env"] == [f"PATH={expected}"]
 
     @pytest.mark.parametrize(
         "base",
         ["ubuntu@24.04", "ubuntu@22.04", "ubuntu@20.04"],
     )
-    def test_set_path_non_bare(self, mock_run, base):
-        image = oci.Image("a:b", Path("/c"))
+    def test_set_path_non_bare(self, bare_image, base):
+        bare_image.set_default_path(base)
+
+        _, config = read_image(bare_image)
+        assert "Env" not in config["config"]
 
-        image.set_default_path(base)
 
-        assert not mock_run.called
+@tests.linux_only
+def test_create_multi_arch_rock(tmp_path):
+    rocks = []
+    for arch in ("amd64", "arm64"):
+        image, _ = oci.Image.new_oci_image(
+            f"{arch}@1.0", image_dir=tmp_path / "images", arch=arch
+        )
+        rocks.append(tmp_path / f"test_1.0_{arch}.rock")
+        image.to_oci_archive("1.0", filename=str(rocks[-1]))
+
+    oci.create_multi_arch_rock(rocks, tmp_path / "test_1.0.rock", tag="1.0")
+
+    layout = oci_layout.Layout(tmp_path / "multi")
+    layout.init()
+    (descriptor,) = layout.import_archive(tmp_path / "test_1.0.rock")
+    assert descriptor["mediaType"] == oci_layout.INDEX_MEDIA_TYPE
+    assert descriptor["annotations"] == {oci_layout.REF_NAME_ANNOTATION: "1.0"}
+    index = layout.read_json_blob(descriptor["digest"])
+    assert [
+        manifest["platform"]["architecture"] for manifest in index["manifests"]
+    ] == [
+        "amd64",
+        "arm64",
+    ]
+    # Only the new rock is left.
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "images",
+        "multi",
+        "test_1.0.rock",
+        "test_1.0_amd64.rock",
+        "test_1.0_arm64.rock",
+    ]
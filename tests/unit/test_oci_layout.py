@@ -0,0 +1,459 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright 2025 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import io
+import json
+import os
+import tarfile
+import threading
+from pathlib import Path
+
+import pytest
+from rockcraft import errors, oci_layout
+
+
+@pytest.fixture
+def layout(tmp_path) -> oci_layout.Layout:
+    editor = oci_layout.ImageEditor(tmp_path / "layout:first", create=True)
+    editor.set_architecture("amd64")
+    editor.commit()
+    return editor.layout
+
+
+def write_layer(layout: oci_layout.Layout, data: bytes) -> oci_layout.LayerBlob:
+    writer = oci_layout.LayerWriter(layout)
+    writer.write(data)
+    return writer.close()
+
+
+def test_split_image_path():
+    assert oci_layout.split_image_path(Path("/a/b:c:d")) == (Path("/a/b"), "c:d")
+
+
+def test_dump_json():
+    assert oci_layout.dump_json({"b": [1, 2], "a": {"d": 1, "c": 2}}) == (
+        b'{"a":{"c":2,"d":1},"b":[1,2]}'
+    )
+
+
+def test_utc_timestamp_source_date_epoch(monkeypatch):
+    monkeypatch.setenv("SOURCE_DATE_EPOCH", "86400")
+
+    assert oci_layout.utc_timestamp() == "1970-01-02T00:00:00.000000Z"
+
+
+def test_commit_reproducible(tmp_path, monkeypatch):
+    """With SOURCE_DATE_EPOCH, identical images get identical manifests."""
+    monkeypatch.setenv("SOURCE_DATE_EPOCH", "86400")
+    digests: list[str] = []
+    for name in ("first", "second"):
+        editor = oci_layout.ImageEditor(tmp_path / f"{name}:latest", create=True)
+        editor.add_layer(write_layer(editor.layout, b"layer"), created_by="test")
+        editor.set_cmd(["foo"])
+        editor.commit()
+        _, descriptor = editor.layout.find_manifest(
+            editor.layout.read_index(), "latest"
+        )
+        digests.append(descriptor["digest"])
+
+    assert digests[0] == digests[1]
+
+
+def test_layer_cache(layout):
+    cache = oci_layout.LayerCache(layout)
+    layer = write_layer(layout, b"layer")
+
+    assert cache.get("key") is None
+    cache.put("key", layer)
+
+    assert oci_layout.LayerCache(layout).get("key") == layer
+
+
+def test_layer_cache_missing_blob(layout):
+    cache = oci_layout.LayerCache(layout)
+    layer = write_layer(layout, b"layer")
+    cache.put("key", layer)
+
+    layout.blob_path(layer.digest).unlink()
+
+    assert cache.get("key") is None
+
+
+def test_layer_cache_max_entries(layout):
+    cache = oci_layout.LayerCache(layout, max_entries=2)
+    layers = [write_layer(layout, data) for data in (b"a", b"b", b"c")]
+    cache.put("a", layers[0])
+    cache.put("b", layers[1])
+    # Recording a layer again makes it the most recently used.
+    cache.put("a", layers[0])
+
+    cache.put("c", layers[2])
+
+    assert cache.get("a") == layers[0]
+    assert cache.get("b") is None
+    assert cache.get("c") == layers[2]
+
+
+def test_layer_cache_evicts_least_recently_used(layout):
+    cache = oci_layout.LayerCache(layout, max_entries=2)
+    layers = [write_layer(layout, data) for data in (b"a", b"b", b"c")]
+    cache.put("a", layers[0])
+    cache.put("b", layers[1])
+    # Reusing a layer makes it the most recently used.
+    assert cache.get("a") == layers[0]
+
+    cache.put("c", layers[2])
+
+    assert cache.get("a") == layers[0]
+    assert cache.get("b") is None
+    assert cache.get("c") == layers[2]
+
+
+def test_find_manifest_missing(layout):
+    with pytest.raises(errors.RockcraftError, match="Cannot find manifest for second"):
+        layout.find_manifest(layout.read_index(), "second")
+
+
+def test_find_manifest_multiple(layout):
+    index = layout.read_index()
+    index["manifests"].append(index["manifests"][0])
+
+    with pytest.raises(errors.RockcraftError, match="Found multiple manifests"):
+        layout.find_manifest(index, "first")
+
+
+def test_commit_keeps_shared_blobs(layout):
+    """Editing a tag must not remove blobs that another tag still uses."""
+    index = layout.read_index()
+    shared = {
+        **index["manifests"][0],
+        "annotations": {oci_layout.REF_NAME_ANNOTATION: "second"},
+    }
+    index["manifests"].append(shared)
+    layout.write_index(index)
+
+    editor = oci_layout.ImageEditor(Path(f"{layout.path}:first"))
+    editor.set_cmd(["foo"])
+    editor.commit()
+
+    _, second = layout.find_manifest(layout.read_index(), "second")
+    manifest = layout.read_json_blob(second["digest"])
+    assert layout.blob_path(manifest["config"]["digest"]).is_file()
+    assert "Cmd" not in layout.read_json_blob(manifest["config"]["digest"])["config"]
+
+
+@pytest.fixture
+def archived_layout(layout) -> oci_layout.Layout:
+    """A layout with a layer in "first", and another image that isn't archived."""
+    editor = oci_layout.ImageEditor(Path(f"{layout.path}:first"))
+    editor.add_layer(write_layer(layout, os.urandom(200_000)), created_by="test")
+    editor.commit()
+    other = oci_layout.ImageEditor(Path(f"{layout.path}:other"), create=True)
+    other.add_layer(write_layer(layout, b"other"), created_by="test")
+    other.commit()
+    return layout
+
+
+def read_archive(data: bytes) -> dict[str, bytes | None]:
+    """Get the contents of each member of an archive, or None for directories."""
+    with tarfile.open(fileobj=io.BytesIO(data)) as tar:
+        return {
+            member.name: tar.extractfile(member).read() if member.isfile() else None  # type: ignore[union-attr]
+            for member in tar
+        }
+
+
+def test_image_blobs(archived_layout):
+    blobs = archived_layout.image_blobs("first")
+
+    _, descriptor = archived_layout.find_manifest(archived_layout.read_index(), "first")
+    manifest = archived_layout.read_json_blob(descriptor["digest"])
+    assert blobs == [descriptor, manifest["config"], *manifest["layers"]]
+
+
+def test_write_archive(archived_layout, tmp_path, monkeypatch):
+    monkeypatch.setenv("SOURCE_DATE_EPOCH", "86400")
+    archive_path = tmp_path / "first.rock"
+    with archive_path.open("wb") as stream:
+        archived_layout.write_archive("first", stream)
+
+    contents = read_archive(archive_path.read_bytes())
+
+    blobs = archived_layout.image_blobs("first")
+    assert list(contents) == [
+        "oci-layout",
+        "index.json",
+        "blobs",
+        "blobs/sha256",
+        *(f"blobs/sha256/{blob['digest'][7:]}" for blob in blobs),
+    ]
+    assert json.loads(contents["index.json"]) == {  # type: ignore[arg-type]
+        "schemaVersion": 2,
+        "manifests": [blobs[0]],
+    }
+    for blob in blobs:
+        assert contents[f"blobs/sha256/{blob['digest'][7:]}"] == (
+            archived_layout.blob_path(blob["digest"]).read_bytes()
+        )
+    with tarfile.open(archive_path) as tar:
+        assert {(m.mtime, m.uid, m.gid) for m in tar} == {(86400, 0, 0)}
+
+
+def test_write_archive_stream(archived_layout, tmp_path):
+    """Archives written to a file or any other stream are the same."""
+    archive_path = tmp_path / "first.rock"
+    with archive_path.open("wb") as archive_file:
+        archived_layout.write_archive("first", archive_file)
+    stream = io.BytesIO()
+
+    archived_layout.write_archive("first", stream)
+
+    assert stream.getvalue() == archive_path.read_bytes()
+
+
+def test_write_archive_pipe(archived_layout):
+    read_fd, write_fd = os.pipe()
+    received: list[bytes] = []
+    reader = threading.Thread(
+        target=lambda: received.append(os.fdopen(read_fd, "rb").read())
+    )
+    reader.start()
+
+    with os.fdopen(write_fd, "wb") as stream:
+        archived_layout.write_archive("first", stream)
+    reader.join()
+
+    stream = io.BytesIO()
+    archived_layout.write_archive("first", stream)
+    assert received == [stream.getvalue()]
+
+
+def test_write_archive_bad_blob(archived_layout):
+    layer = archived_layout.image_blobs("first")[-1]
+    archived_layout.blob_path(layer["digest"]).write_bytes(b"truncated")
+
+    with pytest.raises(errors.RockcraftError, match="unexpected size"):
+        archived_layout.write_archive("first", io.BytesIO())
+
+
+def test_export(archived_layout, tmp_path):
+    dest = tmp_path / "exported"
+    dest.mkdir()
+    (dest / "stale").touch()
+
+    archived_layout.export("first", dest)
+
+    exported = oci_layout.Layout(dest)
+    blobs = archived_layout.image_blobs("first")
+    assert exported.read_index() == {"schemaVersion": 2, "manifests": [blobs[0]]}
+    assert exported.image_blobs("first") == blobs
+    assert sorted(path.name for path in exported.blobs_dir.iterdir()) == sorted(
+        blob["digest"][7:] for blob in blobs
+    )
+    assert not (dest / "stale").exists()
+    # The blobs are shared with the original layout.
+    layer_path = exported.blob_path(blobs[-1]["digest"])
+    assert layer_path.samefile(archived_layout.blob_path(blobs[-1]["digest"]))
+
+
+def test_link_blob_copies(archived_layout, tmp_path, mocker):
+    mocker.patch.object(os, "link", side_effect=OSError("cross-device link"))
+    dest = oci_layout.Layout(tmp_path / "dest")
+    dest.init()
+    digest = archived_layout.image_blobs("first")[-1]["digest"]
+
+    dest.link_blob(archived_layout, digest)
+
+    assert dest.blob_path(digest).read_bytes() == (
+        archived_layout.blob_path(digest).read_bytes()
+    )
+    assert not dest.blob_path(digest).samefile(archived_layout.blob_path(digest))
+
+
+def test_copy_image(archived_layout, tmp_path):
+    dest = oci_layout.Layout(tmp_path / "dest")
+
+    archived_layout.copy_image("first", dest, "copy")
+
+    blobs = archived_layout.image_blobs("first")
+    (descriptor,) = dest.read_index()["manifests"]
+    assert descriptor == {
+        **blobs[0],
+        "annotations": {oci_layout.REF_NAME_ANNOTATION: "copy"},
+    }
+    for blob in blobs:
+        assert dest.blob_path(blob["digest"]).samefile(
+            archived_layout.blob_path(blob["digest"])
+        )
+
+
+def test_copy_image_same_layout(archived_layout, mocker):
+    spy_link = mocker.spy(oci_layout.Layout, "link_blob")
+
+    archived_layout.copy_image("first", archived_layout, "copy")
+
+    assert archived_layout.image_blobs("copy") == [
+        {
+            **archived_layout.image_blobs("first")[0],
+            "annotations": {oci_layout.REF_NAME_ANNOTATION: "copy"},
+        },
+        *archived_layout.image_blobs("first")[1:],
+    ]
+    spy_link.assert_not_called()
+
+
+def test_copy_image_replaces_tag(archived_layout):
+    """Copying over a tag moves it, and removes the manifest it pointed to."""
+    _, other = archived_layout.find_manifest(archived_layout.read_index(), "other")
+
+    archived_layout.copy_image("first", archived_layout, "other")
+
+    index = archived_layout.read_index()
+    assert len(index["manifests"]) == 2
+    _, first = archived_layout.find_manifest(index, "first")
+    _, copy = archived_layout.find_manifest(index, "other")
+    assert copy["digest"] == first["digest"]
+    assert not archived_layout.blob_path(other["digest"]).exists()
+
+
+@pytest.fixture
+def multi_arch_layout(tmp_path) -> oci_layout.Layout:
+    """A layout with an amd64 and an arm64 image that share a layer."""
+    layout = oci_layout.Layout(tmp_path / "multi")
+    for arch, variant in (("amd64", None), ("arm64", "v8")):
+        editor = oci_layout.ImageEditor(
+            layout.path.with_name(f"multi:{arch}"), create=True
+        )
+        editor.set_architecture(arch, variant)
+        editor.add_layer(write_layer(editor.layout, b"shared"), created_by="test")
+        editor.add_layer(write_layer(editor.layout, arch.encode()), created_by="test")
+        editor.commit()
+    return layout
+
+
+def tagged_descriptors(layout: oci_layout.Layout, *tags: str) -> list[dict]:
+    index = layout.read_index()
+    return [
+        {
+            key: value
+            for key, value in layout.find_manifest(index, tag)[1].items()
+            if key != "annotations"
+        }
+        for tag in tags
+    ]
+
+
+def test_write_image_index(multi_arch_layout):
+    manifests = tagged_descriptors(multi_arch_layout, "amd64", "arm64")
+
+    multi_arch_layout.write_image_index(manifests, "1.0")
+
+    _, descriptor = multi_arch_layout.find_manifest(
+        multi_arch_layout.read_index(), "1.0"
+    )
+    assert descriptor["mediaType"] == oci_layout.INDEX_MEDIA_TYPE
+    index = multi_arch_layout.read_json_blob(descriptor["digest"])
+    assert index == {
+        "schemaVersion": 2,
+        "mediaType": oci_layout.INDEX_MEDIA_TYPE,
+        "manifests": [
+            {**manifests[0], "platform": {"architecture": "amd64", "os": "linux"}},
+            {
+                **manifests[1],
+                "platform": {"architecture": "arm64", "os": "linux", "variant": "v8"},
+            },
+        ],
+    }
+
+
+def test_write_image_index_same_platform(multi_arch_layout):
+    manifests = tagged_descriptors(multi_arch_layout, "amd64", "amd64")
+
+    with pytest.raises(errors.RockcraftError, match="several images for linux/amd64"):
+        multi_arch_layout.write_image_index(manifests, "1.0")
+
+
+def test_write_image_index_replaced(multi_arch_layout):
+    """Replacing an image index removes the old index, but not its images."""
+    multi_arch_layout.write_image_index(
+        tagged_descriptors(multi_arch_layout, "amd64"), "1.0"
+    )
+    _, old = multi_arch_layout.find_manifest(multi_arch_layout.read_index(), "1.0")
+
+    multi_arch_layout.write_image_index(
+        tagged_descriptors(multi_arch_layout, "amd64", "arm64"), "1.0"
+    )
+
+    assert not multi_arch_layout.blob_path(old["digest"]).exists()
+    for blob in multi_arch_layout.image_blobs("amd64"):
+        assert multi_arch_layout.blob_path(blob["digest"]).exists()
+
+
+def test_image_blobs_index(multi_arch_layout):
+    multi_arch_layout.write_image_index(
+        tagged_descriptors(multi_arch_layout, "amd64", "arm64"), "1.0"
+    )
+
+    blobs = multi_arch_layout.image_blobs("1.0")
+
+    amd64 = multi_arch_layout.image_blobs("amd64")
+    arm64 = multi_arch_layout.image_blobs("arm64")
+    # The shared layer is only listed once.
+    assert amd64[2] == arm64[2]
+    assert [blob["digest"] for blob in blobs[1:]] == [
+        blob["digest"] for blob in [*amd64, *arm64[:2], arm64[3]]
+    ]
+
+
+def test_import_archive(archived_layout, tmp_path):
+    archive_path = tmp_path / "first.rock"
+    with archive_path.open("wb") as stream:
+        archived_layout.write_archive("first", stream)
+    layout = oci_layout.Layout(tmp_path / "imported")
+    layout.init()
+
+    manifests = layout.import_archive(archive_path)
+
+    assert manifests == [archived_layout.image_blobs("first")[0]]
+    for blob in archived_layout.image_blobs("first"):
+        assert layout.blob_path(blob["digest"]).read_bytes() == (
+            archived_layout.blob_path(blob["digest"]).read_bytes()
+        )
+
+
+def test_import_archive_bad_blob(tmp_path):
+    archive_path = tmp_path / "bad.rock"
+    with tarfile.open(archive_path, "w") as archive:
+        data = b"not the digest"
+        info = tarfile.TarInfo(f"blobs/sha256/{'ab' * 32}")
+        info.size = len(data)
+        archive.addfile(info, io.BytesIO(data))
+    layout = oci_layout.Layout(tmp_path / "imported")
+    layout.init()
+
+    with pytest.raises(errors.RockcraftError, match="doesn't match its digest"):
+        layout.import_archive(archive_path)
+
+    assert list(layout.blobs_dir.iterdir()) == []
+
+
+def test_import_archive_no_index(tmp_path):
+    archive_path = tmp_path / "empty.rock"
+    tarfile.open(archive_path, "w").close()
+    layout = oci_layout.Layout(tmp_path / "imported")
+    layout.init()
+
+    with pytest.raises(errors.RockcraftError, match="is not an OCI archive"):
+        layout.import_archive(archive_path)
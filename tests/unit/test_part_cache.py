@@ -0,0 +1,207 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright 2025 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import subprocess
+from pathlib import Path
+
+import pytest
+from craft_parts.packages.snaps import SnapPackage
+from rockcraft import part_cache
+from rockcraft.extensions.gunicorn import STATSD_EXPORTER_PART_SPEC
+from rockcraft.part_cache import PartCache
+from rockcraft.pebble import Pebble
+
+LS_REMOTE_OUTPUT = (
+    "1111111111111111111111111111111111111111\trefs/tags/v0.26.0\n"
+    "2222222222222222222222222222222222222222\trefs/tags/v0.26.0^{}\n"
+)
+
+
+@pytest.fixture
+def cache(tmp_path) -> PartCache:
+    return PartCache(tmp_path / "part-outputs")
+
+
+@pytest.fixture
+def mock_ls_remote(mocker):
+    return mocker.patch.object(
+        subprocess,
+        "run",
+        return_value=subprocess.CompletedProcess([], 0, stdout=LS_REMOTE_OUTPUT),
+    )
+
+
+@pytest.fixture
+def mock_store_snap_info(mocker):
+    return mocker.patch.object(
+        SnapPackage,
+        "get_store_snap_info",
+        return_value={"channels": {"latest/stable": {"revision": 42}}},
+    )
+
+
+@pytest.mark.usefixtures("mock_ls_remote", "mock_store_snap_info")
+@pytest.mark.parametrize(
+    "spec", [STATSD_EXPORTER_PART_SPEC, Pebble.PEBBLE_PART_SPEC_2404]
+)
+def test_get_key(cache, spec):
+    key = cache.get_key(spec, build_base="ubuntu@24.04", arch="amd64")
+
+    assert key is not None
+    assert key == cache.get_key(spec, build_base="ubuntu@24.04", arch="amd64")
+    assert key != cache.get_key(spec, build_base="ubuntu@22.04", arch="amd64")
+    assert key != cache.get_key(spec, build_base="ubuntu@24.04", arch="arm64")
+
+
+@pytest.mark.usefixtures("mock_store_snap_info")
+def test_get_key_tag_revision(cache, mock_ls_remote):
+    """The key changes when the tag of the source is moved."""
+    key = cache.get_key(
+        STATSD_EXPORTER_PART_SPEC, build_base="ubuntu@24.04", arch="amd64"
+    )
+    # The commit of annotated tags is used, rather than the tag object.
+    mock_ls_remote.return_value.stdout = LS_REMOTE_OUTPUT.replace("2222", "3333")
+
+    assert key != cache.get_key(
+        STATSD_EXPORTER_PART_SPEC, build_base="ubuntu@24.04", arch="amd64"
+    )
+
+
+@pytest.mark.usefixtures("mock_ls_remote")
+def test_get_key_snap_revision(cache, mock_store_snap_info):
+    key = cache.get_key(
+        Pebble.PEBBLE_PART_SPEC, build_base="ubuntu@25.10", arch="amd64"
+    )
+    mock_store_snap_info.return_value = {
+        "channels": {"latest/stable": {"revision": 43}}
+    }
+
+    assert key != cache.get_key(
+        Pebble.PEBBLE_PART_SPEC, build_base="ubuntu@25.10", arch="amd64"
+    )
+
+
+@pytest.mark.usefixtures("mock_ls_remote")
+@pytest.mark.parametrize(
+    "spec", [STATSD_EXPORTER_PART_SPEC, Pebble.PEBBLE_PART_SPEC_2404]
+)
+def test_get_key_build_snap_revision(cache, mock_store_snap_info, spec):
+    """The key changes with the revision of the build snaps, like Go's."""
+    spec = {**spec, "build-snaps": ["go/1.22/stable"]}
+    mock_store_snap_info.return_value = {
+        "channels": {"latest/stable": {"revision": 42}, "1.22/stable": {"revision": 1}}
+    }
+    key = cache.get_key(spec, build_base="ubuntu@24.04", arch="amd64")
+    mock_store_snap_info.return_value["channels"]["1.22/stable"]["revision"] = 2
+
+    assert key is not None
+    assert key != cache.get_key(spec, build_base="ubuntu@24.04", arch="amd64")
+
+
+@pytest.mark.usefixtures("mock_ls_remote")
+def test_get_key_build_snap_unresolved(cache, mocker):
+    mocker.patch.object(SnapPackage, "get_store_snap_info", return_value=None)
+
+    assert (
+        cache.get_key(
+            STATSD_EXPORTER_PART_SPEC, build_base="ubuntu@24.04", arch="amd64"
+        )
+        is None
+    )
+
+
+@pytest.mark.parametrize(
+    "spec",
+    [
+        {"plugin": "go", "source": "https://github.com/example/project.git"},
+        {"plugin": "dump", "source": "src", "source-tag": "v1"},
+        {**STATSD_EXPORTER_PART_SPEC, "build-packages": ["gcc"]},
+    ],
+)
+def test_get_key_unpinned(cache, spec, mock_ls_remote):
+    assert cache.get_key(spec, build_base="ubuntu@24.04", arch="amd64") is None
+    mock_ls_remote.assert_not_called()
+
+
+@pytest.mark.usefixtures("mock_store_snap_info")
+def test_get_key_unresolved(cache, mocker):
+    mocker.patch.object(
+        subprocess,
+        "run",
+        side_effect=subprocess.CalledProcessError(128, ["git", "ls-remote"]),
+    )
+
+    assert (
+        cache.get_key(
+            STATSD_EXPORTER_PART_SPEC, build_base="ubuntu@24.04", arch="amd64"
+        )
+        is None
+    )
+
+
+def test_store_get(cache, tmp_path):
+    install_dir = tmp_path / "parts/statsd-exporter/install"
+    (install_dir / "bin").mkdir(parents=True)
+    (install_dir / "bin/statsd_exporter").write_text("binary")
+    (install_dir / "exporter").symlink_to("bin/statsd_exporter")
+
+    assert cache.get("key") is None
+
+    cache.store("key", install_dir)
+
+    cached = cache.get("key")
+    assert cached == cache.path / "key/install"
+    assert (cached / "bin/statsd_exporter").read_text() == "binary"
+    assert (cached / "exporter").readlink() == Path("bin/statsd_exporter")
+    # No temporary directory is left behind.
+    assert [path.name for path in cache.path.iterdir()] == ["key"]
+
+
+def test_store_existing(cache, tmp_path):
+    install_dir = tmp_path / "install"
+    install_dir.mkdir()
+    (install_dir / "file").write_text("first")
+    cache.store("key", install_dir)
+    (install_dir / "file").write_text("second")
+
+    cache.store("key", install_dir)
+
+    assert (cache.path / "key/install/file").read_text() == "first"
+
+
+@pytest.mark.parametrize(
+    ("spec", "expected"),
+    [
+        (STATSD_EXPORTER_PART_SPEC, True),
+        (Pebble.PEBBLE_PART_SPEC_2204_2004, True),
+        ({**STATSD_EXPORTER_PART_SPEC, "source-tag": "v0.27.0"}, False),
+        ({"plugin": "nil"}, False),
+    ],
+)
+def test_is_helper_part(spec, expected):
+    assert part_cache.is_helper_part(spec) == expected
+
+
+def test_get_restored_spec(tmp_path):
+    spec = part_cache.get_restored_spec(Pebble.PEBBLE_PART_SPEC_2404, tmp_path)
+
+    assert spec == {
+        "plugin": "dump",
+        "source": str(tmp_path),
+        "source-type": "local",
+        "stage": ["usr/bin/pebble"],
+        "override-prime": Pebble.PEBBLE_PART_SPEC_2404["override-prime"],
+    }
@@ -31,6 +31,7 @@ from rockcraft.pebble import (
     TcpCheckOptions,
     add_pebble_part,
 )
+from rockcraft.rootfs_index import INDEX_FILE, RootfsIndex
 
 import tests
 
@@ -206,6 +207,22 @@ class TestPebble:
                 for field in service_fields:
                     check.is_not_in("_", field)
 
+    def test_define_pebble_layer_index(self, tmp_path):
+        """The existing Pebble layers are listed from the index of the base."""
+        base_layer_dir = tmp_path / "base"
+        base_layers_dir = base_layer_dir / Pebble.PEBBLE_LAYERS_PATH
+        base_layers_dir.mkdir(parents=True)
+        (base_layers_dir / "002-base.yaml").touch()
+        (base_layers_dir / "003-x.yaml").touch()
+        RootfsIndex.build(base_layer_dir).write(tmp_path / INDEX_FILE)
+        (base_layers_dir / "002-base.yaml").unlink()
+        target_dir = tmp_path / "target"
+
+        Pebble().define_pebble_layer(target_dir, base_layer_dir, {}, "my-rock")
+
+        new_layers = list((target_dir / Pebble.PEBBLE_LAYERS_PATH).iterdir())
+        assert [layer.name for layer in new_layers] == ["003-rockcraft-my-rock.yaml"]
+
     @pytest.mark.parametrize(
         "service",
         [
@@ -235,6 +235,45 @@ def test_project_base_invalid(yaml_loaded_data):
         load_project_yaml(yaml_loaded_data)
 
 
+def test_project_layers(yaml_loaded_data):
+    yaml_loaded_data["layers"] = {
+        "dependencies": {"parts": ["foo"]},
+        "assets": {"paths": ["srv/*"]},
+    }
+
+    project = load_project_yaml(yaml_loaded_data)
+
+    assert project.layers is not None
+    assert list(project.layers) == ["dependencies", "assets"]
+    assert project.layers["dependencies"].parts == ["foo"]
+    assert project.layers["assets"].paths == ["srv/*"]
+
+
+@pytest.mark.parametrize(
+    ("layers", "message"),
+    [
+        ({"dependencies": {"parts": ["bar"]}}, "refers to unknown part 'bar'"),
+        ({"dependencies": {}}, "must select files with 'parts' or 'paths'"),
+        ({"dependencies": {"files": ["srv"]}}, "files"),
+    ],
+)
+def test_project_layers_invalid(yaml_loaded_data, layers, message):
+    yaml_loaded_data["layers"] = layers
+
+    with pytest.raises(CraftValidationError, match=message):
+        load_project_yaml(yaml_loaded_data)
+
+
+@pytest.mark.parametrize(("value", "expected"), [(None, False), (True, True)])
+def test_project_deduplicate_files(yaml_loaded_data, value, expected):
+    if value is not None:
+        yaml_loaded_data["deduplicate-files"] = value
+
+    project = load_project_yaml(yaml_loaded_data)
+
+    assert project.deduplicate_files is expected
+
+
 def test_project_license_invalid(yaml_loaded_data):
     yaml_loaded_data["license"] = "apache 0.x"
 
@@ -0,0 +1,223 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright 2025 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from pathlib import Path
+
+import pytest
+from rockcraft import oci
+from rockcraft.rootfs_cache import RootfsCache, fingerprint
+from rockcraft.rootfs_index import INDEX_FILE, RootfsIndex
+
+DIGEST = "sha256:" + "ab" * 32
+NEW_DIGEST = "sha256:" + "cd" * 32
+
+
+def fake_extract_to(self, bundle_dir: Path, *, rootless: bool = False) -> Path:
+    """Unpack a small rootfs in place of the image's."""
+    rootfs = bundle_dir / self.image_name.replace(":", "-") / "rootfs"
+    (rootfs / "etc").mkdir(parents=True)
+    (rootfs / "etc/os-release").write_text("ubuntu")
+    (rootfs / "bin").symlink_to("usr/bin")
+    (rootfs.parent / "config.json").write_text("{}")
+    return rootfs
+
+
+@pytest.fixture
+def mock_extract_to(mocker):
+    return mocker.patch.object(
+        oci.Image, "extract_to", autospec=True, side_effect=fake_extract_to
+    )
+
+
+def fake_index_to(self, bundle_dir: Path, *, extract, rootless: bool = False) -> Path:
+    """Index a small rootfs in place of the image's, extracting its user database."""
+    rootfs = bundle_dir / self.image_name.replace(":", "-") / "rootfs"
+    (rootfs / "etc").mkdir(parents=True)
+    assert extract("etc/passwd")
+    assert extract("usr/lib/pkgconfig/foo.pc")
+    assert not extract("etc/os-release")
+    (rootfs / "etc/passwd").write_text("root:x:0:0::/root:/bin/bash")
+    RootfsIndex.build(rootfs).write(rootfs.parent / INDEX_FILE)
+    return rootfs
+
+
+@pytest.fixture
+def mock_index_to(mocker):
+    return mocker.patch.object(
+        oci.Image, "index_to", autospec=True, side_effect=fake_index_to
+    )
+
+
+@pytest.fixture
+def mock_manifest_digest(mocker):
+    return mocker.patch.object(oci.Image, "manifest_digest", return_value=DIGEST)
+
+
+@pytest.fixture
+def image():
+    return oci.Image("ubuntu:24.04", Path("images"))
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return RootfsCache(tmp_path / "bundles")
+
+
+@pytest.mark.parametrize(("rootless", "mode"), [(False, "rootful"), (True, "rootless")])
+def test_get_rootfs(
+    cache, image, mock_extract_to, mock_manifest_digest, rootless, mode
+):
+    rootfs = cache.get_rootfs(image, rootless=rootless)
+
+    bundle_path = cache.bundle_dir / f"sha256-{'ab' * 32}-{mode}"
+    assert rootfs == bundle_path / "rootfs"
+    assert (rootfs / "etc/os-release").read_text() == "ubuntu"
+    assert (bundle_path / "config.json").exists()
+    assert bundle_path.stat().st_mode & 0o777 == 0o555
+    # No temporary bundles are left behind
+    assert [path.name for path in cache.bundle_dir.iterdir()] == [bundle_path.name]
+    mock_extract_to.assert_called_once()
+    assert mock_extract_to.call_args.kwargs == {"rootless": rootless}
+
+
+def test_get_rootfs_reused(cache, image, mock_extract_to, mock_manifest_digest):
+    rootfs = cache.get_rootfs(image)
+
+    assert cache.get_rootfs(image) == rootfs
+    mock_extract_to.assert_called_once()
+
+
+def test_get_rootfs_index(cache, image, mock_extract_to, mock_manifest_digest):
+    rootfs = cache.get_rootfs(image)
+
+    index = RootfsIndex.for_rootfs(rootfs)
+    assert index is not None
+    entry = index.lookup("etc/os-release")
+    assert entry is not None
+    assert entry.is_file
+    assert index.list_dir("bin") == []
+
+
+def test_get_rootfs_modes(cache, image, mock_extract_to, mock_manifest_digest):
+    """Rootful and rootless bundles of the same image are cached separately."""
+    rootful = cache.get_rootfs(image)
+    rootless = cache.get_rootfs(image, rootless=True)
+
+    assert rootful != rootless
+    assert rootful.exists()
+    assert rootless.exists()
+    assert mock_extract_to.call_count == 2
+
+
+def test_get_rootfs_modified(cache, image, mock_extract_to, mock_manifest_digest):
+    rootfs = cache.get_rootfs(image)
+    (rootfs / "etc/os-release").write_text("modified")
+
+    assert cache.get_rootfs(image) == rootfs
+
+    assert (rootfs / "etc/os-release").read_text() == "ubuntu"
+    assert mock_extract_to.call_count == 2
+
+
+def test_get_rootfs_new_digest(cache, image, mock_extract_to, mock_manifest_digest):
+    """A new base is extracted again, and the stale bundle is removed."""
+    old_rootfs = cache.get_rootfs(image)
+    mock_manifest_digest.return_value = NEW_DIGEST
+
+    rootfs = cache.get_rootfs(image)
+
+    assert rootfs == cache.bundle_dir / f"sha256-{'cd' * 32}-rootful/rootfs"
+    assert rootfs.exists()
+    assert not old_rootfs.parent.exists()
+    assert mock_extract_to.call_count == 2
+
+
+def test_get_rootfs_keeps_unknown_dirs(
+    cache, image, mock_extract_to, mock_manifest_digest
+):
+    other = cache.bundle_dir / "other-rootful"
+    other.mkdir(parents=True)
+
+    cache.get_rootfs(image)
+
+    assert other.exists()
+
+
+def test_get_rootfs_index_only(
+    cache, image, mock_extract_to, mock_index_to, mock_manifest_digest
+):
+    rootfs = cache.get_rootfs(image, index_only=True)
+
+    bundle_path = cache.bundle_dir / f"sha256-{'ab' * 32}-rootful-index"
+    assert rootfs == bundle_path / "rootfs"
+    assert (rootfs / "etc/passwd").exists()
+    assert bundle_path.stat().st_mode & 0o777 == 0o555
+    assert cache.get_rootfs(image, index_only=True) == rootfs
+    mock_index_to.assert_called_once()
+    mock_extract_to.assert_not_called()
+
+
+@pytest.mark.usefixtures("mock_manifest_digest")
+@pytest.mark.parametrize("index_only", [False, True])
+def test_get_rootfs_missing_index(
+    cache, image, mock_extract_to, mock_index_to, index_only
+):
+    """Bundles are only reused with their index."""
+    rootfs = cache.get_rootfs(image, index_only=index_only)
+    rootfs.parent.chmod(0o755)
+    (rootfs.parent / INDEX_FILE).unlink()
+    rootfs.parent.chmod(0o555)
+
+    assert cache.get_rootfs(image, index_only=index_only) == rootfs
+
+    assert (rootfs.parent / INDEX_FILE).exists()
+    unpack = mock_index_to if index_only else mock_extract_to
+    assert unpack.call_count == 2
+
+
+def test_get_rootfs_index_only_extracted(
+    cache, image, mock_extract_to, mock_index_to, mock_manifest_digest
+):
+    """An extracted bundle is used in place of an index-only one."""
+    rootfs = cache.get_rootfs(image)
+
+    assert cache.get_rootfs(image, index_only=True) == rootfs
+    mock_index_to.assert_not_called()
+
+
+def test_get_rootfs_extracted_after_index(
+    cache, image, mock_extract_to, mock_index_to, mock_manifest_digest
+):
+    """Index-only bundles are not used when the rootfs must be extracted."""
+    indexed = cache.get_rootfs(image, index_only=True)
+
+    rootfs = cache.get_rootfs(image)
+
+    assert rootfs != indexed
+    assert (rootfs / "etc/os-release").exists()
+    mock_extract_to.assert_called_once()
+
+
+def test_fingerprint(tmp_path):
+    (tmp_path / "dir").mkdir()
+    (tmp_path / "dir/file").write_text("content")
+    (tmp_path / "link").symlink_to("dir")
+    original = fingerprint(tmp_path)
+
+    assert fingerprint(tmp_path) == original
+
+    (tmp_path / "dir/file").chmod(0o600)
+    assert fingerprint(tmp_path) != original
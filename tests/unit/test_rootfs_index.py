@@ -0,0 +1,284 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright 2025 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import hashlib
+import io
+import os
+import stat
+import tarfile
+
+import pytest
+from rockcraft.rootfs_index import INDEX_FILE, RootfsIndex
+
+from tests.unit.testing.layers import make_layer
+
+
+@pytest.fixture
+def rootfs(tmp_path):
+    rootfs = tmp_path / "bundle/rootfs"
+    (rootfs / "usr/bin").mkdir(parents=True)
+    (rootfs / "usr/bin/tool").write_text("tool")
+    (rootfs / "usr/bin/tool").chmod(0o755)
+    (rootfs / "bin").symlink_to("usr/bin")
+    (rootfs / "etc/alternatives").mkdir(parents=True)
+    (rootfs / "etc/alternatives/tool").symlink_to("/usr/bin/tool")
+    (rootfs / "etc/loop").symlink_to("loop")
+    return rootfs
+
+
+def test_build(rootfs):
+    index = RootfsIndex.build(rootfs)
+
+    assert len(index) == 9
+    entry = index.lookup("usr/bin/tool")
+    assert entry is not None
+    assert entry.is_file
+    assert entry.mode & 0o777 == 0o755
+    assert entry.size == 4
+    assert entry.digest == hashlib.sha256(b"tool").hexdigest()
+    link = index.lookup("bin", follow_symlinks=False)
+    assert link is not None
+    assert link.is_symlink
+    assert link.target == "usr/bin"
+
+
+@pytest.mark.parametrize(
+    ("path", "expected"),
+    [
+        ("usr/bin/tool", "usr/bin/tool"),
+        ("/usr/bin/tool", "usr/bin/tool"),
+        ("bin/tool", "usr/bin/tool"),
+        ("bin/../bin/tool", "usr/bin/tool"),
+        # Absolute targets are resolved within the rootfs.
+        ("etc/alternatives/tool", "usr/bin/tool"),
+        ("bin", "usr/bin"),
+        ("", "."),
+        ("missing", None),
+        ("bin/missing", None),
+        ("usr/bin/tool/file", None),
+        ("etc/loop", None),
+    ],
+)
+def test_lookup(rootfs, path, expected):
+    index = RootfsIndex.build(rootfs)
+
+    entry = index.lookup(path)
+
+    if expected is None:
+        assert entry is None
+    else:
+        assert entry == index.lookup(expected, follow_symlinks=False)
+
+
+def test_lookup_no_follow(rootfs):
+    index = RootfsIndex.build(rootfs)
+
+    entry = index.lookup("bin", follow_symlinks=False)
+    assert entry is not None
+    assert entry.is_symlink
+    # Parents are still resolved.
+    entry = index.lookup("bin/tool", follow_symlinks=False)
+    assert entry is not None
+    assert entry.is_file
+
+
+def test_list_dir(rootfs):
+    index = RootfsIndex.build(rootfs)
+
+    assert index.list_dir("") == ["bin", "etc", "usr"]
+    assert index.list_dir("bin") == ["tool"]
+    assert index.list_dir("usr/bin/tool") == []
+    assert index.list_dir("missing") == []
+
+
+def test_write_read(rootfs):
+    index = RootfsIndex.build(rootfs)
+    index.write(rootfs.parent / INDEX_FILE)
+
+    read_index = RootfsIndex.for_rootfs(rootfs)
+
+    assert read_index is not None
+    assert len(read_index) == len(index)
+    for path in ("usr/bin/tool", "bin", "etc/alternatives/tool"):
+        assert read_index.lookup(path, follow_symlinks=False) == index.lookup(
+            path, follow_symlinks=False
+        )
+
+
+def test_write_reproducible(rootfs):
+    index_path = rootfs.parent / INDEX_FILE
+    RootfsIndex.build(rootfs).write(index_path)
+    content = index_path.read_bytes()
+
+    RootfsIndex.build(rootfs).write(index_path)
+
+    assert index_path.read_bytes() == content
+
+
+def test_for_rootfs_missing(rootfs):
+    assert RootfsIndex.for_rootfs(rootfs) is None
+
+
+def test_for_rootfs_invalid(rootfs):
+    (rootfs.parent / INDEX_FILE).write_text("not an index")
+
+    assert RootfsIndex.for_rootfs(rootfs) is None
+
+
+def extract_selected(path: str) -> bool:
+    return path.startswith("etc/")
+
+
+def test_from_layers_matches_build(rootfs, tmp_path):
+    """Indexing a layer of a rootfs gives the same entries as indexing the rootfs."""
+    stream = io.BytesIO()
+    with tarfile.open(fileobj=stream, mode="w") as tar:
+        tar.add(rootfs, arcname=".")
+    stream.seek(0)
+    built = RootfsIndex.build(rootfs)
+
+    index = RootfsIndex.from_layers(
+        [stream], tmp_path / "partial", extract=extract_selected
+    )
+
+    assert len(index) == len(built)
+    for path in ("usr/bin/tool", "bin", "etc/alternatives/tool", "etc/loop"):
+        assert index.lookup(path, follow_symlinks=False) == built.lookup(
+            path, follow_symlinks=False
+        )
+    for path in ("", "usr", "usr/bin"):
+        entry = index.lookup(path)
+        built_entry = built.lookup(path)
+        assert entry is not None
+        assert built_entry is not None
+        assert (entry.mode, entry.uid, entry.gid) == (
+            built_entry.mode,
+            built_entry.uid,
+            built_entry.gid,
+        )
+
+
+def test_from_layers_extract(tmp_path):
+    layer = make_layer(
+        ("dir", "etc", ""),
+        ("file", "etc/passwd", "root:x:0:0::/root:/bin/bash\n"),
+        ("file", "usr/share/doc/README", "readme"),
+        ("symlink", "etc/mtab", "../proc/self/mounts"),
+        ("hardlink", "etc/passwd-", "etc/passwd"),
+    )
+    partial = tmp_path / "partial"
+
+    index = RootfsIndex.from_layers([layer], partial, extract=extract_selected)
+
+    assert sorted(str(path.relative_to(partial)) for path in partial.rglob("*")) == [
+        "etc",
+        "etc/mtab",
+        "etc/passwd",
+        "etc/passwd-",
+    ]
+    assert (partial / "etc/passwd").read_text() == "root:x:0:0::/root:/bin/bash\n"
+    assert (partial / "etc/passwd").stat().st_mode & 0o777 == 0o644
+    assert (partial / "etc/passwd-").read_text() == (partial / "etc/passwd").read_text()
+    assert (partial / "etc/mtab").readlink().as_posix() == "../proc/self/mounts"
+    # Files that aren't extracted are still indexed, with their parents.
+    entry = index.lookup("usr/share/doc/README")
+    assert entry is not None
+    assert entry.digest == hashlib.sha256(b"readme").hexdigest()
+    assert index.list_dir("usr/share") == ["doc"]
+    usr = index.lookup("usr")
+    assert usr is not None
+    assert usr.mode == stat.S_IFDIR | 0o755
+    assert index.lookup("etc/passwd-") == index.lookup("etc/passwd")
+
+
+def test_from_layers_whiteouts(tmp_path):
+    lower = make_layer(
+        ("file", "etc/passwd", "old"),
+        ("file", "etc/group", "group"),
+        ("file", "opt/app/old", "old"),
+        ("file", "var/lib/data", "data"),
+        ("file", "srv/file", "file"),
+    )
+    upper = make_layer(
+        ("file", "etc/passwd", "new"),
+        ("file", "etc/.wh.group", ""),
+        ("dir", "opt/app", ""),
+        ("file", "opt/app/.wh..wh..opq", ""),
+        ("file", "opt/app/new", "new"),
+        ("file", "var/.wh.lib", ""),
+        ("symlink", "srv", "var"),
+    )
+    partial = tmp_path / "partial"
+
+    index = RootfsIndex.from_layers([lower, upper], partial, extract=extract_selected)
+
+    assert (partial / "etc/passwd").read_text() == "new"
+    assert not (partial / "etc/group").exists()
+    assert index.lookup("etc/group") is None
+    assert index.list_dir("opt/app") == ["new"]
+    assert index.lookup("var/lib") is None
+    assert index.list_dir("var") == []
+    srv = index.lookup("srv", follow_symlinks=False)
+    assert srv is not None
+    assert srv.is_symlink
+    assert index.lookup("srv/file") is None
+
+
+def test_from_layers_opaque_whiteout_last(tmp_path):
+    """Opaque whiteouts keep the directories that their layer writes into."""
+    lower = make_layer(
+        ("file", "opt/app/old", "old"),
+        ("file", "opt/app/lib/old", "old"),
+    )
+    upper = make_layer(
+        ("file", "opt/app/lib/new", "new"),
+        ("file", "opt/app/.wh..wh..opq", ""),
+    )
+
+    index = RootfsIndex.from_layers(
+        [lower, upper], tmp_path / "partial", extract=extract_selected
+    )
+
+    assert index.list_dir("opt/app") == ["lib"]
+    assert index.list_dir("opt/app/lib") == ["new"]
+
+
+def test_from_layers_rootless(tmp_path):
+    layer = make_layer(("file", "etc/passwd", "passwd"))
+
+    index = RootfsIndex.from_layers(
+        [layer], tmp_path / "partial", extract=extract_selected, rootless=True
+    )
+
+    entry = index.lookup("etc/passwd")
+    assert entry is not None
+    assert (entry.uid, entry.gid) == (os.getuid(), os.getgid())
+
+
+def test_from_layers_not_under_symlink(tmp_path):
+    """Files are never extracted through the symlinks of the layers."""
+    outside = tmp_path / "outside"
+    outside.mkdir()
+    layer = make_layer(
+        ("symlink", "etc", str(outside)),
+        ("file", "etc/passwd", "passwd"),
+    )
+    partial = tmp_path / "partial"
+
+    RootfsIndex.from_layers([layer], partial, extract=extract_selected)
+
+    assert list(outside.iterdir()) == []
+    assert not (partial / "etc").exists()
@@ -0,0 +1,181 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright 2025 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import threading
+import time
+
+import pytest
+from craft_parts import Action, Step
+from rockcraft import scheduler
+
+PLAN = [
+    Action("a", Step.PULL),
+    Action("b", Step.PULL),
+    Action("c", Step.PULL),
+    Action("a", Step.BUILD),
+    Action("b", Step.BUILD),
+    Action("c", Step.BUILD),
+    Action("a", Step.STAGE),
+    Action("b", Step.STAGE),
+    Action("c", Step.STAGE),
+]
+
+
+def is_concurrent(action: Action) -> bool:
+    return action.step in (Step.PULL, Step.BUILD)
+
+
+class Recorder:
+    """Record when actions start and end."""
+
+    def __init__(self) -> None:
+        self.events: list[tuple[str, Action]] = []
+        self._lock = threading.Lock()
+
+    def __call__(self, action: Action) -> None:
+        with self._lock:
+            self.events.append(("start", action))
+        # Let other actions start, if they can.
+        time.sleep(0.01)
+        with self._lock:
+            self.events.append(("end", action))
+
+    def position(self, event: str, action: Action) -> int:
+        return self.events.index((event, action))
+
+
+def test_run_actions_serial():
+    recorder = Recorder()
+
+    scheduler.run_actions(
+        PLAN,
+        recorder,
+        concurrent_action=is_concurrent,
+        dependencies={},
+        jobs=1,
+    )
+
+    assert [action for event, action in recorder.events if event == "start"] == PLAN
+    assert recorder.events[1::2] == [("end", action) for action in PLAN]
+
+
+def test_run_actions_concurrent():
+    # Waits for every build to start, which only works if they run together.
+    barrier = threading.Barrier(3, timeout=10)
+
+    def execute(action: Action) -> None:
+        if action.step == Step.BUILD:
+            barrier.wait()
+
+    scheduler.run_actions(
+        PLAN,
+        execute,
+        concurrent_action=is_concurrent,
+        dependencies={},
+        jobs=3,
+    )
+
+
+def test_run_actions_order():
+    """Serial actions wait for the previous ones, and parts' steps stay in order."""
+    recorder = Recorder()
+
+    scheduler.run_actions(
+        PLAN,
+        recorder,
+        concurrent_action=is_concurrent,
+        dependencies={},
+        jobs=2,
+    )
+
+    for part in ("a", "b", "c"):
+        assert recorder.position("end", Action(part, Step.PULL)) < (
+            recorder.position("start", Action(part, Step.BUILD))
+        )
+    # Staging is done one part at a time, in the order of the plan.
+    assert recorder.events[-6:] == [
+        (event, action) for action in PLAN[-3:] for event in ("start", "end")
+    ]
+
+
+def test_run_actions_jobs_limit():
+    running = 0
+    most_running = 0
+    lock = threading.Lock()
+
+    def execute(_: Action) -> None:
+        nonlocal running, most_running
+        with lock:
+            running += 1
+            most_running = max(most_running, running)
+        time.sleep(0.01)
+        with lock:
+            running -= 1
+
+    scheduler.run_actions(
+        PLAN,
+        execute,
+        concurrent_action=is_concurrent,
+        dependencies={},
+        jobs=2,
+    )
+
+    assert most_running == 2
+
+
+def test_run_actions_dependencies():
+    """Parts are only built once the parts they depend on are."""
+    recorder = Recorder()
+
+    scheduler.run_actions(
+        PLAN,
+        recorder,
+        concurrent_action=is_concurrent,
+        dependencies={"c": {"a"}},
+        jobs=3,
+    )
+
+    assert recorder.position("end", Action("a", Step.BUILD)) < (
+        recorder.position("start", Action("c", Step.BUILD))
+    )
+    # Pulling doesn't depend on the other parts.
+    assert recorder.position("start", Action("c", Step.PULL)) < (
+        recorder.position("end", Action("a", Step.PULL))
+    )
+
+
+def test_run_actions_error():
+    recorder = Recorder()
+
+    def execute(action: Action) -> None:
+        recorder(action)
+        if action == Action("b", Step.BUILD):
+            raise RuntimeError("build failed")
+
+    with pytest.raises(RuntimeError, match="build failed"):
+        scheduler.run_actions(
+            PLAN,
+            execute,
+            concurrent_action=is_concurrent,
+            dependencies={},
+            jobs=3,
+        )
+
+    # The running actions are done, and no other action is started.
+    started = [action for event, action in recorder.events if event == "start"]
+    ended = [action for event, action in recorder.events if event == "end"]
+    assert sorted(started, key=PLAN.index) == sorted(ended, key=PLAN.index)
+    assert not any(action.step == Step.STAGE for action in started)
@@ -0,0 +1,185 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright 2025 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+from pathlib import Path
+
+import pytest
+from rockcraft.unpacker import unpack_layers
+
+from tests.unit.testing.layers import make_layer
+
+
+def list_dir(path: Path) -> list[str]:
+    return sorted(child.name for child in path.iterdir())
+
+
+@pytest.fixture
+def rootfs(tmp_path):
+    rootfs = tmp_path / "rootfs"
+    rootfs.mkdir()
+    return rootfs
+
+
+def test_unpack_layers(rootfs):
+    layer = make_layer(
+        ("dir", "etc", ""),
+        ("file", "etc/passwd", "root:x:0:0::/root:/bin/bash\n"),
+        ("file", "usr/share/doc/README", "readme"),
+        ("symlink", "etc/mtab", "../proc/self/mounts"),
+        ("hardlink", "etc/passwd-", "etc/passwd"),
+    )
+
+    unpack_layers([layer], rootfs, rootless=True)
+
+    assert (rootfs / "etc/passwd").read_text() == "root:x:0:0::/root:/bin/bash\n"
+    assert (rootfs / "etc/passwd").stat().st_mode & 0o777 == 0o644
+    assert (rootfs / "etc/passwd").stat().st_mtime == 1_700_000_000
+    assert (rootfs / "etc/passwd-").samefile(rootfs / "etc/passwd")
+    assert (rootfs / "etc/mtab").readlink().as_posix() == "../proc/self/mounts"
+    assert (rootfs / "usr/share/doc/README").read_text() == "readme"
+    # Directories that the layer only implies get the usual permissions.
+    assert (rootfs / "usr/share").stat().st_mode & 0o777 == 0o755
+    assert (rootfs / "etc").stat().st_mtime == 1_700_000_000
+
+
+def test_unpack_layers_whiteouts(rootfs):
+    lower = make_layer(
+        ("file", "etc/passwd", "old"),
+        ("file", "etc/group", "group"),
+        ("file", "opt/app/old", "old"),
+        ("file", "opt/app/lib/old", "old"),
+        ("file", "var/lib/data", "data"),
+        ("file", "srv/file", "file"),
+    )
+    upper = make_layer(
+        ("file", "etc/passwd", "new"),
+        ("file", "etc/.wh.group", ""),
+        ("dir", "opt/app", ""),
+        ("file", "opt/app/.wh..wh..opq", ""),
+        ("file", "opt/app/new", "new"),
+        ("file", "opt/app/lib/new", "new"),
+        ("file", "var/.wh.lib", ""),
+        ("symlink", "srv", "var"),
+    )
+
+    unpack_layers([lower, upper], rootfs, rootless=True)
+
+    assert (rootfs / "etc/passwd").read_text() == "new"
+    assert list_dir(rootfs / "etc") == ["passwd"]
+    assert list_dir(rootfs / "opt/app") == ["lib", "new"]
+    assert list_dir(rootfs / "opt/app/lib") == ["new"]
+    assert list_dir(rootfs / "var") == []
+    assert (rootfs / "srv").readlink().as_posix() == "var"
+
+
+def test_unpack_layers_opaque_whiteout_last(rootfs):
+    """Opaque whiteouts keep the directories that their layer writes into."""
+    lower = make_layer(
+        ("file", "opt/app/old", "old"),
+        ("file", "opt/app/lib/old", "old"),
+        ("symlink", "opt/current", "app"),
+    )
+    upper = make_layer(
+        # Written through a symlink, and in a directory the layer implies.
+        ("file", "opt/current/lib/new", "new"),
+        ("file", "opt/app/share/new", "new"),
+        ("file", "opt/app/.wh..wh..opq", ""),
+    )
+
+    unpack_layers([lower, upper], rootfs, rootless=True)
+
+    assert list_dir(rootfs / "opt/app") == ["lib", "share"]
+    assert list_dir(rootfs / "opt/app/lib") == ["new"]
+    assert list_dir(rootfs / "opt/app/share") == ["new"]
+
+
+def test_unpack_layers_symlinks_contained(rootfs, tmp_path):
+    """The symlinks of the layers are resolved within the rootfs."""
+    outside = tmp_path / "outside"
+    outside.mkdir()
+    layer = make_layer(
+        ("symlink", "abs", str(outside)),
+        ("file", "abs/file", "abs"),
+        ("symlink", "rel", "../../../.."),
+        ("file", "rel/file", "rel"),
+    )
+
+    unpack_layers([layer], rootfs, rootless=True)
+
+    assert list(outside.iterdir()) == []
+    assert (rootfs / str(outside).lstrip("/") / "file").read_text() == "abs"
+    assert (rootfs / "file").read_text() == "rel"
+
+
+def test_unpack_layers_outside_members(rootfs, tmp_path):
+    layer = make_layer(
+        ("file", "../escaped", "escaped"),
+        ("hardlink", "passwd", "../../etc/passwd"),
+    )
+
+    unpack_layers([layer], rootfs, rootless=True)
+
+    assert not (tmp_path / "escaped").exists()
+    assert list(rootfs.iterdir()) == []
+
+
+def test_unpack_layers_replace_types(rootfs):
+    lower = make_layer(
+        ("dir", "data", ""),
+        ("file", "data/file", "file"),
+        ("file", "link", "file"),
+    )
+    upper = make_layer(
+        ("file", "data", "now a file"),
+        ("symlink", "link", "data"),
+    )
+
+    unpack_layers([lower, upper], rootfs, rootless=True)
+
+    assert (rootfs / "data").read_text() == "now a file"
+    assert (rootfs / "link").readlink().as_posix() == "data"
+
+
+def test_unpack_layers_read_only_dirs(rootfs):
+    """Read-only directories are only made read-only once every layer is applied."""
+    lower = make_layer(("dir", "ro", ""), mode=0o555)
+    upper = make_layer(("file", "ro/file", "file"))
+
+    unpack_layers([lower, upper], rootfs, rootless=True)
+
+    assert (rootfs / "ro/file").read_text() == "file"
+    assert (rootfs / "ro").stat().st_mode & 0o777 == 0o555
+
+
+def test_unpack_layers_rootless(rootfs):
+    layer = make_layer(("file", "file", "file"))
+
+    unpack_layers([layer], rootfs, rootless=True)
+
+    info = (rootfs / "file").stat()
+    assert (info.st_uid, info.st_gid) == (os.getuid(), os.getgid())
+
+
+@pytest.mark.skipif(os.geteuid() != 0, reason="requires root permissions")
+def test_unpack_layers_ownership(rootfs):
+    layer = make_layer(("file", "file", "file"), ("symlink", "link", "file"))
+
+    unpack_layers([layer], rootfs)
+
+    for path in (rootfs / "file", rootfs / "link"):
+        info = path.lstat()
+        assert (info.st_uid, info.st_gid) == (1000, 1000)
@@ -18,7 +18,7 @@ import re
 from pathlib import Path
 
 import pytest
-from rockcraft import utils
+from rockcraft import errors, utils
 
 
 @pytest.fixture
@@ -60,6 +60,35 @@ def test_get_managed_environment_snap_channel_none(monkeypatch):
     assert utils.get_managed_environment_snap_channel() is None
 
 
+@pytest.mark.parametrize(
+    ("value", "expected"), [("", None), ("1700000000", 1700000000)]
+)
+def test_get_source_date_epoch(monkeypatch, value, expected):
+    monkeypatch.setenv("SOURCE_DATE_EPOCH", value)
+
+    assert utils.get_source_date_epoch() == expected
+
+
+def test_get_source_date_epoch_unset(monkeypatch):
+    monkeypatch.delenv("SOURCE_DATE_EPOCH", raising=False)
+
+    assert utils.get_source_date_epoch() is None
+
+
+@pytest.mark.parametrize("value", ["now", "-1", "1.5"])
+def test_get_source_date_epoch_invalid(monkeypatch, value):
+    monkeypatch.setenv("SOURCE_DATE_EPOCH", value)
+
+    with pytest.raises(errors.RockcraftError, match="Invalid SOURCE_DATE_EPOCH"):
+        utils.get_source_date_epoch()
+
+
+def test_utc_now_source_date_epoch(monkeypatch):
+    monkeypatch.setenv("SOURCE_DATE_EPOCH", "86400")
+
+    assert utils.utc_now().isoformat() == "1970-01-02T00:00:00+00:00"
+
+
 @pytest.mark.parametrize(
     ("command", "expected"),
     [
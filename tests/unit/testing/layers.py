@@ -0,0 +1,48 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright 2025 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Layer tarballs for use in tests."""
+
+import io
+import tarfile
+
+
+def make_layer(*members: tuple[str, str, bytes | str], mode: int = 0) -> io.BytesIO:
+    """Create a layer tarball from ``(type, name, content or target)`` tuples."""
+    stream = io.BytesIO()
+    with tarfile.open(fileobj=stream, mode="w") as tar:
+        for kind, name, content in members:
+            info = tarfile.TarInfo(name)
+            info.mode = mode or (0o755 if kind == "dir" else 0o644)
+            info.uid = info.gid = 1000
+            info.mtime = 1_700_000_000
+            if kind == "dir":
+                info.type = tarfile.DIRTYPE
+                tar.addfile(info)
+            elif kind == "symlink":
+                info.type = tarfile.SYMTYPE
+                info.linkname = str(content)
+                tar.addfile(info)
+            elif kind == "hardlink":
+                info.type = tarfile.LNKTYPE
+                info.linkname = str(content)
+                tar.addfile(info)
+            else:
+                data = content if isinstance(content, bytes) else content.encode()
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+    stream.seek(0)
+    return stream
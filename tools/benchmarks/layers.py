@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+#
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright 2025 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmark of the archiving of a prime directory into a layer.
+
+The prime directory is a synthetic tree of small files, and of a few large
+ones. The time taken to gather its paths, fingerprint them and write them as
+an (uncompressed) layer tarball is reported, with the number of read and
+write system calls and, if strace is installed, a summary of all the system
+calls. The tarball is written to a stream and to a file, whose large files
+are copied by the kernel, and with tarfile for comparison.
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+from pathlib import Path
+from typing import BinaryIO
+
+from craft_cli import EmitterMode, emit
+
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+
+from rockcraft import layers
+
+
+class NullStream:
+    """A binary stream discarding everything written to it."""
+
+    def write(self, data: bytes) -> int:
+        """Discard ``data``."""
+        return len(data)
+
+
+def create_tree(
+    root: Path, files: int, files_per_dir: int, large_files: int, large_size: int
+) -> None:
+    """Create a tree of ``files`` small files, with a few symlinks.
+
+    ``large_files`` files of ``large_size`` MiB are added in ``opt/data``.
+    """
+    for index in range(files):
+        directory = root / f"usr/lib/dir{index // files_per_dir:05d}"
+        if index % files_per_dir == 0:
+            directory.mkdir(parents=True)
+            (directory / "link").symlink_to("file00000")
+        (directory / f"file{index % files_per_dir:05d}").write_bytes(b"x" * 64)
+
+    data_dir = root / "opt/data"
+    data_dir.mkdir(parents=True)
+    chunk = os.urandom(1024 * 1024)
+    for index in range(large_files):
+        with (data_dir / f"large{index:03d}.bin").open("wb") as stream:
+            for _ in range(large_size):
+                stream.write(chunk)
+
+
+def read_io_counters() -> dict[str, int]:
+    """Get the number of read and write system calls made by this process."""
+    io_path = Path("/proc/self/io")
+    if not io_path.exists():
+        return {}
+    counters = dict(line.split(": ") for line in io_path.read_text().splitlines())
+    return {name: int(counters[name]) for name in ("syscr", "syscw")}
+
+
+def write_with_tarfile(
+    layer_paths: dict[str, layers.LayerEntry], tar_stream: BinaryIO
+) -> None:
+    """Archive the paths with ``TarFile.add()``, as a baseline."""
+    with tarfile.open(
+        fileobj=tar_stream, mode="w|", format=tarfile.PAX_FORMAT
+    ) as tar_file:
+        for arcname in sorted(layer_paths):
+            tar_file.add(layer_paths[arcname].filepath, arcname, recursive=False)
+
+
+def run(prime_dir: Path) -> None:
+    """Archive ``prime_dir`` into a layer, reporting the time it took."""
+    counters = read_io_counters()
+    start = time.monotonic()
+    layer_paths = layers.gather_layer_paths(prime_dir)
+    gathered = time.monotonic()
+    layers.fingerprint_layer_paths(layer_paths)
+    layers.write_layer_paths(layer_paths, NullStream())  # type: ignore[arg-type]
+    written = time.monotonic()
+    print(
+        f"{len(layer_paths)} paths: gathered in {gathered - start:.2f}s, "
+        f"fingerprinted and written in {written - gathered:.2f}s"
+    )
+    if counters:
+        new_counters = read_io_counters()
+        print(
+            f"read system calls: {new_counters['syscr'] - counters['syscr']}, "
+            f"write system calls: {new_counters['syscw'] - counters['syscw']}"
+        )
+
+    size = sum(entry.info.st_size for entry in layer_paths.values())
+    tar_path = prime_dir.parent / "layer.tar"
+    for label, write in (
+        ("", layers.write_layer_paths),
+        (" with tarfile", write_with_tarfile),
+    ):
+        start = time.monotonic()
+        write(layer_paths, NullStream())  # type: ignore[arg-type]
+        report(f"written to a stream{label}", size, time.monotonic() - start)
+        start = time.monotonic()
+        with tar_path.open("wb") as tar_stream:
+            write(layer_paths, tar_stream)
+        report(f"written to a file{label}", size, time.monotonic() - start)
+        tar_path.unlink()
+
+
+def report(label: str, size: int, duration: float) -> None:
+    """Print the duration and throughput of writing ``size`` bytes."""
+    throughput = size / (1024 * 1024) / duration if duration else 0
+    print(f"{label}: {duration:.2f}s ({throughput:.0f} MiB/s)")
+
+
+def main() -> None:
+    """Run the benchmark on a new prime directory."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--files", type=int, default=200_000)
+    parser.add_argument("--files-per-dir", type=int, default=100)
+    parser.add_argument("--large-files", type=int, default=8)
+    parser.add_argument(
+        "--large-size", type=int, default=128, help="size of the large files (MiB)"
+    )
+    parser.add_argument("--prime-dir", type=Path, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.prime_dir:
+        log_path = args.prime_dir.parent / "benchmark.log"
+        emit.init(EmitterMode.BRIEF, "rockcraft", "Benchmark", log_filepath=log_path)
+        try:
+            run(args.prime_dir)
+        finally:
+            emit.ended_ok()
+        return
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        prime_dir = Path(temp_dir, "prime")
+        create_tree(
+            prime_dir,
+            args.files,
+            args.files_per_dir,
+            args.large_files,
+            args.large_size,
+        )
+        command = [sys.executable, __file__, "--prime-dir", str(prime_dir)]
+        subprocess.run(command, check=True)
+
+        strace = shutil.which("strace")
+        if strace is None:
+            print("Install strace to count the system calls.")
+            return
+        summary = subprocess.run(
+            [strace, "-f", "-c", "-o", "/dev/stdout", *command],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        print(summary)
+
+
+if __name__ == "__main__":
+    main()